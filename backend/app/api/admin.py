@@ -0,0 +1,50 @@
+import os
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+
+from app.core.config import settings
+from app.core.profiling import TraceStore, require_profiling_token, sampler
+from app.schemas.profiling import ProfileTrace, ProfileTraceSummary
+
+router = APIRouter(
+    prefix="/admin/profiling",
+    tags=["admin"],
+    dependencies=[Depends(require_profiling_token)],
+)
+
+
+def _folded_text(stacks) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+
+@router.get("/traces", response_model=List[ProfileTraceSummary])
+async def list_slowest_traces(route: Optional[str] = None):
+    """Slowest sampled requests per route (``route`` like "GET /api/v1/points/{point_id}")"""
+    return await TraceStore.slowest(route)
+
+
+@router.get("/traces/{trace_id}", response_model=ProfileTrace)
+async def get_trace(trace_id: str, format: str = Query("json", pattern="^(json|folded)$")):
+    """A profiled request; ``format=folded`` returns its stacks for flamegraph tools"""
+    trace = await TraceStore.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Trace not found")
+    if format == "folded":
+        stacks = sorted(trace["stacks"].items(), key=lambda item: item[1], reverse=True)
+        return PlainTextResponse(_folded_text(stacks))
+    return trace
+
+
+@router.get("/flamegraph", response_class=PlainTextResponse)
+async def continuous_profile(
+    seconds: int = Query(60, ge=1, le=settings.PROFILING_WINDOW_SECONDS),
+):
+    """Continuous profile of the serving process over the last ``seconds``, as folded stacks"""
+    if not sampler.running or not settings.PROFILING_CONTINUOUS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Continuous profiling is disabled")
+    return PlainTextResponse(
+        _folded_text(sampler.folded(seconds)),
+        headers={"X-Profile-Process": str(os.getpid())},
+    )
@@ -1,20 +1,24 @@
-from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordRequestForm
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.security import HTTPAuthorizationCredentials, OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.database import get_db
-from app.core.security import create_access_token
-from app.core.config import settings
+from app.core.rate_limit import rate_limiter
 from app.schemas.user import (
     UserRegister, 
     UserLogin, 
     Token, 
+    TokenRefresh,
     User,
     UserProfile,
-    OAuthLoginRequest
+    OAuthLoginRequest,
+    EmailVerification,
+    PasswordReset,
+    PasswordResetConfirm,
+    PushDeviceRegister
 )
-from app.services.auth import AuthService
+from app.services.auth import AuthService, security
+from app.services.notifications import NotificationService
 
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
@@ -23,9 +27,12 @@ router = APIRouter(prefix="/auth", tags=["authentication"])
 @router.post("/register", response_model=Token)
 async def register(
     user_data: UserRegister,
+    request: Request,
+    response: Response,
     db: AsyncSession = Depends(get_db)
 ):
     """Register new user with email and password"""
+    await rate_limiter.hit(request, response, "auth.register", email=user_data.email)
     from app.schemas.user import UserCreate
     from app.models.user import AuthProviderEnum
     
@@ -38,27 +45,21 @@ async def register(
     )
     
     user = await AuthService.create_user(db, user_create)
+    if not user.is_verified:
+        await NotificationService.send_verification_email(user.email)
     
-    # Create access token
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
-    )
-    
-    return Token(
-        access_token=access_token,
-        token_type="bearer",
-        expires_in=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
-        user=User.from_orm(user)
-    )
+    return await AuthService.issue_tokens(user)
 
 
 @router.post("/login", response_model=Token)
 async def login(
     user_data: UserLogin,
+    request: Request,
+    response: Response,
     db: AsyncSession = Depends(get_db)
 ):
     """Login with email and password"""
+    await rate_limiter.hit(request, response, "auth.login", email=user_data.email)
     user = await AuthService.authenticate_user(db, user_data.email, user_data.password)
     
     if not user:
@@ -68,48 +69,32 @@ async def login(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Create access token
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
-    )
-    
-    return Token(
-        access_token=access_token,
-        token_type="bearer",
-        expires_in=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
-        user=User.from_orm(user)
-    )
+    return await AuthService.issue_tokens(user)
 
 
 @router.post("/login/oauth", response_model=Token)
 async def oauth_login(
     oauth_data: OAuthLoginRequest,
+    request: Request,
+    response: Response,
     db: AsyncSession = Depends(get_db)
 ):
     """Login with OAuth (Google, Facebook)"""
+    await rate_limiter.hit(request, response, "auth.oauth")
     user = await AuthService.oauth_login(db, oauth_data)
     
-    # Create access token
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
-    )
-    
-    return Token(
-        access_token=access_token,
-        token_type="bearer",
-        expires_in=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
-        user=User.from_orm(user)
-    )
+    return await AuthService.issue_tokens(user)
 
 
 @router.post("/token", response_model=Token)
 async def login_for_access_token(
+    request: Request,
+    response: Response,
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: AsyncSession = Depends(get_db)
 ):
     """OAuth2 compatible token endpoint"""
+    await rate_limiter.hit(request, response, "auth.token", email=form_data.username)
     user = await AuthService.authenticate_user(db, form_data.username, form_data.password)
     
     if not user:
@@ -119,17 +104,88 @@ async def login_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
-    )
-    
-    return Token(
-        access_token=access_token,
-        token_type="bearer",
-        expires_in=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
-        user=User.from_orm(user)
-    )
+    return await AuthService.issue_tokens(user)
+
+
+@router.post("/refresh", response_model=Token)
+async def refresh_token(
+    data: TokenRefresh,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db)
+):
+    """Exchange a refresh token for a new token pair (the old refresh token stops working)"""
+    await rate_limiter.hit(request, response, "auth.refresh")
+    return await AuthService.refresh_tokens(db, data.refresh_token)
+
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    current_user: User = Depends(AuthService.get_current_user)
+):
+    """End this session: its access and refresh tokens are revoked"""
+    await AuthService.logout(credentials.credentials)
+
+
+@router.post("/logout/all")
+async def logout_all(
+    current_user: User = Depends(AuthService.get_current_user)
+):
+    """End every session of the current user"""
+    return {"revoked_sessions": await AuthService.logout_all(current_user.id)}
+
+
+@router.post("/verify-email", response_model=UserProfile)
+async def verify_email(
+    data: EmailVerification,
+    db: AsyncSession = Depends(get_db)
+):
+    """Confirm the email address from the verification link"""
+    user = await AuthService.verify_email(db, data.token)
+    return UserProfile.from_orm(user)
+
+
+@router.post("/password-reset", status_code=status.HTTP_202_ACCEPTED)
+async def request_password_reset(
+    data: PasswordReset,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db)
+):
+    """Email a password reset link (same answer whether the account exists or not)"""
+    await rate_limiter.hit(request, response, "auth.password_reset", email=data.email)
+    await AuthService.request_password_reset(db, data.email)
+    return {"message": "If the account exists, a reset link has been sent"}
+
+
+@router.post("/password-reset/confirm", status_code=status.HTTP_204_NO_CONTENT)
+async def confirm_password_reset(
+    data: PasswordResetConfirm,
+    db: AsyncSession = Depends(get_db)
+):
+    """Set a new password from the reset link; every session is logged out"""
+    await AuthService.reset_password(db, data.token, data.new_password)
+
+
+@router.post("/devices", status_code=status.HTTP_204_NO_CONTENT)
+async def register_push_device(
+    data: PushDeviceRegister,
+    current_user: User = Depends(AuthService.get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Receive order status pushes on this device"""
+    await NotificationService.register_device(db, current_user.id, data.token, data.platform)
+
+
+@router.delete("/devices/{token}", status_code=status.HTTP_204_NO_CONTENT)
+async def unregister_push_device(
+    token: str,
+    current_user: User = Depends(AuthService.get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Stop pushes to this device"""
+    await NotificationService.unregister_device(db, current_user.id, token)
 
 
 @router.get("/me", response_model=UserProfile)
@@ -0,0 +1,46 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import get_db
+from app.models.user import User
+from app.core.config import settings
+from app.schemas.cashier import Cashier, CashierHeartbeat, CashierPresence, CashierStatusUpdate
+from app.services.auth import AuthService
+from app.services.cashier import CashierService
+from app.services.presence import PresenceService
+
+
+router = APIRouter(prefix="/cashiers", tags=["cashiers"])
+
+
+@router.put("/{cashier_id}/status", response_model=Cashier)
+async def update_cashier_status(
+    cashier_id: int,
+    status_update: CashierStatusUpdate,
+    current_user: User = Depends(AuthService.get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Change cashier working status"""
+    return await CashierService.set_status(db, current_user, cashier_id, status_update)
+
+
+@router.post("/{cashier_id}/heartbeat", response_model=CashierPresence)
+async def cashier_heartbeat(
+    cashier_id: int,
+    heartbeat: CashierHeartbeat,
+    current_user: User = Depends(AuthService.get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Keep the cashier's console session alive, optionally changing its status.
+
+    Send every few seconds (well within ``ttl_seconds``); without heartbeats the
+    cashier goes offline. Only state changes are written to the database.
+    """
+    point_id = await PresenceService.authorize(db, current_user, cashier_id)
+    previous, current = await PresenceService.heartbeat(cashier_id, point_id, heartbeat.status)
+    return CashierPresence(
+        cashier_id=cashier_id,
+        status=current,
+        changed=previous != current,
+        ttl_seconds=settings.PRESENCE_TTL_SECONDS,
+    )
@@ -0,0 +1,88 @@
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import get_db
+from app.core.idempotency import idempotency
+from app.core.rate_limit import rate_limiter
+from app.models.user import User
+from app.schemas.location import LocationPingAck, LocationPingBatch
+from app.schemas.order import ActiveOrder, Order, OrderCreate, OrderStatusTransition
+from app.services.active_orders import ActiveOrdersIndex
+from app.services.auth import AuthService
+from app.services.geofence import geofence
+from app.services.order import OrderService
+from app.services.order_intake import order_intake
+
+
+router = APIRouter(prefix="/orders", tags=["orders"])
+
+
+@router.post("", response_model=Order, status_code=status.HTTP_201_CREATED)
+async def create_order(
+    order_data: OrderCreate,
+    request: Request,
+    response: Response,
+    current_user: User = Depends(AuthService.get_current_user),
+):
+    """Create order (join the point's queue).
+
+    Concurrent orders are created together in one transaction (group commit).
+    """
+    await rate_limiter.hit(request, response, "orders.create", user=str(current_user.id))
+    return await idempotency.run(
+        request,
+        response,
+        "orders.create",
+        current_user.id,
+        lambda: order_intake.submit(current_user, order_data),
+        Order,
+        status_code=status.HTTP_201_CREATED,
+    )
+
+
+@router.get("/active", response_model=List[ActiveOrder])
+async def get_active_orders(
+    current_user: User = Depends(AuthService.get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """The user's current orders across all points with status and queue position"""
+    return await ActiveOrdersIndex.get(db, current_user.id)
+
+
+@router.post("/location", response_model=LocationPingAck, status_code=status.HTTP_202_ACCEPTED)
+async def report_location(
+    batch: LocationPingBatch,
+    current_user: User = Depends(AuthService.get_current_user),
+):
+    """Location pings of a customer with active orders (arrival detection).
+
+    Pings are buffered and checked against the orders' points in the
+    background; arrival shows up as an ``order.arrived`` event.
+    """
+    return LocationPingAck(accepted=geofence.submit(current_user.id, batch.pings))
+
+
+@router.put("/{order_id}/status", response_model=Order)
+async def transition_order_status(
+    order_id: int,
+    transition: OrderStatusTransition,
+    request: Request,
+    current_user: User = Depends(AuthService.get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Move order to another status of the point's workflow"""
+    if transition.order_id != order_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="order_id in body does not match the URL"
+        )
+    return await idempotency.run(
+        request,
+        None,
+        "orders.transition",
+        current_user.id,
+        lambda: OrderService.transition_status(db, current_user, order_id, transition),
+        Order,
+    )
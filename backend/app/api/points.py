@@ -0,0 +1,338 @@
+import os
+from typing import Dict, List, Optional
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import get_db, get_read_db
+from app.core.encoding import EncodedPayload, negotiated_response, response_cache, shared_payload
+from app.models.user import User
+from app.schemas.bulk_import import BulkImportRequest, BulkImportResult
+from app.schemas.cashier import PointPresence
+from app.schemas.export import ExportJob, ExportJobStatusEnum, ExportRequest
+from app.schemas.order import OrderStatusPublic, PointQueueCounts
+from app.schemas.point import PointPublic, PointSearchFilters, PointSearchResult
+from app.schemas.simulation import SimulationJob, SimulationRequest, SimulationResult
+from app.schemas.sync import PointChanges
+from app.services.auth import AuthService
+from app.services.bulk_import import BulkImportService
+from app.services.changefeed import ChangeFeed
+from app.services.export import MEDIA_TYPES, ExportJobService, OrderExportService
+from app.services.point import PointService
+from app.services.presence import PresenceService
+from app.services.queue_counters import QueueCounters
+from app.services.search import PointSearchService
+from app.services.simulation import SimulationJobService, SimulationService
+
+
+router = APIRouter(prefix="/points", tags=["points"])
+
+
+@router.get("/search", response_model=List[PointSearchResult])
+async def search_points(
+    request: Request,
+    filters: PointSearchFilters = Depends(),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Search points by name, description and address, ranked by relevance and distance"""
+    key = ("search", PointSearchService.cache_key(filters))
+    payload = response_cache.get(key)
+    if payload is None:
+        results = await PointSearchService.search(db, filters)
+        payload = EncodedPayload(jsonable_encoder(results))
+        response_cache.set(key, payload)
+    return negotiated_response(request, payload)
+
+
+@router.get("/queue", response_model=List[PointQueueCounts])
+async def get_owned_points_queue(
+    point_id: Optional[List[int]] = Query(None),
+    current_user: User = Depends(AuthService.get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Live order counts of the current user's points (or the given ones among them), for the owner dashboard"""
+    point_ids = await PointService.owned_point_ids(db, current_user.id, point_id)
+    return await QueueCounters.get_many(db, point_ids)
+
+
+def _check_import_size(data: BulkImportRequest) -> None:
+    if max(len(data.points), len(data.cashiers), len(data.statuses)) > settings.BULK_IMPORT_MAX_ROWS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {settings.BULK_IMPORT_MAX_ROWS} rows of each kind per import"
+        )
+
+
+@router.post("/import", response_model=BulkImportResult)
+async def import_points(
+    data: BulkImportRequest,
+    dry_run: bool = False,
+    current_user: User = Depends(AuthService.get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Create or update the user's points, cashiers and status workflows in bulk.
+
+    Invalid rows are skipped and listed in ``errors``; with ``dry_run`` nothing
+    is saved.
+    """
+    _check_import_size(data)
+    return await BulkImportService.run(db, current_user.id, data, dry_run=dry_run)
+
+
+async def _read_csv(upload: Optional[UploadFile]) -> List[dict]:
+    if upload is None:
+        return []
+    content = await upload.read(settings.MAX_FILE_SIZE + 1)
+    if len(content) > settings.MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"{upload.filename} is larger than {settings.MAX_FILE_SIZE} bytes"
+        )
+    try:
+        return BulkImportService.parse_csv(content.decode("utf-8-sig"))
+    except UnicodeDecodeError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{upload.filename} is not UTF-8 text"
+        )
+
+
+@router.post("/import/csv", response_model=BulkImportResult)
+async def import_points_csv(
+    points: Optional[UploadFile] = File(None),
+    cashiers: Optional[UploadFile] = File(None),
+    statuses: Optional[UploadFile] = File(None),
+    dry_run: bool = False,
+    current_user: User = Depends(AuthService.get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Same as ``/points/import`` with one CSV file (header row) per kind"""
+    data = BulkImportRequest(
+        points=await _read_csv(points),
+        cashiers=await _read_csv(cashiers),
+        statuses=await _read_csv(statuses),
+    )
+    _check_import_size(data)
+    return await BulkImportService.run(db, current_user.id, data, dry_run=dry_run)
+
+
+@router.get("/{point_id}/changes", response_model=PointChanges)
+async def get_point_changes(
+    point_id: int,
+    since: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    current_user: User = Depends(AuthService.get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Deltas of the point's live orders, cashiers and statuses after ``since``.
+
+    When the client is too far behind, the response carries a snapshot and the
+    seq to resume from instead of deltas.
+    """
+    await PointService.ensure_staff(db, point_id, current_user)
+    return await ChangeFeed.changes_since(db, point_id, since, limit)
+
+
+@router.get("/{point_id}/queue", response_model=PointQueueCounts)
+async def get_point_queue(
+    point_id: int,
+    current_user: User = Depends(AuthService.get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Live order counts of the point by status and by cashier (point staff only)"""
+    await PointService.ensure_staff(db, point_id, current_user)
+    return await QueueCounters.get(db, point_id)
+
+
+def _export_job(request: Request, job: Dict[str, str]) -> ExportJob:
+    params = ExportJobService.params(job)
+    done = job["status"] == ExportJobStatusEnum.DONE.value
+    return ExportJob(
+        id=job["id"],
+        point_id=int(job["point_id"]),
+        status=job["status"],
+        format=params.format,
+        gzip=params.gzip,
+        rows=int(job.get("rows", 0)),
+        error=job.get("error"),
+        download_url=str(request.url_for(
+            "download_point_export", point_id=job["point_id"], job_id=job["id"]
+        )) if done else None,
+    )
+
+
+async def _get_export_job(point_id: int, job_id: str) -> Dict[str, str]:
+    job = await ExportJobService.get(job_id)
+    if job is None or int(job["point_id"]) != point_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Export not found"
+        )
+    return job
+
+
+@router.get("/{point_id}/orders/export")
+async def export_point_orders(
+    point_id: int,
+    request: Request,
+    params: ExportRequest = Depends(),
+    current_user: User = Depends(AuthService.get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Stream the point's orders with status history as CSV or NDJSON.
+
+    Exports larger than ``EXPORT_INLINE_MAX_ROWS`` are handed to the worker
+    instead: the response is 202 with the export job to poll.
+    """
+    await PointService.ensure_owner(db, point_id, current_user)
+    if await OrderExportService.exceeds(point_id, params, settings.EXPORT_INLINE_MAX_ROWS):
+        job = _export_job(request, await ExportJobService.enqueue(point_id, current_user.id, params))
+        location = request.url_for("get_point_export", point_id=point_id, job_id=job.id)
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content=job.model_dump(mode="json"),
+            headers={"Location": str(location)},
+        )
+
+    filename = OrderExportService.filename(point_id, params)
+    return StreamingResponse(
+        OrderExportService.stream(point_id, params),
+        media_type="application/gzip" if params.gzip else MEDIA_TYPES[params.format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.post("/{point_id}/exports", response_model=ExportJob, status_code=status.HTTP_202_ACCEPTED)
+async def create_point_export(
+    point_id: int,
+    params: ExportRequest,
+    request: Request,
+    current_user: User = Depends(AuthService.get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Queue an export to be written to a file by the worker"""
+    await PointService.ensure_owner(db, point_id, current_user)
+    return _export_job(request, await ExportJobService.enqueue(point_id, current_user.id, params))
+
+
+@router.get("/{point_id}/exports/{job_id}", response_model=ExportJob)
+async def get_point_export(
+    point_id: int,
+    job_id: str,
+    request: Request,
+    current_user: User = Depends(AuthService.get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Export job status"""
+    await PointService.ensure_owner(db, point_id, current_user)
+    return _export_job(request, await _get_export_job(point_id, job_id))
+
+
+@router.get("/{point_id}/exports/{job_id}/download")
+async def download_point_export(
+    point_id: int,
+    job_id: str,
+    current_user: User = Depends(AuthService.get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Download a finished export file"""
+    await PointService.ensure_owner(db, point_id, current_user)
+    job = await _get_export_job(point_id, job_id)
+    path = ExportJobService.path(job)
+    if job["status"] != ExportJobStatusEnum.DONE.value or not os.path.exists(path):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Export is not ready"
+        )
+    params = ExportJobService.params(job)
+    return FileResponse(
+        path,
+        media_type="application/gzip" if params.gzip else MEDIA_TYPES[params.format],
+        filename=OrderExportService.filename(point_id, params),
+    )
+
+
+@router.get("/{point_id}", response_model=PointPublic)
+async def get_point(
+    point_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Public point info (QR code landing, map card)"""
+    payload = await shared_payload(
+        PointService.public_key(point_id), lambda: PointService.get_public_point(db, point_id)
+    )
+    return negotiated_response(request, payload)
+
+
+@router.get("/{point_id}/statuses", response_model=List[OrderStatusPublic])
+async def get_point_statuses(
+    point_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """The point's order status workflow, in order"""
+    payload = await shared_payload(
+        PointService.statuses_key(point_id), lambda: PointService.get_public_statuses(db, point_id)
+    )
+    return negotiated_response(request, payload)
+
+
+@router.get("/{point_id}/presence", response_model=PointPresence)
+async def get_point_presence(
+    point_id: int,
+    current_user: User = Depends(AuthService.get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Cashiers of the point with a live console session and their status (point staff only)"""
+    await PointService.ensure_staff(db, point_id, current_user)
+    return PointPresence(point_id=point_id, cashiers=await PresenceService.point_presence(point_id))
+
+
+def _simulation_job(job: Dict[str, str]) -> SimulationJob:
+    return SimulationJob(
+        id=job["id"],
+        point_id=int(job["point_id"]),
+        status=job["status"],
+        scenarios=int(job["scenarios"]),
+        error=job.get("error"),
+        result=SimulationResult.model_validate_json(job["result"]) if job.get("result") else None,
+    )
+
+
+@router.post("/{point_id}/simulations", response_model=SimulationJob, status_code=status.HTTP_202_ACCEPTED)
+async def create_point_simulation(
+    point_id: int,
+    params: SimulationRequest,
+    current_user: User = Depends(AuthService.get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Queue a capacity-planning simulation over every combination of the given
+    cashier counts, concurrency and slot settings; poll the job for results"""
+    await PointService.ensure_owner(db, point_id, current_user)
+    if len(SimulationService.scenarios(params)) > settings.SIMULATION_MAX_SCENARIOS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.SIMULATION_MAX_SCENARIOS} scenarios per simulation"
+        )
+    return _simulation_job(await SimulationJobService.enqueue(point_id, current_user.id, params))
+
+
+@router.get("/{point_id}/simulations/{job_id}", response_model=SimulationJob)
+async def get_point_simulation(
+    point_id: int,
+    job_id: str,
+    current_user: User = Depends(AuthService.get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Simulation job status, with the results once done"""
+    await PointService.ensure_owner(db, point_id, current_user)
+    job = await SimulationJobService.get(job_id)
+    if job is None or int(job["point_id"]) != point_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Simulation not found"
+        )
+    return _simulation_job(job)
@@ -1,11 +1,19 @@
 from fastapi import APIRouter
 
+from app.api.admin import router as admin_router
 from app.api.auth import router as auth_router
+from app.api.points import router as points_router
+from app.api.orders import router as orders_router
+from app.api.cashiers import router as cashiers_router
 
 api_router = APIRouter()
 
 # Include all routers
 api_router.include_router(auth_router)
+api_router.include_router(points_router)
+api_router.include_router(orders_router)
+api_router.include_router(cashiers_router)
+api_router.include_router(admin_router)
 
 # Health check endpoint
 @api_router.get("/health")
@@ -0,0 +1,219 @@
+"""Management commands: python -m app.cli <command> [args...]"""
+import argparse
+import asyncio
+import sys
+
+
+async def _create_tables(args) -> int:
+    from app.core.database import create_tables
+
+    await create_tables()
+    print("Tables created")
+    return 0
+
+
+async def _check_schema(args) -> int:
+    from app.core.database import check_schema
+
+    problems = await check_schema()
+    for problem in problems:
+        print(problem)
+    if problems:
+        print("Schema check failed, run the migrate step")
+        return 1
+    print("Schema is up to date")
+    return 0
+
+
+async def _import_points(args) -> int:
+    import json
+
+    from sqlalchemy import select
+
+    from app import models  # noqa: F401  register all mappers
+    from app.core.database import AsyncSessionLocal, engine
+    from app.models.user import User
+    from app.schemas.bulk_import import BulkImportRequest
+    from app.services.bulk_import import BulkImportService
+
+    def read(path):
+        with open(path, encoding="utf-8-sig") as source:
+            return source.read()
+
+    if args.json:
+        data = BulkImportRequest.model_validate_json(read(args.json))
+    else:
+        data = BulkImportRequest(**{
+            kind: BulkImportService.parse_csv(read(path))
+            for kind, path in (("points", args.points), ("cashiers", args.cashiers), ("statuses", args.statuses))
+            if path
+        })
+
+    try:
+        async with AsyncSessionLocal() as db:
+            owner_id = await db.scalar(select(User.id).where(User.email == args.owner_email))
+            if owner_id is None:
+                print(f"No user with email {args.owner_email}")
+                return 1
+            result = await BulkImportService.run(db, owner_id, data, dry_run=args.dry_run)
+    finally:
+        await engine.dispose()
+
+    for kind in ("points", "cashiers", "statuses"):
+        counts = getattr(result, kind)
+        print(f"{kind}: {counts.created} created, {counts.updated} updated")
+    print(f"default workflows: {result.default_workflows}")
+    for error in result.errors:
+        print(json.dumps(error.model_dump(mode="json"), ensure_ascii=False), file=sys.stderr)
+    if result.dry_run:
+        print("Dry run, nothing saved")
+    return 1 if result.errors else 0
+
+
+async def _simulate(args) -> int:
+    from app import models  # noqa: F401  register all mappers
+    from app.core.database import AsyncSessionLocal, engine
+    from pydantic import ValidationError
+
+    from app.schemas.simulation import SimulationRequest
+    from app.services.simulation import SimulationService
+
+    try:
+        params = SimulationRequest(
+            cashiers=args.cashiers,
+            max_concurrent_orders=args.max_concurrent,
+            slot_duration_minutes=args.slot_duration,
+            slots_per_interval=args.slots,
+            replications=args.replications,
+            history_days=args.history_days,
+            weekday=args.weekday,
+            target_wait_minutes=args.target_wait,
+            seed=args.seed,
+        )
+    except ValidationError as error:
+        print(f"Invalid simulation parameters: {error}")
+        return 1
+    try:
+        async with AsyncSessionLocal() as db:
+            result = await SimulationService.run(db, args.point_id, params)
+    finally:
+        await engine.dispose()
+
+    if args.json:
+        print(result.model_dump_json(indent=2))
+        return 0
+
+    arrivals, service = result.arrivals, result.service
+    print(
+        f"history: {arrivals.orders} orders over {arrivals.days} days, "
+        f"peak {max(arrivals.hourly_rate):.1f}/h, {arrivals.scheduled_share:.0%} booked in slots"
+    )
+    print(
+        f"service ({service.distribution}, {service.samples} samples): "
+        f"mean {service.mean_minutes:.1f} min, p90 {service.p90_minutes:.1f} min"
+    )
+    print("cashiers concurrent slot_min slots orders/day turned_away p50 p90 p99 utilization")
+    for scenario in result.scenarios:
+        print(
+            f"{scenario.cashiers:8d} {scenario.max_concurrent_orders:10d} "
+            f"{scenario.slot_duration_minutes:8d} {scenario.slots_per_interval:5d} "
+            f"{scenario.orders_per_day:10.1f} {scenario.turned_away_per_day:11.1f} "
+            f"{scenario.wait_p50_minutes:5.1f} {scenario.wait_p90_minutes:5.1f} "
+            f"{scenario.wait_p99_minutes:5.1f} {scenario.utilization:11.0%}"
+        )
+    recommended = result.recommended
+    if recommended is None:
+        print(f"No scenario keeps the p90 wait under {params.target_wait_minutes:g} min")
+    else:
+        print(
+            f"recommended: {recommended.cashiers} cashiers x {recommended.max_concurrent_orders}, "
+            f"{recommended.slots_per_interval} slots per {recommended.slot_duration_minutes} min"
+        )
+    print(f"{len(result.scenarios)} scenarios x {result.replications} days in {result.elapsed_seconds:.2f}s")
+    return 0
+
+
+async def _redis_rebalance(args) -> int:
+    from app import models  # noqa: F401  register all mappers
+    from app.core.database import engine, redis_client
+    from app.core.sharding import ShardRebalancer, shards
+
+    rebalancer = ShardRebalancer(shards)
+    try:
+        if args.cleanup:
+            if shards.rebalancing:
+                print("REDIS_SHARD_PREVIOUS_URLS is still set: deploy without it before cleaning up")
+                return 1
+            print(f"Deleted {await rebalancer.cleanup()} rebalancing markers")
+            return 0
+        if not shards.rebalancing:
+            print("REDIS_SHARD_PREVIOUS_URLS is not set: nothing to rebalance")
+            return 1
+        moved = await rebalancer.run(
+            dry_run=args.dry_run,
+            progress=lambda old, new, total: print(f"{old} -> {new}: {total} points", flush=True),
+        )
+    finally:
+        await shards.close()
+        await redis_client.close()
+        await engine.dispose()
+    print(f"{moved} points would be moved" if args.dry_run else f"{moved} points moved")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    create_tables = subparsers.add_parser("create-tables", help="Create all tables")
+    create_tables.set_defaults(handler=_create_tables)
+
+    check_schema = subparsers.add_parser("check-schema", help="Verify tables, columns, indexes and constraints exist")
+    check_schema.set_defaults(handler=_check_schema)
+
+    import_points = subparsers.add_parser(
+        "import-points", help="Bulk import points, cashiers and status workflows"
+    )
+    import_points.add_argument("--owner-email", required=True, help="owner of the imported points")
+    import_points.add_argument("--json", help="JSON file with points/cashiers/statuses lists")
+    import_points.add_argument("--points", help="points CSV")
+    import_points.add_argument("--cashiers", help="cashiers CSV (point_external_id, number, name, ...)")
+    import_points.add_argument("--statuses", help="statuses CSV (point_external_id, name, color, ...)")
+    import_points.add_argument("--dry-run", action="store_true", help="validate and roll back")
+    import_points.set_defaults(handler=_import_points)
+
+    simulate = subparsers.add_parser(
+        "simulate", help="Simulate a point's queue over staffing and slot configurations"
+    )
+    simulate.add_argument("--point-id", type=int, required=True)
+    simulate.add_argument("--cashiers", type=int, nargs="+", default=[1, 2, 3, 4])
+    simulate.add_argument("--max-concurrent", type=int, nargs="+", default=[1])
+    simulate.add_argument("--slot-duration", type=int, nargs="+", default=[30], help="minutes")
+    simulate.add_argument("--slots", type=int, nargs="+", default=[5], help="slots per interval")
+    simulate.add_argument("--replications", type=int, default=50, help="simulated days per scenario")
+    simulate.add_argument("--history-days", type=int, default=28)
+    simulate.add_argument("--weekday", type=int, choices=range(7), help="0 = Monday (default: all days)")
+    simulate.add_argument("--target-wait", type=float, default=10.0, help="p90 wait target, minutes")
+    simulate.add_argument("--seed", type=int)
+    simulate.add_argument("--json", action="store_true", help="print the full result as JSON")
+    simulate.set_defaults(handler=_simulate)
+
+    redis_rebalance = subparsers.add_parser(
+        "redis-rebalance", help="Move live point queues onto the nodes in REDIS_SHARD_URLS"
+    )
+    redis_rebalance.add_argument("--dry-run", action="store_true", help="only count the points to move")
+    redis_rebalance.add_argument(
+        "--cleanup", action="store_true", help="drop markers once REDIS_SHARD_PREVIOUS_URLS is unset"
+    )
+    redis_rebalance.set_defaults(handler=_redis_rebalance)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    return asyncio.run(args.handler(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
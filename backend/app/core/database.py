@@ -1,26 +1,215 @@
+"""Database engine, sessions and Redis clients.
+
+Request sessions (``get_db``) hold a pool connection only while they need
+one. A statement that reads alone (a plain SELECT, no FOR UPDATE, while the
+session has no transaction open and nothing to flush) runs on an
+autocommit connection that goes back to the pool right after it: no
+BEGIN/COMMIT round trips, and nothing pinned while the request hashes a
+password, calls an OAuth provider or serializes the response. Anything else
+(writes, FOR UPDATE, ``stream()``, ``connection()``, ``begin()``) opens a
+normal transaction that holds its connection until commit or rollback, as
+before. Under READ COMMITTED reads never shared a snapshot across
+statements anyway; statements that rely on transaction-local state
+(``set_config(..., true)``, ``SET LOCAL``, ``pg_advisory_xact_lock``) must
+open the transaction first with ``await db.connection()``.
+
+``get_read_db`` goes further for endpoints that only read: every statement
+runs in autocommit, nothing is ever flushed and writes (FOR UPDATE
+included) are refused.
+"""
+import time
+from typing import Any, Dict, List
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DisconnectionError
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
-from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.orm import DeclarativeBase, Session
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy import Column, Index, UniqueConstraint, event, text
 import redis.asyncio as redis
 
 from app.core.config import settings
+from app.core.metrics import Counter, Gauge
 
 
 # Database engine
 engine = create_async_engine(
     settings.DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://"),
     echo=settings.DEBUG,
-    pool_pre_ping=True,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
 )
 
-# Session factory
+db_connections_in_use = Gauge("db_pool_connections_in_use", "Database connections checked out of the pool")
+db_checkouts_total = Counter("db_pool_checkouts_total", "Database connection checkouts")
+db_hold_seconds_total = Counter(
+    "db_pool_hold_seconds_total", "Time database connections spent checked out of the pool"
+)
+db_pings_total = Counter("db_pool_pings_total", "Pings of idle connections on checkout", ("outcome",))
+db_statements_total = Counter(
+    "db_session_statements_total", "Session statements by how they ran", ("mode",)
+)
+
+
+# Pre-ping on every checkout would cost a round trip (three with asyncpg)
+# per statement now that sessions check out per statement: only connections
+# that sat idle long enough to have been dropped are pinged.
+@event.listens_for(engine.sync_engine, "checkout")
+def _on_checkout(dbapi_connection, record, proxy) -> None:
+    now = time.monotonic()
+    returned_at = record.info.get("returned_at")
+    if returned_at is not None and now - returned_at > settings.DB_POOL_PING_IDLE_SECONDS:
+        try:
+            engine.dialect.do_ping(dbapi_connection)
+        except Exception as error:
+            db_pings_total.inc(outcome="failed")
+            # The pool replaces the connection and checks out again
+            raise DisconnectionError() from error
+        db_pings_total.inc(outcome="ok")
+    record.info["checked_out_at"] = now
+    db_connections_in_use.inc()
+    db_checkouts_total.inc()
+
+
+@event.listens_for(engine.sync_engine, "checkin")
+def _on_checkin(dbapi_connection, record) -> None:
+    now = time.monotonic()
+    checked_out_at = record.info.pop("checked_out_at", None)
+    if checked_out_at is not None:
+        db_connections_in_use.dec()
+        db_hold_seconds_total.inc(now - checked_out_at)
+    record.info["returned_at"] = now
+
+
+_autocommit_binds: Dict[Engine, Engine] = {}
+
+
+class _ShortSyncSession(Session):
+    """Session handing out autocommit connections while ``read_alone`` is set"""
+
+    read_alone = False
+    read_only = False
+
+    def get_bind(self, mapper=None, *, clause=None, **kw):
+        bind = super().get_bind(mapper, clause=clause, **kw)
+        if not self.read_alone:
+            return bind
+        autocommit = _autocommit_binds.get(bind)
+        if autocommit is None:
+            autocommit = _autocommit_binds[bind] = bind.execution_options(isolation_level="AUTOCOMMIT")
+        return autocommit
+
+    def flush(self, objects=None) -> None:
+        if self.read_only and (self.new or self.dirty or self.deleted):
+            raise RuntimeError("Read-only session: use get_db to write")
+        super().flush(objects)
+
+
+class _ReadOnlySyncSession(_ShortSyncSession):
+    read_only = True
+
+
+class ShortSession(AsyncSession):
+    """AsyncSession releasing its connection after every statement that reads alone"""
+
+    sync_session_class = _ShortSyncSession
+
+    def _reads_alone(self, statement: Any = None, with_for_update: Any = None) -> bool:
+        sync_session = self.sync_session
+        if sync_session.read_only and (
+            isinstance(statement, UpdateBase)
+            or with_for_update
+            or (isinstance(statement, Select) and statement._for_update_arg is not None)
+        ):
+            # Row locks announce a write (and would not outlive an autocommit read)
+            raise RuntimeError("Read-only session: use get_db to write")
+        if sync_session.in_transaction() or with_for_update:
+            return False
+        if sync_session.read_only:
+            return True
+        if sync_session.new or sync_session.deleted or sync_session.identity_map.check_modified():
+            return False
+        return statement is None or (isinstance(statement, Select) and statement._for_update_arg is None)
+
+    async def _alone(self, call):
+        sync_session = self.sync_session
+        sync_session.read_alone = True
+        try:
+            result = await call
+        except Exception:
+            sync_session.read_alone = False
+            if self.in_transaction():
+                await self.rollback()
+            raise
+        sync_session.read_alone = False
+        if self.in_transaction():
+            # Nothing to flush: this only gives the connection back
+            await self.commit()
+        db_statements_total.inc(mode="autocommit")
+        return result
+
+    async def execute(self, statement, params=None, **kw):
+        if self._reads_alone(statement):
+            return await self._alone(super().execute(statement, params, **kw))
+        db_statements_total.inc(mode="transaction")
+        return await super().execute(statement, params, **kw)
+
+    async def scalar(self, statement, params=None, **kw):
+        if self._reads_alone(statement):
+            return await self._alone(super().scalar(statement, params, **kw))
+        db_statements_total.inc(mode="transaction")
+        return await super().scalar(statement, params, **kw)
+
+    async def get(self, entity, ident, *, with_for_update=None, **kw):
+        if self._reads_alone(with_for_update=with_for_update):
+            return await self._alone(super().get(entity, ident, **kw))
+        return await super().get(entity, ident, with_for_update=with_for_update, **kw)
+
+    async def refresh(self, instance, attribute_names=None, with_for_update=None) -> None:
+        if self._reads_alone(with_for_update=with_for_update):
+            return await self._alone(super().refresh(instance, attribute_names))
+        return await super().refresh(instance, attribute_names, with_for_update)
+
+
+class ReadOnlySession(ShortSession):
+    """Every statement runs in autocommit; flushes and DML raise"""
+
+    sync_session_class = _ReadOnlySyncSession
+
+
+# Session factories
 AsyncSessionLocal = async_sessionmaker(
     engine,
-    class_=AsyncSession,
+    class_=ShortSession,
+    expire_on_commit=False,
+)
+ReadOnlySessionLocal = async_sessionmaker(
+    engine,
+    class_=ReadOnlySession,
     expire_on_commit=False,
+    autoflush=False,
 )
 
-# Redis connection
-redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+def create_redis_pool(url: str) -> redis.BlockingConnectionPool:
+    """Callers wait up to REDIS_POOL_TIMEOUT_SECONDS for a free connection
+    instead of failing once REDIS_MAX_CONNECTIONS are in use"""
+    return redis.BlockingConnectionPool.from_url(
+        url,
+        decode_responses=True,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        timeout=settings.REDIS_POOL_TIMEOUT_SECONDS,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT_SECONDS,
+        socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT_SECONDS,
+        socket_keepalive=True,
+        health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL_SECONDS,
+    )
+
+
+# Redis connection (shared state; live point queues may be sharded, see app/core/sharding.py)
+redis_pool = create_redis_pool(settings.REDIS_URL)
+redis_client = redis.Redis.from_pool(redis_pool)
 
 
 class Base(DeclarativeBase):
@@ -36,14 +225,121 @@ async def get_db():
             await session.close()
 
 
+async def get_read_db():
+    """Dependency to get a read-only session (endpoints that never write)"""
+    async with ReadOnlySessionLocal() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
+
+
 async def get_redis():
     """Dependency to get Redis client"""
     return redis_client
 
 
+# Changes to tables that already exist. create_all only creates missing
+# tables, so every column, index or unique constraint later added to an
+# existing table is listed here ("table.column" or the index/constraint
+# name), in order, and added by the migrate step when it is missing. The DDL
+# comes from the models.
+SCHEMA_UPGRADES: List[str] = [
+    # Points search: generated columns and their indexes
+    "points.search_vector",
+    "points.search_text",
+    "ix_points_search_vector",
+    "ix_points_search_text_trgm",
+    "ix_points_location",
+    # Working hours: timezone and the compiled weekly bitmap
+    "points.timezone",
+    "points.working_hours_bitmap",
+    # Order exports: per-point scans in id order and history lookups
+    "ix_orders_point_id_id",
+    "ix_order_status_history_order_id",
+    # Bulk import: upsert keys
+    "points.external_id",
+    "uq_points_owner_external_id",
+    "uq_cashiers_point_number",
+    "uq_order_statuses_point_name",
+    # Geofence arrivals
+    "orders.arrived_at",
+    # Active orders: queue positions
+    "ix_orders_point_status_id",
+]
+
+
+def _schema_element(name: str):
+    if "." in name:
+        table_name, column_name = name.split(".", 1)
+        return Base.metadata.tables[table_name].c[column_name]
+    for table in Base.metadata.tables.values():
+        for element in (*table.indexes, *table.constraints):
+            if element.name == name:
+                return element
+    raise KeyError(f"Unknown schema element {name}")
+
+
+def _upgrade_schema(sync_conn) -> None:
+    """Add the SCHEMA_UPGRADES elements missing from existing tables"""
+    from sqlalchemy import inspect
+    from sqlalchemy.schema import AddConstraint, CreateColumn, CreateIndex
+
+    inspector = inspect(sync_conn)
+    for name in SCHEMA_UPGRADES:
+        element = _schema_element(name)
+        if isinstance(element, Column):
+            column = CreateColumn(element).compile(dialect=sync_conn.dialect)
+            sync_conn.execute(text(f"ALTER TABLE {element.table.name} ADD COLUMN IF NOT EXISTS {column}"))
+        elif isinstance(element, Index):
+            sync_conn.execute(CreateIndex(element, if_not_exists=True))
+        else:
+            existing = {constraint["name"] for constraint in inspector.get_unique_constraints(element.table.name)}
+            if name not in existing:
+                # Fails (and rolls the migration back) while duplicate rows exist
+                sync_conn.execute(AddConstraint(element))
+
+
 async def create_tables():
-    """Create all tables"""
-    from app.models import user, point, cashier, order  # Import all models
+    """Create missing tables and apply SCHEMA_UPGRADES to existing ones"""
+    from app.models import user, point, cashier, order, outbox  # Import all models
     
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+        # Trigram operator classes used by the points search indexes
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_upgrade_schema)
+        await conn.run_sync(point.backfill_working_hours_bitmaps)
+        for statement in outbox.NOTIFY_DDL:
+            await conn.execute(text(statement))
+
+
+async def check_schema():
+    """Verify that every mapped table, column, index and named unique constraint exists"""
+    from sqlalchemy import inspect
+    from app.models import user, point, cashier, order, outbox  # Import all models
+
+    def _missing(sync_conn):
+        inspector = inspect(sync_conn)
+        existing_tables = set(inspector.get_table_names())
+        problems = []
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                problems.append(f"missing table {table.name}")
+                continue
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    problems.append(f"missing column {table.name}.{column.name}")
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    problems.append(f"missing index {index.name}")
+            constraints = {constraint["name"] for constraint in inspector.get_unique_constraints(table.name)}
+            for constraint in table.constraints:
+                if isinstance(constraint, UniqueConstraint) and constraint.name and constraint.name not in constraints:
+                    problems.append(f"missing constraint {constraint.name}")
+        return problems
+
+    async with engine.connect() as conn:
+        return await conn.run_sync(_missing)
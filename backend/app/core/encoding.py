@@ -0,0 +1,239 @@
+"""Response encoding negotiation: gzip/brotli compression and MessagePack.
+
+``CompressionMiddleware`` handles every response: JSON bodies are transcoded
+to MessagePack for clients that prefer it in ``Accept`` and bodies of at
+least ``COMPRESSION_MIN_SIZE`` bytes are compressed per ``Accept-Encoding``
+(brotli over gzip). Cacheable endpoints instead keep an ``EncodedPayload`` in
+``response_cache`` or the Redis client cache (``shared_payload``); it
+memoizes every variant it was asked for, so each one is serialized and
+compressed once per cache entry, and the middleware passes such responses
+through untouched.
+
+brotli and msgpack are optional: without them only gzip and JSON are offered.
+"""
+import gzip
+import json
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import Request, Response
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.core.database import redis_client
+from app.core.metrics import Counter
+from app.core.redis_layer import client_cache
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+MSGPACK_TYPES = (MSGPACK, "application/x-msgpack", "application/vnd.msgpack")
+COMPRESSIBLE_TYPES = (
+    "text/", JSON, MSGPACK, "application/x-ndjson", "application/javascript", "application/xml",
+)
+
+encoded_bytes_total = Counter(
+    "response_encoded_bytes_total", "Response bytes before and after encoding", ("stage",)
+)
+encodings_total = Counter(
+    "response_encodings_total", "Responses by media type and content encoding", ("media_type", "encoding")
+)
+
+
+def _qualities(header: str) -> Dict[str, float]:
+    """Parse an Accept / Accept-Encoding header into {token: q}"""
+    qualities = {}
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        if not token:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[token.strip().lower()] = quality
+    return qualities
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Best supported content coding the client accepts (None: identity)"""
+    qualities = _qualities(accept_encoding)
+    wildcard = qualities.get("*", 0.0)
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    best, best_quality = None, 0.0
+    for coding in candidates:
+        quality = qualities.get(coding, wildcard)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def choose_media_type(accept: str) -> str:
+    """MessagePack when the client ranks it above JSON, else JSON"""
+    if msgpack is None or not accept:
+        return JSON
+    qualities = _qualities(accept)
+    packed = max(qualities.get(media_type, 0.0) for media_type in MSGPACK_TYPES)
+    plain = max(qualities.get(JSON, 0.0), qualities.get("application/*", 0.0), qualities.get("*/*", 0.0))
+    return MSGPACK if packed > 0 and packed >= plain else JSON
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+def serialize(content: Any, media_type: str) -> bytes:
+    """JSON exactly as FastAPI's JSONResponse renders it, or MessagePack"""
+    if media_type == MSGPACK:
+        return msgpack.packb(content, use_bin_type=True)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+def encode(body: bytes, encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    """Compress when worthwhile; returns the body and the coding actually applied"""
+    if encoding is None or len(body) < settings.COMPRESSION_MIN_SIZE:
+        return body, None
+    return compress(body, encoding), encoding
+
+
+class EncodedPayload:
+    """A JSON-compatible response body with memoized encoded variants"""
+
+    def __init__(self, content: Any):
+        self.content = content
+        self._variants: Dict[Tuple[str, Optional[str]], Tuple[bytes, Optional[str]]] = {}
+
+    def variant(self, media_type: str, encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+        key = (media_type, encoding)
+        if key not in self._variants:
+            plain = self._variants.get((media_type, None))
+            if plain is None:
+                plain = (serialize(self.content, media_type), None)
+                self._variants[(media_type, None)] = plain
+            self._variants[key] = encode(plain[0], encoding)
+        return self._variants[key]
+
+
+def negotiated_response(request: Request, payload: EncodedPayload, status_code: int = 200) -> Response:
+    """Response with the variant of ``payload`` the client asked for"""
+    media_type = choose_media_type(request.headers.get("accept", ""))
+    body, encoding = payload.variant(media_type, choose_encoding(request.headers.get("accept-encoding", "")))
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    encodings_total.inc(media_type=media_type, encoding=encoding or "identity")
+    return Response(content=body, status_code=status_code, media_type=media_type, headers=headers)
+
+
+# Public, user-independent responses that aren't a single Redis key (search)
+response_cache = LRUCache(maxsize=settings.RESPONSE_CACHE_SIZE, ttl=settings.RESPONSE_CACHE_TTL_SECONDS)
+
+
+async def shared_payload(key: str, load: Callable[[], Awaitable[Any]]) -> EncodedPayload:
+    """EncodedPayload of a JSON value stored in Redis under ``key`` (a client-cached prefix).
+
+    Repeated reads come from process memory until any process writes or
+    deletes the key; on a miss ``load()`` builds the value and stores it.
+    """
+    payload = await client_cache.get(key, decode=lambda raw: EncodedPayload(json.loads(raw)))
+    if payload is None:
+        content = await load()
+        await redis_client.set(key, serialize(content, JSON), ex=int(settings.REDIS_CLIENT_CACHE_TTL_SECONDS))
+        payload = EncodedPayload(content)
+    return payload
+
+
+class CompressionMiddleware:
+    """Negotiates MessagePack and gzip/brotli for complete (non-streaming) responses"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        media_type = choose_media_type(headers.get("accept", ""))
+        encoding = choose_encoding(headers.get("accept-encoding", ""))
+        if media_type == JSON and encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            if message.get("more_body", False):
+                # Streaming response: forward as is
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            await self._send_encoded(send, start_message, message.get("body", b""), media_type, encoding)
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    async def _send_encoded(send, start_message, body: bytes, media_type: str, encoding: Optional[str]):
+        response_headers = [(key.lower(), value) for key, value in start_message["headers"]]
+        content_type = next((value for key, value in response_headers if key == b"content-type"), b"").decode()
+        # negotiated_response() output (Vary set) and pre-encoded bodies go out as they are
+        already_encoded = any(
+            key == b"content-encoding" or (key == b"vary" and b"accept-encoding" in value.lower())
+            for key, value in response_headers
+        )
+        if already_encoded or not body or not content_type.startswith(COMPRESSIBLE_TYPES):
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        encoded_bytes_total.inc(len(body), stage="original")
+        if media_type == MSGPACK and content_type.startswith(JSON):
+            body = serialize(json.loads(body), MSGPACK)
+            content_type = MSGPACK
+        body, applied = encode(body, encoding)
+        encoded_bytes_total.inc(len(body), stage="sent")
+        encodings_total.inc(media_type=content_type.split(";")[0], encoding=applied or "identity")
+
+        kept = [
+            (key, value) for key, value in response_headers
+            if key not in (b"content-length", b"content-type", b"vary")
+        ]
+        kept += [
+            (b"content-type", content_type.encode()),
+            (b"content-length", str(len(body)).encode()),
+            (b"vary", b"Accept, Accept-Encoding"),
+        ]
+        if applied is not None:
+            kept.append((b"content-encoding", applied.encode()))
+        await send({**start_message, "headers": kept})
+        await send({"type": "http.response.body", "body": body})
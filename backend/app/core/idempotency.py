@@ -0,0 +1,196 @@
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, Awaitable, Callable, Optional, Type
+
+from fastapi import HTTPException, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from app.core.config import settings
+from app.core.database import redis_client
+from app.core.metrics import Counter
+
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+_PENDING = "pending"
+_DONE = "done"
+
+idempotent_requests_total = Counter(
+    "idempotent_requests_total", "Requests carrying an Idempotency-Key", ("scope", "outcome")
+)
+
+
+class IdempotencyStore:
+    """Deduplicates retried requests that carry an ``Idempotency-Key`` header.
+
+    The first request claims the key in Redis (``SET NX`` with a lock TTL) and
+    runs; its rendered response is stored under the key for
+    ``IDEMPOTENCY_TTL_SECONDS`` and replayed byte-for-byte to later retries.
+    A duplicate arriving while the first is still running waits for it
+    instead of executing. Reusing a key with a different request body is
+    rejected with 422. Requests failing with an exception release the key so
+    they can be retried; cancelled ones keep it until the lock TTL runs out.
+    """
+
+    @staticmethod
+    def _key(scope: str, user_id: int, idempotency_key: str) -> str:
+        digest = hashlib.blake2b(idempotency_key.encode(), digest_size=16).hexdigest()
+        return f"idem:{scope}:{user_id}:{digest}"
+
+    @staticmethod
+    async def fingerprint(request: Request) -> str:
+        body = await request.body()
+        digest = hashlib.sha256()
+        digest.update(request.method.encode())
+        digest.update(b"\0")
+        digest.update(request.url.path.encode())
+        digest.update(b"\0")
+        digest.update(body)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _copy_headers(source: Optional[Response], target: Response) -> None:
+        """Carry headers set on the injected response (e.g. RateLimit-*)"""
+        if source is None:
+            return
+        for name, value in source.headers.items():
+            if name not in ("content-length", "content-type"):
+                target.headers[name] = value
+
+    def _replay(self, entry: dict, response: Optional[Response]) -> Response:
+        replayed = Response(
+            content=entry["body"].encode(),
+            status_code=entry["status_code"],
+            media_type=entry["media_type"],
+        )
+        self._copy_headers(response, replayed)
+        replayed.headers[REPLAYED_HEADER] = "true"
+        return replayed
+
+    @staticmethod
+    def _mismatch() -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key was already used with a different request"
+        )
+
+    async def _wait(self, key: str, fingerprint: str) -> Optional[dict]:
+        """Wait for an in-flight request with the same key, return its entry.
+
+        Returns None if the key was released (the other request failed or its
+        lock expired) so the caller may claim it.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.IDEMPOTENCY_WAIT_SECONDS
+        delay = 0.02
+        while loop.time() < deadline:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+            raw = await redis_client.get(key)
+            if raw is None:
+                return None
+            entry = json.loads(raw)
+            if entry["fingerprint"] != fingerprint:
+                raise self._mismatch()
+            if entry["state"] == _DONE:
+                return entry
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A request with this Idempotency-Key is still being processed",
+            headers={"Retry-After": "1"},
+        )
+
+    async def run(
+        self,
+        request: Request,
+        response: Optional[Response],
+        scope: str,
+        user_id: int,
+        execute: Callable[[], Awaitable[Any]],
+        response_model: Type[BaseModel],
+        status_code: int = status.HTTP_200_OK,
+    ) -> Any:
+        """Run ``execute`` at most once per Idempotency-Key.
+
+        Without the header ``execute``'s result is returned unchanged.
+        """
+        idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+        if idempotency_key is None:
+            return await execute()
+        if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters"
+            )
+
+        key = self._key(scope, user_id, idempotency_key)
+        fingerprint = await self.fingerprint(request)
+        pending = json.dumps({"state": _PENDING, "fingerprint": fingerprint})
+
+        while True:
+            claimed = await redis_client.set(
+                key, pending, nx=True, px=int(settings.IDEMPOTENCY_LOCK_SECONDS * 1000)
+            )
+            if claimed:
+                break
+            raw = await redis_client.get(key)
+            if raw is None:
+                continue  # released in between, try to claim again
+            entry = json.loads(raw)
+            if entry["fingerprint"] != fingerprint:
+                idempotent_requests_total.inc(scope=scope, outcome="mismatch")
+                raise self._mismatch()
+            if entry["state"] == _PENDING:
+                idempotent_requests_total.inc(scope=scope, outcome="waited")
+                entry = await self._wait(key, fingerprint)
+                if entry is None:
+                    continue
+            idempotent_requests_total.inc(scope=scope, outcome="replayed")
+            return self._replay(entry, response)
+
+        try:
+            result = await execute()
+        except Exception:
+            # Failed before committing: let a retry run it. A cancellation
+            # (e.g. client disconnect) may come after the commit, so its
+            # pending entry is left to expire instead.
+            await redis_client.delete(key)
+            raise
+
+        # Render exactly like FastAPI would, then keep the bytes for replays
+        rendered = JSONResponse(
+            content=jsonable_encoder(response_model.model_validate(result)),
+            status_code=status_code,
+        )
+        entry = {
+            "state": _DONE,
+            "fingerprint": fingerprint,
+            "status_code": status_code,
+            "media_type": rendered.media_type,
+            "body": rendered.body.decode(),
+        }
+        try:
+            await redis_client.set(key, json.dumps(entry), ex=settings.IDEMPOTENCY_TTL_SECONDS)
+        except Exception:
+            logger.exception(
+                "Failed to store idempotent response for %s, a retry with the same key may execute again", scope
+            )
+            try:
+                await redis_client.delete(key)  # don't leave waiters stuck on the pending entry
+            except Exception:
+                logger.exception("Failed to release idempotency key for %s", scope)
+        idempotent_requests_total.inc(scope=scope, outcome="executed")
+
+        self._copy_headers(response, rendered)
+        return rendered
+
+
+idempotency = IdempotencyStore()
@@ -0,0 +1,188 @@
+"""Request prioritization and load shedding (pure ASGI middleware).
+
+Requests are classified by method and path into priority classes
+(``LOAD_SHED_CLASSES``, highest first). Each class has its own concurrency
+limit and a bounded wait queue, so a flood of customer reads can't take the
+slots cashiers need to advance orders. On top of that, an overload pressure
+computed from event-loop lag and DB pool saturation sheds whole classes,
+lowest first, with 503 + Retry-After before they reach the application.
+"""
+import asyncio
+import json
+import logging
+import re
+from time import monotonic
+from typing import Dict, Optional, Pattern, Tuple
+
+from app.core.config import settings
+from app.core.database import engine
+from app.core.metrics import Counter, Gauge
+
+
+logger = logging.getLogger(__name__)
+
+shed_total = Counter(
+    "load_shed_requests_total", "Requests rejected by load shedding", ("priority", "reason")
+)
+queued_total = Counter(
+    "load_queued_requests_total", "Requests that waited for a concurrency slot", ("priority",)
+)
+in_flight = Gauge("load_in_flight_requests", "Requests being handled", ("priority",))
+waiting = Gauge("load_waiting_requests", "Requests waiting for a concurrency slot", ("priority",))
+loop_lag_seconds = Gauge("event_loop_lag_seconds", "Smoothed event loop scheduling delay")
+db_pool_saturation = Gauge("db_pool_saturation", "Checked out DB connections / pool capacity")
+overload_pressure = Gauge("load_overload_pressure", "max(loop lag, pool saturation) relative to thresholds")
+
+
+class OverloadMonitor:
+    """Samples event-loop lag and DB pool usage into a single pressure value.
+
+    Pressure 1.0 means one of the signals reached its threshold
+    (``LOAD_SHED_LOOP_LAG_SECONDS`` / ``LOAD_SHED_POOL_SATURATION``).
+    """
+
+    def __init__(self):
+        self.lag = 0.0
+        self.saturation = 0.0
+        self.pressure = 0.0
+
+    @staticmethod
+    def pool_saturation() -> float:
+        pool = engine.sync_engine.pool
+        try:
+            capacity = pool.size() + max(getattr(pool, "_max_overflow", 0), 0)
+            return pool.checkedout() / capacity if capacity else 0.0
+        except AttributeError:  # pools without sizing (NullPool, StaticPool)
+            return 0.0
+
+    def sample(self, lag: float) -> None:
+        # EWMA so a single slow callback doesn't flip shedding on
+        self.lag = 0.7 * self.lag + 0.3 * lag
+        self.saturation = self.pool_saturation()
+        self.pressure = max(
+            self.lag / settings.LOAD_SHED_LOOP_LAG_SECONDS,
+            self.saturation / settings.LOAD_SHED_POOL_SATURATION,
+        )
+        loop_lag_seconds.set(self.lag)
+        db_pool_saturation.set(self.saturation)
+        overload_pressure.set(self.pressure)
+
+    async def run(self, stop: asyncio.Event) -> None:
+        interval = settings.LOAD_SHED_SAMPLE_INTERVAL_SECONDS
+        while not stop.is_set():
+            expected = monotonic() + interval
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self.sample(max(monotonic() - expected, 0.0))
+
+
+class _PriorityClass:
+    """Concurrency limit with a bounded FIFO wait queue"""
+
+    def __init__(self, name: str, limit: int, queue_size: int, shed_at: Optional[float]):
+        self.name = name
+        self.queue_size = queue_size
+        self.shed_at = shed_at  # pressure at which the whole class is shed (None: never)
+        self._slots = asyncio.Semaphore(limit)
+        self._waiting = 0
+
+    async def acquire(self) -> Optional[str]:
+        """Take a slot; returns the shed reason instead if none can be had"""
+        if not self._slots.locked():
+            await self._slots.acquire()
+            return None
+        if self._waiting >= self.queue_size:
+            return "queue_full"
+
+        self._waiting += 1
+        waiting.inc(priority=self.name)
+        queued_total.inc(priority=self.name)
+        try:
+            await asyncio.wait_for(
+                self._slots.acquire(), timeout=settings.LOAD_SHED_QUEUE_TIMEOUT_SECONDS
+            )
+        except asyncio.TimeoutError:
+            return "queue_timeout"
+        finally:
+            self._waiting -= 1
+            waiting.dec(priority=self.name)
+        return None
+
+    def release(self) -> None:
+        self._slots.release()
+
+
+def _compile_rule(rule: str) -> Tuple[str, Pattern, str]:
+    """"METHOD /path/*/pattern class": ``*`` is one path segment, ``**`` the rest"""
+    method, path, priority = rule.split()
+    pattern = re.escape(path).replace(r"\*\*", ".*").replace(r"\*", "[^/]+")
+    return method.upper(), re.compile(pattern + "$"), priority
+
+
+class LoadSheddingMiddleware:
+
+    def __init__(self, app, monitor: "OverloadMonitor"):
+        self.app = app
+        self.monitor = monitor
+        self.rules = [_compile_rule(rule) for rule in settings.LOAD_SHED_RULES]
+        self.exempt = tuple(settings.LOAD_SHED_EXEMPT_PATHS)
+        self.classes: Dict[str, _PriorityClass] = {
+            name: _PriorityClass(
+                name,
+                settings.LOAD_SHED_CONCURRENCY[name],
+                settings.LOAD_SHED_QUEUE_SIZE[name],
+                settings.LOAD_SHED_PRESSURE.get(name),
+            )
+            for name in settings.LOAD_SHED_CLASSES
+        }
+        self.default = settings.LOAD_SHED_DEFAULT_CLASS
+
+    def classify(self, method: str, path: str) -> str:
+        for rule_method, pattern, priority in self.rules:
+            if rule_method in ("*", method) and pattern.match(path):
+                return priority
+        return self.default
+
+    async def _reject(self, send, priority: str, reason: str) -> None:
+        shed_total.inc(priority=priority, reason=reason)
+        # Back off longer the harder we are overloaded
+        retry_after = max(1, round(settings.LOAD_SHED_RETRY_AFTER_SECONDS * max(self.monitor.pressure, 1.0)))
+        body = json.dumps({"detail": "Server is overloaded, try again later"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.LOAD_SHED_ENABLED or scope["path"].startswith(self.exempt):
+            await self.app(scope, receive, send)
+            return
+
+        priority = self.classify(scope["method"], scope["path"])
+        priority_class = self.classes[priority]
+        if priority_class.shed_at is not None and self.monitor.pressure >= priority_class.shed_at:
+            await self._reject(send, priority, "overload")
+            return
+
+        reason = await priority_class.acquire()
+        if reason is not None:
+            await self._reject(send, priority, reason)
+            return
+
+        in_flight.inc(priority=priority)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            in_flight.dec(priority=priority)
+            priority_class.release()
+
+
+overload_monitor = OverloadMonitor()
@@ -0,0 +1,438 @@
+"""Request profiling and a continuous sampling profiler.
+
+One sampler thread reads the event-loop thread's stack
+(``sys._current_frames``) and serves three modes:
+
+* On demand: a request carrying ``X-Profile-Token: <PROFILING_TOKEN>`` is
+  sampled every ``PROFILING_REQUEST_INTERVAL_SECONDS``. Its trace (folded
+  call stacks plus time spent waiting on Postgres and Redis) is stored under
+  the id returned in ``X-Profile-Id``.
+* Sampled: one in ``PROFILING_SAMPLE_RATE`` requests is profiled the same way
+  and kept while it is among the ``PROFILING_SLOWEST_PER_ROUTE`` slowest of
+  its route in the last ``PROFILING_TRACE_TTL_SECONDS``.
+* Continuous: the loop thread is sampled every
+  ``PROFILING_CONTINUOUS_INTERVAL_SECONDS`` into ``PROFILING_BUCKET_SECONDS``
+  buckets covering ``PROFILING_WINDOW_SECONDS``, served as folded stacks
+  (flamegraph.pl, speedscope, ...). Per process, like the metrics.
+
+Samples are attributed to the asyncio task running when they are taken, so
+only coroutine code is covered, not sync dependencies in the thread pool.
+While no request is profiled the Postgres and Redis hooks cost a dict check
+and the sampler only wakes at the continuous rate.
+"""
+import asyncio
+import hmac
+import json
+import logging
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from fastapi import Header, HTTPException, status
+from sqlalchemy import event
+
+from app.core.config import settings
+from app.core.database import engine, redis_client, redis_pool
+from app.core.metrics import Counter
+
+
+logger = logging.getLogger(__name__)
+
+TOKEN_HEADER = "X-Profile-Token"
+ID_HEADER = "X-Profile-Id"
+IDLE = "<idle>"
+
+profiled_requests_total = Counter("profiled_requests_total", "Requests profiled", ("mode",))
+
+# Keep a trace in a route's slowest set: drop expired members
+# ("id:expires_at"), add this one and trim to ARGV[5] entries.
+# ARGV: now, member, duration, ttl, keep
+_RANK_SCRIPT = """
+for _, member in ipairs(redis.call('ZRANGE', KEYS[1], 0, -1)) do
+    if tonumber(string.match(member, ':(%d+)$')) <= tonumber(ARGV[1]) then
+        redis.call('ZREM', KEYS[1], member)
+    end
+end
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[2])
+redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -tonumber(ARGV[5]) - 1)
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return redis.call('ZCARD', KEYS[1])
+"""
+
+_rank = redis_client.register_script(_RANK_SCRIPT)
+
+# Frames below this one (in the stack) are the event loop itself
+_HANDLE_RUN = asyncio.events.Handle._run.__code__
+_labels: Dict[Any, str] = {}
+
+
+def _label(frame) -> str:
+    code = frame.f_code
+    label = _labels.get(code)
+    if label is None:
+        label = _labels[code] = f"{frame.f_globals.get('__name__', '?')}:{code.co_qualname}"
+    return label
+
+
+def _folded(frame) -> str:
+    """The stack as "outer;...;inner" from the running callback or task down"""
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    for depth, candidate in enumerate(frames):
+        if candidate.f_code is _HANDLE_RUN:
+            break
+    else:
+        return IDLE  # in select() or loop bookkeeping
+    return ";".join(_label(inner) for inner in reversed(frames[:depth])) or IDLE
+
+
+class RequestProfile:
+    """Stack samples and Postgres / Redis waits of one request"""
+
+    def __init__(self, mode: str):
+        self.id = uuid.uuid4().hex
+        self.mode = mode
+        self.started = time.perf_counter()
+        self.started_at = datetime.now(timezone.utc)
+        self.stacks: Dict[str, int] = {}
+        self.waits = {"db": 0.0, "redis": 0.0}
+        self.calls = {"db": 0, "redis": 0}
+
+    def add_wait(self, kind: str, seconds: float) -> None:
+        self.waits[kind] += seconds
+        self.calls[kind] += 1
+
+    def track(self, future: "asyncio.Future", kind: str) -> None:
+        """Count the time until ``future`` resolves as a wait"""
+        started = time.perf_counter()
+        future.add_done_callback(lambda _: self.add_wait(kind, time.perf_counter() - started))
+
+    def trace(self, route: str, path: str, status_code: int) -> Dict[str, Any]:
+        duration = time.perf_counter() - self.started
+        return {
+            "id": self.id,
+            "mode": self.mode,
+            "route": route,
+            "path": path,
+            "status_code": status_code,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(duration * 1000, 3),
+            "db_ms": round(self.waits["db"] * 1000, 3),
+            "db_queries": self.calls["db"],
+            "redis_ms": round(self.waits["redis"] * 1000, 3),
+            "redis_calls": self.calls["redis"],
+            "other_ms": round(max(duration - self.waits["db"] - self.waits["redis"], 0.0) * 1000, 3),
+            "samples": sum(self.stacks.values()),
+            "sample_interval_ms": settings.PROFILING_REQUEST_INTERVAL_SECONDS * 1000,
+            "stacks": self.stacks,
+        }
+
+
+class Sampler:
+    """Samples the event-loop thread for profiled requests and the continuous profile"""
+
+    def __init__(self):
+        self._profiles: Dict[asyncio.Task, RequestProfile] = {}
+        self._buckets: Deque[Tuple[int, Dict[str, int]]] = deque()  # (bucket start, stacks)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread_id: Optional[int] = None
+        self.running = False
+
+    def current(self) -> Optional[RequestProfile]:
+        """Profile of the running task, if it is being profiled"""
+        if not self._profiles:
+            return None
+        try:
+            return self._profiles.get(asyncio.current_task())
+        except RuntimeError:  # no running loop
+            return None
+
+    def begin(self, mode: str) -> RequestProfile:
+        profile = RequestProfile(mode)
+        with self._lock:
+            self._profiles[asyncio.current_task()] = profile
+        self._wakeup.set()  # switch to the request sampling rate now
+        profiled_requests_total.inc(mode=mode)
+        return profile
+
+    def end(self, profile: RequestProfile) -> None:
+        with self._lock:
+            for task, running in list(self._profiles.items()):
+                if running is profile:
+                    del self._profiles[task]
+
+    def _record(self, stack: str) -> None:
+        bucket = int(time.time()) // settings.PROFILING_BUCKET_SECONDS * settings.PROFILING_BUCKET_SECONDS
+        if not self._buckets or self._buckets[-1][0] != bucket:
+            self._buckets.append((bucket, {}))
+            oldest = bucket - settings.PROFILING_WINDOW_SECONDS
+            while self._buckets[0][0] <= oldest:
+                self._buckets.popleft()
+        stacks = self._buckets[-1][1]
+        stacks[stack] = stacks.get(stack, 0) + 1
+
+    def _sample(self) -> None:
+        frames = sys._current_frames
+        continuous = settings.PROFILING_CONTINUOUS_ENABLED
+        continuous_interval = settings.PROFILING_CONTINUOUS_INTERVAL_SECONDS
+        request_interval = settings.PROFILING_REQUEST_INTERVAL_SECONDS
+        next_continuous = time.monotonic()
+
+        while not self._stopped.is_set():
+            now = time.monotonic()
+            continuous_due = continuous and now >= next_continuous
+            if self._profiles or continuous_due:
+                frame = frames().get(self._thread_id)
+                task = asyncio.current_task(self._loop)
+                stack = _folded(frame) if frame is not None else IDLE
+                del frame
+                with self._lock:
+                    profile = self._profiles.get(task)
+                    if profile is not None:
+                        profile.stacks[stack] = profile.stacks.get(stack, 0) + 1
+                    if continuous_due:
+                        self._record(stack)
+                if continuous_due:
+                    next_continuous = now + continuous_interval
+
+            if self._profiles:
+                timeout = request_interval
+            elif continuous:
+                timeout = max(next_continuous - time.monotonic(), 0.0)
+            else:
+                timeout = None  # until a request is profiled
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+
+    def folded(self, seconds: int) -> List[Tuple[str, int]]:
+        """Continuous profile of the last ``seconds`` as (stack, samples), most sampled first"""
+        since = time.time() - seconds
+        totals: Dict[str, int] = {}
+        with self._lock:
+            for bucket, stacks in self._buckets:
+                if bucket + settings.PROFILING_BUCKET_SECONDS <= since:
+                    continue
+                for stack, count in stacks.items():
+                    totals[stack] = totals.get(stack, 0) + count
+        return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+    async def run(self, stop: asyncio.Event) -> None:
+        """Sample this event loop from a background thread until ``stop`` is set"""
+        if not settings.PROFILING_ENABLED:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._stopped.clear()
+        thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+        thread.start()
+        self.running = True
+        try:
+            await stop.wait()
+        finally:
+            self.running = False
+            self._stopped.set()
+            self._wakeup.set()
+            await asyncio.to_thread(thread.join)
+
+
+sampler = Sampler()
+
+
+# Postgres and Redis wait timing
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if sampler._profiles:
+        conn.info.setdefault("profiling_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("profiling_started")
+    if started:
+        elapsed = time.perf_counter() - started.pop()
+        profile = sampler.current()
+        if profile is not None:
+            profile.add_wait("db", elapsed)
+
+
+class _TimedConnection:
+    """Mixed into the Redis pool's connection class to time replies"""
+
+    async def read_response(self, *args, **kwargs):
+        profile = sampler.current()
+        if profile is None:
+            return await super().read_response(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return await super().read_response(*args, **kwargs)
+        finally:
+            profile.add_wait("redis", time.perf_counter() - started)
+
+
+def install() -> None:
+    """Hook wait timing into the shared engine and Redis pool (API processes)"""
+    if not settings.PROFILING_ENABLED:
+        return
+    if not event.contains(engine.sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+    connection_class = redis_pool.connection_class
+    if not issubclass(connection_class, _TimedConnection):
+        redis_pool.connection_class = type(
+            f"Timed{connection_class.__name__}", (_TimedConnection, connection_class), {}
+        )
+
+
+# Trace store
+
+class TraceStore:
+    """Profiled request traces in Redis, shared by all API processes"""
+
+    @staticmethod
+    def trace_key(trace_id: str) -> str:
+        return f"profiling:trace:{trace_id}"
+
+    @staticmethod
+    def slowest_key(route: str) -> str:
+        return f"profiling:slowest:{route}"
+
+    ROUTES_KEY = "profiling:routes"  # route -> last sampled (unix time)
+
+    @staticmethod
+    async def save(trace: Dict[str, Any]) -> None:
+        ttl = settings.PROFILING_TRACE_TTL_SECONDS
+        now = int(time.time())
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.set(TraceStore.trace_key(trace["id"]), json.dumps(trace, separators=(",", ":")), ex=ttl)
+        if trace["mode"] == "sampled":
+            await _rank(
+                keys=[TraceStore.slowest_key(trace["route"])],
+                args=[now, f"{trace['id']}:{now + ttl}", trace["duration_ms"], ttl,
+                      settings.PROFILING_SLOWEST_PER_ROUTE],
+                client=pipe,
+            )
+            pipe.zadd(TraceStore.ROUTES_KEY, {trace["route"]: now})
+            pipe.zremrangebyscore(TraceStore.ROUTES_KEY, "-inf", now - ttl)
+        await pipe.execute()
+
+    @staticmethod
+    async def get(trace_id: str) -> Optional[Dict[str, Any]]:
+        raw = await redis_client.get(TraceStore.trace_key(trace_id))
+        return json.loads(raw) if raw is not None else None
+
+    @staticmethod
+    async def slowest(route: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Sampled traces, slowest first per route, without their stacks"""
+        now = int(time.time())
+        if route is not None:
+            routes = [route]
+        else:
+            routes = await redis_client.zrangebyscore(
+                TraceStore.ROUTES_KEY, now - settings.PROFILING_TRACE_TTL_SECONDS, "+inf"
+            )
+        if not routes:
+            return []
+
+        pipe = redis_client.pipeline(transaction=False)
+        for name in routes:
+            pipe.zrevrange(TraceStore.slowest_key(name), 0, -1)
+        ids = [
+            member.rpartition(":")[0]
+            for members in await pipe.execute()
+            for member in members
+            if int(member.rpartition(":")[2]) > now
+        ]
+        if not ids:
+            return []
+
+        traces = []
+        for raw in await redis_client.mget([TraceStore.trace_key(trace_id) for trace_id in ids]):
+            if raw is not None:
+                trace = json.loads(raw)
+                trace.pop("stacks", None)
+                traces.append(trace)
+        return traces
+
+
+async def require_profiling_token(
+    token: Optional[str] = Header(None, alias=TOKEN_HEADER)
+) -> None:
+    """Dependency for the profiling admin endpoints"""
+    if not settings.PROFILING_TOKEN:
+        # Profiling endpoints don't exist unless a token is configured
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if token is None or not hmac.compare_digest(token.encode(), settings.PROFILING_TOKEN.encode()):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid profiling token")
+
+
+# Middleware
+
+_route_paths: Dict[Any, str] = {}
+
+
+def _route(scope) -> str:
+    """"METHOD /path/{param}" of the matched route"""
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return f"{scope['method']} <unmatched>"
+    path = _route_paths.get(endpoint)
+    if path is None:
+        for route in scope["app"].routes:
+            if getattr(route, "endpoint", None) is not None:
+                _route_paths[route.endpoint] = route.path
+        path = _route_paths.get(endpoint, scope["path"])
+    return f"{scope['method']} {path}"
+
+
+class ProfilingMiddleware:
+    """Profiles requests carrying the profiling token and a sample of the rest"""
+
+    def __init__(self, app):
+        self.app = app
+        self.token = settings.PROFILING_TOKEN.encode() if settings.PROFILING_TOKEN else None
+        self.header = TOKEN_HEADER.lower().encode()
+
+    def _mode(self, scope) -> Optional[str]:
+        if self.token is not None:
+            for name, value in scope["headers"]:
+                if name == self.header and hmac.compare_digest(value, self.token):
+                    return "on_demand"
+        rate = settings.PROFILING_SAMPLE_RATE
+        if rate and random.random() * rate < 1:
+            return "sampled"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        mode = self._mode(scope) if scope["type"] == "http" and sampler.running else None
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile = sampler.begin(mode)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if mode == "on_demand":
+                    message["headers"] = [*message.get("headers", []), (ID_HEADER.lower().encode(), profile.id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.end(profile)
+            try:
+                await TraceStore.save(profile.trace(_route(scope), scope["path"], status_code))
+            except Exception:
+                logger.exception("Failed to store request profile %s", profile.id)
@@ -0,0 +1,184 @@
+import hashlib
+import logging
+import math
+from dataclasses import dataclass
+from time import monotonic
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request, Response, status
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.core.database import redis_client
+from app.core.metrics import Counter
+
+
+logger = logging.getLogger(__name__)
+
+rate_limited_total = Counter(
+    "rate_limited_total", "Requests rejected by rate limiting", ("route", "source")
+)
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+# GCRA over all policies of a request in one call. A request is admitted only
+# if every key admits it, and only then are the keys' TATs advanced.
+# ARGV: per key (emission interval ms, tolerance ms). Returns
+# {allowed, remaining_1, reset_ms_1, retry_ms_1, remaining_2, ...}.
+_GCRA_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local allowed = 1
+local result = {0}
+local new_tats = {}
+for i = 1, #KEYS do
+    local interval = tonumber(ARGV[i * 2 - 1])
+    local tolerance = tonumber(ARGV[i * 2])
+    local tat = tonumber(redis.call('GET', KEYS[i]) or now)
+    if tat < now then tat = now end
+    local new_tat = tat + interval
+    local wait = new_tat - now - tolerance
+    if wait > 0 then
+        allowed = 0
+        table.insert(result, 0)
+        table.insert(result, math.ceil(tat - now))
+        table.insert(result, math.ceil(wait))
+    else
+        table.insert(result, math.floor(-wait / interval))
+        table.insert(result, math.ceil(new_tat - now))
+        table.insert(result, 0)
+    end
+    new_tats[i] = new_tat
+end
+if allowed == 1 then
+    for i = 1, #KEYS do
+        redis.call('SET', KEYS[i], new_tats[i], 'PX', math.ceil(new_tats[i] - now))
+    end
+end
+result[1] = allowed
+return result
+"""
+
+_gcra = redis_client.register_script(_GCRA_SCRIPT)
+
+
+@dataclass(frozen=True)
+class RatePolicy:
+    scope: str  # ip, email, user
+    limit: int
+    period: int  # seconds
+
+    @classmethod
+    def parse(cls, spec: str) -> "RatePolicy":
+        """Parse "scope:limit/period", e.g. "ip:20/minute" """
+        scope, rate = spec.split(":", 1)
+        limit, period = rate.split("/", 1)
+        if period not in _PERIODS:
+            raise ValueError(f"Unknown rate limit period in {spec!r}")
+        return cls(scope=scope.strip(), limit=int(limit), period=_PERIODS[period])
+
+
+class RateLimiter:
+    """Distributed GCRA rate limiter backed by a single Redis Lua call.
+
+    Policies per route come from ``settings.RATE_LIMITS``. Keys that Redis
+    has just rejected are remembered in-process until their retry time, so
+    a flood from one client is rejected locally without further round-trips.
+    If Redis is unavailable requests are let through.
+    """
+
+    def __init__(self, policies: Dict[str, List[str]]):
+        self.policies = {
+            route: [RatePolicy.parse(spec) for spec in specs]
+            for route, specs in policies.items()
+        }
+        self._blocked = LRUCache(maxsize=settings.RATE_LIMIT_LOCAL_CACHE_SIZE, ttl=1.0)
+
+    @staticmethod
+    def client_ip(request: Request) -> str:
+        return request.client.host if request.client else "unknown"
+
+    @staticmethod
+    def _key(route: str, scope: str, value: str) -> str:
+        digest = hashlib.blake2b(value.lower().encode(), digest_size=12).hexdigest()
+        return f"rl:{route}:{scope}:{digest}"
+
+    def _reject(self, route: str, source: str, limit: int, retry_after: float) -> HTTPException:
+        rate_limited_total.inc(route=route, source=source)
+        retry = max(1, math.ceil(retry_after))
+        return HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests, try again later",
+            headers={
+                "Retry-After": str(retry),
+                "RateLimit-Limit": str(limit),
+                "RateLimit-Remaining": "0",
+                "RateLimit-Reset": str(retry),
+            },
+        )
+
+    async def hit(
+        self,
+        request: Request,
+        response: Optional[Response],
+        route: str,
+        **identities: Optional[str],
+    ) -> None:
+        """Count one request against the route's policies or raise 429.
+
+        ``identities`` supplies values for scopes other than ``ip``
+        (``email=...``, ``user=...``); policies without a value are skipped.
+        """
+        if not settings.RATE_LIMIT_ENABLED:
+            return
+        policies = self.policies.get(route)
+        if not policies:
+            return
+
+        identities = {"ip": self.client_ip(request), **identities}
+        checks: List[Tuple[str, RatePolicy]] = [
+            (self._key(route, policy.scope, str(identities[policy.scope])), policy)
+            for policy in policies
+            if identities.get(policy.scope)
+        ]
+        if not checks:
+            return
+
+        # Local pre-filter: keys Redis rejected recently
+        now = monotonic()
+        for key, policy in checks:
+            blocked_until = self._blocked.get(key)
+            if blocked_until is not None and blocked_until > now:
+                raise self._reject(route, "local", policy.limit, blocked_until - now)
+
+        args = []
+        for _, policy in checks:
+            interval_ms = policy.period * 1000 / policy.limit
+            args += [interval_ms, policy.period * 1000]
+        try:
+            result = await _gcra(keys=[key for key, _ in checks], args=args)
+        except Exception:
+            logger.exception("Rate limiter unavailable, allowing request")
+            return
+
+        rows = [
+            (key, policy, *result[1 + index * 3: 4 + index * 3])
+            for index, (key, policy) in enumerate(checks)
+        ]
+        for key, policy, remaining, reset_ms, retry_ms in rows:
+            if retry_ms > 0:
+                self._blocked.set(key, now + retry_ms / 1000, ttl=retry_ms / 1000)
+
+        if result[0] != 1:
+            _, policy, _, _, retry_ms = max(rows, key=lambda row: row[4])
+            raise self._reject(route, "redis", policy.limit, retry_ms / 1000)
+
+        # Report the most restrictive policy
+        _, policy, remaining, reset_ms, _ = min(rows, key=lambda row: row[2])
+        if response is not None:
+            response.headers["RateLimit-Limit"] = str(policy.limit)
+            response.headers["RateLimit-Remaining"] = str(remaining)
+            response.headers["RateLimit-Reset"] = str(math.ceil(reset_ms / 1000))
+
+
+rate_limiter = RateLimiter(settings.RATE_LIMITS)
@@ -0,0 +1,193 @@
+"""Redis access helpers on top of the shared pool.
+
+``autopipeline`` gathers commands issued by concurrent coroutines within the
+same event-loop iteration and sends them as one pipeline, so N requests each
+doing a GET cost one round-trip instead of N.
+
+``client_cache`` keeps read-mostly keys (``REDIS_CLIENT_CACHE_PREFIXES``) in
+process memory. Redis tracks those prefixes for us (``CLIENT TRACKING ON
+BCAST``) and pushes every write to them on ``__redis__:invalidate``, so
+cached values are dropped as soon as any process changes them. The tracking
+and the subscription share one dedicated connection, redirected to itself;
+while it is down the cache is bypassed.
+"""
+import asyncio
+import logging
+from typing import Any, Callable, List, Optional, Tuple
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.core.database import redis_client
+from app.core.metrics import Counter, Gauge
+from app.core.profiling import sampler
+
+
+logger = logging.getLogger(__name__)
+
+INVALIDATE_CHANNEL = "__redis__:invalidate"
+
+pipelined_commands_total = Counter(
+    "redis_autopipeline_commands_total", "Commands sent through the auto-pipeline"
+)
+pipelines_total = Counter("redis_autopipeline_flushes_total", "Auto-pipeline round-trips")
+client_cache_requests_total = Counter(
+    "redis_client_cache_requests_total", "Client-side cache lookups", ("outcome",)
+)
+client_cache_invalidations_total = Counter(
+    "redis_client_cache_invalidations_total", "Keys invalidated by the server"
+)
+client_cache_tracking = Gauge("redis_client_cache_tracking", "1 while invalidations are being received")
+
+
+class AutoPipeline:
+    """Batches commands issued in the same event-loop iteration into one pipeline"""
+
+    def __init__(self, client=redis_client, max_batch: Optional[int] = None):
+        self.client = client
+        self.max_batch = max_batch or settings.REDIS_AUTOPIPELINE_MAX_BATCH
+        self._pending: List[Tuple[tuple, dict, asyncio.Future]] = []
+        self._scheduled = False
+
+    def execute_command(self, *args, **options) -> "asyncio.Future":
+        """Queue a command; the returned future resolves with its (parsed) reply"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((args, options, future))
+        profile = sampler.current()
+        if profile is not None:
+            profile.track(future, "redis")
+        if len(self._pending) >= self.max_batch:
+            self._send()
+        elif not self._scheduled:
+            self._scheduled = True
+            # Runs after every callback already ready in this iteration has had
+            # its chance to queue commands
+            loop.call_soon(self._send)
+        return future
+
+    def _send(self) -> None:
+        self._scheduled = False
+        if self._pending:
+            batch, self._pending = self._pending, []
+            asyncio.ensure_future(self._execute(batch))
+
+    async def _execute(self, batch: List[Tuple[tuple, dict, asyncio.Future]]) -> None:
+        pipe = self.client.pipeline(transaction=False)
+        for args, options, _ in batch:
+            pipe.execute_command(*args, **options)
+        try:
+            results = await pipe.execute(raise_on_error=False)
+        except Exception as error:
+            results = [error] * len(batch)
+        pipelines_total.inc()
+        pipelined_commands_total.inc(len(batch))
+        for (_, _, future), result in zip(batch, results):
+            if future.done():  # caller was cancelled
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    # Commands used on hot paths
+    def get(self, key: str):
+        return self.execute_command("GET", key)
+
+    def hgetall(self, key: str):
+        return self.execute_command("HGETALL", key)
+
+    def incrby(self, key: str, amount: int = 1):
+        return self.execute_command("INCRBY", key, amount)
+
+    def exists(self, key: str):
+        return self.execute_command("EXISTS", key)
+
+
+class ClientCache:
+    """Process-local copy of tracked Redis keys with server-assisted invalidation"""
+
+    def __init__(self, client=redis_client, prefixes: Optional[List[str]] = None):
+        self.client = client
+        self.prefixes = prefixes if prefixes is not None else settings.REDIS_CLIENT_CACHE_PREFIXES
+        self._values = LRUCache(
+            maxsize=settings.REDIS_CLIENT_CACHE_SIZE, ttl=settings.REDIS_CLIENT_CACHE_TTL_SECONDS
+        )
+        self._generation = 0  # bumped on every invalidation
+        self.tracking = False
+
+    def tracked(self, key: str) -> bool:
+        return key.startswith(tuple(self.prefixes))
+
+    async def get(self, key: str, decode: Callable[[str], Any] = lambda raw: raw) -> Any:
+        """GET through the local cache; ``decode(raw)`` is cached, missing keys return None"""
+        if self.tracking and self.tracked(key):
+            cached = self._values.get(key)
+            if cached is not None:
+                client_cache_requests_total.inc(outcome="hit")
+                return cached
+            client_cache_requests_total.inc(outcome="miss")
+        else:
+            client_cache_requests_total.inc(outcome="bypass")
+
+        generation = self._generation
+        raw = await autopipeline.get(key)
+        if raw is None:
+            return None
+        value = decode(raw)
+        # Don't cache a value an invalidation may have overtaken while we read it
+        if self.tracking and self.tracked(key) and generation == self._generation:
+            self._values.set(key, value)
+        return value
+
+    def invalidate(self, keys: Optional[List[str]]) -> None:
+        self._generation += 1
+        if keys is None:  # FLUSHDB / FLUSHALL
+            self._values.clear()
+            return
+        for key in keys:
+            self._values.pop(key)
+        client_cache_invalidations_total.inc(len(keys))
+
+    def _disable(self) -> None:
+        self.tracking = False
+        self._generation += 1
+        self._values.clear()
+        client_cache_tracking.set(0)
+
+    async def _subscribe(self):
+        pubsub = self.client.pubsub()
+        # Take the connection before subscribing: CLIENT commands aren't
+        # allowed on it once it is in subscribed mode
+        connection = pubsub.connection = await self.client.connection_pool.get_connection("pubsub")
+        await connection.send_command("CLIENT", "ID")
+        client_id = await connection.read_response()
+        prefixes = [arg for prefix in self.prefixes for arg in ("PREFIX", prefix)]
+        await connection.send_command("CLIENT", "TRACKING", "ON", "REDIRECT", client_id, "BCAST", *prefixes)
+        await connection.read_response()
+        await pubsub.subscribe(INVALIDATE_CHANNEL)
+        return pubsub
+
+    async def run(self, stop: asyncio.Event) -> None:
+        """Keep the invalidation subscription alive until ``stop`` is set"""
+        while not stop.is_set():
+            pubsub = None
+            try:
+                pubsub = await self._subscribe()
+                self.tracking = True
+                client_cache_tracking.set(1)
+                while not stop.is_set():
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None and message["type"] == "message":
+                        data = message["data"]
+                        self.invalidate([data] if isinstance(data, str) else data)
+            except Exception:
+                logger.exception("Redis client cache invalidation stream failed, retrying")
+                await asyncio.sleep(1.0)
+            finally:
+                self._disable()
+                if pubsub is not None:
+                    await pubsub.close()
+
+
+autopipeline = AutoPipeline()
+client_cache = ClientCache()
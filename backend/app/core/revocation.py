@@ -0,0 +1,166 @@
+"""Token revocation with an in-process Bloom filter in front of Redis.
+
+Revoked ids (access token ``jti``s and refresh token families ``fam``) live
+in the ``auth:revoked`` sorted set, scored by the time the last token they
+can affect expires, and are announced on the ``auth:revoked`` channel. Every
+API process mirrors the set into a Bloom filter: a token whose ids are not in
+the filter is not revoked, which is a memory lookup and the common case. On
+a filter hit (revoked, or a false positive at ``REVOCATION_BLOOM_ERROR_RATE``)
+the sorted set decides. While the mirror isn't in sync, e.g. after losing the
+subscription, every check goes to Redis.
+
+The filter is rebuilt from the set every ``REVOCATION_REBUILD_SECONDS`` so
+expired ids stop taking space. Used refresh tokens are tracked separately
+(``auth:refresh:{jti}``): they are only checked on refresh and would
+otherwise flood the filter.
+"""
+import asyncio
+import logging
+import math
+import time
+from typing import Optional
+
+from app.core.config import settings
+from app.core.database import redis_client
+from app.core.metrics import Counter, Gauge
+from app.core.redis_layer import autopipeline
+
+
+logger = logging.getLogger(__name__)
+
+REVOKED_KEY = "auth:revoked"
+REVOKED_CHANNEL = "auth:revoked"
+
+revocation_checks_total = Counter(
+    "token_revocation_checks_total", "Revocation checks by how they were answered", ("outcome",)
+)
+revocation_filter_size = Gauge("token_revocation_filter_ids", "Ids in this process's revocation filter")
+revocation_synced = Gauge("token_revocation_synced", "1 while the revocation filter mirrors Redis")
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings.
+
+    Probes are derived from the built-in ``hash()`` (double hashing of its
+    two halves). That is salted per process, which is fine: every process
+    builds its own filter from the ids in Redis.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def add(self, item: str) -> None:
+        digest = hash(item) & 0xFFFFFFFFFFFFFFFF
+        position, step = digest & 0xFFFFFFFF, (digest >> 32) | 1
+        bits, size = self.bits, self.size
+        for _ in range(self.hashes):
+            position %= size
+            bits[position >> 3] |= 1 << (position & 7)
+            position += step
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        digest = hash(item) & 0xFFFFFFFFFFFFFFFF
+        position, step = digest & 0xFFFFFFFF, (digest >> 32) | 1
+        bits, size = self.bits, self.size
+        for _ in range(self.hashes):
+            position %= size
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+            position += step
+        return True
+
+
+class RevocationList:
+    """Revoked token ids: Redis sorted set, mirrored into a per-process Bloom filter"""
+
+    def __init__(self):
+        self._filter = self._new_filter()
+        self.synced = False
+
+    @staticmethod
+    def _new_filter() -> BloomFilter:
+        return BloomFilter(settings.REVOCATION_BLOOM_CAPACITY, settings.REVOCATION_BLOOM_ERROR_RATE)
+
+    async def revoke(self, token_id: str, expires_at: float) -> None:
+        """Revoke a jti or family until ``expires_at`` (unix time) everywhere"""
+        now = time.time()
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.zadd(REVOKED_KEY, {token_id: expires_at}, gt=True)
+        pipe.zremrangebyscore(REVOKED_KEY, "-inf", now)
+        pipe.publish(REVOKED_CHANNEL, token_id)
+        await pipe.execute()
+        self._filter.add(token_id)
+
+    async def is_revoked(self, *token_ids: Optional[str]) -> bool:
+        """Whether any of the ids (jti, family) is revoked"""
+        token_ids = [token_id for token_id in token_ids if token_id]
+        if not token_ids:
+            return False
+        if self.synced and not any(token_id in self._filter for token_id in token_ids):
+            revocation_checks_total.inc(outcome="filter")
+            return False
+
+        revocation_checks_total.inc(outcome="redis" if self.synced else "unsynced")
+        scores = await autopipeline.execute_command("ZMSCORE", REVOKED_KEY, *token_ids)
+        now = time.time()
+        return any(score is not None and float(score) > now for score in scores)
+
+    async def _rebuild(self) -> None:
+        """Replace the filter with one holding the ids that are still revoked"""
+        rebuilt = self._new_filter()
+        cursor = 0
+        now = time.time()
+        while True:
+            cursor, entries = await redis_client.zscan(REVOKED_KEY, cursor, count=10000)
+            for token_id, expires_at in entries:
+                if expires_at > now:
+                    rebuilt.add(token_id)
+            if cursor == 0:
+                break
+        if rebuilt.count > settings.REVOCATION_BLOOM_CAPACITY:
+            logger.warning(
+                "%d revoked token ids exceed REVOCATION_BLOOM_CAPACITY, more checks will go to Redis",
+                rebuilt.count,
+            )
+        self._filter = rebuilt
+        revocation_filter_size.set(rebuilt.count)
+
+    async def run(self, stop: asyncio.Event) -> None:
+        """Keep the filter in sync with Redis until ``stop`` is set"""
+        while not stop.is_set():
+            pubsub = redis_client.pubsub()
+            try:
+                await pubsub.subscribe(REVOKED_CHANNEL)
+                # Wait until the subscription is active before loading, so no
+                # revocation falls between the snapshot and the stream
+                while await pubsub.get_message(timeout=1.0) is None:
+                    if stop.is_set():
+                        return
+                await self._rebuild()
+                rebuilt_at = time.monotonic()
+                self.synced = True
+                revocation_synced.set(1)
+
+                while not stop.is_set():
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None and message["type"] == "message":
+                        self._filter.add(message["data"])
+                        revocation_filter_size.set(self._filter.count)
+                    if time.monotonic() - rebuilt_at >= settings.REVOCATION_REBUILD_SECONDS:
+                        # Messages arriving meanwhile wait in the subscription
+                        await self._rebuild()
+                        rebuilt_at = time.monotonic()
+            except Exception:
+                logger.exception("Token revocation stream failed, retrying")
+                await asyncio.sleep(1.0)
+            finally:
+                self.synced = False
+                revocation_synced.set(0)
+                await pubsub.close()
+
+
+revocations = RevocationList()
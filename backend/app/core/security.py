@@ -1,3 +1,4 @@
+import uuid
 from datetime import datetime, timedelta
 from typing import Optional, Any, Dict
 from jose import JWTError, jwt
@@ -11,9 +12,15 @@ from app.core.config import settings
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
+def new_token_id() -> str:
+    """Random id for a token (``jti``) or a refresh token family (``fam``)"""
+    return uuid.uuid4().hex
+
+
 def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta] = None) -> str:
-    """Create JWT access token"""
+    """Create JWT access token (with a ``jti`` so it can be revoked)"""
     to_encode = data.copy()
+    to_encode.setdefault("jti", new_token_id())
     
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
@@ -25,6 +32,13 @@ def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta]
     return encoded_jwt
 
 
+def create_refresh_token(data: Dict[str, Any], expires_delta: Optional[timedelta] = None) -> str:
+    """Create JWT refresh token"""
+    if expires_delta is None:
+        expires_delta = timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+    return create_access_token({**data, "type": "refresh"}, expires_delta)
+
+
 def verify_token(token: str) -> Dict[str, Any]:
     """Verify JWT token and return payload"""
     try:
@@ -0,0 +1,360 @@
+"""Live point queues sharded over several Redis nodes.
+
+Everything kept under a point's ``{point:ID}`` hash tag (``POINT_KEYS``:
+change feed, order numbers, ...) lives on one node, picked by consistent
+hashing of the point id over ``REDIS_SHARD_URLS``, so multi-key scripts on a
+point keep working. The point's pub/sub channel is published on the same
+node. Shared state (caches, rate limits, streams, ...) stays on
+``REDIS_URL``. Without ``REDIS_SHARD_URLS`` every point lives on
+``REDIS_URL``.
+
+Adding nodes moves about 1/N of the points. Rebalancing is online:
+
+1. Deploy ``REDIS_SHARD_URLS`` = new list and ``REDIS_SHARD_PREVIOUS_URLS``
+   = old list everywhere. A point whose node changed keeps being served by
+   its old node until moved (dual read: the old node's ``{point:ID}:moved``
+   marker is checked first).
+2. ``python -m app.cli redis-rebalance`` moves the points in batches: mark
+   them ``migrating`` (requests wait), let commands already routed to the
+   old node finish (``REDIS_SHARD_MIGRATION_GRACE_SECONDS``), DUMP/RESTORE
+   their keys onto the new node, then delete them from the old one and mark
+   them ``done`` in one script that first checks nothing changed since the
+   DUMP (changed keys are copied again). It then flags the old nodes
+   complete, after which nothing is looked up there any more.
+3. Deploy without ``REDIS_SHARD_PREVIOUS_URLS`` and run
+   ``redis-rebalance --cleanup`` to drop the markers.
+
+DUMP/RESTORE goes through this client rather than MIGRATE, so nodes don't
+have to reach each other (managed Redis often disables MIGRATE).
+"""
+import asyncio
+import bisect
+import hashlib
+import logging
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+import redis.asyncio as redis
+from fastapi import HTTPException, status
+
+from app.core.config import settings
+from app.core.database import create_redis_pool, redis_client
+from app.core.metrics import Counter
+from app.core.redis_layer import AutoPipeline, autopipeline
+
+
+logger = logging.getLogger(__name__)
+
+# Every key kept under a point's hash tag; the rebalancer moves exactly these
+POINT_KEYS = ("seq", "changes", "relayed", "order_seq", "queue", "queue_cashiers", "queue_orders")
+MOVED_MARKER = "moved"  # {point:ID}:moved on the old node: "migrating", then "done"
+COMPLETE_KEY = "shards:rebalanced"  # on an old node once every point was moved off it
+RELEASE_ATTEMPTS = 5  # copies of a batch before giving up on keys that keep changing
+
+# KEYS: the points' keys, then their moved markers. ARGV: the DUMP copied to
+# the new node of each point key ("" = absent). Deletes the keys and marks
+# the points done only if none changed since, else returns the changed
+# (1-based) indexes.
+_RELEASE_SCRIPT = """
+local changed = {}
+for i = 1, #ARGV do
+    if (redis.call('DUMP', KEYS[i]) or '') ~= ARGV[i] then
+        changed[#changed + 1] = i
+    end
+end
+if #changed > 0 then
+    return changed
+end
+for i = 1, #ARGV do
+    redis.call('DEL', KEYS[i])
+end
+for i = #ARGV + 1, #KEYS do
+    redis.call('SET', KEYS[i], 'done')
+end
+return changed
+"""
+
+shard_routes_total = Counter(
+    "redis_shard_routes_total", "Point lookups of a moving point while rebalancing", ("outcome",)
+)
+shard_moves_total = Counter("redis_shard_points_moved_total", "Points moved to another Redis node")
+
+
+def point_key(point_id: int, name: str) -> str:
+    return f"{{point:{point_id}}}:{name}"
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+def node_name(url: str) -> str:
+    """Ring identity of a node: host, port and db (not credentials, which may rotate)"""
+    parts = urlsplit(url)
+    return f"{parts.hostname}:{parts.port or 6379}/{parts.path.strip('/') or 0}"
+
+
+class HashRing:
+    """Consistent hashing of point ids onto node names"""
+
+    def __init__(self, nodes: List[str], vnodes: int):
+        self.nodes = sorted(set(nodes))
+        ring = sorted((_hash(f"{node}#{index}"), node) for node in self.nodes for index in range(vnodes))
+        self._hashes = [position for position, _ in ring]
+        self._nodes = [node for _, node in ring]
+
+    def node(self, point_id: int) -> str:
+        index = bisect.bisect(self._hashes, _hash(str(point_id)))
+        return self._nodes[index % len(self._nodes)]
+
+
+class Shard:
+    __slots__ = ("name", "client", "autopipeline")
+
+    def __init__(self, name: str, client: redis.Redis, pipeline: AutoPipeline):
+        self.name = name
+        self.client = client
+        self.autopipeline = pipeline
+
+
+class ShardRouter:
+    """Maps point ids to Redis nodes, following points that are being moved"""
+
+    def __init__(self, urls: List[str], previous_urls: List[str], vnodes: int):
+        self._shards: Dict[str, Shard] = {}
+        self._primary = Shard(node_name(settings.REDIS_URL), redis_client, autopipeline)
+        self.ring = HashRing([self._add(url) for url in urls], vnodes) if urls else None
+        self.previous_ring = HashRing([self._add(url) for url in previous_urls], vnodes) if previous_urls else None
+        self._moved: Set[int] = set()  # points seen "done"
+        self._complete: Set[str] = set()  # old nodes seen complete
+
+    def _add(self, url: str) -> str:
+        name = node_name(url)
+        if name not in self._shards:
+            if name == self._primary.name:
+                self._shards[name] = self._primary
+            else:
+                client = redis.Redis.from_pool(create_redis_pool(url))
+                self._shards[name] = Shard(name, client, AutoPipeline(client))
+        return name
+
+    @property
+    def rebalancing(self) -> bool:
+        return self.previous_ring is not None
+
+    def owner(self, point_id: int) -> Shard:
+        """Node the point belongs to under the current configuration"""
+        return self._shards[self.ring.node(point_id)] if self.ring else self._primary
+
+    def previous_owner(self, point_id: int) -> Shard:
+        return self._shards[self.previous_ring.node(point_id)] if self.previous_ring else self._primary
+
+    async def shard(self, point_id: int) -> Shard:
+        """Node currently holding the point's keys"""
+        shard = self.owner(point_id)
+        if self.previous_ring is None:
+            return shard
+        old = self.previous_owner(point_id)
+        if old is shard or point_id in self._moved or old.name in self._complete:
+            return shard
+
+        deadline = None
+        while True:
+            marker, complete = await old.autopipeline.execute_command(
+                "MGET", point_key(point_id, MOVED_MARKER), COMPLETE_KEY
+            )
+            if complete:
+                self._complete.add(old.name)
+            if marker == "done" or (marker is None and complete):
+                self._moved.add(point_id)
+                shard_routes_total.inc(outcome="moved")
+                return shard
+            if marker is None:
+                shard_routes_total.inc(outcome="previous")
+                return old
+
+            # Being moved right now: wait for the rebalancer
+            loop = asyncio.get_running_loop()
+            if deadline is None:
+                deadline = loop.time() + settings.REDIS_SHARD_MIGRATION_WAIT_SECONDS
+                shard_routes_total.inc(outcome="waited")
+            elif loop.time() >= deadline:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Point is being moved, retry shortly",
+                    headers={"Retry-After": "1"},
+                )
+            await asyncio.sleep(0.05)
+
+    def publish_shards(self, point_id: int) -> List[Shard]:
+        """Nodes to publish a point's events on (both while it may be moving)"""
+        shard = self.owner(point_id)
+        if self.previous_ring is None:
+            return [shard]
+        old = self.previous_owner(point_id)
+        if old is shard or point_id in self._moved or old.name in self._complete:
+            return [shard]
+        return [shard, old]
+
+    @property
+    def shards(self) -> List[Shard]:
+        return list(self._shards.values()) or [self._primary]
+
+    async def close(self) -> None:
+        for shard in self._shards.values():
+            if shard is not self._primary:
+                await shard.client.aclose()
+
+
+class ShardRebalancer:
+    """Moves points whose node changed from the previous to the current configuration"""
+
+    def __init__(self, router: ShardRouter):
+        self.router = router
+
+    def _moving(self, point_ids: List[int]) -> Dict[Tuple[str, str], List[int]]:
+        moves: Dict[Tuple[str, str], List[int]] = {}
+        for point_id in point_ids:
+            old, new = self.router.previous_owner(point_id), self.router.owner(point_id)
+            if old is not new:
+                moves.setdefault((old.name, new.name), []).append(point_id)
+        return moves
+
+    async def _point_ids(self, after: int) -> List[int]:
+        from sqlalchemy import select
+
+        from app.core.database import AsyncSessionLocal
+        from app.models.point import Point
+
+        async with AsyncSessionLocal() as db:
+            return list(await db.scalars(select(Point.id).where(Point.id > after).order_by(Point.id)))
+
+    @staticmethod
+    async def _dump(shard: Shard, keys: List[str]) -> Tuple[List[Optional[bytes]], List[int]]:
+        pipe = shard.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.dump(key)
+            pipe.pttl(key)
+        replies = await pipe.execute()
+        return replies[::2], replies[1::2]
+
+    async def _move(self, old: Shard, new: Shard, point_ids: List[int], handover: bool = True) -> int:
+        """Copy the points' keys to ``new`` and delete them from ``old``.
+
+        With ``handover`` the points are marked ``migrating`` first and
+        ``done`` after; without it (points created after the old node was
+        flagged complete, already served by ``new``) keys already on ``new``
+        win.
+
+        A command routed to ``old`` before the marker and landing after the
+        DUMP (a caller holding its shard beyond the grace period) is not
+        lost: the keys are only deleted if their DUMP is unchanged, changed
+        ones are copied again. One landing after the delete still recreates
+        a key on ``old`` that nobody reads, so the grace period has to cover
+        how long callers hold a routed shard.
+        """
+        markers = [point_key(point_id, MOVED_MARKER) for point_id in point_ids]
+        if handover:
+            states = await old.client.mget(markers)
+            point_ids = [point_id for point_id, state in zip(point_ids, states) if state != "done"]
+            markers = [point_key(point_id, MOVED_MARKER) for point_id in point_ids]
+            if not point_ids:
+                return 0
+            await old.client.mset({marker: "migrating" for marker in markers})
+            await asyncio.sleep(settings.REDIS_SHARD_MIGRATION_GRACE_SECONDS)
+
+        keys = [point_key(point_id, name) for point_id in point_ids for name in POINT_KEYS]
+        dumps, ttls = await self._dump(old, keys)
+        if not handover:
+            present = [key for key, dumped in zip(keys, dumps) if dumped is not None]
+            pipe = new.client.pipeline(transaction=False)
+            for key, dumped, ttl in zip(keys, dumps, ttls):
+                if dumped is not None:
+                    pipe.restore(key, max(ttl, 0), dumped)
+            results = await pipe.execute(raise_on_error=False) if present else []
+            for key, result in zip(present, results):
+                if isinstance(result, Exception):
+                    logger.warning("%s already exists on %s, the copy on %s is dropped", key, new.name, old.name)
+            if present:
+                await old.client.delete(*present)
+            shard_moves_total.inc(len(point_ids))
+            return len(point_ids)
+
+        release = old.client.register_script(_RELEASE_SCRIPT)
+        copying = list(range(len(keys)))
+        for _ in range(RELEASE_ATTEMPTS):
+            pipe = new.client.pipeline(transaction=False)
+            for index in copying:
+                if dumps[index] is not None:
+                    pipe.restore(keys[index], max(ttls[index], 0), dumps[index], replace=True)
+                else:  # deleted on the old node since an earlier copy
+                    pipe.delete(keys[index])
+            results = await pipe.execute(raise_on_error=False)
+            failed = [keys[index] for index, result in zip(copying, results) if isinstance(result, Exception)]
+            if failed:
+                await self._hand_back(old, new, keys, markers)
+                raise RuntimeError(f"RESTORE on {new.name} failed for {len(failed)} keys, e.g. {failed[0]}")
+
+            changed = await release(
+                keys=[*keys, *markers], args=[dumped or b"" for dumped in dumps], client=old.client
+            )
+            if not changed:
+                shard_moves_total.inc(len(point_ids))
+                return len(point_ids)
+            copying = [index - 1 for index in changed]
+            logger.info("%d keys changed on %s while being moved, copying them again", len(copying), old.name)
+            changed_dumps, changed_ttls = await self._dump(old, [keys[index] for index in copying])
+            for index, dumped, ttl in zip(copying, changed_dumps, changed_ttls):
+                dumps[index], ttls[index] = dumped, ttl
+
+        await self._hand_back(old, new, keys, markers)
+        raise RuntimeError(f"Keys on {old.name} kept changing while being moved, e.g. {keys[copying[0]]}")
+
+    @staticmethod
+    async def _hand_back(old: Shard, new: Shard, keys: List[str], markers: List[str]) -> None:
+        """Give the points back to the old node, which still has all their keys"""
+        await new.client.delete(*keys)
+        await old.client.delete(*markers)
+
+    async def run(self, dry_run: bool = False, progress=None) -> int:
+        """Move every point that changed node, return how many were moved (or would be)"""
+        if not self.router.rebalancing:
+            raise RuntimeError("REDIS_SHARD_PREVIOUS_URLS is not set: nothing to rebalance")
+        shards = {shard.name: shard for shard in self.router.shards}
+        total, last_id = 0, 0
+        # Points created meanwhile start on their old node too: loop until none are left
+        while True:
+            point_ids = await self._point_ids(last_id)
+            if not point_ids:
+                break
+            last_id = point_ids[-1]
+            for (old, new), moving in self._moving(point_ids).items():
+                for start in range(0, len(moving), settings.REDIS_SHARD_MIGRATION_BATCH):
+                    batch = moving[start:start + settings.REDIS_SHARD_MIGRATION_BATCH]
+                    total += len(batch) if dry_run else await self._move(shards[old], shards[new], batch)
+                    if progress is not None:
+                        progress(old, new, total)
+        if dry_run:
+            return total
+
+        # From here on points without a marker are served by their new node
+        for name in self.router.previous_ring.nodes:
+            await shards[name].client.set(COMPLETE_KEY, "1")
+        await asyncio.sleep(settings.REDIS_SHARD_MIGRATION_GRACE_SECONDS)
+        # Points created between the last pass and the flag may have keys on the old node
+        for (old, new), moving in self._moving(await self._point_ids(last_id)).items():
+            total += await self._move(shards[old], shards[new], moving, handover=False)
+        return total
+
+    async def cleanup(self) -> int:
+        """Drop markers and completion flags once no process uses the previous configuration"""
+        deleted = 0
+        for shard in self.router.shards:
+            markers = [key async for key in shard.client.scan_iter(match=f"{{point:*}}:{MOVED_MARKER}", count=1000)]
+            for start in range(0, len(markers), 1000):
+                deleted += await shard.client.delete(*markers[start:start + 1000])
+            deleted += await shard.client.delete(COMPLETE_KEY)
+        return deleted
+
+
+shards = ShardRouter(settings.REDIS_SHARD_URLS, settings.REDIS_SHARD_PREVIOUS_URLS, settings.REDIS_SHARD_VNODES)
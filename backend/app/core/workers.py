@@ -0,0 +1,12 @@
+from uvicorn.workers import UvicornWorker
+
+
+class QueueUvicornWorker(UvicornWorker):
+    """Gunicorn worker pinned to uvloop and httptools"""
+
+    CONFIG_KWARGS = {
+        "loop": "uvloop",
+        "http": "httptools",
+        "lifespan": "on",
+        "proxy_headers": True,
+    }
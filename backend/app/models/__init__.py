@@ -1,11 +1,13 @@
-from .user import User, AuthProviderEnum
+from .user import User, AuthProviderEnum, PushDevice
 from .point import Point, PointStatusEnum
 from .cashier import Cashier, CashierStatusEnum
 from .order import Order, OrderStatus, OrderStatusHistory, OrderTypeEnum
+from .outbox import OutboxEvent
 
 __all__ = [
     "User",
     "AuthProviderEnum",
+    "PushDevice",
     "Point", 
     "PointStatusEnum",
     "Cashier",
@@ -14,4 +16,5 @@ __all__ = [
     "OrderStatus",
     "OrderStatusHistory",
     "OrderTypeEnum",
+    "OutboxEvent",
 ]
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Enum, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Enum, ForeignKey, UniqueConstraint
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 import enum
@@ -39,5 +39,9 @@ class Cashier(Base):
     assigned_user = relationship("User", back_populates="cashier_assignments")
     orders = relationship("Order", back_populates="cashier")
     
+    __table_args__ = (
+        UniqueConstraint("point_id", "number", name="uq_cashiers_point_number"),
+    )
+    
     def __repr__(self):
         return f"<Cashier(id={self.id}, number='{self.number}', name='{self.name}', status='{self.status.value}')>"
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, Enum, Index, UniqueConstraint
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 import enum
@@ -29,6 +29,7 @@ class Order(Base):
     
     # Scheduling
     scheduled_time = Column(DateTime(timezone=True), nullable=True)  # For scheduled orders
+    arrived_at = Column(DateTime(timezone=True), nullable=True)  # Customer entered the point's geofence
     
     # Current status
     current_status_id = Column(Integer, ForeignKey("order_statuses.id"), nullable=True)
@@ -44,6 +45,16 @@ class Order(Base):
     current_status = relationship("OrderStatus", foreign_keys=[current_status_id])
     status_history = relationship("OrderStatusHistory", back_populates="order")
     
+    # Load server defaults (created_at) via RETURNING on insert, event payloads need them
+    __mapper_args__ = {"eager_defaults": True}
+    
+    __table_args__ = (
+        # Per-point scans in id order (exports)
+        Index("ix_orders_point_id_id", "point_id", "id"),
+        # Queue positions: non-final orders of a point ahead of a given id
+        Index("ix_orders_point_status_id", "point_id", "current_status_id", "id"),
+    )
+    
     def __repr__(self):
         return f"<Order(id={self.id}, number='{self.order_number}', type='{self.order_type.value}')>"
 
@@ -71,6 +82,10 @@ class OrderStatus(Base):
     # Relationships
     point = relationship("Point", back_populates="order_statuses")
     
+    __table_args__ = (
+        UniqueConstraint("point_id", "name", name="uq_order_statuses_point_name"),
+    )
+    
     def __repr__(self):
         return f"<OrderStatus(id={self.id}, name='{self.name}', order_index={self.order_index})>"
 
@@ -79,7 +94,7 @@ class OrderStatusHistory(Base):
     __tablename__ = "order_status_history"
 
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False)
+    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False, index=True)
     status_id = Column(Integer, ForeignKey("order_statuses.id"), nullable=False)
     
     # Timestamps
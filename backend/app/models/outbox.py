@@ -0,0 +1,46 @@
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, JSON
+from sqlalchemy.sql import func
+
+from app.core.database import Base
+
+
+class OutboxEvent(Base):
+    """Event written in the same transaction as the change it describes.
+
+    The worker relay (app/services/outbox.py) publishes rows to Redis and
+    deletes them, giving at-least-once delivery without dual writes on the
+    request path.
+    """
+    __tablename__ = "outbox_events"
+
+    id = Column(BigInteger, primary_key=True)
+    event_type = Column(String(64), nullable=False)  # order.created, order.status_changed, ...
+    point_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, nullable=True)  # customer to notify, if any
+    entity_id = Column(Integer, nullable=False)
+    payload = Column(JSON, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"<OutboxEvent(id={self.id}, type='{self.event_type}', entity_id={self.entity_id})>"
+
+
+# Wake the relay on commit instead of waiting for the next poll
+NOTIFY_CHANNEL = "outbox_events"
+
+NOTIFY_DDL = [
+    f"""
+    CREATE OR REPLACE FUNCTION notify_outbox_events() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('{NOTIFY_CHANNEL}', '');
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS outbox_events_notify ON outbox_events",
+    """
+    CREATE TRIGGER outbox_events_notify AFTER INSERT ON outbox_events
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_outbox_events()
+    """,
+]
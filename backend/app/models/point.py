@@ -1,11 +1,17 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Enum, Float, ForeignKey, JSON, Time
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Enum, Float, ForeignKey, JSON, Time, Computed, Index, LargeBinary, UniqueConstraint, event
+from sqlalchemy import inspect
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 import enum
+import logging
 
 from app.core.database import Base
 
 
+logger = logging.getLogger(__name__)
+
+
 class PointStatusEnum(enum.Enum):
     ACTIVE = "active"
     INACTIVE = "inactive"
@@ -17,6 +23,7 @@ class Point(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    external_id = Column(String(100), nullable=True)  # Owner's own id, key for bulk imports
     
     # Basic info
     name = Column(String(255), nullable=False)
@@ -33,6 +40,9 @@ class Point(Base):
     
     # Working hours (JSON format: {"monday": {"start": "09:00", "end": "18:00"}, ...})
     working_hours = Column(JSON, nullable=True)
+    timezone = Column(String(64), default="UTC")  # IANA name, working hours are local time
+    # Weekly minute bitmap compiled from working_hours (see app/services/working_hours.py)
+    working_hours_bitmap = Column(LargeBinary, nullable=True)
     
     # Queue settings
     accepts_online_orders = Column(Boolean, default=True)
@@ -51,11 +61,86 @@ class Point(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
+    # Search (generated by Postgres, see app/services/search.py)
+    search_vector = Column(
+        TSVECTOR,
+        Computed(
+            "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(address, '')), 'B') || "
+            "setweight(to_tsvector('simple', coalesce(description, '')), 'C') || "
+            "setweight(to_tsvector('simple', coalesce(detailed_description, '')), 'D')",
+            persisted=True,
+        ),
+    )
+    # Short text for typo-tolerant trigram matching (long descriptions dilute similarity)
+    search_text = Column(
+        Text,
+        Computed("lower(coalesce(name, '') || ' ' || coalesce(address, ''))", persisted=True),
+    )
+    
     # Relationships
     owner = relationship("User", back_populates="owned_points")
     cashiers = relationship("Cashier", back_populates="point")
     orders = relationship("Order", back_populates="point")
     order_statuses = relationship("OrderStatus", back_populates="point")
 
+    __table_args__ = (
+        Index("ix_points_search_vector", "search_vector", postgresql_using="gin"),
+        Index(
+            "ix_points_search_text_trgm",
+            "search_text",
+            postgresql_using="gin",
+            postgresql_ops={"search_text": "gin_trgm_ops"},
+        ),
+        Index("ix_points_location", "latitude", "longitude"),
+        UniqueConstraint("owner_id", "external_id", name="uq_points_owner_external_id"),
+    )
+
     def __repr__(self):
-        return f"<Point(id={self.id}, name='{self.name}', status='{self.status.value}')>"
\ No newline at end of file
+        return f"<Point(id={self.id}, name='{self.name}', status='{self.status.value}')>"
+
+
+@event.listens_for(Point, "before_insert")
+def _compile_working_hours_on_insert(mapper, connection, target):
+    """Store the compiled working hours alongside the row"""
+    from app.services.working_hours import compile_working_hours
+
+    target.working_hours_bitmap = compile_working_hours(target.working_hours)
+
+
+@event.listens_for(Point, "before_update")
+def _compile_working_hours_on_update(mapper, connection, target):
+    """Recompile only when working_hours changed"""
+    from app.services.working_hours import compile_working_hours
+
+    if inspect(target).attrs.working_hours.history.has_changes():
+        target.working_hours_bitmap = compile_working_hours(target.working_hours)
+
+
+def backfill_working_hours_bitmaps(sync_conn) -> int:
+    """Compile working hours of rows stored before the bitmap column existed"""
+    from sqlalchemy import select, update
+    from app.services.working_hours import compile_working_hours
+
+    table = Point.__table__
+    rows = sync_conn.execute(
+        select(table.c.id, table.c.working_hours).where(
+            table.c.working_hours.isnot(None), table.c.working_hours_bitmap.is_(None)
+        )
+    ).all()
+    compiled = 0
+    for point_id, working_hours in rows:
+        try:
+            bitmap = compile_working_hours(working_hours)
+        except (AttributeError, KeyError, TypeError, ValueError):
+            logger.warning("Point %s has invalid working hours, left always open", point_id)
+            continue
+        if bitmap is not None:
+            # A migration is not an edit: updated_at keeps its value
+            sync_conn.execute(
+                update(table)
+                .where(table.c.id == point_id)
+                .values(working_hours_bitmap=bitmap, updated_at=table.c.updated_at)
+            )
+            compiled += 1
+    return compiled
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Enum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Enum, ForeignKey
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 import enum
@@ -41,6 +41,25 @@ class User(Base):
     owned_points = relationship("Point", back_populates="owner")
     cashier_assignments = relationship("Cashier", back_populates="assigned_user")
     orders = relationship("Order", back_populates="user")
+    push_devices = relationship("PushDevice", back_populates="user")
 
     def __repr__(self):
-        return f"<User(id={self.id}, email='{self.email}', provider='{self.auth_provider.value}')>"
\ No newline at end of file
+        return f"<User(id={self.id}, email='{self.email}', provider='{self.auth_provider.value}')>"
+
+
+class PushDevice(Base):
+    """A user's app installation that receives push notifications"""
+    __tablename__ = "push_devices"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    token = Column(String(255), unique=True, nullable=False)  # push gateway address of the device
+    platform = Column(String(16), nullable=True)  # ios, android, web
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    user = relationship("User", back_populates="push_devices")
+
+    def __repr__(self):
+        return f"<PushDevice(id={self.id}, user_id={self.user_id}, platform='{self.platform}')>"
@@ -0,0 +1,41 @@
+from pydantic import BaseModel
+from typing import Optional, Dict, Any, List
+from enum import Enum
+
+
+class ImportKindEnum(str, Enum):
+    POINTS = "points"
+    CASHIERS = "cashiers"
+    STATUSES = "statuses"
+
+
+class BulkImportRequest(BaseModel):
+    """Flat rows; cashiers and statuses reference points by ``point_external_id``.
+
+    Points are matched on (owner, external_id), cashiers on (point, number)
+    and statuses on (point, name): existing rows are updated, others created.
+    """
+    points: List[Dict[str, Any]] = []
+    cashiers: List[Dict[str, Any]] = []
+    statuses: List[Dict[str, Any]] = []
+
+
+class ImportRowError(BaseModel):
+    kind: ImportKindEnum
+    row: int  # 1-based position in the input list / CSV data row
+    field: Optional[str] = None
+    message: str
+
+
+class ImportCounts(BaseModel):
+    created: int = 0
+    updated: int = 0
+
+
+class BulkImportResult(BaseModel):
+    dry_run: bool = False
+    points: ImportCounts = ImportCounts()
+    cashiers: ImportCounts = ImportCounts()
+    statuses: ImportCounts = ImportCounts()
+    default_workflows: int = 0  # points that got the default status workflow
+    errors: List[ImportRowError] = []
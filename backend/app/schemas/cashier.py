@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, EmailStr
-from typing import Optional, List
+from typing import Dict, Optional, List
 from datetime import datetime
 from enum import Enum
 
@@ -66,6 +66,23 @@ class CashierStatusUpdate(BaseModel):
     status: CashierStatusEnum
 
 
+class CashierHeartbeat(BaseModel):
+    status: Optional[CashierStatusEnum] = None  # None keeps the current status
+
+
+class CashierPresence(BaseModel):
+    cashier_id: int
+    status: CashierStatusEnum
+    changed: bool
+    ttl_seconds: int  # heartbeat again before this runs out
+
+
+class PointPresence(BaseModel):
+    """Cashiers with a live console session; absent cashiers are offline"""
+    point_id: int
+    cashiers: Dict[int, CashierStatusEnum] = {}
+
+
 class CashierCurrentOrders(BaseModel):
     cashier_id: int
     current_orders: List["OrderPublic"] = []
@@ -0,0 +1,35 @@
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
+from enum import Enum
+
+
+class ExportFormatEnum(str, Enum):
+    CSV = "csv"
+    NDJSON = "ndjson"
+
+
+class ExportJobStatusEnum(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class ExportRequest(BaseModel):
+    format: ExportFormatEnum = ExportFormatEnum.CSV
+    gzip: bool = False
+    since: Optional[datetime] = None  # orders created at or after
+    until: Optional[datetime] = None  # orders created before
+
+
+class ExportJob(BaseModel):
+    """Export running in the background worker"""
+    id: str
+    point_id: int
+    status: ExportJobStatusEnum
+    format: ExportFormatEnum
+    gzip: bool
+    rows: int = 0
+    error: Optional[str] = None
+    download_url: Optional[str] = None
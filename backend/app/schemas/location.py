@@ -0,0 +1,28 @@
+from pydantic import BaseModel, Field, field_validator
+from typing import Optional, List
+from datetime import datetime, timezone
+
+
+def _assume_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Timestamps without an offset are taken as UTC"""
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class LocationPing(BaseModel):
+    latitude: float = Field(..., ge=-90, le=90)
+    longitude: float = Field(..., ge=-180, le=180)
+    accuracy_m: Optional[float] = Field(None, ge=0)
+    recorded_at: Optional[datetime] = None
+
+    _check_recorded_at = field_validator("recorded_at")(_assume_utc)
+
+
+class LocationPingBatch(BaseModel):
+    """Pings collected by the app since its last upload, oldest first"""
+    pings: List[LocationPing] = Field(..., min_length=1, max_length=100)
+
+
+class LocationPingAck(BaseModel):
+    accepted: int
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Dict, Optional, List
 from datetime import datetime
 from enum import Enum
 
@@ -36,6 +36,7 @@ class OrderInDB(OrderBase):
     order_number: str
     order_type: OrderTypeEnum
     scheduled_time: Optional[datetime] = None
+    arrived_at: Optional[datetime] = None
     current_status_id: Optional[int] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
@@ -77,7 +78,7 @@ class OrderWithDetails(OrderInDB):
 class OrderStatusBase(BaseModel):
     name: str = Field(..., min_length=1, max_length=100)
     description: Optional[str] = None
-    color: str = Field("#007AFF", regex=r"^#[0-9A-Fa-f]{6}$")
+    color: str = Field("#007AFF", pattern=r"^#[0-9A-Fa-f]{6}$")
 
 
 class OrderStatusCreate(OrderStatusBase):
@@ -89,7 +90,7 @@ class OrderStatusCreate(OrderStatusBase):
 class OrderStatusUpdate(BaseModel):
     name: Optional[str] = Field(None, min_length=1, max_length=100)
     description: Optional[str] = None
-    color: Optional[str] = Field(None, regex=r"^#[0-9A-Fa-f]{6}$")
+    color: Optional[str] = Field(None, pattern=r"^#[0-9A-Fa-f]{6}$")
     order_index: Optional[int] = None
     is_final: Optional[bool] = None
     is_active: Optional[bool] = None
@@ -181,6 +182,27 @@ class QueueStatus(BaseModel):
     queue: List[QueuePosition] = []
 
 
+class ActiveOrder(BaseModel):
+    """One of the user's non-final orders, as shown on the home screen"""
+    id: int
+    order_number: str
+    point_id: int
+    point_name: Optional[str] = None
+    order_type: OrderTypeEnum
+    scheduled_time: Optional[datetime] = None
+    created_at: Optional[datetime] = None
+    status: Optional[OrderStatusPublic] = None
+    position: Optional[int] = None  # immediate orders ahead + 1, as of the last change
+
+
+class PointQueueCounts(BaseModel):
+    """Live orders of a point by status id and by assigned cashier id (final statuses aren't counted)"""
+    point_id: int
+    total: int = 0
+    statuses: Dict[int, int] = {}
+    cashiers: Dict[int, int] = {}
+
+
 class OrderStatusTransition(BaseModel):
     order_id: int
     new_status_id: int
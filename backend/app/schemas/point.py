@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from typing import Optional, Dict, Any, List
 from datetime import datetime, time
 from enum import Enum
@@ -25,9 +25,36 @@ class PointBase(BaseModel):
     longitude: Optional[float] = Field(None, ge=-180, le=180)
 
 
+def _validate_timezone(value: Optional[str]) -> Optional[str]:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+    if value is None:
+        return value
+    try:
+        ZoneInfo(value)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown timezone: {value}")
+    return value
+
+
+def _validate_working_hours(value: Optional[Dict[str, Dict[str, Any]]]) -> Optional[Dict[str, Dict[str, Any]]]:
+    """Reject schedules the working hours index can't compile (422 instead of a failed flush)"""
+    from app.services.working_hours import compile_working_hours
+
+    try:
+        compile_working_hours(value)
+    except KeyError as exc:
+        raise ValueError(f"Working hours day is missing {exc}")
+    except (AttributeError, TypeError, ValueError) as exc:
+        raise ValueError(f"Invalid working hours: {exc}")
+    return value
+
+
 class PointCreate(PointBase):
+    external_id: Optional[str] = Field(None, max_length=100)  # Owner's own id for bulk imports
     # Working hours as dict: {"monday": {"start": "09:00", "end": "18:00", "is_closed": false}, ...}
     working_hours: Optional[Dict[str, Dict[str, Any]]] = None
+    timezone: str = Field("UTC", max_length=64)  # IANA name, working hours are local time
     
     # Queue settings
     accepts_online_orders: bool = True
@@ -42,8 +69,12 @@ class PointCreate(PointBase):
     enable_qr_code: bool = True
     require_phone_verification: bool = False
 
+    _check_timezone = field_validator("timezone")(_validate_timezone)
+    _check_working_hours = field_validator("working_hours")(_validate_working_hours)
+
 
 class PointUpdate(BaseModel):
+    external_id: Optional[str] = Field(None, max_length=100)
     name: Optional[str] = Field(None, min_length=1, max_length=255)
     description: Optional[str] = None
     detailed_description: Optional[str] = None
@@ -52,6 +83,7 @@ class PointUpdate(BaseModel):
     longitude: Optional[float] = Field(None, ge=-180, le=180)
     status: Optional[PointStatusEnum] = None
     working_hours: Optional[Dict[str, Dict[str, Any]]] = None
+    timezone: Optional[str] = Field(None, max_length=64)
     accepts_online_orders: Optional[bool] = None
     accepts_scheduled_orders: Optional[bool] = None
     slot_duration_minutes: Optional[int] = Field(None, ge=15, le=120)
@@ -60,12 +92,17 @@ class PointUpdate(BaseModel):
     enable_qr_code: Optional[bool] = None
     require_phone_verification: Optional[bool] = None
 
+    _check_timezone = field_validator("timezone")(_validate_timezone)
+    _check_working_hours = field_validator("working_hours")(_validate_working_hours)
+
 
 class PointInDB(PointBase):
     id: int
     owner_id: int
+    external_id: Optional[str] = None
     status: PointStatusEnum
     working_hours: Optional[Dict[str, Any]] = None
+    timezone: Optional[str] = "UTC"
     accepts_online_orders: bool
     accepts_scheduled_orders: bool
     slot_duration_minutes: int
@@ -94,6 +131,7 @@ class PointPublic(BaseModel):
     longitude: Optional[float] = None
     status: PointStatusEnum
     working_hours: Optional[Dict[str, Any]] = None
+    timezone: Optional[str] = "UTC"
     accepts_online_orders: bool
     accepts_scheduled_orders: bool
 
@@ -123,6 +161,14 @@ class PointSearchFilters(BaseModel):
     status: Optional[PointStatusEnum] = None
     accepts_online_orders: Optional[bool] = None
     accepts_scheduled_orders: Optional[bool] = None
+    open_now: Optional[bool] = None
+    limit: int = Field(20, ge=1, le=100)
+
+
+class PointSearchResult(PointPublic):
+    """Search hit with relevance score and distance from the requested location"""
+    score: float = 0.0
+    distance_km: Optional[float] = None
 
 
 # Forward reference resolution
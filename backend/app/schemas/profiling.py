@@ -0,0 +1,25 @@
+from pydantic import BaseModel
+from typing import Dict
+from datetime import datetime
+
+
+class ProfileTraceSummary(BaseModel):
+    id: str
+    mode: str  # on_demand or sampled
+    route: str  # "METHOD /path/{param}"
+    path: str
+    status_code: int
+    started_at: datetime
+    duration_ms: float
+    db_ms: float  # waiting on Postgres
+    db_queries: int
+    redis_ms: float  # waiting on Redis
+    redis_calls: int
+    other_ms: float  # neither: Python code, other awaits
+    samples: int
+
+
+class ProfileTrace(ProfileTraceSummary):
+    """Profiled request with its statistical call tree"""
+    sample_interval_ms: float
+    stacks: Dict[str, int]  # folded call stack ("outer;...;inner") -> samples
@@ -0,0 +1,74 @@
+from pydantic import BaseModel, Field, conint
+from typing import List, Optional
+from enum import Enum
+
+
+class SimulationJobStatusEnum(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class SimulationRequest(BaseModel):
+    """Staffing and slot configurations to try; every combination is one scenario"""
+    cashiers: List[conint(ge=1)] = Field([1, 2, 3, 4], min_length=1)
+    max_concurrent_orders: List[conint(ge=1)] = Field([1], min_length=1)
+    slot_duration_minutes: List[conint(ge=1, le=1440)] = Field([30], min_length=1)
+    slots_per_interval: List[conint(ge=0)] = Field([5], min_length=1)
+    replications: int = Field(50, ge=1, le=1000)  # simulated days per scenario
+    history_days: int = Field(28, ge=1, le=365)  # orders used to fit the distributions
+    weekday: Optional[int] = Field(None, ge=0, le=6)  # 0 = Monday; None fits all days together
+    target_wait_minutes: float = Field(10.0, gt=0)  # p90 wait a recommended scenario must meet
+    seed: Optional[int] = None
+
+
+class ArrivalFit(BaseModel):
+    orders: int  # orders in the history window
+    days: float  # days the hourly rates are averaged over
+    hourly_rate: List[float]  # orders per hour by local hour of day
+    scheduled_share: float  # part of the demand booking time slots
+
+
+class ServiceFit(BaseModel):
+    samples: int  # orders with a measured service time (0: defaults used)
+    distribution: str = "lognormal"
+    mu: float
+    sigma: float
+    mean_minutes: float
+    p50_minutes: float
+    p90_minutes: float
+
+
+class ScenarioResult(BaseModel):
+    cashiers: int
+    max_concurrent_orders: int
+    slot_duration_minutes: int
+    slots_per_interval: int
+    orders_per_day: float
+    turned_away_per_day: float  # slot bookings beyond slots_per_interval
+    wait_p50_minutes: float
+    wait_p90_minutes: float
+    wait_p95_minutes: float
+    wait_p99_minutes: float
+    utilization: float  # service time / capacity over open hours, above 1 the queue never clears
+
+
+class SimulationResult(BaseModel):
+    point_id: int
+    arrivals: ArrivalFit
+    service: ServiceFit
+    replications: int
+    scenarios: List[ScenarioResult] = []
+    recommended: Optional[ScenarioResult] = None  # fewest cashiers meeting the target wait
+    elapsed_seconds: float
+
+
+class SimulationJob(BaseModel):
+    """Simulation running in the background worker"""
+    id: str
+    point_id: int
+    status: SimulationJobStatusEnum
+    scenarios: int
+    error: Optional[str] = None
+    result: Optional[SimulationResult] = None
@@ -0,0 +1,38 @@
+from pydantic import BaseModel
+from typing import Optional, Dict, Any, List
+from enum import Enum
+
+
+class ChangeKindEnum(str, Enum):
+    ORDER = "order"
+    CASHIER = "cashier"
+    STATUS = "status"
+
+
+class ChangeOpEnum(str, Enum):
+    UPSERT = "upsert"
+    DELETE = "delete"  # order left the live queue (final status)
+
+
+class PointChange(BaseModel):
+    """One compact delta in a point's change feed"""
+    seq: int
+    kind: ChangeKindEnum
+    op: ChangeOpEnum
+    id: int
+    data: Optional[Dict[str, Any]] = None
+
+
+class PointSnapshot(BaseModel):
+    """Full live state of a point, sent when a client is too far behind"""
+    orders: List[Dict[str, Any]] = []
+    cashiers: List[Dict[str, Any]] = []
+    statuses: List[Dict[str, Any]] = []
+
+
+class PointChanges(BaseModel):
+    point_id: int
+    seq: int  # pass as ?since= on the next poll
+    changes: List[PointChange] = []
+    has_more: bool = False
+    snapshot: Optional[PointSnapshot] = None
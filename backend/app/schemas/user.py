@@ -63,9 +63,15 @@ class Token(BaseModel):
     access_token: str
     token_type: str = "bearer"
     expires_in: int
+    refresh_token: str
+    refresh_expires_in: int
     user: User
 
 
+class TokenRefresh(BaseModel):
+    refresh_token: str
+
+
 class TokenData(BaseModel):
     email: Optional[str] = None
 
@@ -79,6 +85,15 @@ class PasswordResetConfirm(BaseModel):
     new_password: str = Field(..., min_length=8)
 
 
+class EmailVerification(BaseModel):
+    token: str
+
+
+class PushDeviceRegister(BaseModel):
+    token: str = Field(..., min_length=1, max_length=255)
+    platform: Optional[str] = Field(None, max_length=16)  # ios, android, web
+
+
 class OAuthLoginRequest(BaseModel):
     provider: AuthProviderEnum
     access_token: str  # OAuth access token from client
@@ -0,0 +1,227 @@
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.core.config import settings
+from app.core.database import redis_client
+from app.core.encoding import shared_payload
+from app.core.metrics import Counter
+from app.core.redis_layer import autopipeline
+from app.models.order import Order, OrderStatus, OrderStatusHistory, OrderTypeEnum
+from app.schemas.order import ActiveOrder
+from app.services.point import PointService
+
+
+logger = logging.getLogger(__name__)
+
+COMPLETE_FIELD = "_complete"  # set once the hash was rebuilt from Postgres
+
+# Versioned upsert of order entries ("version|json", "version|" = finalized).
+# An entry only replaces an older version, so out-of-order or duplicate
+# events can't resurrect or roll back an order. ARGV[1] ttl, ARGV[2] '1' to
+# mark the hash complete, then (order_id, version, json or '') triplets.
+_APPLY_SCRIPT = """
+local applied = 0
+for i = 3, #ARGV, 3 do
+    local current = redis.call('HGET', KEYS[1], ARGV[i])
+    local version = current and tonumber(string.match(current, '^(%d+)|')) or -1
+    if tonumber(ARGV[i + 1]) > version then
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1] .. '|' .. ARGV[i + 2])
+        applied = applied + 1
+    end
+end
+if ARGV[2] == '1' then
+    redis.call('HSET', KEYS[1], '_complete', '1')
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+elseif redis.call('TTL', KEYS[1]) == -1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return applied
+"""
+
+_apply = redis_client.register_script(_APPLY_SCRIPT)
+
+# Events that change a user's active orders; their payloads carry "v"
+INDEX_EVENTS = ("order.created", "order.status_changed", "order.finalized")
+
+lookups_total = Counter("active_orders_lookups_total", "Active orders index reads", ("outcome",))
+
+
+def _entry(order_id: int, point_id: int, payload: Dict[str, Any]) -> str:
+    return json.dumps({
+        "id": order_id,
+        "point_id": point_id,
+        "number": payload["number"],
+        "status_id": payload["status_id"],
+        "type": payload["type"],
+        "scheduled_time": payload["scheduled_time"],
+        "created_at": payload["created_at"],
+        "position": payload.get("position"),
+    }, separators=(",", ":"))
+
+
+class ActiveOrdersIndex:
+    """Per-user index of non-final orders in a Redis hash, for the home screen.
+
+    The outbox relay applies ``order.created`` / ``order.status_changed`` /
+    ``order.finalized`` events to ``user:{id}:active_orders`` in the same
+    pipeline it publishes them with. Entries are versioned by the order's
+    latest status history id, which only grows since transitions of an order
+    are serialized by its row lock, so replays and reordering between relays
+    are harmless. A hash without the ``_complete`` marker (new, expired after
+    ``ACTIVE_ORDERS_TTL_SECONDS``, or only partially written by events) is a
+    miss: it is rebuilt from Postgres and merged by the same version rule.
+    """
+
+    @staticmethod
+    def key(user_id: int) -> str:
+        return f"user:{user_id}:active_orders"
+
+    @staticmethod
+    async def queue_event(pipe, row) -> None:
+        """Add the index update of an outbox event row to the relay's pipeline"""
+        entry = "" if row.event_type == "order.finalized" else _entry(row.entity_id, row.point_id, row.payload)
+        await _apply(
+            keys=[ActiveOrdersIndex.key(row.user_id)],
+            args=[settings.ACTIVE_ORDERS_TTL_SECONDS, "0", row.entity_id, row.payload["v"], entry],
+            client=pipe,
+        )
+
+    @staticmethod
+    def queue_position(order_id_column, point_id_column):
+        """Scalar subquery: immediate non-final orders of the point up to this one"""
+        ahead = aliased(Order)
+        return (
+            select(func.count())
+            .where(
+                ahead.point_id == point_id_column,
+                ahead.id <= order_id_column,
+                ahead.order_type == OrderTypeEnum.IMMEDIATE,
+                ahead.current_status_id.in_(
+                    select(OrderStatus.id).where(
+                        OrderStatus.point_id == point_id_column, OrderStatus.is_final.is_(False)
+                    )
+                ),
+            )
+            .scalar_subquery()
+        )
+
+    @staticmethod
+    async def position(db: AsyncSession, order: Order) -> Optional[int]:
+        """Current queue position of an immediate order (call before committing a change)"""
+        if order.order_type != OrderTypeEnum.IMMEDIATE:
+            return None
+        return await db.scalar(select(ActiveOrdersIndex.queue_position(order.id, order.point_id)))
+
+    @staticmethod
+    async def _load(db: AsyncSession, user_id: int, known_ids: Iterable[int]) -> List[Tuple[int, int, str]]:
+        """(order_id, version, entry or '') for the user's active orders and ``known_ids``"""
+        version = (
+            select(func.max(OrderStatusHistory.id))
+            .where(OrderStatusHistory.order_id == Order.id)
+            .scalar_subquery()
+        )
+        position = ActiveOrdersIndex.queue_position(Order.id, Order.point_id)
+        rows = (await db.execute(
+            select(Order, OrderStatus.is_final, version, position)
+            .join(OrderStatus, OrderStatus.id == Order.current_status_id)
+            .where(
+                Order.user_id == user_id,
+                or_(OrderStatus.is_final.is_(False), Order.id.in_(list(known_ids))),
+            )
+        )).all()
+
+        items = []
+        for order, is_final, order_version, order_position in rows:
+            if is_final:
+                items.append((order.id, order_version or 0, ""))
+                continue
+            items.append((order.id, order_version or 0, _entry(order.id, order.point_id, {
+                "number": order.order_number,
+                "status_id": order.current_status_id,
+                "type": order.order_type.value,
+                "scheduled_time": order.scheduled_time.isoformat() if order.scheduled_time else None,
+                "created_at": order.created_at.isoformat() if order.created_at else None,
+                "position": order_position if order.order_type == OrderTypeEnum.IMMEDIATE else None,
+            })))
+        return items
+
+    @staticmethod
+    async def repair(db: AsyncSession, user_id: int, known_ids: Iterable[int] = ()) -> Dict[str, str]:
+        """Rebuild the user's index from Postgres, return the merged hash"""
+        items = await ActiveOrdersIndex._load(db, user_id, known_ids)
+        args: List[Any] = [settings.ACTIVE_ORDERS_TTL_SECONDS, "1"]
+        for item in items:
+            args.extend(item)
+        key = ActiveOrdersIndex.key(user_id)
+        pipe = redis_client.pipeline(transaction=False)
+        await _apply(keys=[key], args=args, client=pipe)
+        pipe.hgetall(key)
+        _, merged = await pipe.execute()
+        return merged
+
+    @staticmethod
+    async def _statuses(db: AsyncSession, point_id: int) -> Dict[int, Dict[str, Any]]:
+        payload = await shared_payload(
+            PointService.statuses_key(point_id), lambda: PointService.get_public_statuses(db, point_id)
+        )
+        return {entry["id"]: entry for entry in payload.content}
+
+    @staticmethod
+    async def _point_name(db: AsyncSession, point_id: int) -> Optional[str]:
+        try:
+            payload = await shared_payload(
+                PointService.public_key(point_id), lambda: PointService.get_public_point(db, point_id)
+            )
+        except HTTPException:
+            return None
+        return payload.content["name"]
+
+    @staticmethod
+    async def get(db: AsyncSession, user_id: int) -> List[ActiveOrder]:
+        """The user's non-final orders, oldest first: one HGETALL, Postgres on a miss"""
+        raw = await autopipeline.hgetall(ActiveOrdersIndex.key(user_id))
+        if COMPLETE_FIELD in raw:
+            lookups_total.inc(outcome="hit")
+        else:
+            lookups_total.inc(outcome="miss")
+            known = [int(field) for field in raw if field != COMPLETE_FIELD]
+            raw = await ActiveOrdersIndex.repair(db, user_id, known)
+
+        entries = []
+        for field, value in raw.items():
+            if field == COMPLETE_FIELD:
+                continue
+            _, _, entry = value.partition("|")
+            if entry:
+                entries.append(json.loads(entry))
+        if not entries:
+            return []
+
+        # Point cards and workflows come from the process-local client cache
+        # (one at a time: a miss loads through the request's session)
+        statuses, names = {}, {}
+        for point_id in sorted({entry["point_id"] for entry in entries}):
+            statuses[point_id] = await ActiveOrdersIndex._statuses(db, point_id)
+            names[point_id] = await ActiveOrdersIndex._point_name(db, point_id)
+
+        entries.sort(key=lambda entry: entry["id"])
+        return [
+            ActiveOrder(
+                id=entry["id"],
+                order_number=entry["number"],
+                point_id=entry["point_id"],
+                point_name=names[entry["point_id"]],
+                order_type=entry["type"],
+                scheduled_time=entry["scheduled_time"],
+                created_at=entry["created_at"],
+                status=statuses[entry["point_id"]].get(entry["status_id"]),
+                position=entry["position"],
+            )
+            for entry in entries
+        ]
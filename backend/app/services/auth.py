@@ -1,20 +1,27 @@
+import time
+from datetime import timedelta
 from typing import Optional, Dict, Any
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-import httpx
 
 from app.models.user import User, AuthProviderEnum
-from app.schemas.user import UserCreate, UserLogin, OAuthLoginRequest
+from app.schemas.user import UserCreate, UserLogin, OAuthLoginRequest, Token
+from app.schemas.user import User as UserSchema
 from app.core.security import (
     verify_password, 
     get_password_hash, 
     create_access_token,
-    verify_token
+    create_refresh_token,
+    new_token_id,
+    verify_token,
+    verify_email_verification_token,
 )
-from app.core.database import get_db
+from app.core.database import get_db, redis_client
 from app.core.config import settings
+from app.core.revocation import revocations
+from app.services.write_behind import touch_last_login
 
 
 security = HTTPBearer()
@@ -46,6 +53,7 @@ class AuthService:
                 detail="Inactive user"
             )
         
+        touch_last_login(user.id)
         return user
     
     @staticmethod
@@ -117,6 +125,7 @@ class AuthService:
             user.avatar_url = user_info.get("picture", user.avatar_url)
             await db.commit()
             await db.refresh(user)
+            touch_last_login(user.id)
             return user
         
         # Create new user
@@ -133,6 +142,9 @@ class AuthService:
     @staticmethod
     async def _verify_google_token(access_token: str) -> Optional[Dict[str, Any]]:
         """Verify Google OAuth token"""
+        # httpx is only needed for OAuth logins, keep it off the startup path
+        import httpx
+
         try:
             async with httpx.AsyncClient() as client:
                 response = await client.get(
@@ -149,6 +161,8 @@ class AuthService:
     @staticmethod
     async def _verify_facebook_token(access_token: str) -> Optional[Dict[str, Any]]:
         """Verify Facebook OAuth token"""
+        import httpx
+
         try:
             async with httpx.AsyncClient() as client:
                 response = await client.get(
@@ -165,6 +179,161 @@ class AuthService:
         except Exception:
             return None
     
+    @staticmethod
+    def families_key(user_id: int) -> str:
+        return f"auth:user:{user_id}:families"
+
+    @staticmethod
+    def refresh_used_key(jti: str) -> str:
+        return f"auth:refresh:{jti}"
+
+    @staticmethod
+    def reset_used_key(jti: str) -> str:
+        return f"auth:reset:{jti}"
+
+    @staticmethod
+    async def issue_tokens(user: User, family: Optional[str] = None) -> Token:
+        """Access + refresh token pair; ``family`` continues a rotated session"""
+        family = family or new_token_id()
+        refresh_lifetime = settings.REFRESH_TOKEN_EXPIRE_DAYS * 24 * 3600
+        access_token = create_access_token(
+            data={"sub": user.email, "type": "access", "fam": family},
+            expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES),
+        )
+        refresh_token = create_refresh_token({"sub": user.email, "fam": family})
+
+        # Sessions of the user, for revoking all of them
+        key = AuthService.families_key(user.id)
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.zadd(key, {family: time.time() + refresh_lifetime})
+        pipe.zremrangebyscore(key, "-inf", time.time())
+        pipe.expire(key, refresh_lifetime)
+        await pipe.execute()
+
+        return Token(
+            access_token=access_token,
+            token_type="bearer",
+            expires_in=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+            refresh_token=refresh_token,
+            refresh_expires_in=refresh_lifetime,
+            user=UserSchema.from_orm(user),
+        )
+
+    @staticmethod
+    async def refresh_tokens(db: AsyncSession, refresh_token: str) -> Token:
+        """Rotate a refresh token: each one works once, reuse ends its session"""
+        payload = verify_token(refresh_token)
+        jti, family, email = payload.get("jti"), payload.get("fam"), payload.get("sub")
+        if payload.get("type") != "refresh" or not jti or not family or email is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials"
+            )
+        if await revocations.is_revoked(family):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Session has been revoked"
+            )
+
+        first_use = await redis_client.set(
+            AuthService.refresh_used_key(jti), "1", nx=True, exat=int(payload["exp"])
+        )
+        if not first_use:
+            # A rotated-out token came back: it may have been stolen, so end
+            # the session for both holders
+            await AuthService.revoke_family(family)
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Refresh token was already used"
+            )
+
+        result = await db.execute(select(User).where(User.email == email))
+        user = result.scalar_one_or_none()
+        if user is None or not user.is_active:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials"
+            )
+        return await AuthService.issue_tokens(user, family)
+
+    @staticmethod
+    async def revoke_family(family: str) -> None:
+        """End a session: its refresh token and every access token issued with it"""
+        await revocations.revoke(family, time.time() + settings.REFRESH_TOKEN_EXPIRE_DAYS * 24 * 3600)
+
+    @staticmethod
+    async def logout(access_token: str) -> None:
+        """Revoke the session the access token belongs to"""
+        payload = verify_token(access_token)
+        if payload.get("jti"):
+            await revocations.revoke(payload["jti"], payload["exp"])
+        if payload.get("fam"):
+            await AuthService.revoke_family(payload["fam"])
+
+    @staticmethod
+    async def logout_all(user_id: int) -> int:
+        """Revoke every session of the user, return how many were live"""
+        families = await redis_client.zrangebyscore(AuthService.families_key(user_id), time.time(), "+inf")
+        for family in families:
+            await AuthService.revoke_family(family)
+        await redis_client.delete(AuthService.families_key(user_id))
+        return len(families)
+
+    @staticmethod
+    async def verify_email(db: AsyncSession, token: str) -> User:
+        """Mark the email from a verification link as verified"""
+        email = verify_email_verification_token(token)
+        user = None
+        if email is not None:
+            result = await db.execute(select(User).where(User.email == email))
+            user = result.scalar_one_or_none()
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid or expired verification link"
+            )
+        if not user.is_verified:
+            user.is_verified = True
+            await db.commit()
+        return user
+
+    @staticmethod
+    async def request_password_reset(db: AsyncSession, email: str) -> None:
+        """Queue a reset link if an email account exists (the caller can't tell)"""
+        from app.services.notifications import NotificationService
+
+        result = await db.execute(select(User).where(User.email == email))
+        user = result.scalar_one_or_none()
+        if user is not None and user.is_active and user.auth_provider == AuthProviderEnum.EMAIL:
+            await NotificationService.send_password_reset_email(user.email)
+
+    @staticmethod
+    async def reset_password(db: AsyncSession, token: str, new_password: str) -> None:
+        """Set a new password from a reset link (once) and end every session"""
+        invalid = HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid or expired reset link"
+        )
+        try:
+            payload = verify_token(token)
+        except HTTPException:
+            raise invalid
+        if payload.get("type") != "password_reset" or not payload.get("jti") or payload.get("sub") is None:
+            raise invalid
+        result = await db.execute(select(User).where(User.email == payload["sub"]))
+        user = result.scalar_one_or_none()
+        if user is None or user.auth_provider != AuthProviderEnum.EMAIL:
+            raise invalid
+
+        first_use = await redis_client.set(
+            AuthService.reset_used_key(payload["jti"]), "1", nx=True, exat=int(payload["exp"])
+        )
+        if not first_use:
+            raise invalid
+        user.hashed_password = get_password_hash(new_password)
+        await db.commit()
+        await AuthService.logout_all(user.id)
+
     @staticmethod
     async def get_current_user(
         credentials: HTTPAuthorizationCredentials = Depends(security),
@@ -175,7 +344,14 @@ class AuthService:
             payload = verify_token(credentials.credentials)
             email: str = payload.get("sub")
             
-            if email is None:
+            # Only access tokens that can be revoked (per token and per
+            # session family); older untyped tokens make the client log in again
+            if (
+                email is None
+                or payload.get("type") != "access"
+                or not payload.get("jti")
+                or not payload.get("fam")
+            ):
                 raise HTTPException(
                     status_code=status.HTTP_401_UNAUTHORIZED,
                     detail="Could not validate credentials"
@@ -186,6 +362,13 @@ class AuthService:
                 detail="Could not validate credentials"
             )
         
+        # Bloom filter lookup; Redis only on a hit
+        if await revocations.is_revoked(payload["jti"], payload["fam"]):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Token has been revoked"
+            )
+        
         result = await db.execute(select(User).where(User.email == email))
         user = result.scalar_one_or_none()
         
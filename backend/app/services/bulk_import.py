@@ -0,0 +1,456 @@
+import csv
+import io
+import json
+import re
+from typing import Any, Callable, Collection, Dict, List, Optional, Sequence, Tuple
+from zoneinfo import available_timezones
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.point import PointStatusEnum
+from app.schemas.bulk_import import (
+    BulkImportRequest,
+    BulkImportResult,
+    ImportCounts,
+    ImportKindEnum,
+    ImportRowError,
+)
+from app.services.point import PointService
+from app.services.working_hours import compile_working_hours
+
+
+# Created for imported points that come without any statuses
+DEFAULT_STATUS_WORKFLOW = (
+    # name, color, order_index, is_final
+    ("в очереди", "#007AFF", 0, False),
+    ("обслуживается", "#FF9500", 1, False),
+    ("завершен", "#34C759", 2, True),
+    ("отменен", "#FF3B30", 3, True),
+)
+
+_TRUE = {"1", "true", "t", "yes", "y"}
+_FALSE = {"0", "false", "f", "no", "n", ""}
+_TIMEZONES = frozenset(available_timezones())
+_POINT_STATUSES = {status.value: status.name for status in PointStatusEnum}
+_COLOR = re.compile(r"^#[0-9A-Fa-f]{6}$")
+
+
+def _blank(value: Any) -> bool:
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+class _Columns:
+    """Column-wise validation of one kind of import rows.
+
+    Every check looks at a whole column at once (NumPy masks); a failing row
+    gets an error per failing field and is excluded from the load.
+    """
+
+    def __init__(self, kind: ImportKindEnum, rows: Sequence[Dict[str, Any]]):
+        self.kind = kind
+        self.rows = rows
+        self.size = len(rows)
+        self.valid = np.ones(self.size, dtype=bool)
+        self.errors: List[ImportRowError] = []
+
+    def fail(self, mask: np.ndarray, field: Optional[str], message: str) -> None:
+        for index in np.flatnonzero(mask):
+            self.errors.append(
+                ImportRowError(kind=self.kind, row=int(index) + 1, field=field, message=message)
+            )
+        self.valid &= ~mask
+
+    def raw(self, field: str) -> List[Any]:
+        return [row.get(field) for row in self.rows]
+
+    def convert(self, field: str, values: List[Any], convert: Callable[[Any], Any], message: str):
+        converted = [None] * self.size
+        bad = np.zeros(self.size, dtype=bool)
+        for index, value in enumerate(values):
+            if _blank(value):
+                continue
+            try:
+                converted[index] = convert(value)
+            except (TypeError, ValueError):
+                bad[index] = True
+        self.fail(bad, field, message)
+        return converted
+
+    def text(self, field: str, required: bool = False, max_length: Optional[int] = None) -> List[Optional[str]]:
+        values = [None if _blank(value) else str(value).strip() for value in self.raw(field)]
+        missing = np.fromiter((value is None for value in values), dtype=bool, count=self.size)
+        if required:
+            self.fail(missing, field, "Field is required")
+        if max_length is not None:
+            lengths = np.fromiter(
+                (len(value) if value is not None else 0 for value in values), dtype=np.int64, count=self.size
+            )
+            self.fail(lengths > max_length, field, f"Longer than {max_length} characters")
+        return values
+
+    def number(
+        self,
+        field: str,
+        cast: Callable[[Any], Any] = float,
+        minimum: Optional[float] = None,
+        maximum: Optional[float] = None,
+        default: Optional[float] = None,
+        message: str = "Not a number",
+    ) -> List[Any]:
+        values = self.convert(field, self.raw(field), cast, message)
+        array = np.array([np.nan if value is None else value for value in values], dtype=float)
+        out_of_range = np.zeros(self.size, dtype=bool)
+        if minimum is not None:
+            out_of_range |= array < minimum
+        if maximum is not None:
+            out_of_range |= array > maximum
+        self.fail(out_of_range, field, f"Must be between {minimum} and {maximum}")
+        if default is not None:
+            values = [default if value is None else value for value in values]
+        return values
+
+    def integer(self, field: str, minimum: int, maximum: int, default: int) -> List[int]:
+        def to_int(value: Any) -> int:
+            number = float(value)
+            if not number.is_integer():
+                raise ValueError(value)
+            return int(number)
+
+        return self.number(field, to_int, minimum, maximum, default, "Not an integer")
+
+    def boolean(self, field: str, default: bool) -> List[bool]:
+        def to_bool(value: Any) -> bool:
+            if isinstance(value, bool):
+                return value
+            text = str(value).strip().lower()
+            if text in _TRUE:
+                return True
+            if text in _FALSE:
+                return False
+            raise ValueError(value)
+
+        values = self.convert(field, self.raw(field), to_bool, "Not a boolean")
+        return [default if value is None else value for value in values]
+
+    def choice(self, field: str, choices: Dict[str, str], default: str) -> List[str]:
+        """Map allowed values (case-insensitive) to what the database stores"""
+        values = [default if _blank(value) else str(value).strip().lower() for value in self.raw(field)]
+        allowed = np.fromiter((value in choices for value in values), dtype=bool, count=self.size)
+        self.fail(~allowed, field, f"Must be one of: {', '.join(choices)}")
+        return [choices.get(value, value) for value in values]
+
+    def member(self, field: str, values: List[Optional[str]], allowed: Collection[str]) -> None:
+        bad = np.fromiter(
+            (value is not None and value not in allowed for value in values), dtype=bool, count=self.size
+        )
+        self.fail(bad, field, f"Unknown {field}")
+
+    def matches(self, field: str, values: List[Optional[str]], pattern: "re.Pattern", message: str) -> None:
+        bad = np.fromiter(
+            (value is not None and not pattern.match(value) for value in values), dtype=bool, count=self.size
+        )
+        self.fail(bad, field, message)
+
+    def unique(self, fields: Tuple[str, ...], *columns: List[Any]) -> None:
+        """Reject valid rows repeating the key of an earlier valid row"""
+        candidates = np.flatnonzero(self.valid)
+        if not len(candidates):
+            return
+        keys = np.array(
+            ["\x1f".join(map(str, key)) for key in zip(*columns)], dtype=object
+        )[candidates]
+        _, first = np.unique(keys, return_index=True)
+        duplicate = np.zeros(self.size, dtype=bool)
+        duplicate[candidates] = True
+        duplicate[candidates[first]] = False
+        self.fail(duplicate, ",".join(fields), "Duplicate row in this import")
+
+    def records(self, *columns: List[Any]) -> List[tuple]:
+        """Valid rows as COPY records, prefixed with the 1-based row number"""
+        rows = zip(range(1, self.size + 1), *columns)
+        return [row for row, ok in zip(rows, self.valid.tolist()) if ok]
+
+
+class _WorkingHours:
+    """Parses and compiles working hours, once per distinct schedule"""
+
+    def __init__(self):
+        self._compiled: Dict[str, Tuple[Optional[str], Optional[bytes]]] = {}
+
+    def __call__(self, value: Any) -> Tuple[Optional[str], Optional[bytes]]:
+        text = value if isinstance(value, str) else json.dumps(value, sort_keys=True)
+        if text not in self._compiled:
+            hours = json.loads(text)
+            if not isinstance(hours, dict):
+                raise ValueError(text)
+            try:
+                bitmap = compile_working_hours(hours)
+            except (KeyError, AttributeError) as exc:
+                raise ValueError(text) from exc
+            self._compiled[text] = (json.dumps(hours), bitmap)
+        return self._compiled[text]
+
+
+POINT_COLUMNS = (
+    "row_no", "external_id", "name", "description", "detailed_description", "address",
+    "latitude", "longitude", "status", "working_hours", "timezone", "working_hours_bitmap",
+    "accepts_online_orders", "accepts_scheduled_orders", "slot_duration_minutes",
+    "slots_per_interval", "advance_booking_days", "enable_qr_code", "require_phone_verification",
+)
+CASHIER_COLUMNS = ("row_no", "point_external_id", "number", "name", "max_concurrent_orders")
+STATUS_COLUMNS = (
+    "row_no", "point_external_id", "name", "description", "color", "order_index", "is_final",
+)
+
+_STAGING_DDL = (
+    """
+    CREATE TEMP TABLE import_points (
+        row_no integer, external_id text, name text, description text,
+        detailed_description text, address text, latitude double precision,
+        longitude double precision, status text, working_hours json, timezone text,
+        working_hours_bitmap bytea, accepts_online_orders boolean,
+        accepts_scheduled_orders boolean, slot_duration_minutes integer,
+        slots_per_interval integer, advance_booking_days integer, enable_qr_code boolean,
+        require_phone_verification boolean
+    ) ON COMMIT DROP
+    """,
+    """
+    CREATE TEMP TABLE import_cashiers (
+        row_no integer, point_external_id text, number text, name text,
+        max_concurrent_orders integer
+    ) ON COMMIT DROP
+    """,
+    """
+    CREATE TEMP TABLE import_statuses (
+        row_no integer, point_external_id text, name text, description text, color text,
+        order_index integer, is_final boolean
+    ) ON COMMIT DROP
+    """,
+)
+
+_UPSERT_POINTS = """
+INSERT INTO points (
+    owner_id, external_id, name, description, detailed_description, address, latitude,
+    longitude, status, working_hours, timezone, working_hours_bitmap, accepts_online_orders,
+    accepts_scheduled_orders, slot_duration_minutes, slots_per_interval, advance_booking_days,
+    enable_qr_code, require_phone_verification
+)
+SELECT
+    $1, external_id, name, description, detailed_description, address, latitude,
+    longitude, status::pointstatusenum, working_hours, timezone, working_hours_bitmap,
+    accepts_online_orders, accepts_scheduled_orders, slot_duration_minutes,
+    slots_per_interval, advance_booking_days, enable_qr_code, require_phone_verification
+FROM import_points
+ON CONFLICT (owner_id, external_id) DO UPDATE SET
+    name = EXCLUDED.name,
+    description = EXCLUDED.description,
+    detailed_description = EXCLUDED.detailed_description,
+    address = EXCLUDED.address,
+    latitude = EXCLUDED.latitude,
+    longitude = EXCLUDED.longitude,
+    status = EXCLUDED.status,
+    working_hours = EXCLUDED.working_hours,
+    timezone = EXCLUDED.timezone,
+    working_hours_bitmap = EXCLUDED.working_hours_bitmap,
+    accepts_online_orders = EXCLUDED.accepts_online_orders,
+    accepts_scheduled_orders = EXCLUDED.accepts_scheduled_orders,
+    slot_duration_minutes = EXCLUDED.slot_duration_minutes,
+    slots_per_interval = EXCLUDED.slots_per_interval,
+    advance_booking_days = EXCLUDED.advance_booking_days,
+    enable_qr_code = EXCLUDED.enable_qr_code,
+    require_phone_verification = EXCLUDED.require_phone_verification,
+    updated_at = now()
+RETURNING (xmax = 0) AS inserted
+"""
+
+# Rows whose point is neither in this import nor already owned by the user
+_ORPHANS = """
+SELECT s.row_no FROM {table} s
+LEFT JOIN points p ON p.owner_id = $1 AND p.external_id = s.point_external_id
+WHERE p.id IS NULL
+ORDER BY s.row_no
+"""
+
+_UPSERT_CASHIERS = """
+INSERT INTO cashiers (point_id, number, name, status, is_active, max_concurrent_orders)
+SELECT p.id, s.number, s.name, 'AVAILABLE'::cashierstatusenum, true, s.max_concurrent_orders
+FROM import_cashiers s
+JOIN points p ON p.owner_id = $1 AND p.external_id = s.point_external_id
+ON CONFLICT (point_id, number) DO UPDATE SET
+    name = EXCLUDED.name,
+    max_concurrent_orders = EXCLUDED.max_concurrent_orders,
+    updated_at = now()
+RETURNING (xmax = 0) AS inserted
+"""
+
+_UPSERT_STATUSES = """
+INSERT INTO order_statuses (point_id, name, description, color, order_index, is_final, is_active)
+SELECT p.id, s.name, s.description, s.color, s.order_index, s.is_final, true
+FROM import_statuses s
+JOIN points p ON p.owner_id = $1 AND p.external_id = s.point_external_id
+ON CONFLICT (point_id, name) DO UPDATE SET
+    description = EXCLUDED.description,
+    color = EXCLUDED.color,
+    order_index = EXCLUDED.order_index,
+    is_final = EXCLUDED.is_final,
+    updated_at = now()
+RETURNING (xmax = 0) AS inserted
+"""
+
+_DEFAULT_WORKFLOWS = """
+WITH targets AS (
+    SELECT p.id FROM points p
+    JOIN import_points s ON p.owner_id = $1 AND p.external_id = s.external_id
+    WHERE NOT EXISTS (SELECT 1 FROM order_statuses os WHERE os.point_id = p.id)
+), inserted AS (
+    INSERT INTO order_statuses (point_id, name, color, order_index, is_final, is_active)
+    SELECT t.id, d.name, d.color, d.order_index, d.is_final, true
+    FROM targets t
+    CROSS JOIN unnest($2::text[], $3::text[], $4::integer[], $5::boolean[])
+        AS d(name, color, order_index, is_final)
+    RETURNING point_id
+)
+SELECT count(DISTINCT point_id) FROM inserted
+"""
+
+_TOUCHED_POINTS = """
+SELECT p.id FROM points p
+WHERE p.owner_id = $1 AND p.external_id IN (
+    SELECT external_id FROM import_points UNION SELECT point_external_id FROM import_statuses
+)
+"""
+
+
+def _counts(rows) -> ImportCounts:
+    created = sum(1 for row in rows if row["inserted"])
+    return ImportCounts(created=created, updated=len(rows) - created)
+
+
+class BulkImportService:
+    """Bulk onboarding of points with their cashiers and status workflows.
+
+    Rows are validated column-wise, valid rows are loaded with COPY into
+    temporary staging tables and merged into the real tables with one
+    ``INSERT ... ON CONFLICT DO UPDATE`` per table, all in one transaction.
+    Invalid rows are skipped and reported; they never abort the import.
+    """
+
+    @staticmethod
+    def parse_csv(text: str) -> List[Dict[str, Any]]:
+        return list(csv.DictReader(io.StringIO(text)))
+
+    @staticmethod
+    def validate_points(rows: Sequence[Dict[str, Any]]) -> Tuple[List[tuple], List[ImportRowError]]:
+        columns = _Columns(ImportKindEnum.POINTS, rows)
+        external_id = columns.text("external_id", required=True, max_length=100)
+        name = columns.text("name", required=True, max_length=255)
+        description = columns.text("description")
+        detailed_description = columns.text("detailed_description")
+        address = columns.text("address", required=True)
+        latitude = columns.number("latitude", minimum=-90, maximum=90)
+        longitude = columns.number("longitude", minimum=-180, maximum=180)
+        point_status = columns.choice("status", _POINT_STATUSES, PointStatusEnum.ACTIVE.value)
+        timezone = columns.text("timezone", max_length=64)
+        columns.member("timezone", timezone, _TIMEZONES)
+        timezone = [value or "UTC" for value in timezone]
+        hours = columns.convert(
+            "working_hours", columns.raw("working_hours"), _WorkingHours(), "Invalid working hours"
+        )
+        working_hours = [value[0] if value else None for value in hours]
+        bitmap = [value[1] if value else None for value in hours]
+        accepts_online_orders = columns.boolean("accepts_online_orders", True)
+        accepts_scheduled_orders = columns.boolean("accepts_scheduled_orders", False)
+        slot_duration_minutes = columns.integer("slot_duration_minutes", 15, 120, 30)
+        slots_per_interval = columns.integer("slots_per_interval", 1, 50, 5)
+        advance_booking_days = columns.integer("advance_booking_days", 1, 30, 7)
+        enable_qr_code = columns.boolean("enable_qr_code", True)
+        require_phone_verification = columns.boolean("require_phone_verification", False)
+        columns.unique(("external_id",), external_id)
+
+        records = columns.records(
+            external_id, name, description, detailed_description, address, latitude, longitude,
+            point_status, working_hours, timezone, bitmap, accepts_online_orders,
+            accepts_scheduled_orders, slot_duration_minutes, slots_per_interval,
+            advance_booking_days, enable_qr_code, require_phone_verification,
+        )
+        return records, columns.errors
+
+    @staticmethod
+    def validate_cashiers(rows: Sequence[Dict[str, Any]]) -> Tuple[List[tuple], List[ImportRowError]]:
+        columns = _Columns(ImportKindEnum.CASHIERS, rows)
+        point_external_id = columns.text("point_external_id", required=True, max_length=100)
+        number = columns.text("number", required=True, max_length=50)
+        name = columns.text("name", required=True, max_length=255)
+        max_concurrent_orders = columns.integer("max_concurrent_orders", 1, 10, 1)
+        columns.unique(("point_external_id", "number"), point_external_id, number)
+        return columns.records(point_external_id, number, name, max_concurrent_orders), columns.errors
+
+    @staticmethod
+    def validate_statuses(rows: Sequence[Dict[str, Any]]) -> Tuple[List[tuple], List[ImportRowError]]:
+        columns = _Columns(ImportKindEnum.STATUSES, rows)
+        point_external_id = columns.text("point_external_id", required=True, max_length=100)
+        name = columns.text("name", required=True, max_length=100)
+        description = columns.text("description")
+        color = columns.text("color", max_length=7)
+        columns.matches("color", color, _COLOR, "Must be a #RRGGBB color")
+        color = [value or "#007AFF" for value in color]
+        order_index = columns.integer("order_index", 0, 1000, 0)
+        is_final = columns.boolean("is_final", False)
+        columns.unique(("point_external_id", "name"), point_external_id, name)
+        return (
+            columns.records(point_external_id, name, description, color, order_index, is_final),
+            columns.errors,
+        )
+
+    @staticmethod
+    async def _orphans(conn, table: str, owner_id: int, kind: ImportKindEnum) -> List[ImportRowError]:
+        rows = await conn.fetch(_ORPHANS.format(table=table), owner_id)
+        if rows:
+            await conn.execute(
+                f"DELETE FROM {table} WHERE row_no = ANY($1::integer[])", [row["row_no"] for row in rows]
+            )
+        return [
+            ImportRowError(kind=kind, row=row["row_no"], field="point_external_id", message="Unknown point")
+            for row in rows
+        ]
+
+    @staticmethod
+    async def run(
+        db: AsyncSession, owner_id: int, data: BulkImportRequest, dry_run: bool = False
+    ) -> BulkImportResult:
+        """Validate and load an import for ``owner_id``; commits unless ``dry_run``"""
+        points, point_errors = BulkImportService.validate_points(data.points)
+        cashiers, cashier_errors = BulkImportService.validate_cashiers(data.cashiers)
+        statuses, status_errors = BulkImportService.validate_statuses(data.statuses)
+        result = BulkImportResult(dry_run=dry_run, errors=point_errors + cashier_errors + status_errors)
+
+        connection = await db.connection()
+        conn = (await connection.get_raw_connection()).driver_connection
+        for ddl in _STAGING_DDL:
+            await conn.execute(ddl)
+        await conn.copy_records_to_table("import_points", records=points, columns=POINT_COLUMNS)
+        await conn.copy_records_to_table("import_cashiers", records=cashiers, columns=CASHIER_COLUMNS)
+        await conn.copy_records_to_table("import_statuses", records=statuses, columns=STATUS_COLUMNS)
+
+        result.points = _counts(await conn.fetch(_UPSERT_POINTS, owner_id))
+        result.errors += await BulkImportService._orphans(
+            conn, "import_cashiers", owner_id, ImportKindEnum.CASHIERS
+        )
+        result.errors += await BulkImportService._orphans(
+            conn, "import_statuses", owner_id, ImportKindEnum.STATUSES
+        )
+        result.cashiers = _counts(await conn.fetch(_UPSERT_CASHIERS, owner_id))
+        result.statuses = _counts(await conn.fetch(_UPSERT_STATUSES, owner_id))
+        result.default_workflows = await conn.fetchval(
+            _DEFAULT_WORKFLOWS, owner_id, *map(list, zip(*DEFAULT_STATUS_WORKFLOW))
+        )
+
+        if dry_run:
+            await db.rollback()
+        else:
+            touched = await conn.fetch(_TOUCHED_POINTS, owner_id)
+            await db.commit()
+            await PointService.invalidate_public(row["id"] for row in touched)
+        result.errors.sort(key=lambda error: (error.kind.value, error.row))
+        return result
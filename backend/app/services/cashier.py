@@ -0,0 +1,54 @@
+from datetime import datetime, timezone
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import HTTPException, status
+
+from app.models.cashier import Cashier, CashierStatusEnum
+from app.models.user import User
+from app.schemas.cashier import CashierStatusUpdate
+from app.services.changefeed import cashier_payload
+from app.services.outbox import OutboxService
+from app.services.point import PointService
+from app.services.presence import PresenceService
+
+
+class CashierService:
+
+    @staticmethod
+    async def get_cashier(db: AsyncSession, cashier_id: int) -> Cashier:
+        """Get cashier or raise 404"""
+        cashier = await db.get(Cashier, cashier_id)
+        if cashier is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Cashier not found"
+            )
+        return cashier
+
+    @staticmethod
+    async def set_status(
+        db: AsyncSession,
+        user: User,
+        cashier_id: int,
+        status_update: CashierStatusUpdate,
+    ) -> Cashier:
+        """Change cashier working status (assigned user or point staff)"""
+        cashier = await CashierService.get_cashier(db, cashier_id)
+        if cashier.assigned_user_id != user.id:
+            await PointService.ensure_staff(db, cashier.point_id, user)
+
+        new_status = CashierStatusEnum(status_update.status.value)
+        if cashier.status != new_status:
+            cashier.status = new_status
+            cashier.last_activity = datetime.now(timezone.utc)
+            OutboxService.add(
+                db, "cashier.status_changed", cashier.point_id, cashier.id, cashier_payload(cashier)
+            )
+            await db.commit()
+            await db.refresh(cashier)
+
+        # Postgres has the status (already or written above): mirror it into
+        # presence, which may disagree, without queueing a DB write
+        await PresenceService.heartbeat(
+            cashier.id, cashier.point_id, status_update.status, queue_change=False
+        )
+        return cashier
@@ -0,0 +1,250 @@
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import redis_client
+from app.core.sharding import point_key, shards
+from app.models.cashier import Cashier
+from app.models.order import Order, OrderStatus
+from app.schemas.sync import ChangeKindEnum, ChangeOpEnum, PointChange, PointChanges, PointSnapshot
+
+
+# INCR the point's sequence and XADD each delta with the sequence as stream id,
+# atomically, so ids in the stream are gap-free and strictly increasing.
+_APPEND_SCRIPT = """
+local seq = tonumber(redis.call('INCRBY', KEYS[1], #ARGV - 1))
+local first = seq - (#ARGV - 1) + 1
+for i = 2, #ARGV do
+    redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[1], (first + i - 2) .. '-0', 'd', ARGV[i])
+end
+return seq
+"""
+
+_append = redis_client.register_script(_APPEND_SCRIPT)
+
+# Same for deltas of relayed outbox events: ARGV[1] maxlen, then (event id,
+# delta) pairs. Ids of the last ARGV[1] appended events are kept in KEYS[3]
+# and an event found there is skipped, so a batch retried after a partial
+# publish does not append its deltas again under new seqs.
+_APPEND_EVENTS_SCRIPT = """
+local seq = tonumber(redis.call('GET', KEYS[1]) or '0')
+local appended = 0
+for i = 2, #ARGV, 2 do
+    if not redis.call('ZSCORE', KEYS[3], ARGV[i]) then
+        seq = seq + 1
+        redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[1], seq .. '-0', 'd', ARGV[i + 1])
+        redis.call('ZADD', KEYS[3], ARGV[i], ARGV[i])
+        appended = appended + 1
+    end
+end
+if appended > 0 then
+    redis.call('SET', KEYS[1], seq)
+    redis.call('ZREMRANGEBYRANK', KEYS[3], 0, -tonumber(ARGV[1]) - 1)
+end
+return seq
+"""
+
+_append_events = redis_client.register_script(_APPEND_EVENTS_SCRIPT)
+
+Change = Tuple[ChangeKindEnum, ChangeOpEnum, int, Optional[Dict[str, Any]]]
+
+
+def _iso(value) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def order_payload(order: Order) -> Dict[str, Any]:
+    """Compact order payload for deltas and snapshots"""
+    return {
+        "number": order.order_number,
+        "status_id": order.current_status_id,
+        "cashier_id": order.cashier_id,
+        "user_id": order.user_id,
+        "type": order.order_type.value if order.order_type else None,
+        "scheduled_time": _iso(order.scheduled_time),
+        "arrived_at": _iso(order.arrived_at),
+        "created_at": _iso(order.created_at),
+    }
+
+
+def cashier_payload(cashier: Cashier) -> Dict[str, Any]:
+    """Compact cashier payload for deltas and snapshots"""
+    return {
+        "number": cashier.number,
+        "name": cashier.name,
+        "status": cashier.status.value if cashier.status else None,
+        "is_active": cashier.is_active,
+        "max_concurrent_orders": cashier.max_concurrent_orders,
+    }
+
+
+def status_payload(order_status: OrderStatus) -> Dict[str, Any]:
+    """Compact order status payload for deltas and snapshots"""
+    return {
+        "name": order_status.name,
+        "color": order_status.color,
+        "order_index": order_status.order_index,
+        "is_final": order_status.is_final,
+        "is_active": order_status.is_active,
+    }
+
+
+class ChangeFeed:
+    """Per-point change feed for cashier consoles.
+
+    Every change to a point's live orders, cashiers and statuses gets the next
+    value of ``{point:ID}:seq`` and is kept in the capped stream
+    ``{point:ID}:changes`` (``CHANGEFEED_MAXLEN`` entries). Clients poll with
+    the last seq they saw; catch-up is served from Redis only, and a client
+    whose position was trimmed away gets a snapshot plus the seq to resume
+    from.
+    """
+
+    @staticmethod
+    def seq_key(point_id: int) -> str:
+        return point_key(point_id, "seq")
+
+    @staticmethod
+    def stream_key(point_id: int) -> str:
+        return point_key(point_id, "changes")
+
+    @staticmethod
+    def _encode(changes: Iterable[Change]) -> List[str]:
+        return [
+            json.dumps(
+                {"k": kind.value, "o": op.value, "i": entity_id, "d": data},
+                separators=(",", ":"),
+                default=str,
+            )
+            for kind, op, entity_id, data in changes
+        ]
+
+    @staticmethod
+    async def append_many(point_id: int, changes: Iterable[Change]) -> int:
+        """Append deltas for one point, return the sequence number of the last one"""
+        payloads = ChangeFeed._encode(changes)
+        if not payloads:
+            return await ChangeFeed.current_seq(point_id)
+        shard = await shards.shard(point_id)
+        return int(await _append(
+            keys=[ChangeFeed.seq_key(point_id), ChangeFeed.stream_key(point_id)],
+            args=[settings.CHANGEFEED_MAXLEN, *payloads],
+            client=shard.client,
+        ))
+
+    @staticmethod
+    def relayed_key(point_id: int) -> str:
+        return point_key(point_id, "relayed")
+
+    @staticmethod
+    async def queue_events(pipe, point_id: int, events: Iterable[Tuple[int, Change]]) -> None:
+        """Queue the deltas of (outbox event id, change) pairs on a pipeline of
+        the point's shard (executed by the caller); each event is appended once"""
+        events = list(events)
+        args: List[Any] = [settings.CHANGEFEED_MAXLEN]
+        for (event_id, _), payload in zip(events, ChangeFeed._encode(change for _, change in events)):
+            args.extend((event_id, payload))
+        if len(args) > 1:
+            await _append_events(
+                keys=[ChangeFeed.seq_key(point_id), ChangeFeed.stream_key(point_id), ChangeFeed.relayed_key(point_id)],
+                args=args,
+                client=pipe,
+            )
+
+    @staticmethod
+    async def append(
+        point_id: int,
+        kind: ChangeKindEnum,
+        op: ChangeOpEnum,
+        entity_id: int,
+        data: Optional[Dict[str, Any]] = None,
+    ) -> int:
+        """Append one delta for a point"""
+        return await ChangeFeed.append_many(point_id, [(kind, op, entity_id, data)])
+
+    @staticmethod
+    async def current_seq(point_id: int) -> int:
+        shard = await shards.shard(point_id)
+        value = await shard.autopipeline.get(ChangeFeed.seq_key(point_id))
+        return int(value or 0)
+
+    @staticmethod
+    async def read(point_id: int, since: int, limit: int) -> Tuple[int, Optional[List[PointChange]], bool]:
+        """Read deltas after ``since``.
+
+        Returns (current seq, changes, has_more); changes is None when the
+        client cannot catch up from the stream and needs a snapshot.
+        """
+        shard = await shards.shard(point_id)
+        pipe = shard.client.pipeline(transaction=False)
+        pipe.get(ChangeFeed.seq_key(point_id))
+        pipe.xrange(ChangeFeed.stream_key(point_id), min=f"{since + 1}-0", max="+", count=limit)
+        current, entries = await pipe.execute()
+        current = int(current or 0)
+
+        if since == current:
+            return current, [], False
+        if since > current or not entries:
+            return current, None, False
+
+        changes = []
+        for entry_id, fields in entries:
+            seq = int(entry_id.split("-", 1)[0])
+            payload = json.loads(fields["d"])
+            changes.append(PointChange(
+                seq=seq,
+                kind=payload["k"],
+                op=payload["o"],
+                id=payload["i"],
+                data=payload["d"],
+            ))
+
+        # The entry right after ``since`` was trimmed: there is a gap
+        if changes[0].seq != since + 1:
+            return current, None, False
+        return current, changes, changes[-1].seq < current
+
+    @staticmethod
+    async def snapshot(db: AsyncSession, point_id: int) -> PointSnapshot:
+        """Live state of a point from the database"""
+        statuses = (await db.execute(
+            select(OrderStatus).where(OrderStatus.point_id == point_id).order_by(OrderStatus.order_index)
+        )).scalars().all()
+        cashiers = (await db.execute(
+            select(Cashier).where(Cashier.point_id == point_id).order_by(Cashier.id)
+        )).scalars().all()
+        orders = (await db.execute(
+            select(Order)
+            .join(OrderStatus, Order.current_status_id == OrderStatus.id)
+            .where(Order.point_id == point_id, OrderStatus.is_final.is_(False))
+            .order_by(Order.created_at, Order.id)
+        )).scalars().all()
+
+        return PointSnapshot(
+            orders=[{"id": order.id, **order_payload(order)} for order in orders],
+            cashiers=[{"id": cashier.id, **cashier_payload(cashier)} for cashier in cashiers],
+            statuses=[{"id": item.id, **status_payload(item)} for item in statuses],
+        )
+
+    @staticmethod
+    async def changes_since(
+        db: AsyncSession,
+        point_id: int,
+        since: int,
+        limit: Optional[int] = None,
+    ) -> PointChanges:
+        """Deltas after ``since``, or a snapshot with the seq to resume from"""
+        limit = limit or settings.CHANGEFEED_MAX_BATCH
+        current, changes, has_more = await ChangeFeed.read(point_id, since, limit)
+        if changes is not None:
+            seq = changes[-1].seq if changes else current
+            return PointChanges(point_id=point_id, seq=seq, changes=changes, has_more=has_more)
+
+        # Seq is read before the snapshot; deltas replayed on top of it are
+        # idempotent upserts/deletes by id.
+        seq = await ChangeFeed.current_seq(point_id)
+        snapshot = await ChangeFeed.snapshot(db, point_id)
+        return PointChanges(point_id=point_id, seq=seq, snapshot=snapshot)
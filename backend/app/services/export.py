@@ -0,0 +1,383 @@
+import asyncio
+import csv
+import enum
+import io
+import json
+import logging
+import os
+import uuid
+import zlib
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from app.core.config import settings
+from app.core.database import engine, redis_client
+from app.core.metrics import Counter
+from app.models.cashier import Cashier
+from app.models.order import Order, OrderStatus, OrderStatusHistory
+from app.schemas.export import ExportFormatEnum, ExportJobStatusEnum, ExportRequest
+
+
+logger = logging.getLogger(__name__)
+
+EXPORT_QUEUE = "exports:queue"
+EXPORT_PROCESSING = "exports:processing"  # jobs taken by the worker, until they finish
+
+exported_rows_total = Counter(
+    "export_rows_total", "Rows written by order exports", ("format", "mode")
+)
+export_jobs_requeued_total = Counter(
+    "export_jobs_requeued_total", "Export jobs put back on the queue after a worker stopped"
+)
+export_files_removed_total = Counter(
+    "export_files_removed_total", "Export files removed after their job expired"
+)
+
+# Output columns, one row per status history entry
+COLUMNS = (
+    ("order_id", Order.id),
+    ("order_number", Order.order_number),
+    ("order_type", Order.order_type),
+    ("user_id", Order.user_id),
+    ("created_at", Order.created_at),
+    ("scheduled_time", Order.scheduled_time),
+    ("cashier_id", Order.cashier_id),
+    ("cashier_number", Cashier.number),
+    ("cashier_name", Cashier.name),
+    ("status_id", OrderStatusHistory.status_id),
+    ("status_name", OrderStatus.name),
+    ("status_is_final", OrderStatus.is_final),
+    ("status_started_at", OrderStatusHistory.created_at),
+    ("status_ended_at", OrderStatusHistory.ended_at),
+    ("changed_by_user_id", OrderStatusHistory.changed_by_user_id),
+    ("notes", OrderStatusHistory.notes),
+)
+HEADER = [name for name, _ in COLUMNS]
+
+
+class _Explain(Executable, ClauseElement):
+    """``EXPLAIN (FORMAT JSON)`` of a statement: planned, never run"""
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(_Explain, "postgresql")
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+def _cell(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.value
+    return value
+
+
+def _csv_chunk(rows: Iterable[tuple], header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(HEADER)
+    writer.writerows([_cell(value) for value in row] for row in rows)
+    return buffer.getvalue().encode()
+
+
+def _ndjson_chunk(rows: Iterable[tuple], header: bool = False) -> bytes:
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    return "".join(
+        dumps(dict(zip(HEADER, [_cell(value) for value in row]))) + "\n" for row in rows
+    ).encode()
+
+
+SERIALIZERS: Dict[ExportFormatEnum, Callable[..., bytes]] = {
+    ExportFormatEnum.CSV: _csv_chunk,
+    ExportFormatEnum.NDJSON: _ndjson_chunk,
+}
+
+MEDIA_TYPES = {
+    ExportFormatEnum.CSV: "text/csv",
+    ExportFormatEnum.NDJSON: "application/x-ndjson",
+}
+
+
+class OrderExportService:
+    """Constant-memory exports of a point's orders with their status history.
+
+    Rows come from a server-side cursor in ``EXPORT_CHUNK_ROWS`` chunks as
+    plain tuples (no ORM objects) and each chunk is serialized straight to
+    bytes, so memory use does not grow with the size of the export.
+    """
+
+    @staticmethod
+    def _filters(point_id: int, since: Optional[datetime], until: Optional[datetime]) -> List:
+        filters = [Order.point_id == point_id]
+        if since is not None:
+            filters.append(Order.created_at >= since)
+        if until is not None:
+            filters.append(Order.created_at < until)
+        return filters
+
+    @staticmethod
+    def query(point_id: int, since: Optional[datetime] = None, until: Optional[datetime] = None):
+        return (
+            select(*[column for _, column in COLUMNS])
+            .select_from(Order)
+            .join(OrderStatusHistory, OrderStatusHistory.order_id == Order.id)
+            .join(OrderStatus, OrderStatus.id == OrderStatusHistory.status_id)
+            .outerjoin(Cashier, Cashier.id == Order.cashier_id)
+            .where(*OrderExportService._filters(point_id, since, until))
+            .order_by(Order.id, OrderStatusHistory.id)
+        )
+
+    @staticmethod
+    async def estimated_rows(point_id: int, params: ExportRequest) -> int:
+        """Planner's row estimate for the export (table statistics, no rows read)"""
+        async with engine.connect() as conn:
+            plan = await conn.scalar(_Explain(OrderExportService.query(point_id, params.since, params.until)))
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    @staticmethod
+    async def exceeds(point_id: int, params: ExportRequest, limit: int) -> bool:
+        """Whether the export is expected to have more than ``limit`` rows.
+
+        Goes by the planner's estimate: counting exactly would read up to
+        ``limit`` joined rows on every request. A misestimate only changes
+        whether the export streams inline or runs in the worker.
+        """
+        return await OrderExportService.estimated_rows(point_id, params) > limit
+
+    @staticmethod
+    async def iter_rows(
+        point_id: int,
+        params: ExportRequest,
+        mode: str = "stream",
+        on_rows: Optional[Callable[[int], None]] = None,
+    ) -> AsyncIterator[bytes]:
+        """Serialized export, one bytes chunk per fetched batch of rows"""
+        serialize = SERIALIZERS[params.format]
+        stmt = OrderExportService.query(point_id, params.since, params.until).execution_options(
+            yield_per=settings.EXPORT_CHUNK_ROWS
+        )
+        first = True
+        async with engine.connect() as conn:
+            result = await conn.stream(stmt)
+            async for rows in result.partitions():
+                yield serialize(rows, header=first)
+                first = False
+                exported_rows_total.inc(len(rows), format=params.format.value, mode=mode)
+                if on_rows is not None:
+                    on_rows(len(rows))
+        if first:
+            yield serialize([], header=True)
+
+    @staticmethod
+    async def stream(
+        point_id: int,
+        params: ExportRequest,
+        mode: str = "stream",
+        on_rows: Optional[Callable[[int], None]] = None,
+    ) -> AsyncIterator[bytes]:
+        """``iter_rows``, gzip-compressed when requested"""
+        chunks = OrderExportService.iter_rows(point_id, params, mode, on_rows)
+        if not params.gzip:
+            async for chunk in chunks:
+                yield chunk
+            return
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        async for chunk in chunks:
+            compressed = compressor.compress(chunk)
+            if compressed:
+                yield compressed
+        yield compressor.flush()
+
+    @staticmethod
+    def filename(point_id: int, params: ExportRequest) -> str:
+        name = f"point-{point_id}-orders.{params.format.value}"
+        return name + ".gz" if params.gzip else name
+
+
+class ExportJobService:
+    """Large exports written to ``UPLOAD_PATH/exports`` by the worker.
+
+    Job state lives in a Redis hash with ``EXPORT_JOB_TTL_SECONDS`` expiry;
+    job ids are queued on a Redis list consumed by ``ExportWorker``.
+    """
+
+    @staticmethod
+    def job_key(job_id: str) -> str:
+        return f"export:{job_id}"
+
+    @staticmethod
+    def directory() -> str:
+        return os.path.join(settings.UPLOAD_PATH, "exports")
+
+    @staticmethod
+    def path(job: Dict[str, str]) -> str:
+        params = ExportJobService.params(job)
+        filename = f"{job['id']}-{OrderExportService.filename(int(job['point_id']), params)}"
+        return os.path.join(ExportJobService.directory(), filename)
+
+    @staticmethod
+    def params(job: Dict[str, str]) -> ExportRequest:
+        return ExportRequest.model_validate_json(job["params"])
+
+    @staticmethod
+    async def enqueue(point_id: int, user_id: int, params: ExportRequest) -> Dict[str, str]:
+        job = {
+            "id": uuid.uuid4().hex,
+            "point_id": str(point_id),
+            "user_id": str(user_id),
+            "params": params.model_dump_json(),
+            "status": ExportJobStatusEnum.QUEUED.value,
+            "rows": "0",
+        }
+        key = ExportJobService.job_key(job["id"])
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.hset(key, mapping=job)
+        pipe.expire(key, settings.EXPORT_JOB_TTL_SECONDS)
+        pipe.rpush(EXPORT_QUEUE, job["id"])
+        await pipe.execute()
+        return job
+
+    @staticmethod
+    async def get(job_id: str) -> Optional[Dict[str, str]]:
+        job = await redis_client.hgetall(ExportJobService.job_key(job_id))
+        return job or None
+
+    @staticmethod
+    async def update(job_id: str, **fields: Any) -> None:
+        await redis_client.hset(
+            ExportJobService.job_key(job_id), mapping={k: str(v) for k, v in fields.items()}
+        )
+
+    @staticmethod
+    async def run_job(job: Dict[str, str]) -> int:
+        """Write the export file, return the number of rows"""
+        params = ExportJobService.params(job)
+        path = ExportJobService.path(job)
+        await asyncio.to_thread(os.makedirs, os.path.dirname(path), exist_ok=True)
+        rows = 0
+
+        def count(batch: int) -> None:
+            nonlocal rows
+            rows += batch
+
+        partial = path + ".part"
+        chunks = OrderExportService.stream(int(job["point_id"]), params, mode="job", on_rows=count)
+        # File I/O in worker threads: a slow disk must not stall the event loop
+        output = await asyncio.to_thread(open, partial, "wb")
+        try:
+            async for chunk in chunks:
+                await asyncio.to_thread(output.write, chunk)
+        finally:
+            await asyncio.to_thread(output.close)
+        await asyncio.to_thread(os.replace, partial, path)
+        return rows
+
+
+class ExportWorker:
+    """Worker loop running queued export jobs one at a time.
+
+    A job id is moved atomically from the queue to ``EXPORT_PROCESSING`` and
+    only removed from there once the job has finished, so jobs of a worker
+    that crashed or was killed are put back on the queue when it starts
+    again (one export worker per deployment). Files of jobs whose state has
+    expired are removed every ``EXPORT_CLEANUP_INTERVAL_SECONDS``.
+    """
+
+    async def requeue_unfinished(self) -> int:
+        """Put the jobs left in ``EXPORT_PROCESSING`` back at the head of the queue"""
+        requeued = 0
+        while await redis_client.lmove(EXPORT_PROCESSING, EXPORT_QUEUE, "RIGHT", "LEFT") is not None:
+            requeued += 1
+        if requeued:
+            export_jobs_requeued_total.inc(requeued)
+            logger.warning("Requeued %d unfinished export jobs", requeued)
+        return requeued
+
+    async def remove_expired_files(self) -> int:
+        """Delete export files (and leftover ``.part`` files) of expired jobs"""
+        directory = ExportJobService.directory()
+        try:
+            names = await asyncio.to_thread(os.listdir, directory)
+        except FileNotFoundError:
+            return 0
+        job_ids = sorted({name.split("-", 1)[0] for name in names})
+        if not job_ids:
+            return 0
+        pipe = redis_client.pipeline(transaction=False)
+        for job_id in job_ids:
+            pipe.exists(ExportJobService.job_key(job_id))
+        expired = {job_id for job_id, exists in zip(job_ids, await pipe.execute()) if not exists}
+        removed = 0
+        for name in names:
+            if name.split("-", 1)[0] not in expired:
+                continue
+            try:
+                await asyncio.to_thread(os.remove, os.path.join(directory, name))
+            except FileNotFoundError:
+                continue
+            removed += 1
+        if removed:
+            export_files_removed_total.inc(removed)
+            logger.info("Removed %d expired export files", removed)
+        return removed
+
+    async def process(self, job_id: str) -> None:
+        job = await ExportJobService.get(job_id)
+        if job is None:
+            return  # expired before it was picked up
+        await ExportJobService.update(job_id, status=ExportJobStatusEnum.RUNNING.value)
+        try:
+            rows = await ExportJobService.run_job(job)
+        except Exception as exc:
+            logger.exception("Export %s failed", job_id)
+            await ExportJobService.update(
+                job_id, status=ExportJobStatusEnum.FAILED.value, error=str(exc)[:500]
+            )
+        else:
+            await ExportJobService.update(
+                job_id, status=ExportJobStatusEnum.DONE.value, rows=rows
+            )
+
+    async def run(self, stop: asyncio.Event) -> None:
+        loop = asyncio.get_running_loop()
+        next_cleanup = loop.time()
+        requeued = False
+        while not stop.is_set():
+            try:
+                if not requeued:
+                    await self.requeue_unfinished()
+                    requeued = True
+                if loop.time() >= next_cleanup:
+                    next_cleanup = loop.time() + settings.EXPORT_CLEANUP_INTERVAL_SECONDS
+                    await self.remove_expired_files()
+                job_id = await redis_client.blmove(EXPORT_QUEUE, EXPORT_PROCESSING, 1, "LEFT", "RIGHT")
+            except Exception:
+                logger.exception("Export queue unavailable")
+                await asyncio.sleep(1)
+                continue
+            if job_id is None:
+                continue
+
+            try:
+                await self.process(job_id)
+            except Exception:
+                # Job state could not be read or written: stays in
+                # EXPORT_PROCESSING and is requeued on the next start
+                logger.exception("Export %s interrupted", job_id)
+                await asyncio.sleep(1)
+                continue
+            try:
+                await redis_client.lrem(EXPORT_PROCESSING, 1, job_id)
+            except Exception:
+                logger.exception("Could not release export %s, it will run again", job_id)
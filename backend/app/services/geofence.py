@@ -0,0 +1,247 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from time import perf_counter
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import and_, case, literal, select, update
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.metrics import Counter, Gauge
+from app.models.order import Order, OrderStatus, OrderTypeEnum
+from app.models.point import Point
+from app.schemas.location import LocationPing
+from app.services.changefeed import order_payload
+from app.services.outbox import OutboxService
+
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_M = 6_371_000.0
+
+pings_total = Counter("geofence_pings_total", "Location pings by outcome", ("outcome",))
+arrivals_total = Counter("geofence_arrivals_total", "Orders marked as arrived")
+batch_seconds = Gauge("geofence_batch_seconds", "Duration of the last micro-batch")
+buffered_pings = Gauge("geofence_buffered_pings", "Pings waiting for the next micro-batch")
+
+# Per user: order ids and their points' coordinates in radians
+Targets = Tuple[np.ndarray, np.ndarray, np.ndarray]
+_NO_TARGETS: Targets = (np.empty(0, dtype=np.int64), np.empty(0), np.empty(0))
+
+
+def haversine_m(lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    """Element-wise great-circle distance in meters, coordinates in radians"""
+    a = (
+        np.sin((lat2 - lat1) / 2.0) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.0) ** 2
+    )
+    return 2.0 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class GeofenceProcessor:
+    """Detects customers arriving at the point of their active order.
+
+    The ping endpoint only appends to this worker's in-memory buffer. A
+    background loop drains it in micro-batches: each user's active orders
+    and their points' coordinates come from an in-memory cache (one query
+    per batch for users not cached), pings are expanded against them and
+    checked with a vectorized haversine. Orders inside the geofence get
+    ``arrived_at`` set once (``WHERE arrived_at IS NULL`` makes it safe across
+    workers) and an ``order.arrived`` outbox event; scheduled orders whose
+    time is close are switched to immediate so they join the live queue.
+    """
+
+    def __init__(self):
+        self._targets = LRUCache(
+            maxsize=settings.GEOFENCE_CACHE_SIZE, ttl=settings.GEOFENCE_CACHE_TTL_SECONDS
+        )
+        self._reset_buffer()
+        self.ready = asyncio.Event()
+
+    def _reset_buffer(self) -> None:
+        self._users: List[int] = []
+        self._latitudes: List[float] = []
+        self._longitudes: List[float] = []
+        self._accuracies: List[float] = []
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def submit(self, user_id: int, pings: Sequence[LocationPing]) -> int:
+        """Buffer a user's pings, return how many were accepted"""
+        now = datetime.now(timezone.utc)
+        max_age = timedelta(seconds=settings.GEOFENCE_MAX_PING_AGE_SECONDS)
+        fresh = [
+            ping for ping in pings
+            if ping.recorded_at is None or now - ping.recorded_at <= max_age
+        ]
+        room = max(settings.GEOFENCE_BUFFER_MAX - len(self._users), 0)
+        accepted = fresh[:room]
+
+        self._users.extend([user_id] * len(accepted))
+        self._latitudes.extend(ping.latitude for ping in accepted)
+        self._longitudes.extend(ping.longitude for ping in accepted)
+        self._accuracies.extend(ping.accuracy_m or 0.0 for ping in accepted)
+
+        pings_total.inc(len(accepted), outcome="accepted")
+        pings_total.inc(len(pings) - len(fresh), outcome="stale")
+        pings_total.inc(len(fresh) - len(accepted), outcome="dropped")
+        buffered_pings.set(len(self._users))
+        if len(self._users) >= settings.GEOFENCE_BATCH_SIZE:
+            self.ready.set()
+        return len(accepted)
+
+    def invalidate(self, user_id: int) -> None:
+        """Forget a user's cached orders (call after their orders change)"""
+        self._targets.pop(user_id)
+
+    async def _load_targets(self, user_ids: List[int]) -> None:
+        """Cache active, not yet arrived orders with located points for the users"""
+        stmt = (
+            select(Order.user_id, Order.id, Point.latitude, Point.longitude)
+            .join(Point, Point.id == Order.point_id)
+            .join(OrderStatus, OrderStatus.id == Order.current_status_id)
+            .where(
+                Order.user_id.in_(user_ids),
+                Order.arrived_at.is_(None),
+                OrderStatus.is_final.is_(False),
+                Point.latitude.is_not(None),
+                Point.longitude.is_not(None),
+            )
+        )
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(stmt)).all()
+
+        by_user: Dict[int, List[tuple]] = {}
+        for user_id, order_id, latitude, longitude in rows:
+            by_user.setdefault(user_id, []).append((order_id, latitude, longitude))
+        for user_id in user_ids:
+            orders = by_user.get(user_id)
+            if not orders:
+                self._targets.set(user_id, _NO_TARGETS)  # negative entry, most pingers
+                continue
+            order_ids, latitudes, longitudes = zip(*orders)
+            self._targets.set(user_id, (
+                np.array(order_ids, dtype=np.int64),
+                np.radians(np.array(latitudes, dtype=float)),
+                np.radians(np.array(longitudes, dtype=float)),
+            ))
+
+    async def _match(
+        self,
+        users: np.ndarray,
+        latitudes: np.ndarray,
+        longitudes: np.ndarray,
+        accuracies: np.ndarray,
+    ) -> Dict[int, float]:
+        """Orders with at least one ping inside their point's geofence -> closest distance (m)"""
+        unique_users, user_index = np.unique(users, return_inverse=True)
+        targets = [self._targets.get(int(user_id)) for user_id in unique_users]
+        missing = [int(user_id) for user_id, entry in zip(unique_users, targets) if entry is None]
+        if missing:
+            await self._load_targets(missing)
+            targets = [self._targets.get(int(user_id)) or _NO_TARGETS for user_id in unique_users]
+
+        # Concatenate the users' targets once, then expand every ping against its
+        # user's slice: ping i is paired with targets starts[u_i] .. starts[u_i] + counts[u_i]
+        counts = np.array([len(entry[0]) for entry in targets], dtype=np.int64)
+        if not counts.sum():
+            return {}
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        order_ids = np.concatenate([entry[0] for entry in targets])
+        target_lat = np.concatenate([entry[1] for entry in targets])
+        target_lon = np.concatenate([entry[2] for entry in targets])
+
+        per_ping = counts[user_index]
+        ping_index = np.repeat(np.arange(len(users)), per_ping)
+        offsets = np.arange(len(ping_index)) - np.repeat(np.cumsum(per_ping) - per_ping, per_ping)
+        target_index = starts[user_index][ping_index] + offsets
+
+        distances = haversine_m(
+            np.radians(latitudes[ping_index]),
+            np.radians(longitudes[ping_index]),
+            target_lat[target_index],
+            target_lon[target_index],
+        )
+        slack = np.minimum(accuracies[ping_index], settings.GEOFENCE_MAX_ACCURACY_SLACK_M)
+        inside = distances <= settings.GEOFENCE_RADIUS_M + slack
+        if not inside.any():
+            return {}
+
+        arrived_ids, inverse = np.unique(order_ids[target_index[inside]], return_inverse=True)
+        closest = np.full(len(arrived_ids), np.inf)
+        np.minimum.at(closest, inverse, distances[inside])
+        return dict(zip(arrived_ids.tolist(), closest.tolist()))
+
+    async def _mark_arrived(self, arrivals: Dict[int, float]) -> List[int]:
+        """Set arrived_at and stage events; returns users whose orders changed"""
+        now = datetime.now(timezone.utc)
+        activate = and_(
+            Order.order_type == OrderTypeEnum.SCHEDULED,
+            Order.scheduled_time <= now + timedelta(minutes=settings.GEOFENCE_ACTIVATION_WINDOW_MINUTES),
+        )
+        stmt = (
+            update(Order)
+            .where(Order.id.in_(list(arrivals)), Order.arrived_at.is_(None))
+            .values(
+                arrived_at=now,
+                order_type=case(
+                    (activate, literal(OrderTypeEnum.IMMEDIATE, Order.order_type.type)),
+                    else_=Order.order_type,
+                ),
+            )
+            .returning(*Order.__table__.c)
+            .execution_options(synchronize_session=False)
+        )
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(stmt)).all()
+            for row in rows:
+                payload = {**order_payload(row), "distance_m": round(arrivals[row.id], 1)}
+                OutboxService.add(db, "order.arrived", row.point_id, row.id, payload, user_id=row.user_id)
+            await db.commit()
+
+        arrivals_total.inc(len(rows))
+        return [row.user_id for row in rows]
+
+    async def process(self) -> int:
+        """Run one micro-batch over everything buffered, return the number of arrivals"""
+        if not self._users:
+            return 0
+        users = np.array(self._users, dtype=np.int64)
+        latitudes = np.array(self._latitudes, dtype=float)
+        longitudes = np.array(self._longitudes, dtype=float)
+        accuracies = np.array(self._accuracies, dtype=float)
+        self._reset_buffer()
+        self.ready.clear()
+        buffered_pings.set(0)
+
+        started = perf_counter()
+        arrivals = await self._match(users, latitudes, longitudes, accuracies)
+        arrived_users: List[int] = []
+        if arrivals:
+            arrived_users = await self._mark_arrived(arrivals)
+            for user_id in set(arrived_users):
+                self.invalidate(user_id)
+        pings_total.inc(len(users), outcome="processed")
+        batch_seconds.set(perf_counter() - started)
+        return len(arrived_users)
+
+    async def run(self, stop: asyncio.Event) -> None:
+        """Process micro-batches every GEOFENCE_BATCH_INTERVAL_SECONDS or when the buffer fills"""
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(
+                    self.ready.wait(), timeout=settings.GEOFENCE_BATCH_INTERVAL_SECONDS
+                )
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.process()
+            except Exception:
+                logger.exception("Geofence batch failed")
+
+
+geofence = GeofenceProcessor()
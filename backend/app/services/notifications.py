@@ -0,0 +1,498 @@
+import asyncio
+import json
+import logging
+import os
+import smtplib
+import socket
+import time
+from email.message import EmailMessage
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import httpx
+from fastapi import HTTPException
+from redis.exceptions import ResponseError
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, redis_client
+from app.core.encoding import shared_payload
+from app.core.metrics import Counter
+from app.core.security import create_email_verification_token, create_password_reset_token
+from app.models.user import PushDevice
+from app.services.outbox import ORDER_EVENTS_STREAM
+from app.services.point import PointService
+
+
+logger = logging.getLogger(__name__)
+
+EMAIL_QUEUE = "notifications:email"
+EMAIL_PROCESSING = "notifications:email:processing"  # emails taken by the worker, until sent or given up
+CONSUMER_GROUP = "notifications"
+PUSH_EVENTS = ("order.status_changed", "order.finalized")
+
+notifications_total = Counter("notifications_total", "Notifications by channel and outcome", ("channel", "outcome"))
+push_requests_total = Counter("notification_push_requests_total", "Push gateway requests", ("outcome",))
+
+
+class NotificationService:
+    """Request-side API: queue emails, manage push devices. Sending happens in the worker."""
+
+    @staticmethod
+    async def queue_email(to: str, subject: str, body: str) -> None:
+        await redis_client.lpush(EMAIL_QUEUE, json.dumps({"to": to, "subject": subject, "body": body}))
+
+    @staticmethod
+    async def send_verification_email(email: str) -> None:
+        token = create_email_verification_token(email)
+        await NotificationService.queue_email(
+            email,
+            "Confirm your email",
+            f"Confirm your email address: {settings.EMAIL_LINK_BASE_URL}/verify-email?token={token}\n\n"
+            "The link is valid for 24 hours.",
+        )
+
+    @staticmethod
+    async def send_password_reset_email(email: str) -> None:
+        token = create_password_reset_token(email)
+        await NotificationService.queue_email(
+            email,
+            "Reset your password",
+            f"Set a new password: {settings.EMAIL_LINK_BASE_URL}/reset-password?token={token}\n\n"
+            "The link is valid for 1 hour. If you didn't ask for it, ignore this email.",
+        )
+
+    @staticmethod
+    async def register_device(db: AsyncSession, user_id: int, token: str, platform: Optional[str]) -> None:
+        """Attach a push token to the user (moving it if another account had it)"""
+        stmt = insert(PushDevice).values(user_id=user_id, token=token, platform=platform)
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[PushDevice.token],
+            set_={"user_id": stmt.excluded.user_id, "platform": stmt.excluded.platform},
+        ))
+        await db.commit()
+
+    @staticmethod
+    async def unregister_device(db: AsyncSession, user_id: int, token: str) -> None:
+        await db.execute(delete(PushDevice).where(PushDevice.user_id == user_id, PushDevice.token == token))
+        await db.commit()
+
+
+class SMTPPool:
+    """Reused SMTP connections; smtplib calls run in worker threads"""
+
+    def __init__(self, size: int):
+        self._slots = asyncio.Semaphore(size)
+        self._idle: List[smtplib.SMTP] = []
+
+    @staticmethod
+    def _connect() -> smtplib.SMTP:
+        connection = smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT_SECONDS)
+        if settings.SMTP_STARTTLS:
+            connection.starttls()
+        if settings.SMTP_USERNAME:
+            connection.login(settings.SMTP_USERNAME, settings.SMTP_PASSWORD or "")
+        return connection
+
+    @staticmethod
+    def _send(connection: Optional[smtplib.SMTP], message: EmailMessage) -> smtplib.SMTP:
+        if connection is not None:
+            try:
+                connection.send_message(message)
+                return connection
+            except smtplib.SMTPServerDisconnected:
+                pass  # idle connection closed by the server: reconnect once
+            except smtplib.SMTPException:
+                raise  # refused by the server (SMTPException is an OSError too)
+            except OSError:
+                pass
+        connection = SMTPPool._connect()
+        try:
+            connection.send_message(message)
+        except Exception:
+            SMTPPool._close(connection)  # send() only keeps connections it handed in
+            raise
+        return connection
+
+    @staticmethod
+    def _close(connection: smtplib.SMTP) -> None:
+        try:
+            connection.quit()
+        except (smtplib.SMTPException, OSError):
+            connection.close()
+
+    async def send(self, message: EmailMessage) -> None:
+        async with self._slots:
+            connection = self._idle.pop() if self._idle else None
+            try:
+                connection = await asyncio.to_thread(self._send, connection, message)
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError):
+                if connection is not None:  # the message was refused, the session is fine
+                    self._idle.append(connection)
+                raise
+            except Exception:
+                if connection is not None:
+                    await asyncio.to_thread(self._close, connection)
+                raise
+            self._idle.append(connection)
+
+    async def close(self) -> None:
+        idle, self._idle = self._idle, []
+        for connection in idle:
+            await asyncio.to_thread(self._close, connection)
+
+
+class PushGateway:
+    """HTTP push gateway taking JSON arrays of messages (Expo push API format)"""
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        headers = {"Accept": "application/json"}
+        if settings.NOTIFICATIONS_PUSH_ACCESS_TOKEN:
+            headers["Authorization"] = f"Bearer {settings.NOTIFICATIONS_PUSH_ACCESS_TOKEN}"
+        self._client = httpx.AsyncClient(
+            headers=headers,
+            transport=transport,
+            timeout=settings.NOTIFICATIONS_HTTP_TIMEOUT_SECONDS,
+            limits=httpx.Limits(
+                max_connections=settings.NOTIFICATIONS_HTTP_POOL_SIZE,
+                max_keepalive_connections=settings.NOTIFICATIONS_HTTP_POOL_SIZE,
+            ),
+        )
+
+    async def send(self, messages: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """Send one batch; the error code of every message (None if accepted)"""
+        response = await self._client.post(settings.NOTIFICATIONS_PUSH_URL, json=messages)
+        response.raise_for_status()
+        tickets = response.json().get("data", [])
+        return [
+            (ticket.get("details") or {}).get("error", "error") if ticket.get("status") == "error" else None
+            for ticket in tickets
+        ]
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+class _Push:
+    """Latest status of an order waiting out the coalescing window"""
+    __slots__ = ("due", "event", "version", "message_ids")
+
+    def __init__(self, due: float):
+        self.due = due
+        self.event: Dict[str, Any] = {}
+        self.version = -1
+        self.message_ids: List[str] = []
+
+
+async def within_cap(kind: str, keys: Iterable[Any], cap: int) -> List[bool]:
+    """Count one notification per key in the current window; False where over ``cap``"""
+    keys = list(keys)
+    if not keys:
+        return []
+    window = settings.NOTIFICATIONS_CAP_WINDOW_SECONDS
+    bucket = int(time.time()) // window
+    pipe = redis_client.pipeline(transaction=False)
+    for key in keys:
+        cap_key = f"notify:cap:{kind}:{key}:{bucket}"
+        pipe.incr(cap_key)
+        pipe.expire(cap_key, window)
+    counts = (await pipe.execute())[::2]
+    return [count <= cap for count in counts]
+
+
+class NotificationWorker:
+    """Worker loops sending order status pushes and queued emails.
+
+    Pushes come from the ``events:orders`` stream (consumer group
+    ``notifications``). Status changes of one order arriving within
+    ``NOTIFICATIONS_COALESCE_SECONDS`` of the first are coalesced into a
+    single push with the latest status. Due pushes are sent to the push
+    gateway in batches of ``NOTIFICATIONS_PUSH_BATCH_SIZE`` over a pooled
+    HTTP client, and only then acknowledged. Events left unacknowledged by a
+    crashed worker are claimed after ``NOTIFICATIONS_CLAIM_IDLE_SECONDS``.
+
+    Emails are moved atomically from ``notifications:email`` to
+    ``EMAIL_PROCESSING`` and sent over a small pool of persistent SMTP
+    connections. A failed send goes back on the queue until it has been tried
+    ``NOTIFICATIONS_EMAIL_MAX_ATTEMPTS`` times; emails left in
+    ``EMAIL_PROCESSING`` by a crashed worker are requeued when it starts
+    again (at least once: an email may be sent twice if the worker dies
+    between sending and releasing it). Both channels drop what exceeds the
+    per-user caps. Without ``NOTIFICATIONS_PUSH_URL`` / ``SMTP_HOST`` nothing
+    is sent (emails are logged), so local stubs can be pointed at by
+    settings alone.
+    """
+
+    def __init__(self):
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self._pending: Dict[int, _Push] = {}  # order id -> coalesced push
+        self._ack: List[str] = []  # stream entries with nothing to send
+        self._claimed_at = 0.0
+
+    async def _ensure_group(self) -> None:
+        try:
+            await redis_client.xgroup_create(ORDER_EVENTS_STREAM, CONSUMER_GROUP, id="$", mkstream=True)
+        except ResponseError as error:
+            if "BUSYGROUP" not in str(error):
+                raise
+
+    def _add(self, message_id: str, event: Dict[str, Any]) -> None:
+        data = event.get("data") or {}
+        if event.get("type") not in PUSH_EVENTS or not event.get("user_id") or "status_id" not in data:
+            self._ack.append(message_id)
+            return
+        push = self._pending.get(event["entity_id"])
+        if push is None:
+            push = self._pending[event["entity_id"]] = _Push(time.monotonic() + settings.NOTIFICATIONS_COALESCE_SECONDS)
+        else:
+            notifications_total.inc(channel="push", outcome="coalesced")
+        # Redelivered or reordered events must not roll the status back
+        version = data.get("v", 0)
+        if version >= push.version:
+            push.event, push.version = event, version
+        push.message_ids.append(message_id)
+
+    async def _read(self) -> None:
+        now = time.monotonic()
+        if now - self._claimed_at >= settings.NOTIFICATIONS_CLAIM_IDLE_SECONDS:
+            self._claimed_at = now
+            claimed = await redis_client.xautoclaim(
+                ORDER_EVENTS_STREAM, CONSUMER_GROUP, self.consumer,
+                min_idle_time=int(settings.NOTIFICATIONS_CLAIM_IDLE_SECONDS * 1000),
+                count=settings.NOTIFICATIONS_READ_BATCH,
+            )
+            for message_id, fields in claimed[1]:
+                if fields:
+                    self._add(message_id, json.loads(fields["e"]))
+                else:  # trimmed from the stream meanwhile
+                    self._ack.append(message_id)
+
+        if self._pending:
+            next_due = min(push.due for push in self._pending.values())
+            block = max(int((next_due - time.monotonic()) * 1000), 1)
+        else:
+            block = 1000
+        entries = await redis_client.xreadgroup(
+            CONSUMER_GROUP, self.consumer, {ORDER_EVENTS_STREAM: ">"},
+            count=settings.NOTIFICATIONS_READ_BATCH, block=min(block, 1000),
+        )
+        for _, messages in entries or []:
+            for message_id, fields in messages:
+                self._add(message_id, json.loads(fields["e"]))
+
+    async def _flush(self, gateway: PushGateway, everything: bool = False) -> None:
+        now = time.monotonic()
+        due = [
+            order_id for order_id, push in self._pending.items()
+            if everything or push.due <= now
+        ]
+        pushes = [self._pending.pop(order_id) for order_id in due]
+        if pushes:
+            try:
+                await self._deliver(gateway, [push.event for push in pushes])
+            except Exception:
+                # Pushes are best effort: a failed batch is not retried
+                logger.exception("Failed to send %d pushes", len(pushes))
+                notifications_total.inc(len(pushes), channel="push", outcome="failed")
+        acks = self._ack + [message_id for push in pushes for message_id in push.message_ids]
+        if acks:
+            await redis_client.xack(ORDER_EVENTS_STREAM, CONSUMER_GROUP, *acks)
+            self._ack = []
+
+    @staticmethod
+    async def _texts(db: AsyncSession, point_ids: Set[int]) -> Dict[int, Tuple[Optional[str], Dict[int, str]]]:
+        """Point name and status names by point, from the shared public payloads"""
+        texts = {}
+        for point_id in point_ids:
+            try:
+                point = await shared_payload(
+                    PointService.public_key(point_id), lambda: PointService.get_public_point(db, point_id)
+                )
+                statuses = await shared_payload(
+                    PointService.statuses_key(point_id), lambda: PointService.get_public_statuses(db, point_id)
+                )
+            except HTTPException:  # point deleted
+                continue
+            texts[point_id] = (
+                point.content["name"],
+                {entry["id"]: entry["name"] for entry in statuses.content},
+            )
+        return texts
+
+    async def _deliver(self, gateway: PushGateway, events: List[Dict[str, Any]]) -> None:
+        if not settings.NOTIFICATIONS_PUSH_URL:
+            notifications_total.inc(len(events), channel="push", outcome="disabled")
+            return
+        allowed = await within_cap("push", (event["user_id"] for event in events), settings.NOTIFICATIONS_PUSH_USER_CAP)
+        notifications_total.inc(allowed.count(False), channel="push", outcome="capped")
+        events = [event for event, ok in zip(events, allowed) if ok]
+        if not events:
+            return
+
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                select(PushDevice.user_id, PushDevice.token)
+                .where(PushDevice.user_id.in_({event["user_id"] for event in events}))
+            )).all()
+            texts = await self._texts(db, {event["point_id"] for event in events})
+        devices: Dict[int, List[str]] = {}
+        for user_id, token in rows:
+            devices.setdefault(user_id, []).append(token)
+
+        messages = []
+        for event in events:
+            if event["point_id"] not in texts or event["user_id"] not in devices:
+                notifications_total.inc(channel="push", outcome="no_device")
+                continue
+            point_name, status_names = texts[event["point_id"]]
+            data = event["data"]
+            status_name = status_names.get(data["status_id"], "updated")
+            for token in devices[event["user_id"]]:
+                messages.append({
+                    "to": token,
+                    "title": point_name,
+                    "body": f"Order {data['number']}: {status_name}",
+                    "data": {"order_id": event["entity_id"], "point_id": event["point_id"], "status_id": data["status_id"]},
+                })
+
+        size = settings.NOTIFICATIONS_PUSH_BATCH_SIZE
+        batches = [messages[start:start + size] for start in range(0, len(messages), size)]
+        results = await asyncio.gather(*(gateway.send(batch) for batch in batches), return_exceptions=True)
+        unregistered = []
+        for batch, result in zip(batches, results):
+            if isinstance(result, Exception):
+                logger.warning("Push gateway request failed: %s", result)
+                push_requests_total.inc(outcome="failed")
+                notifications_total.inc(len(batch), channel="push", outcome="failed")
+                continue
+            push_requests_total.inc(outcome="sent")
+            for message, error in zip(batch, result):
+                notifications_total.inc(channel="push", outcome="sent" if error is None else "rejected")
+                if error == "DeviceNotRegistered":
+                    unregistered.append(message["to"])
+        if unregistered:
+            async with AsyncSessionLocal() as db:
+                await db.execute(delete(PushDevice).where(PushDevice.token.in_(unregistered)))
+                await db.commit()
+
+    async def _push_loop(self, stop: asyncio.Event) -> None:
+        gateway = PushGateway()
+        ready = False
+        try:
+            while not stop.is_set():
+                try:
+                    if not ready:
+                        await self._ensure_group()
+                        ready = True
+                    await self._read()
+                    await self._flush(gateway)
+                except Exception:
+                    logger.exception("Push notification loop failed")
+                    await asyncio.sleep(1.0)
+            if ready:
+                await self._flush(gateway, everything=True)
+        finally:
+            await gateway.close()
+
+    async def _send_emails(self, smtp: SMTPPool, emails: List[Dict[str, Any]]) -> List[bool]:
+        """Send what the caps allow; per email, whether it is done with (False = send failed)"""
+        allowed = await within_cap("email", (email["to"] for email in emails), settings.NOTIFICATIONS_EMAIL_USER_CAP)
+        notifications_total.inc(allowed.count(False), channel="email", outcome="capped")
+        done = [True] * len(emails)
+        sending = [index for index, ok in enumerate(allowed) if ok]
+        if not settings.SMTP_HOST:
+            for index in sending:
+                logger.info("SMTP is not configured, email to %s not sent: %s", emails[index]["to"], emails[index]["subject"])
+            notifications_total.inc(len(sending), channel="email", outcome="disabled")
+            return done
+
+        messages = []
+        for index in sending:
+            message = EmailMessage()
+            message["From"] = settings.SMTP_FROM
+            message["To"] = emails[index]["to"]
+            message["Subject"] = emails[index]["subject"]
+            message.set_content(emails[index]["body"])
+            messages.append(message)
+        results = await asyncio.gather(*(smtp.send(message) for message in messages), return_exceptions=True)
+        for index, message, result in zip(sending, messages, results):
+            if isinstance(result, Exception):
+                logger.warning("Failed to send email to %s: %s", message["To"], result)
+                done[index] = False
+            else:
+                notifications_total.inc(channel="email", outcome="sent")
+        return done
+
+    @staticmethod
+    async def requeue_unfinished_emails() -> int:
+        """Put the emails left in ``EMAIL_PROCESSING`` back at the sending end of the queue"""
+        requeued = 0
+        while await redis_client.lmove(EMAIL_PROCESSING, EMAIL_QUEUE, "LEFT", "RIGHT") is not None:
+            requeued += 1
+        if requeued:
+            logger.warning("Requeued %d unsent emails", requeued)
+        return requeued
+
+    @staticmethod
+    async def _take_emails() -> List[str]:
+        """Move up to ``NOTIFICATIONS_EMAIL_BATCH`` queued emails to ``EMAIL_PROCESSING``"""
+        first = await redis_client.blmove(EMAIL_QUEUE, EMAIL_PROCESSING, 1, "RIGHT", "LEFT")
+        if first is None:
+            return []
+        pipe = redis_client.pipeline(transaction=False)
+        for _ in range(settings.NOTIFICATIONS_EMAIL_BATCH - 1):
+            pipe.lmove(EMAIL_QUEUE, EMAIL_PROCESSING, "RIGHT", "LEFT")
+        return [first, *(entry for entry in await pipe.execute() if entry is not None)]
+
+    async def _process_emails(self, smtp: SMTPPool) -> int:
+        raw = await self._take_emails()
+        if not raw:
+            return 0
+        entries, emails = [], []
+        for entry in raw:
+            try:
+                emails.append(json.loads(entry))
+                entries.append(entry)
+            except ValueError:
+                logger.error("Dropping malformed queued email: %r", entry[:200])
+                await redis_client.lrem(EMAIL_PROCESSING, 1, entry)
+
+        done = await self._send_emails(smtp, emails)
+        pipe = redis_client.pipeline(transaction=True)
+        for entry, email, ok in zip(entries, emails, done):
+            if not ok:
+                attempts = email.get("attempts", 0) + 1
+                if attempts < settings.NOTIFICATIONS_EMAIL_MAX_ATTEMPTS:
+                    # Back at the far end of the queue: retried after what is waiting now
+                    pipe.lpush(EMAIL_QUEUE, json.dumps({**email, "attempts": attempts}))
+                    notifications_total.inc(channel="email", outcome="retried")
+                else:
+                    logger.error("Giving up on email to %s after %d attempts", email["to"], attempts)
+                    notifications_total.inc(channel="email", outcome="failed")
+            pipe.lrem(EMAIL_PROCESSING, 1, entry)
+        await pipe.execute()
+        return len(entries)
+
+    async def _email_loop(self, stop: asyncio.Event) -> None:
+        smtp = SMTPPool(settings.SMTP_POOL_SIZE)
+        requeued = False
+        try:
+            while not stop.is_set():
+                try:
+                    if not requeued:
+                        await self.requeue_unfinished_emails()
+                        requeued = True
+                    await self._process_emails(smtp)
+                except Exception:
+                    # Emails taken meanwhile stayed in EMAIL_PROCESSING: requeue them
+                    logger.exception("Email loop failed")
+                    requeued = False
+                    await asyncio.sleep(1.0)
+        finally:
+            await smtp.close()
+
+    async def run(self, stop: asyncio.Event) -> None:
+        if not settings.NOTIFICATIONS_ENABLED:
+            return
+        await asyncio.gather(self._push_loop(stop), self._email_loop(stop))
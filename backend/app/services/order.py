@@ -0,0 +1,258 @@
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import Integer, cast, func, select
+from sqlalchemy.exc import IntegrityError
+from fastapi import HTTPException, status
+
+from app.models.order import Order, OrderStatus, OrderStatusHistory, OrderTypeEnum
+from app.models.point import Point, PointStatusEnum
+from app.models.cashier import Cashier
+from app.models.user import User
+from app.schemas.order import OrderCreate, OrderStatusTransition
+from app.core.database import AsyncSessionLocal, redis_client
+from app.core.metrics import Counter
+from app.core.sharding import point_key, shards
+from app.services.active_orders import ActiveOrdersIndex
+from app.services.changefeed import order_payload
+from app.services.geofence import geofence
+from app.services.outbox import OutboxService
+from app.services.point import PointService
+
+
+# Raise the counter to at least ARGV[1], then take ARGV[2] numbers
+_ALLOCATE_AFTER_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+if current < tonumber(ARGV[1]) then
+    redis.call('SET', KEYS[1], ARGV[1])
+end
+return redis.call('INCRBY', KEYS[1], ARGV[2])
+"""
+
+_allocate_after = redis_client.register_script(_ALLOCATE_AFTER_SCRIPT)
+
+order_seq_seeds_total = Counter(
+    "order_seq_seeds_total", "Order number counters re-seeded from Postgres", ("reason",)
+)
+
+
+class OrderService:
+
+    @staticmethod
+    def order_seq_key(point_id: int) -> str:
+        return point_key(point_id, "order_seq")
+
+    @staticmethod
+    async def _highest_order_number(point_id: int) -> int:
+        async with AsyncSessionLocal() as db:
+            return await db.scalar(
+                select(func.max(cast(func.split_part(Order.order_number, "-", 2), Integer)))
+                .where(Order.point_id == point_id)
+            ) or 0
+
+    @staticmethod
+    async def allocate_order_numbers(point_id: int, count: int = 1, reseed: bool = False) -> List[str]:
+        """Reserve ``count`` consecutive order numbers for a point.
+
+        The counter lives in Redis only; when it was missing (first order, or
+        lost to a flush, eviction or failover) or ``reseed`` is set, numbering
+        continues after the highest number in Postgres.
+        """
+        shard = await shards.shard(point_id)
+        key = OrderService.order_seq_key(point_id)
+        last = None if reseed else await shard.autopipeline.incrby(key, count)
+        if last is None or last == count:  # INCRBY created the key
+            highest = await OrderService._highest_order_number(point_id)
+            if last is None or highest:
+                last = int(await _allocate_after(keys=[key], args=[highest, count], client=shard.client))
+                order_seq_seeds_total.inc(reason="conflict" if reseed else "missing")
+        return [f"{point_id}-{number:04d}" for number in range(last - count + 1, last + 1)]
+
+    @staticmethod
+    def is_number_conflict(error: IntegrityError) -> bool:
+        """Whether an insert failed on the unique order number"""
+        return "order_number" in str(error.orig)
+
+    @staticmethod
+    async def get_initial_status(db: AsyncSession, point_id: int) -> OrderStatus:
+        """First active non-final status of the point's workflow"""
+        result = await db.execute(
+            select(OrderStatus)
+            .where(
+                OrderStatus.point_id == point_id,
+                OrderStatus.is_active.is_(True),
+                OrderStatus.is_final.is_(False),
+            )
+            .order_by(OrderStatus.order_index, OrderStatus.id)
+            .limit(1)
+        )
+        initial_status = result.scalar_one_or_none()
+        if initial_status is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Point has no order statuses configured"
+            )
+        return initial_status
+
+    @staticmethod
+    def check_order(point: Point, order_data: OrderCreate, cashier: Optional[Cashier]) -> None:
+        """Raise 400 unless the point (and cashier) can accept this order"""
+        if point.status != PointStatusEnum.ACTIVE or not point.accepts_online_orders:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Point does not accept orders"
+            )
+
+        if order_data.order_type.value == OrderTypeEnum.SCHEDULED.value:
+            if not point.accepts_scheduled_orders:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Point does not accept scheduled orders"
+                )
+            if order_data.scheduled_time is None:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="scheduled_time is required for scheduled orders"
+                )
+            scheduled_time = order_data.scheduled_time
+            if scheduled_time.tzinfo is None:
+                scheduled_time = scheduled_time.replace(tzinfo=timezone.utc)
+            now = datetime.now(timezone.utc)
+            if not now <= scheduled_time <= now + timedelta(days=point.advance_booking_days):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="scheduled_time is outside the booking window"
+                )
+
+        if order_data.cashier_id is not None:
+            if cashier is None or cashier.point_id != point.id or not cashier.is_active:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Invalid cashier for this point"
+                )
+
+    @staticmethod
+    async def validate_order(db: AsyncSession, order_data: OrderCreate) -> Point:
+        """Check that the point (and cashier) can accept this order"""
+        point = await PointService.get_point(db, order_data.point_id)
+        cashier = None
+        if order_data.cashier_id is not None:
+            cashier = await db.get(Cashier, order_data.cashier_id)
+        OrderService.check_order(point, order_data, cashier)
+        return point
+
+    @staticmethod
+    async def create_order(db: AsyncSession, user: User, order_data: OrderCreate) -> Order:
+        """Create order in the point's initial status"""
+        point = await OrderService.validate_order(db, order_data)
+        initial_status = await OrderService.get_initial_status(db, point.id)
+
+        # A number can collide once if the Redis counter fell behind; the
+        # savepoint keeps the rest of the session intact for the retry
+        for attempt in range(2):
+            order_number, = await OrderService.allocate_order_numbers(point.id, reseed=attempt > 0)
+            db_order = Order(
+                user_id=user.id,
+                point_id=point.id,
+                cashier_id=order_data.cashier_id,
+                order_number=order_number,
+                order_type=OrderTypeEnum(order_data.order_type.value),
+                description=order_data.description,
+                customer_notes=order_data.customer_notes,
+                scheduled_time=order_data.scheduled_time,
+                current_status_id=initial_status.id,
+            )
+            try:
+                async with db.begin_nested():
+                    db.add(db_order)
+                    await db.flush()
+                break
+            except IntegrityError as error:
+                if attempt or not OrderService.is_number_conflict(error):
+                    raise
+
+        history = OrderStatusHistory(
+            order_id=db_order.id,
+            status_id=initial_status.id,
+            changed_by_user_id=user.id,
+        )
+        db.add(history)
+        await db.flush()
+        OutboxService.add(
+            db, "order.created", point.id, db_order.id, {
+                **order_payload(db_order),
+                "v": history.id,
+                "position": await ActiveOrdersIndex.position(db, db_order),
+            }, user_id=user.id
+        )
+        await db.commit()
+        await db.refresh(db_order)
+        geofence.invalidate(user.id)
+        return db_order
+
+    @staticmethod
+    async def transition_status(
+        db: AsyncSession,
+        user: User,
+        order_id: int,
+        transition: OrderStatusTransition,
+    ) -> Order:
+        """Move order to a new status (point staff only)"""
+        result = await db.execute(
+            select(Order).where(Order.id == order_id).with_for_update()
+        )
+        order = result.scalar_one_or_none()
+        if order is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Order not found"
+            )
+
+        await PointService.ensure_staff(db, order.point_id, user)
+
+        new_status = await db.get(OrderStatus, transition.new_status_id)
+        if new_status is None or new_status.point_id != order.point_id or not new_status.is_active:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid status for this point"
+            )
+
+        current_status: Optional[OrderStatus] = None
+        if order.current_status_id is not None:
+            current_status = await db.get(OrderStatus, order.current_status_id)
+        if current_status is not None and current_status.is_final:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Order is already in a final status"
+            )
+
+        now = datetime.now(timezone.utc)
+        result = await db.execute(
+            select(OrderStatusHistory).where(
+                OrderStatusHistory.order_id == order.id,
+                OrderStatusHistory.ended_at.is_(None),
+            )
+        )
+        for entry in result.scalars():
+            entry.ended_at = now
+
+        history = OrderStatusHistory(
+            order_id=order.id,
+            status_id=new_status.id,
+            notes=transition.notes,
+            changed_by_user_id=user.id,
+            ended_at=now if new_status.is_final else None,
+        )
+        db.add(history)
+        order.current_status_id = new_status.id
+        await db.flush()
+        event_type = "order.finalized" if new_status.is_final else "order.status_changed"
+        payload = {**order_payload(order), "v": history.id}
+        if not new_status.is_final:
+            payload["position"] = await ActiveOrdersIndex.position(db, order)
+        OutboxService.add(
+            db, event_type, order.point_id, order.id, payload, user_id=order.user_id
+        )
+        await db.commit()
+        await db.refresh(order)
+        return order
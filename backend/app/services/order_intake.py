@@ -0,0 +1,258 @@
+import asyncio
+import logging
+from collections import Counter as Tally
+from time import perf_counter
+from typing import Dict, List, Optional, Set
+
+from fastapi import HTTPException, status
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.metrics import Counter, Gauge
+from app.models.cashier import Cashier
+from app.models.order import Order, OrderStatus, OrderStatusHistory, OrderTypeEnum
+from app.models.outbox import OutboxEvent
+from app.models.point import Point
+from app.models.user import User
+from app.schemas.order import OrderCreate
+from app.services.active_orders import ActiveOrdersIndex
+from app.services.changefeed import order_payload
+from app.services.geofence import geofence
+from app.services.order import OrderService
+
+
+logger = logging.getLogger(__name__)
+
+intake_orders_total = Counter("order_intake_orders_total", "Orders submitted to group commit", ("outcome",))
+intake_batches_total = Counter("order_intake_batches_total", "Group commits", ("outcome",))
+intake_batch_size = Gauge("order_intake_batch_size", "Orders in the last group commit")
+intake_batch_seconds = Gauge("order_intake_batch_seconds", "Duration of the last group commit")
+
+
+class _PendingOrder:
+    __slots__ = ("user", "data", "future")
+
+    def __init__(self, user: User, data: OrderCreate, future: "asyncio.Future"):
+        self.user = user
+        self.data = data
+        self.future = future
+
+    def resolve(self, order: Order) -> None:
+        if not self.future.done():  # caller may have gone away
+            self.future.set_result(order)
+
+    def fail(self, error: BaseException) -> None:
+        if not self.future.done():
+            self.future.set_exception(error)
+
+
+class OrderIntake:
+    """Group commit for order creation bursts.
+
+    Orders submitted within ``ORDER_INTAKE_WINDOW_SECONDS`` of the first one
+    (or until ``ORDER_INTAKE_MAX_BATCH`` are waiting) are created together by
+    this process: points, initial statuses and cashiers are loaded once,
+    each order is validated on its own (``OrderService.check_order``), order
+    numbers are reserved per point, and the orders, their first status
+    history rows and ``order.created`` outbox events go in with multi-row
+    INSERTs in a single transaction. Every caller gets its own order or its
+    own error. If the batch transaction fails, its orders are retried one by
+    one through ``OrderService.create_order`` so one bad row only fails its
+    own request.
+    """
+
+    def __init__(self):
+        self._pending: List[_PendingOrder] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._batches: Set[asyncio.Task] = set()
+        self._slots = asyncio.Semaphore(settings.ORDER_INTAKE_MAX_CONCURRENT_BATCHES)
+
+    async def submit(self, user: User, order_data: OrderCreate) -> Order:
+        """Create an order as part of the next group commit"""
+        if not settings.ORDER_INTAKE_ENABLED:
+            async with AsyncSessionLocal() as db:
+                return await OrderService.create_order(db, user, order_data)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(_PendingOrder(user, order_data, future))
+        if len(self._pending) >= settings.ORDER_INTAKE_MAX_BATCH:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(settings.ORDER_INTAKE_WINDOW_SECONDS, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = asyncio.ensure_future(self._run(batch))
+        self._batches.add(task)
+        task.add_done_callback(self._batches.discard)
+
+    async def _run(self, batch: List[_PendingOrder]) -> None:
+        try:
+            async with self._slots:
+                started = perf_counter()
+                try:
+                    async with AsyncSessionLocal() as db:
+                        await self._commit(db, batch)
+                    intake_batches_total.inc(outcome="committed")
+                except Exception:
+                    logger.exception("Order group commit of %d orders failed, retrying one by one", len(batch))
+                    intake_batches_total.inc(outcome="retried")
+                    await asyncio.gather(*(
+                        self._create_one(item) for item in batch if not item.future.done()
+                    ))
+                intake_batch_size.set(len(batch))
+                intake_batch_seconds.set(perf_counter() - started)
+        finally:
+            for item in batch:  # cancelled mid-batch: don't leave callers waiting
+                item.fail(HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Order could not be created"
+                ))
+
+    @staticmethod
+    async def _create_one(item: _PendingOrder) -> None:
+        try:
+            async with AsyncSessionLocal() as db:
+                order = await OrderService.create_order(db, item.user, item.data)
+        except Exception as error:
+            intake_orders_total.inc(outcome="failed")
+            item.fail(error)
+        else:
+            intake_orders_total.inc(outcome="created")
+            item.resolve(order)
+
+    @staticmethod
+    async def _validate(db: AsyncSession, batch: List[_PendingOrder]) -> Dict[int, OrderStatus]:
+        """Fail the orders that can't be accepted; initial status by point for the rest"""
+        point_ids = {item.data.point_id for item in batch}
+        points = {
+            point.id: point
+            for point in await db.scalars(select(Point).where(Point.id.in_(point_ids)))
+        }
+        initial_statuses = {
+            order_status.point_id: order_status
+            for order_status in await db.scalars(
+                select(OrderStatus)
+                .where(
+                    OrderStatus.point_id.in_(point_ids),
+                    OrderStatus.is_active.is_(True),
+                    OrderStatus.is_final.is_(False),
+                )
+                .order_by(OrderStatus.point_id, OrderStatus.order_index, OrderStatus.id)
+                .distinct(OrderStatus.point_id)
+            )
+        }
+        cashier_ids = {item.data.cashier_id for item in batch if item.data.cashier_id is not None}
+        cashiers = {}
+        if cashier_ids:
+            cashiers = {
+                cashier.id: cashier
+                for cashier in await db.scalars(select(Cashier).where(Cashier.id.in_(cashier_ids)))
+            }
+
+        for item in batch:
+            point = points.get(item.data.point_id)
+            try:
+                if point is None:
+                    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Point not found")
+                OrderService.check_order(point, item.data, cashiers.get(item.data.cashier_id))
+                if point.id not in initial_statuses:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="Point has no order statuses configured"
+                    )
+            except HTTPException as error:
+                intake_orders_total.inc(outcome="rejected")
+                item.fail(error)
+        return initial_statuses
+
+    @staticmethod
+    async def _commit(db: AsyncSession, batch: List[_PendingOrder]) -> None:
+        initial_statuses = await OrderIntake._validate(db, batch)
+        accepted = [item for item in batch if not item.future.done()]
+        if not accepted:
+            return
+
+        counts = Tally(item.data.point_id for item in accepted)
+        # A number can collide once if a Redis counter fell behind: re-seed
+        # and retry, the savepoint keeps the batch's transaction usable
+        for attempt in range(2):
+            # One INCRBY per point, sent together by the auto-pipeline
+            allocated = await asyncio.gather(*(
+                OrderService.allocate_order_numbers(point_id, count, reseed=attempt > 0)
+                for point_id, count in counts.items()
+            ))
+            numbers = {point_id: iter(point_numbers) for point_id, point_numbers in zip(counts, allocated)}
+            try:
+                async with db.begin_nested():
+                    orders = (await db.scalars(
+                        insert(Order).returning(Order, sort_by_parameter_order=True),
+                        [
+                            {
+                                "user_id": item.user.id,
+                                "point_id": item.data.point_id,
+                                "cashier_id": item.data.cashier_id,
+                                "order_number": next(numbers[item.data.point_id]),
+                                "order_type": OrderTypeEnum(item.data.order_type.value),
+                                "description": item.data.description,
+                                "customer_notes": item.data.customer_notes,
+                                "scheduled_time": item.data.scheduled_time,
+                                "current_status_id": initial_statuses[item.data.point_id].id,
+                            }
+                            for item in accepted
+                        ],
+                    )).all()
+                break
+            except IntegrityError as error:
+                if attempt or not OrderService.is_number_conflict(error):
+                    raise
+        history_ids = (await db.scalars(
+            insert(OrderStatusHistory).returning(OrderStatusHistory.id, sort_by_parameter_order=True),
+            [
+                {"order_id": order.id, "status_id": order.current_status_id, "changed_by_user_id": order.user_id}
+                for order in orders
+            ],
+        )).all()
+
+        immediate = [order.id for order in orders if order.order_type == OrderTypeEnum.IMMEDIATE]
+        positions = {}
+        if immediate:
+            positions = dict((await db.execute(
+                select(Order.id, ActiveOrdersIndex.queue_position(Order.id, Order.point_id))
+                .where(Order.id.in_(immediate))
+            )).all())
+
+        await db.execute(insert(OutboxEvent), [
+            {
+                "event_type": "order.created",
+                "point_id": order.point_id,
+                "user_id": order.user_id,
+                "entity_id": order.id,
+                "payload": {**order_payload(order), "v": history_id, "position": positions.get(order.id)},
+            }
+            for order, history_id in zip(orders, history_ids)
+        ])
+        await db.commit()
+
+        for item, order in zip(accepted, orders):
+            geofence.invalidate(order.user_id)
+            intake_orders_total.inc(outcome="created")
+            item.resolve(order)
+
+    async def drain(self) -> None:
+        """Commit whatever is waiting (shutdown)"""
+        self._flush()
+        if self._batches:
+            await asyncio.gather(*self._batches, return_exceptions=True)
+
+
+order_intake = OrderIntake()
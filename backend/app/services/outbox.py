@@ -0,0 +1,222 @@
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, redis_client
+from app.core.sharding import shards
+from app.models.outbox import OutboxEvent, NOTIFY_CHANNEL
+from app.schemas.sync import ChangeKindEnum, ChangeOpEnum
+from app.services.active_orders import INDEX_EVENTS, ActiveOrdersIndex
+from app.services.changefeed import ChangeFeed
+from app.services.queue_counters import QueueCounters
+
+
+logger = logging.getLogger(__name__)
+
+ORDER_EVENTS_STREAM = "events:orders"
+RELAY_LOCK_KEY = 0x6F7574626F78  # pg advisory lock held while a batch is published
+
+# How each event type shows up in the point's change feed
+EVENT_CHANGES = {
+    "order.created": (ChangeKindEnum.ORDER, ChangeOpEnum.UPSERT),
+    "order.status_changed": (ChangeKindEnum.ORDER, ChangeOpEnum.UPSERT),
+    "order.finalized": (ChangeKindEnum.ORDER, ChangeOpEnum.DELETE),
+    "order.arrived": (ChangeKindEnum.ORDER, ChangeOpEnum.UPSERT),
+    "cashier.status_changed": (ChangeKindEnum.CASHIER, ChangeOpEnum.UPSERT),
+}
+
+
+class OutboxService:
+
+    @staticmethod
+    def add(
+        db: AsyncSession,
+        event_type: str,
+        point_id: int,
+        entity_id: int,
+        payload: Optional[Dict[str, Any]] = None,
+        user_id: Optional[int] = None,
+    ) -> OutboxEvent:
+        """Stage an event in the caller's transaction (committed with it)"""
+        event = OutboxEvent(
+            event_type=event_type,
+            point_id=point_id,
+            user_id=user_id,
+            entity_id=entity_id,
+            payload=payload,
+        )
+        db.add(event)
+        return event
+
+
+def _event_message(row) -> Dict[str, Any]:
+    return {
+        "id": row.id,
+        "type": row.event_type,
+        "point_id": row.point_id,
+        "user_id": row.user_id,
+        "entity_id": row.entity_id,
+        "data": row.payload,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+    }
+
+
+class OutboxRelay:
+    """Worker loop moving outbox rows to Redis.
+
+    Each iteration claims up to ``OUTBOX_BATCH_SIZE`` rows with
+    ``DELETE ... WHERE id IN (SELECT ... FOR UPDATE SKIP LOCKED) RETURNING``,
+    publishes them in one pipeline per Redis node (change feed, queue
+    counters, pub/sub channels and the ``events:orders`` stream) and commits.
+    A failed publish rolls back the delete, so rows are retried: delivery is
+    at-least-once and consumers must tolerate duplicates (the change feed
+    skips events it already appended).
+
+    Every worker replica runs a relay, but batches are claimed and published
+    under the transaction-level advisory lock ``RELAY_LOCK_KEY``, one at a
+    time, so change feed seqs follow the order events were relayed in. A
+    relay that finds the lock taken waits for the next wakeup.
+    """
+
+    def __init__(self):
+        self._wakeup = asyncio.Event()
+        self._listen_retry_at = 0.0
+
+    async def claim_and_publish(self) -> int:
+        """Relay one batch, return the number of events published"""
+        claimed = (
+            select(OutboxEvent.id)
+            .order_by(OutboxEvent.id)
+            .limit(settings.OUTBOX_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        stmt = (
+            delete(OutboxEvent)
+            .where(OutboxEvent.id.in_(claimed))
+            .returning(*OutboxEvent.__table__.c)
+            .execution_options(synchronize_session=False)
+        )
+
+        async with AsyncSessionLocal() as db:
+            async with db.begin():
+                if not await db.scalar(select(func.pg_try_advisory_xact_lock(RELAY_LOCK_KEY))):
+                    return 0  # another relay is publishing a batch
+                rows = (await db.execute(stmt)).all()
+                if rows:
+                    await self.publish(sorted(rows, key=lambda row: row.id))
+        return len(rows)
+
+    async def publish(self, rows: List[Any]) -> None:
+        """Publish a batch of outbox rows with one pipelined round-trip per Redis node"""
+        changes_by_point = defaultdict(list)
+        messages_by_point = defaultdict(list)
+        moves_by_point = defaultdict(list)
+        pipe = redis_client.pipeline(transaction=False)
+
+        for row in rows:
+            message = json.dumps(_event_message(row), separators=(",", ":"), default=str)
+            messages_by_point[row.point_id].append(message)
+            if row.user_id is not None:
+                pipe.publish(f"user:{row.user_id}:events", message)
+            pipe.xadd(
+                ORDER_EVENTS_STREAM,
+                {"e": message},
+                maxlen=settings.OUTBOX_STREAM_MAXLEN,
+                approximate=True,
+            )
+            if row.event_type in INDEX_EVENTS and "v" in (row.payload or {}):
+                moves_by_point[row.point_id].append(row)
+                if row.user_id is not None:
+                    await ActiveOrdersIndex.queue_event(pipe, row)
+            change = EVENT_CHANGES.get(row.event_type)
+            if change is not None:
+                kind, op = change
+                changes_by_point[row.point_id].append((row.id, (kind, op, row.entity_id, row.payload)))
+
+        # A point's channel and change feed live on its shard
+        pipes = {}
+
+        def shard_pipe(shard):
+            if shard.client is redis_client:
+                return pipe
+            if shard.name not in pipes:
+                pipes[shard.name] = shard.client.pipeline(transaction=False)
+            return pipes[shard.name]
+
+        for point_id, messages in messages_by_point.items():
+            for shard in shards.publish_shards(point_id):
+                point_pipe = shard_pipe(shard)
+                for message in messages:
+                    point_pipe.publish(f"point:{point_id}:events", message)
+        for point_id, changes in changes_by_point.items():
+            await ChangeFeed.queue_events(shard_pipe(await shards.shard(point_id)), point_id, changes)
+        for point_id, moves in moves_by_point.items():
+            await QueueCounters.queue_events(shard_pipe(await shards.shard(point_id)), point_id, moves)
+
+        await asyncio.gather(pipe.execute(), *(point_pipe.execute() for point_pipe in pipes.values()))
+
+    async def _listen(self):
+        """LISTEN on the outbox channel so commits wake the relay immediately"""
+        import asyncpg
+
+        conn = await asyncpg.connect(settings.DATABASE_URL)
+        await conn.add_listener(NOTIFY_CHANNEL, lambda *args: self._wakeup.set())
+        # Wake the loop so a dropped connection is replaced right away
+        conn.add_termination_listener(lambda *args: self._wakeup.set())
+        return conn
+
+    async def _ensure_listener(self, listener):
+        """Return a live LISTEN connection, or None while only polling works"""
+        if listener is not None and not listener.is_closed():
+            return listener
+        if listener is not None:
+            logger.warning("Outbox LISTEN connection lost, reconnecting")
+            self._listen_retry_at = 0.0
+        now = time.monotonic()
+        if now < self._listen_retry_at:
+            return None
+        try:
+            listener = await self._listen()
+        except Exception as error:
+            self._listen_retry_at = now + settings.OUTBOX_LISTEN_RETRY_SECONDS
+            logger.warning(
+                "Outbox LISTEN unavailable (%s), polling every %ss, retrying in %ss",
+                error,
+                settings.OUTBOX_POLL_INTERVAL_SECONDS,
+                settings.OUTBOX_LISTEN_RETRY_SECONDS,
+            )
+            return None
+        logger.info("Outbox LISTEN connected")
+        return listener
+
+    async def run(self, stop: asyncio.Event) -> None:
+        """Relay until ``stop`` is set"""
+        listener = None
+        try:
+            while not stop.is_set():
+                listener = await self._ensure_listener(listener)
+                self._wakeup.clear()
+                try:
+                    published = await self.claim_and_publish()
+                except Exception:
+                    logger.exception("Outbox relay batch failed")
+                    published = 0
+                if published >= settings.OUTBOX_BATCH_SIZE:
+                    continue  # backlog: keep draining
+                try:
+                    await asyncio.wait_for(
+                        self._wakeup.wait(), timeout=settings.OUTBOX_POLL_INTERVAL_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if listener is not None and not listener.is_closed():
+                await listener.close()
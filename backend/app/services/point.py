@@ -0,0 +1,135 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+
+from app.core.database import redis_client
+from app.models.order import OrderStatus
+from app.models.point import Point
+from app.models.cashier import Cashier
+from app.models.user import User
+from app.schemas.order import OrderStatusPublic
+from app.schemas.point import PointPublic
+from app.services.write_behind import touch_cashier_activity
+
+
+class PointService:
+
+    @staticmethod
+    async def get_point(db: AsyncSession, point_id: int) -> Point:
+        """Get point or raise 404"""
+        point = await db.get(Point, point_id)
+        if point is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Point not found"
+            )
+        return point
+
+    @staticmethod
+    async def owned_point_ids(
+        db: AsyncSession, owner_id: int, point_ids: Optional[Iterable[int]] = None
+    ) -> List[int]:
+        """Ids of the owner's points (restricted to ``point_ids`` if given)"""
+        stmt = select(Point.id).where(Point.owner_id == owner_id).order_by(Point.id)
+        if point_ids:
+            stmt = stmt.where(Point.id.in_(list(point_ids)))
+        return list(await db.scalars(stmt))
+
+    @staticmethod
+    async def get_staff_cashier_id(db: AsyncSession, point_id: int, user: User) -> Tuple[bool, Optional[int]]:
+        """Return (is_staff, cashier_id) for the user at the point.
+
+        cashier_id is the user's active cashier at the point, or None when the
+        user acts only as the owner.
+        """
+        result = await db.execute(
+            select(Point.owner_id).where(Point.id == point_id)
+        )
+        owner_id = result.scalar_one_or_none()
+        if owner_id is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Point not found"
+            )
+
+        result = await db.execute(
+            select(Cashier.id).where(
+                Cashier.point_id == point_id,
+                Cashier.assigned_user_id == user.id,
+                Cashier.is_active.is_(True),
+            ).limit(1)
+        )
+        cashier_id = result.scalar_one_or_none()
+        return owner_id == user.id or cashier_id is not None, cashier_id
+
+    @staticmethod
+    async def is_staff(db: AsyncSession, point_id: int, user: User) -> bool:
+        """Check whether user owns the point or is assigned to one of its cashiers"""
+        is_staff, _ = await PointService.get_staff_cashier_id(db, point_id, user)
+        return is_staff
+
+    @staticmethod
+    async def ensure_staff(db: AsyncSession, point_id: int, user: User) -> Optional[int]:
+        """Raise 403 unless user is the owner or a cashier of the point.
+
+        Returns the user's cashier id at the point (None for the owner) and
+        records it as cashier activity.
+        """
+        is_staff, cashier_id = await PointService.get_staff_cashier_id(db, point_id, user)
+        if not is_staff:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not enough permissions for this point"
+            )
+        if cashier_id is not None:
+            touch_cashier_activity(cashier_id)
+        return cashier_id
+
+    @staticmethod
+    async def ensure_owner(db: AsyncSession, point_id: int, user: User) -> Point:
+        """Get point or raise 404, raise 403 unless user owns it"""
+        point = await PointService.get_point(db, point_id)
+        if point.owner_id != user.id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Only the point owner can do this"
+            )
+        return point
+
+
+    @staticmethod
+    def public_key(point_id: int) -> str:
+        return f"cache:point:{point_id}"
+
+    @staticmethod
+    def statuses_key(point_id: int) -> str:
+        return f"cache:statuses:{point_id}"
+
+    @staticmethod
+    async def get_public_point(db: AsyncSession, point_id: int) -> Dict[str, Any]:
+        """PointPublic of the point as JSON-compatible data, 404 if missing"""
+        point = await PointService.get_point(db, point_id)
+        return jsonable_encoder(PointPublic.model_validate(point))
+
+    @staticmethod
+    async def get_public_statuses(db: AsyncSession, point_id: int) -> List[Dict[str, Any]]:
+        """Active order statuses of the point in workflow order, 404 if the point is missing"""
+        await PointService.get_point(db, point_id)
+        result = await db.execute(
+            select(OrderStatus)
+            .where(OrderStatus.point_id == point_id, OrderStatus.is_active.is_(True))
+            .order_by(OrderStatus.order_index, OrderStatus.id)
+        )
+        return jsonable_encoder([OrderStatusPublic.model_validate(row) for row in result.scalars()])
+
+    @staticmethod
+    async def invalidate_public(point_ids: Iterable[int]) -> None:
+        """Drop cached public data after points or their workflows changed (all processes)"""
+        keys = [
+            key for point_id in point_ids
+            for key in (PointService.public_key(point_id), PointService.statuses_key(point_id))
+        ]
+        for start in range(0, len(keys), 1000):
+            await redis_client.unlink(*keys[start:start + 1000])
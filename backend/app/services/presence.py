@@ -0,0 +1,328 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import DateTime, Integer, String, cast, column, or_, select, update, values
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, redis_client
+from app.core.metrics import Counter, Gauge
+from app.core.redis_layer import autopipeline
+from app.models.cashier import Cashier, CashierStatusEnum
+from app.models.user import User
+from app.schemas.cashier import CashierStatusEnum as CashierStatus
+from app.services.changefeed import cashier_payload
+from app.services.outbox import OutboxService
+from app.services.point import PointService
+
+
+logger = logging.getLogger(__name__)
+
+DEADLINES_KEY = "presence:deadlines"  # zset "point_id:cashier_id" -> expiry (ms)
+CHANGES_KEY = "presence:changes"  # list "cashier_id:status:ms" waiting for the DB
+CASHIER_KEY_PREFIX = "presence:cashier:"
+POINT_KEY_PREFIX = "presence:point:"  # hash cashier_id -> status of present cashiers
+
+# Refresh the cashier's TTL key and deadline; on a state change update the
+# point's hash and queue the change for the DB. An empty status keeps the
+# current one (a new session starts available). Returns [previous, current].
+_HEARTBEAT_SCRIPT = """
+local prev = redis.call('GET', KEYS[1])
+local state = ARGV[3]
+if state == '' then state = prev or 'available' end
+local t = redis.call('TIME')
+local now = t[1] * 1000 + math.floor(t[2] / 1000)
+redis.call('SET', KEYS[1], state, 'PX', ARGV[4])
+redis.call('ZADD', KEYS[3], now + tonumber(ARGV[4]), ARGV[2] .. ':' .. ARGV[1])
+if prev ~= state then
+    redis.call('HSET', KEYS[2], ARGV[1], state)
+    if ARGV[5] == '1' then
+        redis.call('RPUSH', KEYS[4], ARGV[1] .. ':' .. state .. ':' .. now)
+    end
+end
+return {prev or '', state}
+"""
+
+# Drop cashiers whose deadline passed (or, with ARGV[3] = '1', the members
+# given after it) from their point's hash and queue them as offline; ARGV[4]
+# = '0' skips queueing. ZREM makes each expiry claimed by exactly one sweeper.
+_EXPIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = t[1] * 1000 + math.floor(t[2] / 1000)
+local explicit = ARGV[3] == '1'
+local members
+if explicit then
+    members = {}
+    for i = 5, #ARGV do members[#members + 1] = ARGV[i] end
+else
+    members = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now, 'LIMIT', 0, ARGV[1])
+end
+local expired = 0
+for _, member in ipairs(members) do
+    local claimed = redis.call('ZREM', KEYS[1], member) == 1
+    if claimed or explicit then
+        local sep = string.find(member, ':', 1, true)
+        local point_id = string.sub(member, 1, sep - 1)
+        local cashier_id = string.sub(member, sep + 1)
+        redis.call('DEL', ARGV[2] .. 'cashier:' .. cashier_id)
+        local present = redis.call('HDEL', ARGV[2] .. 'point:' .. point_id, cashier_id) == 1
+        if (present or explicit) and ARGV[4] == '1' then
+            redis.call('RPUSH', KEYS[2], cashier_id .. ':offline:' .. now)
+        end
+        if present then expired = expired + 1 end
+    end
+end
+return expired
+"""
+
+_heartbeat = redis_client.register_script(_HEARTBEAT_SCRIPT)
+_expire = redis_client.register_script(_EXPIRE_SCRIPT)
+
+heartbeats_total = Counter("presence_heartbeats_total", "Cashier heartbeats", ("outcome",))
+expired_total = Counter("presence_expired_total", "Cashiers marked offline by the sweeper")
+state_writes_total = Counter("presence_state_writes_total", "Cashier status rows written to the DB")
+pending_changes = Gauge("presence_pending_changes", "Presence changes waiting for the DB")
+
+
+class PresenceService:
+    """Cashier presence kept in Redis instead of per-heartbeat DB writes.
+
+    Consoles heartbeat into ``presence:cashier:{id}`` (TTL
+    ``PRESENCE_TTL_SECONDS``) and each point's present cashiers live in one
+    hash, so availability of a point is a single HGETALL. Expired cashiers
+    are found through the deadline zset by the worker's sweeper (expiry
+    notifications, when enabled, only wake it up early). Heartbeats that
+    change a cashier's state, and expiries, are queued in Redis; the worker
+    writes them to ``cashiers`` in batches, so the DB sees one write per
+    state change instead of one per heartbeat.
+    """
+
+    # cashier_id -> (point_id, assigned_user_id, is_active): heartbeats skip the DB
+    _cashiers = LRUCache(maxsize=10000, ttl=settings.PRESENCE_AUTH_CACHE_TTL_SECONDS)
+
+    @staticmethod
+    def cashier_key(cashier_id: int) -> str:
+        return f"{CASHIER_KEY_PREFIX}{cashier_id}"
+
+    @staticmethod
+    def point_key(point_id: int) -> str:
+        return f"{POINT_KEY_PREFIX}{point_id}"
+
+    @staticmethod
+    async def authorize(db: AsyncSession, user: User, cashier_id: int) -> int:
+        """Return the cashier's point id, raise 404/403 unless the user may drive it"""
+        entry = PresenceService._cashiers.get(cashier_id)
+        if entry is None:
+            row = (await db.execute(
+                select(Cashier.point_id, Cashier.assigned_user_id, Cashier.is_active)
+                .where(Cashier.id == cashier_id)
+            )).one_or_none()
+            if row is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Cashier not found"
+                )
+            entry = tuple(row)
+            PresenceService._cashiers.set(cashier_id, entry)
+
+        point_id, assigned_user_id, is_active = entry
+        if not is_active:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Cashier is not active"
+            )
+        if assigned_user_id != user.id:
+            await PointService.ensure_staff(db, point_id, user)
+        return point_id
+
+    @staticmethod
+    async def heartbeat(
+        cashier_id: int,
+        point_id: int,
+        new_status: Optional[CashierStatus] = None,
+        queue_change: bool = True,
+    ) -> Tuple[Optional[CashierStatus], CashierStatus]:
+        """Refresh presence, return (previous, current) status; previous None if it was offline"""
+        if new_status == CashierStatus.OFFLINE:
+            await PresenceService.go_offline(cashier_id, point_id, queue_change)
+            return None, CashierStatus.OFFLINE
+
+        previous, current = await _heartbeat(
+            keys=[
+                PresenceService.cashier_key(cashier_id),
+                PresenceService.point_key(point_id),
+                DEADLINES_KEY,
+                CHANGES_KEY,
+            ],
+            args=[
+                cashier_id,
+                point_id,
+                new_status.value if new_status else "",
+                settings.PRESENCE_TTL_SECONDS * 1000,
+                "1" if queue_change else "0",
+            ],
+        )
+        heartbeats_total.inc(outcome="changed" if previous != current else "unchanged")
+        return (CashierStatus(previous) if previous else None), CashierStatus(current)
+
+    @staticmethod
+    async def go_offline(cashier_id: int, point_id: int, queue_change: bool = True) -> None:
+        """End the cashier's session now instead of waiting for the TTL"""
+        await _expire(
+            keys=[DEADLINES_KEY, CHANGES_KEY],
+            args=[0, "presence:", "1", "1" if queue_change else "0", f"{point_id}:{cashier_id}"],
+        )
+
+    @staticmethod
+    def _parse(raw: Dict[str, str]) -> Dict[int, CashierStatus]:
+        return {int(cashier_id): CashierStatus(value) for cashier_id, value in raw.items()}
+
+    @staticmethod
+    async def point_presence(point_id: int) -> Dict[int, CashierStatus]:
+        """Present cashiers of a point and their status (absent means offline)"""
+        return PresenceService._parse(await autopipeline.hgetall(PresenceService.point_key(point_id)))
+
+    @staticmethod
+    async def points_presence(point_ids: Iterable[int]) -> Dict[int, Dict[int, CashierStatus]]:
+        """point_presence() for many points in one round-trip"""
+        point_ids = list(point_ids)
+        pipe = redis_client.pipeline(transaction=False)
+        for point_id in point_ids:
+            pipe.hgetall(PresenceService.point_key(point_id))
+        results = await pipe.execute()
+        return {
+            point_id: PresenceService._parse(raw) for point_id, raw in zip(point_ids, results)
+        }
+
+    @staticmethod
+    async def sweep() -> int:
+        """Expire cashiers whose heartbeat deadline passed, return how many went offline"""
+        total = 0
+        while True:
+            expired = await _expire(
+                keys=[DEADLINES_KEY, CHANGES_KEY],
+                args=[settings.PRESENCE_SWEEP_BATCH, "presence:", "0", "1"],
+            )
+            total += expired
+            if expired < settings.PRESENCE_SWEEP_BATCH:
+                break
+        expired_total.inc(total)
+        return total
+
+
+def _status_statement(items: List[Tuple[int, str, object]]):
+    data = values(
+        column("id", Integer),
+        column("status", String),
+        column("ts", DateTime(timezone=True)),
+        name="presence",
+    ).data(items)
+    new_status = cast(data.c.status, Cashier.__table__.c.status.type)
+    return (
+        update(Cashier)
+        .where(
+            Cashier.id == data.c.id,
+            Cashier.status.is_distinct_from(new_status),
+            # A change queued before a newer direct write (PUT status) loses
+            or_(Cashier.last_activity.is_(None), Cashier.last_activity < data.c.ts),
+        )
+        .values(status=new_status, last_activity=data.c.ts)
+        .returning(*Cashier.__table__.c)
+        .execution_options(synchronize_session=False)
+    )
+
+
+class PresenceWorker:
+    """Worker loop: sweeps expired heartbeats and writes queued state changes.
+
+    Changes are drained from Redis in batches of ``PRESENCE_FLUSH_BATCH``,
+    coalesced per cashier (last one wins) and written with one
+    ``UPDATE ... FROM (VALUES ...)`` that skips rows already in that state
+    or written after the change was queued (``last_activity``); every row that actually changed gets a ``cashier.status_changed`` outbox
+    event. A failed write puts the batch back at the head of the queue.
+    """
+
+    def __init__(self):
+        self._wakeup = asyncio.Event()
+
+    async def _drain(self) -> List[str]:
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.lrange(CHANGES_KEY, 0, settings.PRESENCE_FLUSH_BATCH - 1)
+        pipe.ltrim(CHANGES_KEY, settings.PRESENCE_FLUSH_BATCH, -1)
+        pipe.llen(CHANGES_KEY)
+        raw, _, remaining = await pipe.execute()
+        pending_changes.set(remaining)
+        return raw
+
+    async def write_changes(self, raw: List[str]) -> int:
+        """Write one drained batch, return the number of rows that changed"""
+        latest: Dict[int, Tuple[str, datetime]] = {}
+        for entry in raw:
+            cashier_id, state, ms = entry.split(":")
+            latest[int(cashier_id)] = (
+                CashierStatusEnum(state).name,
+                datetime.fromtimestamp(int(ms) / 1000, tz=timezone.utc),
+            )
+        items = [(cashier_id, state, at) for cashier_id, (state, at) in latest.items()]
+
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(_status_statement(items))).all()
+            for row in rows:
+                OutboxService.add(db, "cashier.status_changed", row.point_id, row.id, cashier_payload(row))
+            await db.commit()
+        state_writes_total.inc(len(rows))
+        return len(rows)
+
+    async def flush(self) -> int:
+        written = 0
+        while True:
+            raw = await self._drain()
+            if not raw:
+                return written
+            try:
+                written += await self.write_changes(raw)
+            except Exception:
+                await redis_client.lpush(CHANGES_KEY, *reversed(raw))
+                raise
+            if len(raw) < settings.PRESENCE_FLUSH_BATCH:
+                return written
+
+    async def _listen_expirations(self, stop: asyncio.Event) -> None:
+        """Wake the sweeper on expired presence keys (notify-keyspace-events must include Ex)"""
+        pubsub = redis_client.pubsub()
+        await pubsub.psubscribe("__keyevent@*__:expired")
+        try:
+            while not stop.is_set():
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message and str(message["data"]).startswith(CASHIER_KEY_PREFIX):
+                    self._wakeup.set()
+        finally:
+            await pubsub.close()
+
+    async def run(self, stop: asyncio.Event) -> None:
+        """Sweep and flush every PRESENCE_SWEEP_INTERVAL_SECONDS until ``stop`` is set"""
+        listener = None
+        if settings.PRESENCE_KEYSPACE_EVENTS:
+            listener = asyncio.create_task(self._listen_expirations(stop))
+        try:
+            while not stop.is_set():
+                try:
+                    await PresenceService.sweep()
+                    await self.flush()
+                except Exception:
+                    logger.exception("Presence sweep failed")
+                try:
+                    await asyncio.wait_for(
+                        self._wakeup.wait(), timeout=settings.PRESENCE_SWEEP_INTERVAL_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+        finally:
+            if listener is not None:
+                listener.cancel()
+                await asyncio.gather(listener, return_exceptions=True)
@@ -0,0 +1,345 @@
+"""Live per-point queue counters for owner and cashier dashboards.
+
+Three hashes under the point's ``{point:ID}`` hash tag, on the point's shard:
+
+* ``queue``: live (non-final) orders by current status id, plus ``_complete``
+  once the hash was rebuilt from Postgres;
+* ``queue_cashiers``: live orders by assigned cashier id;
+* ``queue_orders``: what each live order is counted as
+  (``version|status_id|cashier_id``), ``version||`` once finalized.
+
+The outbox relay applies ``order.created`` / ``order.status_changed`` /
+``order.finalized`` events in the pipeline it publishes them with: one Lua
+call per point moves an order from its old status and cashier to the new
+ones in the same step as it records the order's new version. Versions are
+the order's latest status history id, so replays and reordering between
+relays don't double count, and a finalized order's tombstone keeps a late
+duplicate from bringing it back (rebuilds drop tombstones once no event of
+the order is left in the outbox). Counters never get a fresh GROUP BY per
+dashboard refresh; ``QueueCountersReconciler`` rebuilds them from Postgres
+every ``QUEUE_COUNTERS_RECONCILE_SECONDS`` to correct any drift (e.g. a
+workflow status made final, or Redis data lost).
+"""
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, redis_client
+from app.core.metrics import Counter
+from app.core.sharding import Shard, point_key, shards
+from app.models.order import Order, OrderStatus, OrderStatusHistory
+from app.models.outbox import OutboxEvent
+from app.models.point import Point
+from app.schemas.order import PointQueueCounts
+from app.services.active_orders import INDEX_EVENTS
+
+
+logger = logging.getLogger(__name__)
+
+COMPLETE_FIELD = "_complete"  # in the queue hash once it was rebuilt from Postgres
+RECONCILE_KEY = "queue_counters:reconciled"  # held by the worker that reconciles this round
+
+_ENTRY_LUA = """
+local function adjust(key, field, by)
+    if field ~= '' then
+        if redis.call('HINCRBY', key, field, by) <= 0 then
+            redis.call('HDEL', key, field)
+        end
+    end
+end
+"""
+
+# ARGV: (order_id, version, status_id or '' = finalized, cashier_id or '')
+# quadruples. An order only moves when the event is newer than what it is
+# counted as.
+_APPLY_SCRIPT = _ENTRY_LUA + """
+local applied = 0
+for i = 1, #ARGV, 4 do
+    local current = redis.call('HGET', KEYS[3], ARGV[i])
+    local version, status, cashier = -1, '', ''
+    if current then
+        local v, s, c = string.match(current, '^(%d+)|([^|]*)|(.*)$')
+        version, status, cashier = tonumber(v), s, c
+    end
+    if tonumber(ARGV[i + 1]) > version then
+        adjust(KEYS[1], status, -1)
+        adjust(KEYS[2], cashier, -1)
+        local cashier_id = ARGV[i + 2] ~= '' and ARGV[i + 3] or ''
+        redis.call('HSET', KEYS[3], ARGV[i], ARGV[i + 1] .. '|' .. ARGV[i + 2] .. '|' .. cashier_id)
+        adjust(KEYS[1], ARGV[i + 2], 1)
+        adjust(KEYS[2], cashier_id, 1)
+        applied = applied + 1
+    end
+end
+return applied
+"""
+
+# ARGV[1]: number of live orders loaded from Postgres, then those as
+# (order_id, version, status_id, cashier_id or '') quadruples, then
+# (order_id, entry) pairs to drop: entries read before Postgres that it
+# didn't list as live and that have no outbox event left to relay. Loaded
+# orders win when newer; an entry is only dropped if unchanged since it was
+# read (a later event was applied meanwhile otherwise). Tombstones go the
+# same way, so they stay while a late duplicate can still arrive. The
+# counters are then recounted from the entries; returns how many counter
+# fields were off.
+_REBUILD_SCRIPT = """
+local last = 1 + 4 * tonumber(ARGV[1])
+for i = 2, last, 4 do
+    local current = redis.call('HGET', KEYS[3], ARGV[i])
+    local version = current and tonumber(string.match(current, '^(%d+)|')) or -1
+    if tonumber(ARGV[i + 1]) > version then
+        redis.call('HSET', KEYS[3], ARGV[i], ARGV[i + 1] .. '|' .. ARGV[i + 2] .. '|' .. ARGV[i + 3])
+    end
+end
+for i = last + 1, #ARGV, 2 do
+    if redis.call('HGET', KEYS[3], ARGV[i]) == ARGV[i + 1] then
+        redis.call('HDEL', KEYS[3], ARGV[i])
+    end
+end
+
+local counts = {{}, {}}
+local entries = redis.call('HGETALL', KEYS[3])
+for i = 1, #entries, 2 do
+    local s, c = string.match(entries[i + 1], '^%d+|([^|]*)|(.*)$')
+    if s ~= '' then
+        counts[1][s] = (counts[1][s] or 0) + 1
+        if c ~= '' then
+            counts[2][c] = (counts[2][c] or 0) + 1
+        end
+    end
+end
+
+local drift = 0
+for k = 1, 2 do
+    local old = {}
+    local fields = redis.call('HGETALL', KEYS[k])
+    for i = 1, #fields, 2 do
+        if fields[i] ~= '_complete' then
+            old[fields[i]] = tonumber(fields[i + 1])
+            if old[fields[i]] ~= counts[k][fields[i]] then
+                drift = drift + 1
+            end
+        end
+    end
+    for field, count in pairs(counts[k]) do
+        if old[field] == nil then
+            drift = drift + 1
+        end
+    end
+    redis.call('DEL', KEYS[k])
+    for field, count in pairs(counts[k]) do
+        redis.call('HSET', KEYS[k], field, count)
+    end
+end
+redis.call('HSET', KEYS[1], '_complete', '1')
+return drift
+"""
+
+_apply = redis_client.register_script(_APPLY_SCRIPT)
+_rebuild = redis_client.register_script(_REBUILD_SCRIPT)
+
+lookups_total = Counter("queue_counters_lookups_total", "Point queue counter reads", ("outcome",))
+reconciled_total = Counter("queue_counters_reconciled_points_total", "Points whose counters were rebuilt")
+drift_total = Counter("queue_counters_drift_total", "Counter fields corrected by a rebuild")
+
+
+class QueueCounters:
+    """Live orders of a point by status and by cashier, kept in Redis"""
+
+    @staticmethod
+    def keys(point_id: int) -> List[str]:
+        return [
+            point_key(point_id, "queue"),
+            point_key(point_id, "queue_cashiers"),
+            point_key(point_id, "queue_orders"),
+        ]
+
+    @staticmethod
+    async def queue_events(pipe, point_id: int, rows: Iterable[Any]) -> None:
+        """Add the counter updates of a point's outbox event rows to its shard's pipeline"""
+        args: List[Any] = []
+        for row in rows:
+            final = row.event_type == "order.finalized"
+            args.extend((
+                row.entity_id,
+                row.payload["v"],
+                "" if final else row.payload["status_id"],
+                row.payload.get("cashier_id") or "",
+            ))
+        if args:
+            await _apply(keys=QueueCounters.keys(point_id), args=args, client=pipe)
+
+    @staticmethod
+    async def _load(db: AsyncSession, point_ids: List[int]) -> Tuple[Dict[int, List[Any]], Set[int]]:
+        """(rebuild args of each point's live orders, orders with outbox events still to relay)"""
+        version = (
+            select(func.max(OrderStatusHistory.id))
+            .where(OrderStatusHistory.order_id == Order.id)
+            .scalar_subquery()
+        )
+        rows = (await db.execute(
+            select(Order.point_id, Order.id, version, Order.current_status_id, Order.cashier_id)
+            .join(OrderStatus, OrderStatus.id == Order.current_status_id)
+            .where(Order.point_id.in_(point_ids), OrderStatus.is_final.is_(False))
+        )).all()
+        pending = set(await db.scalars(
+            select(OutboxEvent.entity_id).distinct()
+            .where(OutboxEvent.point_id.in_(point_ids), OutboxEvent.event_type.in_(INDEX_EVENTS))
+        ))
+
+        live: Dict[int, List[Any]] = {point_id: [] for point_id in point_ids}
+        for point_id, order_id, order_version, status_id, cashier_id in rows:
+            live[point_id].extend((order_id, order_version or 0, status_id, cashier_id or ""))
+        return live, pending
+
+    @staticmethod
+    async def _by_shard(point_ids: Iterable[int]) -> Dict[str, Tuple[Shard, List[int]]]:
+        groups: Dict[str, Tuple[Shard, List[int]]] = {}
+        for point_id in point_ids:
+            shard = await shards.shard(point_id)
+            groups.setdefault(shard.name, (shard, []))[1].append(point_id)
+        return groups
+
+    @staticmethod
+    async def rebuild(db: AsyncSession, point_ids: List[int]) -> int:
+        """Recount the points' counters from Postgres, return how many fields were off.
+
+        The order entries are read before Postgres: events are only relayed
+        once committed, so every entry read was committed before the
+        Postgres read started and it is authoritative for them. Entries
+        written after it are left alone.
+        """
+        if not point_ids:
+            return 0
+        groups = await QueueCounters._by_shard(point_ids)
+
+        async def read_entries(shard: Shard, ids: List[int]):
+            pipe = shard.client.pipeline(transaction=False)
+            for point_id in ids:
+                pipe.hgetall(QueueCounters.keys(point_id)[2])
+            return zip(ids, await pipe.execute())
+
+        seen = {
+            point_id: entries
+            for result in await asyncio.gather(*(read_entries(shard, ids) for shard, ids in groups.values()))
+            for point_id, entries in result
+        }
+        live, pending = await QueueCounters._load(db, point_ids)
+
+        def args(point_id: int) -> List[Any]:
+            loaded = live[point_id]
+            live_ids = {str(order_id) for order_id in loaded[::4]}
+            drops = [
+                value
+                for order_id, entry in seen[point_id].items()
+                if order_id not in live_ids and int(order_id) not in pending
+                for value in (order_id, entry)
+            ]
+            return [len(loaded) // 4, *loaded, *drops]
+
+        async def rebuild_shard(shard: Shard, ids: List[int]) -> List[int]:
+            pipe = shard.client.pipeline(transaction=False)
+            for point_id in ids:
+                await _rebuild(keys=QueueCounters.keys(point_id), args=args(point_id), client=pipe)
+            return await pipe.execute()
+
+        results = await asyncio.gather(*(rebuild_shard(shard, ids) for shard, ids in groups.values()))
+        drift = sum(sum(result) for result in results)
+        reconciled_total.inc(len(point_ids))
+        drift_total.inc(drift)
+        return drift
+
+    @staticmethod
+    async def _read(point_ids: List[int]) -> Dict[int, Tuple[Dict[str, str], Dict[str, str]]]:
+        """Raw counter hashes of the points, one pipelined round trip per shard"""
+        async def read_shard(shard: Shard, ids: List[int]):
+            pipe = shard.client.pipeline(transaction=False)
+            for point_id in ids:
+                statuses_key, cashiers_key, _ = QueueCounters.keys(point_id)
+                pipe.hgetall(statuses_key)
+                pipe.hgetall(cashiers_key)
+            replies = await pipe.execute()
+            return zip(ids, replies[::2], replies[1::2])
+
+        results = await asyncio.gather(*(
+            read_shard(shard, ids) for shard, ids in (await QueueCounters._by_shard(point_ids)).values()
+        ))
+        return {point_id: (statuses, cashiers) for result in results for point_id, statuses, cashiers in result}
+
+    @staticmethod
+    async def get_many(db: AsyncSession, point_ids: Iterable[int]) -> List[PointQueueCounts]:
+        """Counters of several points; points never rebuilt are loaded from Postgres first"""
+        point_ids = list(dict.fromkeys(point_ids))
+        if not point_ids:
+            return []
+        raw = await QueueCounters._read(point_ids)
+        missing = [point_id for point_id in point_ids if COMPLETE_FIELD not in raw[point_id][0]]
+        lookups_total.inc(len(point_ids) - len(missing), outcome="hit")
+        if missing:
+            lookups_total.inc(len(missing), outcome="miss")
+            await QueueCounters.rebuild(db, missing)
+            raw.update(await QueueCounters._read(missing))
+
+        counters = []
+        for point_id in point_ids:
+            statuses, cashiers = raw[point_id]
+            by_status = {int(field): int(count) for field, count in statuses.items() if field != COMPLETE_FIELD}
+            counters.append(PointQueueCounts(
+                point_id=point_id,
+                total=sum(by_status.values()),
+                statuses=by_status,
+                cashiers={int(field): int(count) for field, count in cashiers.items()},
+            ))
+        return counters
+
+    @staticmethod
+    async def get(db: AsyncSession, point_id: int) -> PointQueueCounts:
+        counters, = await QueueCounters.get_many(db, [point_id])
+        return counters
+
+
+class QueueCountersReconciler:
+    """Worker loop rebuilding every point's counters from Postgres.
+
+    One worker per round does it: the first to set ``RECONCILE_KEY`` (which
+    expires after ``QUEUE_COUNTERS_RECONCILE_SECONDS``) walks the points in
+    batches of ``QUEUE_COUNTERS_RECONCILE_BATCH``.
+    """
+
+    async def reconcile(self) -> int:
+        """Rebuild every point once, return how many counter fields were off"""
+        drift, last_id = 0, 0
+        while True:
+            async with AsyncSessionLocal() as db:
+                point_ids = list(await db.scalars(
+                    select(Point.id)
+                    .where(Point.id > last_id)
+                    .order_by(Point.id)
+                    .limit(settings.QUEUE_COUNTERS_RECONCILE_BATCH)
+                ))
+                if not point_ids:
+                    return drift
+                drift += await QueueCounters.rebuild(db, point_ids)
+            last_id = point_ids[-1]
+
+    async def run(self, stop: asyncio.Event) -> None:
+        """Reconcile every ``QUEUE_COUNTERS_RECONCILE_SECONDS`` until ``stop`` is set"""
+        interval = settings.QUEUE_COUNTERS_RECONCILE_SECONDS
+        while not stop.is_set():
+            try:
+                if await redis_client.set(RECONCILE_KEY, "1", nx=True, px=int(interval * 1000)):
+                    drift = await self.reconcile()
+                    if drift:
+                        logger.warning("Queue counters drifted: %d fields corrected", drift)
+            except Exception:
+                logger.exception("Queue counters reconciliation failed")
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+
@@ -0,0 +1,171 @@
+import math
+import re
+from typing import List, Optional
+
+from sqlalchemy import Float, and_, func, literal, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.point import Point, PointStatusEnum
+from app.schemas.point import PointSearchFilters, PointSearchResult
+from app.services.working_hours import working_hours_index
+
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class PointSearchService:
+    """Ranked text + location search over points.
+
+    Matching uses two GIN indexes on generated columns of ``points``:
+    ``search_vector`` (weighted tsvector, prefix queries for as-you-type) and
+    ``search_text`` (pg_trgm, tolerates typos). ``open_now`` is applied to
+    the candidates with the in-memory working hours index. Rendered results
+    are cached by the API in ``response_cache`` under ``cache_key``.
+    """
+
+    @staticmethod
+    def normalize_query(query: Optional[str]) -> str:
+        """Lowercase and collapse whitespace so equivalent queries share a cache entry"""
+        if not query:
+            return ""
+        return " ".join(_TOKEN_RE.findall(query.lower()))
+
+    @staticmethod
+    def prefix_tsquery(query: str) -> Optional[str]:
+        """Build a to_tsquery() expression where every term matches as a prefix"""
+        tokens = _TOKEN_RE.findall(query)
+        if not tokens:
+            return None
+        return " & ".join(f"{token}:*" for token in tokens)
+
+    @staticmethod
+    def distance_km(latitude: float, longitude: float):
+        """Haversine distance from (latitude, longitude) to the point, in km"""
+        d_lat = func.radians(Point.latitude - latitude, type_=Float)
+        d_lon = func.radians(Point.longitude - longitude, type_=Float)
+        a = func.power(func.sin(d_lat / 2.0, type_=Float), 2, type_=Float) + (
+            math.cos(math.radians(latitude))
+            * func.cos(func.radians(Point.latitude, type_=Float), type_=Float)
+            * func.power(func.sin(d_lon / 2.0, type_=Float), 2, type_=Float)
+        )
+        return 2 * EARTH_RADIUS_KM * func.asin(func.sqrt(a, type_=Float), type_=Float)
+
+    @staticmethod
+    def cache_key(filters: PointSearchFilters) -> tuple:
+        """Key identifying equivalent searches (for caches of rendered results)"""
+        # ~100m grid so nearby users share entries
+        latitude = round(filters.latitude, 3) if filters.latitude is not None else None
+        longitude = round(filters.longitude, 3) if filters.longitude is not None else None
+        return (
+            PointSearchService.normalize_query(filters.query),
+            latitude,
+            longitude,
+            filters.radius_km,
+            filters.status,
+            filters.accepts_online_orders,
+            filters.accepts_scheduled_orders,
+            filters.open_now,
+            filters.limit,
+        )
+
+    @staticmethod
+    async def search(db: AsyncSession, filters: PointSearchFilters) -> List[PointSearchResult]:
+        """Search points by text and/or location"""
+        query = PointSearchService.normalize_query(filters.query)
+
+        conditions = []
+        if filters.status is not None:
+            conditions.append(Point.status == PointStatusEnum(filters.status.value))
+        if filters.accepts_online_orders is not None:
+            conditions.append(Point.accepts_online_orders == filters.accepts_online_orders)
+        if filters.accepts_scheduled_orders is not None:
+            conditions.append(Point.accepts_scheduled_orders == filters.accepts_scheduled_orders)
+
+        has_location = filters.latitude is not None and filters.longitude is not None
+        distance = None
+        if has_location:
+            distance = PointSearchService.distance_km(filters.latitude, filters.longitude)
+            if filters.radius_km is not None:
+                # Bounding box first so the location index prunes rows before haversine
+                d_lat = filters.radius_km / KM_PER_DEGREE
+                d_lon = filters.radius_km / (
+                    KM_PER_DEGREE * max(math.cos(math.radians(filters.latitude)), 0.01)
+                )
+                conditions.append(Point.latitude.between(filters.latitude - d_lat, filters.latitude + d_lat))
+                conditions.append(Point.longitude.between(filters.longitude - d_lon, filters.longitude + d_lon))
+                conditions.append(distance <= filters.radius_km)
+
+        relevance = None
+        if query:
+            tsquery_text = PointSearchService.prefix_tsquery(query)
+            similarity = func.word_similarity(query, Point.search_text)
+            matches = [literal(query).op("<%")(Point.search_text)]
+            relevance = similarity
+            if tsquery_text:
+                tsquery = func.to_tsquery("simple", tsquery_text)
+                matches.append(Point.search_vector.op("@@")(tsquery))
+                # Normalization 32 scales the rank into [0, 1)
+                relevance = func.ts_rank_cd(Point.search_vector, tsquery, 32) + similarity
+            conditions.append(or_(*matches))
+
+            # Threshold for the <% operator, scoped to this transaction: open it
+            # first so the search runs in the same one
+            await db.connection()
+            await db.execute(
+                select(
+                    func.set_config(
+                        "pg_trgm.word_similarity_threshold",
+                        str(settings.SEARCH_SIMILARITY_THRESHOLD),
+                        True,
+                    )
+                )
+            )
+
+        if relevance is not None and distance is not None:
+            score = relevance / (1 + func.coalesce(distance, 1e6) / settings.SEARCH_DISTANCE_DECAY_KM)
+        elif relevance is not None:
+            score = relevance
+        else:
+            score = literal(0.0)
+
+        columns = [Point, score.label("score")]
+        if distance is not None:
+            columns.append(distance.label("distance_km"))
+
+        stmt = select(*columns)
+        if conditions:
+            stmt = stmt.where(and_(*conditions))
+        if relevance is not None:
+            stmt = stmt.order_by(score.desc(), Point.id)
+        elif distance is not None:
+            stmt = stmt.order_by(distance.asc().nulls_last(), Point.id)
+        else:
+            stmt = stmt.order_by(Point.id)
+        if filters.open_now is None:
+            stmt = stmt.limit(filters.limit)
+        else:
+            # Open-now is decided in memory, so fetch extra candidates to fill the page
+            stmt = stmt.limit(filters.limit * settings.SEARCH_OPEN_NOW_OVERFETCH)
+
+        rows = (await db.execute(stmt)).all()
+
+        if filters.open_now is not None and rows:
+            point_ids = [row[0].id for row in rows]
+            await working_hours_index.ensure_loaded(db, point_ids)
+            mask = working_hours_index.open_mask(point_ids)
+            if not filters.open_now:
+                mask = ~mask
+            rows = [row for row, keep in zip(rows, mask) if keep][:filters.limit]
+
+        results = []
+        for row in rows:
+            result = PointSearchResult.model_validate(row[0])
+            result.score = float(row[1] or 0.0)
+            if distance is not None and row[2] is not None:
+                result.distance_km = round(float(row[2]), 3)
+            results.append(result)
+        return results
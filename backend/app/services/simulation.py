@@ -0,0 +1,383 @@
+import asyncio
+import itertools
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from time import perf_counter
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import and_, case, extract, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, redis_client
+from app.models.order import Order, OrderStatus, OrderStatusHistory, OrderTypeEnum
+from app.schemas.simulation import (
+    ArrivalFit,
+    ScenarioResult,
+    ServiceFit,
+    SimulationJobStatusEnum,
+    SimulationRequest,
+    SimulationResult,
+)
+from app.services.point import PointService
+
+
+logger = logging.getLogger(__name__)
+
+SIMULATION_QUEUE = "simulations:queue"
+MINUTES_PER_DAY = 24 * 60
+WAIT_PERCENTILES = (50, 90, 95, 99)
+Z_90 = 1.2816  # standard normal 90th percentile
+
+
+class Scenario(NamedTuple):
+    cashiers: int
+    max_concurrent_orders: int
+    slot_duration_minutes: int
+    slots_per_interval: int
+
+    @property
+    def servers(self) -> int:
+        """Orders served in parallel"""
+        return self.cashiers * self.max_concurrent_orders
+
+
+def _lognormal_fit(mu: float, sigma: float, samples: int) -> ServiceFit:
+    return ServiceFit(
+        samples=samples,
+        mu=mu,
+        sigma=sigma,
+        mean_minutes=float(np.exp(mu + sigma ** 2 / 2)),
+        p50_minutes=float(np.exp(mu)),
+        p90_minutes=float(np.exp(mu + Z_90 * sigma)),
+    )
+
+
+def immediate_arrivals(hourly_rate: np.ndarray, replications: int, rng: np.random.Generator) -> np.ndarray:
+    """Walk-in arrival minutes per simulated day (rows), Poisson per hour, padded with inf"""
+    counts = rng.poisson(hourly_rate, size=(replications, 24))
+    totals = counts.sum(axis=1)
+    arrivals = np.full((replications, max(int(totals.max()), 1)), np.inf)
+    hours = np.repeat(np.tile(np.arange(24), replications), counts.ravel())
+    rows = np.repeat(np.arange(replications), totals)
+    columns = np.arange(len(rows)) - np.repeat(np.cumsum(totals) - totals, totals)
+    arrivals[rows, columns] = (hours + rng.random(len(rows))) * 60.0
+    arrivals.sort(axis=1)
+    return arrivals
+
+
+def scheduled_arrivals(
+    hourly_rate: np.ndarray,
+    slot_duration: int,
+    slots_per_interval: int,
+    replications: int,
+    rng: np.random.Generator,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Slot bookings arriving at their slot start, and bookings turned away per day"""
+    starts = np.arange(0, MINUTES_PER_DAY, slot_duration)
+    demand = hourly_rate[starts // 60] * slot_duration / 60.0
+    requested = rng.poisson(demand, size=(replications, len(starts)))
+    booked = np.minimum(requested, slots_per_interval)
+    totals = booked.sum(axis=1)
+    arrivals = np.full((replications, max(int(totals.max()), 1)), np.inf)
+    rows = np.repeat(np.arange(replications), totals)
+    columns = np.arange(len(rows)) - np.repeat(np.cumsum(totals) - totals, totals)
+    arrivals[rows, columns] = np.repeat(np.tile(starts, replications), booked.ravel())
+    return arrivals, (requested - booked).sum(axis=1)
+
+
+def _merge(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    merged = np.sort(np.concatenate([first, second], axis=1), axis=1)
+    width = max(int(np.isfinite(merged).sum(axis=1).max()), 1)
+    return merged[:, :width]
+
+
+def serve(arrivals: np.ndarray, service: np.ndarray, servers: np.ndarray) -> np.ndarray:
+    """FCFS multi-server queue, one simulated day per row: service start minutes.
+
+    Rows are independent runs with their own server count; the recursion
+    walks customers in arrival order and is vectorized across rows. Rows
+    must be sorted with inf padding at the end.
+    """
+    rows, customers = arrivals.shape
+    index = np.arange(rows)
+    free_at = np.zeros((rows, int(servers.max())))
+    free_at[np.arange(free_at.shape[1]) >= servers[:, None]] = np.inf  # servers this row doesn't have
+    starts = np.empty_like(arrivals)
+    for column in range(customers):
+        server = free_at.argmin(axis=1)
+        start = np.maximum(arrivals[:, column], free_at[index, server])
+        starts[:, column] = start
+        free_at[index, server] = start + service[:, column]
+    return starts
+
+
+def simulate(
+    hourly_rate: List[float],
+    scheduled_share: float,
+    service: ServiceFit,
+    scenarios: List[Scenario],
+    replications: int,
+    seed: Optional[int] = None,
+) -> List[ScenarioResult]:
+    """Run every scenario ``replications`` times (one simulated day each).
+
+    All scenarios share the same random walk-in streams, slot demand and
+    service times (common random numbers), so differences between them come
+    from the configuration, not from noise.
+    """
+    rng = np.random.default_rng(seed)
+    rate = np.asarray(hourly_rate, dtype=float)
+    open_minutes = max(int(np.count_nonzero(rate)) * 60, 60)
+
+    walk_ins = immediate_arrivals(rate * (1 - scheduled_share), replications, rng)
+    by_slots: Dict[Tuple[int, int], Tuple[np.ndarray, np.ndarray]] = {}
+    for scenario in scenarios:
+        key = (scenario.slot_duration_minutes, scenario.slots_per_interval)
+        if key not in by_slots:
+            slot_rng = np.random.default_rng([seed or 0, *key])
+            booked, turned_away = scheduled_arrivals(rate * scheduled_share, *key, replications, slot_rng)
+            by_slots[key] = (_merge(walk_ins, booked), turned_away)
+    width = max(arrivals.shape[1] for arrivals, _ in by_slots.values())
+    service_minutes = rng.lognormal(service.mu, service.sigma, size=(replications, width))
+
+    results = []
+    per_chunk = max(1, settings.SIMULATION_CHUNK_ROWS // replications)
+    for offset in range(0, len(scenarios), per_chunk):
+        group = scenarios[offset:offset + per_chunk]
+        blocks = [by_slots[(s.slot_duration_minutes, s.slots_per_interval)] for s in group]
+        columns = max(arrivals.shape[1] for arrivals, _ in blocks)
+        arrivals = np.full((len(group) * replications, columns), np.inf)
+        for position, (block, _) in enumerate(blocks):
+            arrivals[position * replications:(position + 1) * replications, :block.shape[1]] = block
+        service_block = np.tile(service_minutes[:, :columns], (len(group), 1))
+        servers = np.repeat([s.servers for s in group], replications)
+
+        starts = serve(arrivals, service_block, servers)
+        served = np.isfinite(arrivals)
+        waits = np.subtract(starts, arrivals, out=np.zeros_like(starts), where=served)
+        busy = np.where(served, service_block, 0.0).sum(axis=1)
+
+        for position, scenario in enumerate(group):
+            rows = slice(position * replications, (position + 1) * replications)
+            block_waits = waits[rows][served[rows]]
+            percentiles = (
+                np.percentile(block_waits, WAIT_PERCENTILES) if block_waits.size
+                else np.zeros(len(WAIT_PERCENTILES))
+            )
+            results.append(ScenarioResult(
+                **scenario._asdict(),
+                orders_per_day=float(served[rows].sum() / replications),
+                turned_away_per_day=float(blocks[position][1].mean()),
+                wait_p50_minutes=round(float(percentiles[0]), 2),
+                wait_p90_minutes=round(float(percentiles[1]), 2),
+                wait_p95_minutes=round(float(percentiles[2]), 2),
+                wait_p99_minutes=round(float(percentiles[3]), 2),
+                utilization=round(float(busy[rows].sum() / (scenario.servers * open_minutes * replications)), 4),
+            ))
+    return results
+
+
+def recommend(results: List[ScenarioResult], target_wait_minutes: float) -> Optional[ScenarioResult]:
+    """Fewest cashiers meeting the p90 wait target, then fewest turned away, then shortest wait"""
+    meeting = [result for result in results if result.wait_p90_minutes <= target_wait_minutes]
+    if not meeting:
+        return None
+    return min(meeting, key=lambda result: (
+        result.cashiers, round(result.turned_away_per_day, 1), result.wait_p90_minutes,
+    ))
+
+
+class SimulationService:
+    """Capacity planning for a point by simulating its queue.
+
+    Arrivals are fitted from the point's orders (Poisson rates per local hour
+    of day, plus the share booking time slots) and service times from its
+    status history: time from the first status after the initial one to a
+    final status, fitted as a lognormal. ``simulate`` then replays many days
+    for every staffing / slot configuration, vectorized with NumPy.
+    """
+
+    @staticmethod
+    def scenarios(params: SimulationRequest) -> List[Scenario]:
+        return [
+            Scenario(*combination)
+            for combination in itertools.product(
+                sorted(set(params.cashiers)),
+                sorted(set(params.max_concurrent_orders)),
+                sorted(set(params.slot_duration_minutes)),
+                sorted(set(params.slots_per_interval)),
+            )
+        ]
+
+    @staticmethod
+    async def fit_arrivals(db: AsyncSession, point_id: int, params: SimulationRequest) -> ArrivalFit:
+        point = await PointService.get_point(db, point_id)
+        now = datetime.now(timezone.utc)
+        since = now - timedelta(days=params.history_days)
+        # Scheduled orders count as demand at the time they booked, not when they were made
+        demand_at = func.timezone(point.timezone or "UTC", case(
+            (Order.order_type == OrderTypeEnum.SCHEDULED, func.coalesce(Order.scheduled_time, Order.created_at)),
+            else_=Order.created_at,
+        ))
+        rows = (await db.execute(
+            select(
+                extract("hour", demand_at),
+                extract("isodow", demand_at),
+                Order.order_type == OrderTypeEnum.SCHEDULED,
+                extract("epoch", Order.created_at),
+            ).where(Order.point_id == point_id, Order.created_at >= since)
+        )).all()
+
+        if not rows:
+            return ArrivalFit(orders=0, days=0, hourly_rate=[0.0] * 24, scheduled_share=0.0)
+        hours, weekdays, scheduled, created = (np.array(column, dtype=float) for column in zip(*rows))
+        days = min(max((now.timestamp() - created.min()) / 86400, 1.0), params.history_days)
+        selected = np.ones(len(rows), dtype=bool)
+        if params.weekday is not None:
+            selected = weekdays - 1 == params.weekday
+            days = max(days / 7, 1.0)
+
+        counts = np.bincount(hours[selected].astype(int), minlength=24)
+        return ArrivalFit(
+            orders=int(selected.sum()),
+            days=round(days, 2),
+            hourly_rate=(counts / days).round(3).tolist(),
+            scheduled_share=float(scheduled[selected].mean()) if selected.any() else 0.0,
+        )
+
+    @staticmethod
+    async def fit_service(db: AsyncSession, point_id: int, params: SimulationRequest) -> ServiceFit:
+        since = datetime.now(timezone.utc) - timedelta(days=params.history_days)
+        first_index = await db.scalar(
+            select(func.min(OrderStatus.order_index))
+            .where(OrderStatus.point_id == point_id, OrderStatus.is_active.is_(True))
+        )
+        per_order = (
+            select(
+                func.min(OrderStatusHistory.created_at).filter(and_(
+                    OrderStatus.order_index > (first_index or 0), OrderStatus.is_final.is_(False),
+                )).label("started"),
+                func.min(OrderStatusHistory.created_at).filter(OrderStatus.is_final.is_(True)).label("finished"),
+            )
+            .join(OrderStatus, OrderStatus.id == OrderStatusHistory.status_id)
+            .join(Order, Order.id == OrderStatusHistory.order_id)
+            .where(Order.point_id == point_id, Order.created_at >= since)
+            .group_by(OrderStatusHistory.order_id)
+            .subquery()
+        )
+        minutes = (await db.scalars(
+            select(extract("epoch", per_order.c.finished - per_order.c.started) / 60)
+            .where(per_order.c.started.is_not(None), per_order.c.finished > per_order.c.started)
+        )).all()
+
+        samples = np.array(minutes, dtype=float)
+        if samples.size >= settings.SIMULATION_MIN_SERVICE_SAMPLES:
+            # Orders left open for hours are forgotten clicks, not service
+            samples = samples[samples <= np.percentile(samples, 99)]
+        if samples.size < settings.SIMULATION_MIN_SERVICE_SAMPLES:
+            fit = _lognormal_fit(np.log(settings.SIMULATION_DEFAULT_SERVICE_MINUTES), 0.5, 0)
+            fit.distribution = "default"
+            return fit
+        logs = np.log(samples)
+        return _lognormal_fit(float(logs.mean()), max(float(logs.std(ddof=1)), 0.05), int(samples.size))
+
+    @staticmethod
+    async def run(db: AsyncSession, point_id: int, params: SimulationRequest) -> SimulationResult:
+        """Fit the point's history and simulate every scenario of ``params``"""
+        started = perf_counter()
+        arrivals = await SimulationService.fit_arrivals(db, point_id, params)
+        service = await SimulationService.fit_service(db, point_id, params)
+        # CPU-bound: keep the event loop (outbox relay, other jobs) responsive
+        results = await asyncio.to_thread(
+            simulate,
+            arrivals.hourly_rate,
+            arrivals.scheduled_share,
+            service,
+            SimulationService.scenarios(params),
+            params.replications,
+            params.seed,
+        )
+        return SimulationResult(
+            point_id=point_id,
+            arrivals=arrivals,
+            service=service,
+            replications=params.replications,
+            scenarios=results,
+            recommended=recommend(results, params.target_wait_minutes),
+            elapsed_seconds=round(perf_counter() - started, 3),
+        )
+
+
+class SimulationJobService:
+    """Simulations run by the worker; state and result in a Redis hash
+    (``SIMULATION_JOB_TTL_SECONDS`` expiry), ids queued on a Redis list."""
+
+    @staticmethod
+    def job_key(job_id: str) -> str:
+        return f"simulation:{job_id}"
+
+    @staticmethod
+    async def enqueue(point_id: int, user_id: int, params: SimulationRequest) -> Dict[str, str]:
+        job = {
+            "id": uuid.uuid4().hex,
+            "point_id": str(point_id),
+            "user_id": str(user_id),
+            "params": params.model_dump_json(),
+            "status": SimulationJobStatusEnum.QUEUED.value,
+            "scenarios": str(len(SimulationService.scenarios(params))),
+        }
+        key = SimulationJobService.job_key(job["id"])
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.hset(key, mapping=job)
+        pipe.expire(key, settings.SIMULATION_JOB_TTL_SECONDS)
+        pipe.rpush(SIMULATION_QUEUE, job["id"])
+        await pipe.execute()
+        return job
+
+    @staticmethod
+    async def get(job_id: str) -> Optional[Dict[str, str]]:
+        job = await redis_client.hgetall(SimulationJobService.job_key(job_id))
+        return job or None
+
+    @staticmethod
+    async def update(job_id: str, **fields: Any) -> None:
+        await redis_client.hset(
+            SimulationJobService.job_key(job_id), mapping={k: str(v) for k, v in fields.items()}
+        )
+
+
+class SimulationWorker:
+    """Worker loop running queued simulations one at a time"""
+
+    async def run(self, stop: asyncio.Event) -> None:
+        while not stop.is_set():
+            try:
+                item = await redis_client.blpop(SIMULATION_QUEUE, timeout=1)
+            except Exception:
+                logger.exception("Simulation queue unavailable")
+                await asyncio.sleep(1)
+                continue
+            if item is None:
+                continue
+
+            _, job_id = item
+            job = await SimulationJobService.get(job_id)
+            if job is None:
+                continue  # expired before it was picked up
+            await SimulationJobService.update(job_id, status=SimulationJobStatusEnum.RUNNING.value)
+            try:
+                params = SimulationRequest.model_validate_json(job["params"])
+                async with AsyncSessionLocal() as db:
+                    result = await SimulationService.run(db, int(job["point_id"]), params)
+            except Exception as exc:
+                logger.exception("Simulation %s failed", job_id)
+                await SimulationJobService.update(
+                    job_id, status=SimulationJobStatusEnum.FAILED.value, error=str(exc)[:500]
+                )
+            else:
+                await SimulationJobService.update(
+                    job_id, status=SimulationJobStatusEnum.DONE.value, result=result.model_dump_json()
+                )
@@ -0,0 +1,211 @@
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from time import monotonic
+from typing import Any, Dict, Iterable, List, Optional, Union
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from sqlalchemy import select, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.point import Point
+
+
+DAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+BITMAP_BYTES = MINUTES_PER_WEEK // 8  # 1260
+
+
+def _parse_minutes(value: Union[str, time]) -> int:
+    """Minutes since midnight for "HH:MM", "HH:MM:SS" or time; "24:00" is end of day"""
+    if isinstance(value, time):
+        return value.hour * 60 + value.minute
+    parts = str(value).split(":")
+    hours, minutes = int(parts[0]), int(parts[1]) if len(parts) > 1 else 0
+    if not (0 <= hours <= 24 and 0 <= minutes < 60) or (hours == 24 and minutes):
+        raise ValueError(f"Invalid time of day: {value}")
+    return hours * 60 + minutes
+
+
+def compile_working_hours(working_hours: Optional[Dict[str, Any]]) -> Optional[bytes]:
+    """Compile working hours JSON into a weekly minute bitmap.
+
+    Bit ``weekday * 1440 + minute`` (Monday = 0, local time) is set when the
+    point is open. ``end <= start`` is an overnight interval that continues into
+    the next day (Sunday wraps to Monday); ``start == end`` means open all day.
+    Missing days and ``is_closed`` days are closed. Returns None when no hours
+    are configured, which the index treats as always open.
+    """
+    if not working_hours:
+        return None
+
+    week = np.zeros(MINUTES_PER_WEEK, dtype=bool)
+    for day_index, day in enumerate(DAYS):
+        hours = working_hours.get(day)
+        if not hours or hours.get("is_closed"):
+            continue
+        start = _parse_minutes(hours["start"])
+        end = _parse_minutes(hours["end"])
+        if end <= start:
+            end += MINUTES_PER_DAY  # overnight (or 24h when start == end)
+        first = day_index * MINUTES_PER_DAY + start
+        last = day_index * MINUTES_PER_DAY + end
+        if last <= MINUTES_PER_WEEK:
+            week[first:last] = True
+        else:
+            week[first:] = True
+            week[:last - MINUTES_PER_WEEK] = True
+    return np.packbits(week).tobytes()
+
+
+def minute_of_week(at: datetime, tz_name: str) -> int:
+    """Local minute of the week (Monday 00:00 = 0) of an aware datetime"""
+    local = at.astimezone(ZoneInfo(tz_name or "UTC"))
+    return local.weekday() * MINUTES_PER_DAY + local.hour * 60 + local.minute
+
+
+def is_open(bitmap: Optional[bytes], tz_name: str, at: Optional[datetime] = None) -> bool:
+    """Check a compiled bitmap at time ``at`` (default now)"""
+    if bitmap is None:
+        return True
+    minute = minute_of_week(at or datetime.now(dt_timezone.utc), tz_name)
+    return bool(bitmap[minute >> 3] >> (7 - (minute & 7)) & 1)
+
+
+class WorkingHoursIndex:
+    """In-memory index of compiled working hours for vectorized open-now checks.
+
+    Identical schedules (chains usually share one) are interned as rows of a
+    ``(n_schedules, 1260)`` uint8 matrix; row 0 is the always-open schedule.
+    Per-point schedule row and timezone are kept in dense arrays indexed by
+    point id, so a whole result set is checked with a few NumPy gathers.
+    """
+
+    def __init__(self):
+        self._schedule_rows: Dict[bytes, int] = {}
+        self._bitmaps = np.zeros((64, BITMAP_BYTES), dtype=np.uint8)
+        self._bitmaps[0] = 0xFF
+        self._schedule_count = 1
+        self._timezones: List[str] = ["UTC"]
+        self._timezone_index: Dict[str, int] = {"UTC": 0}
+        self._schedule_of = np.full(1024, -1, dtype=np.int32)
+        self._timezone_of = np.zeros(1024, dtype=np.int16)
+        self._synced_at: Optional[datetime] = None
+        self._refreshed_at = 0.0
+
+    def _intern_schedule(self, bitmap: Optional[bytes]) -> int:
+        if bitmap is None:
+            return 0
+        row = self._schedule_rows.get(bitmap)
+        if row is None:
+            row = self._schedule_count
+            if row == len(self._bitmaps):
+                grown = np.zeros((row * 2, BITMAP_BYTES), dtype=np.uint8)
+                grown[:row] = self._bitmaps
+                self._bitmaps = grown
+            self._bitmaps[row] = np.frombuffer(bitmap, dtype=np.uint8)
+            self._schedule_count += 1
+            self._schedule_rows[bitmap] = row
+        return row
+
+    def _intern_timezone(self, tz_name: Optional[str]) -> int:
+        tz_name = tz_name or "UTC"
+        index = self._timezone_index.get(tz_name)
+        if index is None:
+            index = len(self._timezones)
+            self._timezones.append(tz_name)
+            self._timezone_index[tz_name] = index
+        return index
+
+    def _grow(self, max_id: int) -> None:
+        size = len(self._schedule_of)
+        if max_id < size:
+            return
+        while size <= max_id:
+            size *= 2
+        schedule_of = np.full(size, -1, dtype=np.int32)
+        schedule_of[:len(self._schedule_of)] = self._schedule_of
+        timezone_of = np.zeros(size, dtype=np.int16)
+        timezone_of[:len(self._timezone_of)] = self._timezone_of
+        self._schedule_of, self._timezone_of = schedule_of, timezone_of
+
+    def put(self, point_id: int, bitmap: Optional[bytes], tz_name: Optional[str]) -> None:
+        """Add or replace one point's compiled schedule"""
+        self._grow(point_id)
+        self._schedule_of[point_id] = self._intern_schedule(bitmap)
+        self._timezone_of[point_id] = self._intern_timezone(tz_name)
+
+    def __contains__(self, point_id: int) -> bool:
+        return point_id < len(self._schedule_of) and self._schedule_of[point_id] >= 0
+
+    def open_mask(self, point_ids: Iterable[int], at: Optional[datetime] = None) -> np.ndarray:
+        """Boolean mask of which ``point_ids`` are open at ``at`` (default now).
+
+        Points that are not loaded are reported closed; call ``ensure_loaded``
+        first.
+        """
+        ids = np.asarray(point_ids, dtype=np.int64)
+        if ids.size == 0:
+            return np.zeros(0, dtype=bool)
+        at = at or datetime.now(dt_timezone.utc)
+
+        known = ids < len(self._schedule_of)
+        safe_ids = np.where(known, ids, 0)
+        rows = np.where(known, self._schedule_of[safe_ids], -1)
+        loaded = rows >= 0
+
+        # Local minute of the week is computed once per distinct timezone
+        minutes_by_tz = np.array(
+            [minute_of_week(at, tz_name) for tz_name in self._timezones], dtype=np.int64
+        )
+        minutes = minutes_by_tz[self._timezone_of[safe_ids]]
+        cells = self._bitmaps[np.maximum(rows, 0), minutes >> 3]
+        bits = (cells >> (7 - (minutes & 7)).astype(np.uint8)) & 1
+        return loaded & bits.astype(bool)
+
+    def filter_open(self, point_ids: Iterable[int], at: Optional[datetime] = None) -> np.ndarray:
+        """Return only the ids that are open at ``at``"""
+        ids = np.asarray(point_ids, dtype=np.int64)
+        return ids[self.open_mask(ids, at)]
+
+    async def ensure_loaded(self, db: AsyncSession, point_ids: Iterable[int]) -> None:
+        """Load schedules of points missing from the index and pick up recent edits"""
+        await self.refresh(db)
+        ids = np.asarray(point_ids, dtype=np.int64)
+        known = ids < len(self._schedule_of)
+        loaded = np.zeros(ids.size, dtype=bool)
+        loaded[known] = self._schedule_of[ids[known]] >= 0
+        missing = ids[~loaded]
+        if missing.size:
+            await self._load(db, Point.id.in_(missing.tolist()))
+
+    async def refresh(self, db: AsyncSession, force: bool = False) -> None:
+        """Reload points changed since the last sync, at most every WORKING_HOURS_REFRESH_SECONDS"""
+        if not force and monotonic() - self._refreshed_at < settings.WORKING_HOURS_REFRESH_SECONDS:
+            return
+        self._refreshed_at = monotonic()
+        if self._synced_at is None:
+            self._synced_at = datetime.now(dt_timezone.utc)
+            return
+        # updated_at is the writer's transaction start, so look back a little
+        since = self._synced_at - timedelta(seconds=settings.WORKING_HOURS_REFRESH_SECONDS)
+        self._synced_at = datetime.now(dt_timezone.utc)
+        await self._load(db, or_(Point.updated_at >= since, Point.created_at >= since))
+
+    async def load_all(self, db: AsyncSession) -> None:
+        """Warm the index with every point"""
+        self._synced_at = datetime.now(dt_timezone.utc)
+        self._refreshed_at = monotonic()
+        await self._load(db, None)
+
+    async def _load(self, db: AsyncSession, condition) -> None:
+        stmt = select(Point.id, Point.working_hours_bitmap, Point.timezone)
+        if condition is not None:
+            stmt = stmt.where(condition)
+        result = await db.stream(stmt.execution_options(yield_per=10_000))
+        async for point_id, bitmap, tz_name in result:
+            self.put(point_id, bitmap, tz_name)
+
+
+working_hours_index = WorkingHoursIndex()
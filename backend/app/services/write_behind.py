@@ -0,0 +1,146 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from sqlalchemy import Column, DateTime, Integer, Table, column, or_, update, values
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.metrics import Counter, Gauge
+from app.models.cashier import Cashier
+from app.models.user import User
+
+
+logger = logging.getLogger(__name__)
+
+FLUSH_CHUNK_ROWS = 10000
+
+touches_total = Counter(
+    "write_behind_touches_total", "Timestamp touches recorded", ("column",)
+)
+rows_flushed_total = Counter(
+    "write_behind_rows_flushed_total", "Rows written by write-behind flushes", ("column",)
+)
+flushes_total = Counter(
+    "write_behind_flushes_total", "Write-behind flush statements executed", ("column",)
+)
+pending_rows = Gauge(
+    "write_behind_pending_rows", "Rows waiting for the next flush", ("column",)
+)
+coalescing_ratio = Gauge(
+    "write_behind_coalescing_ratio", "Touches per row written (higher is better)", ("column",)
+)
+
+
+class TimestampBuffer:
+    """Coalesces "last seen" timestamp updates for one column.
+
+    ``touch()`` only records the newest timestamp per row id in memory; the
+    flusher writes all pending rows with batched
+    ``UPDATE ... FROM (VALUES ...)`` statements that never move a timestamp
+    backwards, so concurrent workers flushing the same rows are harmless.
+    """
+
+    def __init__(self, table: Table, id_column: Column, ts_column: Column):
+        self.table = table
+        self.id_column = id_column
+        self.ts_column = ts_column
+        self.label = f"{table.name}.{ts_column.name}"
+        self._pending: Dict[int, datetime] = {}
+        self.full = asyncio.Event()
+
+    def touch(self, row_id: int, at: Optional[datetime] = None) -> None:
+        at = at or datetime.now(timezone.utc)
+        current = self._pending.get(row_id)
+        if current is None or current < at:
+            self._pending[row_id] = at
+        touches_total.inc(column=self.label)
+        pending_rows.set(len(self._pending), column=self.label)
+        if len(self._pending) >= settings.WRITE_BEHIND_MAX_PENDING:
+            self.full.set()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def _statement(self, items):
+        data = values(
+            column("id", Integer),
+            column("ts", DateTime(timezone=True)),
+            name="touched",
+        ).data(items)
+        return (
+            update(self.table)
+            .where(self.id_column == data.c.id)
+            .where(or_(self.ts_column.is_(None), self.ts_column < data.c.ts))
+            # Keep updated_at: a touch is not an edit of the row
+            .values({self.ts_column.name: data.c.ts, "updated_at": self.table.c.updated_at})
+        )
+
+    async def flush(self) -> int:
+        """Write pending rows, return how many were sent"""
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        self.full.clear()
+        pending_rows.set(0, column=self.label)
+
+        items = list(pending.items())
+        try:
+            async with AsyncSessionLocal() as db:
+                # asyncpg caps bind parameters at 32767 per statement
+                for start in range(0, len(items), FLUSH_CHUNK_ROWS):
+                    await db.execute(self._statement(items[start:start + FLUSH_CHUNK_ROWS]))
+                await db.commit()
+        except Exception:
+            # Put rows back (keeping any newer touches) and retry next interval
+            for row_id, at in pending.items():
+                if row_id not in self._pending or self._pending[row_id] < at:
+                    self._pending[row_id] = at
+            pending_rows.set(len(self._pending), column=self.label)
+            raise
+
+        flushes_total.inc(column=self.label)
+        rows_flushed_total.inc(len(pending), column=self.label)
+        written = rows_flushed_total.get(column=self.label)
+        coalescing_ratio.set(touches_total.get(column=self.label) / written, column=self.label)
+        return len(pending)
+
+
+last_login_buffer = TimestampBuffer(User.__table__, User.__table__.c.id, User.__table__.c.last_login)
+cashier_activity_buffer = TimestampBuffer(
+    Cashier.__table__, Cashier.__table__.c.id, Cashier.__table__.c.last_activity
+)
+
+BUFFERS = (last_login_buffer, cashier_activity_buffer)
+
+
+def touch_last_login(user_id: int) -> None:
+    last_login_buffer.touch(user_id)
+
+
+def touch_cashier_activity(cashier_id: int) -> None:
+    cashier_activity_buffer.touch(cashier_id)
+
+
+async def flush_all() -> None:
+    for buffer in BUFFERS:
+        try:
+            await buffer.flush()
+        except Exception:
+            logger.exception("Write-behind flush of %s failed", buffer.label)
+
+
+async def run_flusher(stop: asyncio.Event) -> None:
+    """Flush every WRITE_BEHIND_FLUSH_SECONDS (bounded staleness) or when a buffer fills up"""
+    while not stop.is_set():
+        waiters = [asyncio.create_task(stop.wait())]
+        waiters += [asyncio.create_task(buffer.full.wait()) for buffer in BUFFERS]
+        await asyncio.wait(
+            waiters,
+            timeout=settings.WRITE_BEHIND_FLUSH_SECONDS,
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+        for waiter in waiters:
+            waiter.cancel()
+        await flush_all()
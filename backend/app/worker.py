@@ -0,0 +1,63 @@
+"""Background worker: python -m app.worker"""
+import asyncio
+import logging
+import signal
+from typing import Awaitable, Callable, List
+
+from app import models  # noqa: F401  register all mappers
+from app.core.database import engine, redis_client
+from app.core.sharding import shards
+
+
+logger = logging.getLogger("app.worker")
+
+WorkerTask = Callable[[asyncio.Event], Awaitable[None]]
+
+
+def get_tasks() -> List[WorkerTask]:
+    """Long-running loops started by the worker; each returns once ``stop`` is set"""
+    from app.services.export import ExportWorker
+    from app.services.notifications import NotificationWorker
+    from app.services.outbox import OutboxRelay
+    from app.services.presence import PresenceWorker
+    from app.services.queue_counters import QueueCountersReconciler
+    from app.services.simulation import SimulationWorker
+
+    return [
+        OutboxRelay().run,
+        ExportWorker().run,
+        PresenceWorker().run,
+        SimulationWorker().run,
+        NotificationWorker().run,
+        QueueCountersReconciler().run,
+    ]
+
+
+async def run(shutdown_timeout: float = 30.0) -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    tasks = [asyncio.create_task(task(stop)) for task in get_tasks()]
+    logger.info("Worker started with %d tasks", len(tasks))
+
+    await stop.wait()
+    logger.info("Worker stopping")
+    _, pending = await asyncio.wait(tasks, timeout=shutdown_timeout)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+    await shards.close()
+    await redis_client.close()
+    await engine.dispose()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
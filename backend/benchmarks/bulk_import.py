@@ -0,0 +1,140 @@
+"""Bulk import benchmark: 10k points with 50k cashiers and their workflows.
+
+Needs a migrated database (docker-entrypoint.sh migrate). Run from backend/:
+    python benchmarks/bulk_import.py --points 10000 --cashiers-per-point 5
+Runs the import twice (first creates, second updates the same rows) and, for
+comparison, inserts a sample of points one by one through the ORM.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import models  # noqa: E402,F401  register all mappers
+
+
+OWNER_EMAIL = "bench-import@example.com"
+HOURS = {day: {"start": "09:00", "end": "21:00"} for day in (
+    "monday", "tuesday", "wednesday", "thursday", "friday", "saturday",
+)}
+
+
+def build_import(points: int, cashiers_per_point: int, rng: random.Random):
+    from app.schemas.bulk_import import BulkImportRequest
+
+    point_rows, cashier_rows = [], []
+    for index in range(points):
+        external_id = f"store-{index:06d}"
+        point_rows.append({
+            "external_id": external_id,
+            "name": f"Store #{index}",
+            "address": f"ул. Ленина, {rng.randint(1, 200)}",
+            "latitude": 55.75 + rng.uniform(-0.5, 0.5),
+            "longitude": 37.61 + rng.uniform(-0.8, 0.8),
+            "timezone": "Europe/Moscow",
+            "working_hours": HOURS,
+        })
+        for number in range(1, cashiers_per_point + 1):
+            cashier_rows.append({
+                "point_external_id": external_id,
+                "number": str(number),
+                "name": f"Касса {number}",
+            })
+    return BulkImportRequest(points=point_rows, cashiers=cashier_rows)
+
+
+async def get_owner_id(db) -> int:
+    from sqlalchemy import text
+
+    owner_id = await db.scalar(text(
+        "INSERT INTO users (email, full_name, auth_provider, is_active, is_verified) "
+        "VALUES (:email, 'Bench', 'EMAIL', true, true) "
+        "ON CONFLICT (email) DO UPDATE SET full_name = EXCLUDED.full_name RETURNING id"
+    ), {"email": OWNER_EMAIL})
+    await db.commit()
+    return owner_id
+
+
+async def run_import(data, label: str) -> None:
+    from app.core.database import AsyncSessionLocal
+    from app.services.bulk_import import BulkImportService
+
+    async with AsyncSessionLocal() as db:
+        owner_id = await get_owner_id(db)
+        started = time.perf_counter()
+        BulkImportService.validate_points(data.points)
+        BulkImportService.validate_cashiers(data.cashiers)
+        validated = time.perf_counter()
+        result = await BulkImportService.run(db, owner_id, data)
+        finished = time.perf_counter()
+
+    print(
+        f"{label:7s} points={result.points.created}+{result.points.updated} "
+        f"cashiers={result.cashiers.created}+{result.cashiers.updated} "
+        f"workflows={result.default_workflows} errors={len(result.errors)} "
+        f"validate={validated - started:.2f}s import={finished - validated:.2f}s"
+    )
+
+
+async def run_orm_sample(data, sample: int, total: int) -> None:
+    """Per-row ORM inserts with refresh(), the pattern of AuthService.create_user"""
+    from sqlalchemy import delete
+
+    from app.core.database import AsyncSessionLocal
+    from app.models.cashier import Cashier
+    from app.models.point import Point
+
+    cashiers_by_point = {}
+    for row in data.cashiers:
+        cashiers_by_point.setdefault(row["point_external_id"], []).append(row)
+
+    async with AsyncSessionLocal() as db:
+        owner_id = await get_owner_id(db)
+        started = time.perf_counter()
+        for row in data.points[:sample]:
+            point = Point(owner_id=owner_id, **{**row, "external_id": "orm-" + row["external_id"]})
+            db.add(point)
+            await db.commit()
+            await db.refresh(point)
+            for cashier_row in cashiers_by_point.get(row["external_id"], []):
+                cashier = Cashier(point_id=point.id, **{
+                    k: v for k, v in cashier_row.items() if k != "point_external_id"
+                })
+                db.add(cashier)
+                await db.commit()
+                await db.refresh(cashier)
+        elapsed = time.perf_counter() - started
+
+        orm_points = Point.external_id.like("orm-%")
+        await db.execute(delete(Cashier).where(Cashier.point_id.in_(
+            Point.__table__.select().with_only_columns(Point.id).where(orm_points)
+        )))
+        await db.execute(delete(Point).where(orm_points))
+        await db.commit()
+
+    print(f"orm     {sample} points in {elapsed:.2f}s, ~{elapsed / sample * total:.0f}s for {total}")
+
+
+async def main():
+    from app.core.database import engine
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=10_000)
+    parser.add_argument("--cashiers-per-point", type=int, default=5)
+    parser.add_argument("--orm-sample", type=int, default=200, help="0 skips the ORM comparison")
+    args = parser.parse_args()
+
+    data = build_import(args.points, args.cashiers_per_point, random.Random(42))
+    await run_import(data, "create")
+    await run_import(data, "update")
+    if args.orm_sample:
+        await run_orm_sample(data, args.orm_sample, args.points)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
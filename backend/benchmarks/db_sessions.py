@@ -0,0 +1,86 @@
+"""Request session benchmark: connection held per request vs per statement.
+
+Needs a migrated database. Run from backend/:
+    python benchmarks/db_sessions.py --requests 5000 --concurrency 200 --pool-size 10
+Simulates requests shaped like an authenticated read: look up the user, do
+``--work-ms`` of non-database work (password hashing, an OAuth call, response
+serialization), read again, do ``--work-ms`` more. Each is run with a session
+holding its connection until the request ends (the old ``get_db``), with
+``get_db``'s short-held session and with ``get_read_db``'s read-only one,
+all on the same pool of ``--pool-size`` connections without overflow.
+Reports requests/s, latency and how long connections were held, from the
+pool metrics.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+
+async def run_mode(label: str, session_factory, requests: int, concurrency: int, work: float) -> None:
+    from sqlalchemy import func, select
+
+    from app.core.database import db_checkouts_total, db_hold_seconds_total
+    from app.models.point import Point
+    from app.models.user import User
+
+    async def request() -> None:
+        async with session_factory() as db:
+            await db.scalar(select(User).order_by(User.id).limit(1))
+            await asyncio.sleep(work)
+            await db.scalar(select(func.count()).select_from(Point))
+            await asyncio.sleep(work)
+
+    latencies = np.empty(requests)
+    next_index = iter(range(requests))
+
+    async def worker() -> None:
+        for index in next_index:
+            started = time.perf_counter()
+            await request()
+            latencies[index] = time.perf_counter() - started
+
+    checkouts, held = db_checkouts_total.get(), db_hold_seconds_total.get()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    checkouts, held = db_checkouts_total.get() - checkouts, db_hold_seconds_total.get() - held
+    ms = latencies * 1000
+    print(
+        f"{label:9s} {requests / elapsed:7.0f} req/s"
+        f"  p50 {np.percentile(ms, 50):7.1f}ms  p99 {np.percentile(ms, 99):7.1f}ms"
+        f"  held {held / requests * 1000:6.2f}ms/req  {held / max(checkouts, 1) * 1000:6.2f}ms/checkout"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+    from app import models  # noqa: F401  register all mappers
+    from app.core.database import AsyncSessionLocal, ReadOnlySessionLocal, engine
+
+    held = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    work = args.work_ms / 1000
+    try:
+        for label, factory in (("held", held), ("short", AsyncSessionLocal), ("read-only", ReadOnlySessionLocal)):
+            await run_mode(label, factory, args.requests, args.concurrency, work)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--pool-size", type=int, default=10)
+    parser.add_argument("--work-ms", type=float, default=5.0)
+    args = parser.parse_args()
+    # Read by the settings when the engine is created
+    os.environ["DB_POOL_SIZE"] = str(args.pool_size)
+    os.environ["DB_MAX_OVERFLOW"] = "0"
+    asyncio.run(main(args))
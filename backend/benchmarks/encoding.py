@@ -0,0 +1,109 @@
+"""Response encoding benchmark: bytes on the wire and CPU per response.
+
+No database needed. Run from backend/:
+    python benchmarks/encoding.py --orders 50 --points 100
+Compares JSON and MessagePack, each uncompressed, gzip and brotli, for a
+QueueStatus payload and a PointPublic list. "cached" is the cost of serving
+an already encoded variant from an EncodedPayload.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+from app.core import encoding  # noqa: E402
+from app.schemas.order import OrderPublic, OrderStatusPublic, QueuePosition, QueueStatus  # noqa: E402
+from app.schemas.point import PointPublic  # noqa: E402
+
+
+STATUSES = [
+    OrderStatusPublic(id=i + 1, name=name, color="#007AFF", order_index=i, is_final=i > 1)
+    for i, name in enumerate(["в очереди", "обслуживается", "завершен", "отменен"])
+]
+HOURS = {day: {"start": "09:00", "end": "21:00"} for day in ("monday", "tuesday", "wednesday", "thursday", "friday")}
+
+
+def queue_status(orders: int, rng: random.Random) -> dict:
+    now = datetime.now(timezone.utc)
+    current = [
+        OrderPublic(
+            id=1000 + i,
+            order_number=f"42-{i:04d}",
+            order_type="immediate",
+            current_status=rng.choice(STATUSES[:2]),
+            created_at=now - timedelta(minutes=rng.randint(0, 120)),
+        )
+        for i in range(orders)
+    ]
+    queue = [
+        QueuePosition(order_id=1000 + i, position=i + 1, estimated_wait_time_minutes=3 * (i + 1))
+        for i in range(orders)
+    ]
+    return jsonable_encoder(QueueStatus(point_id=42, total_orders=orders, current_orders=current, queue=queue))
+
+
+def point_list(points: int, rng: random.Random) -> list:
+    return jsonable_encoder([
+        PointPublic(
+            id=i,
+            name=f"Кофейня #{i}",
+            description="Кофе, выпечка и завтраки весь день",
+            address=f"ул. Ленина, {rng.randint(1, 200)}",
+            latitude=55.75 + rng.uniform(-0.5, 0.5),
+            longitude=37.61 + rng.uniform(-0.8, 0.8),
+            status="active",
+            working_hours=HOURS,
+            timezone="Europe/Moscow",
+            accepts_online_orders=True,
+            accepts_scheduled_orders=bool(i % 2),
+        )
+        for i in range(points)
+    ])
+
+
+def measure(label: str, content, repeat: int) -> None:
+    media_types = [encoding.JSON] + ([encoding.MSGPACK] if encoding.msgpack else [])
+    codings = [None, "gzip"] + (["br"] if encoding.brotli else [])
+    baseline = len(encoding.serialize(content, encoding.JSON))
+    print(f"{label} (JSON {baseline} bytes)")
+    for media_type in media_types:
+        for coding in codings:
+            started = time.perf_counter()
+            for _ in range(repeat):
+                body, applied = encoding.encode(encoding.serialize(content, media_type), coding)
+            per_response = (time.perf_counter() - started) / repeat * 1e6
+
+            payload = encoding.EncodedPayload(content)
+            payload.variant(media_type, coding)
+            started = time.perf_counter()
+            for _ in range(repeat):
+                payload.variant(media_type, coding)
+            cached = (time.perf_counter() - started) / repeat * 1e6
+
+            name = f"{media_type.split('/')[1]}+{applied or 'identity'}"
+            print(
+                f"  {name:18s} {len(body):7d} bytes ({len(body) / baseline:6.1%})"
+                f"  encode {per_response:8.1f}us  cached {cached:5.2f}us"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=50)
+    parser.add_argument("--points", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    measure(f"QueueStatus with {args.orders} orders", queue_status(args.orders, rng), args.repeat)
+    measure(f"PointPublic list of {args.points}", point_list(args.points, rng), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
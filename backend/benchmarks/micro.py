@@ -0,0 +1,479 @@
+"""Micro-benchmarks of per-request hot paths, with JSON baselines.
+
+Run from backend/:
+    python benchmarks/micro.py run --output benchmarks/baselines/micro.json
+    python benchmarks/micro.py compare benchmarks/baselines/micro.json
+``run`` times every benchmark (``--only`` takes name prefixes) and writes the
+results as JSON. ``compare BASELINE [CURRENT]`` compares a results file, or a
+fresh run of the benchmarks in the baseline, against the baseline and exits
+with 1 if a median got slower by more than its threshold (10% for CPU-bound
+benchmarks, 25% for the ones doing I/O, or ``--threshold``). Baselines are
+only comparable on the machine they were recorded on: record them on the CI
+runner and commit them with the change that moves them.
+
+CPU benchmarks need nothing. ``redis.*`` needs Redis at REDIS_URL and
+``db.*`` a migrated database; they are skipped when those are unreachable.
+Each benchmark is calibrated so a round takes ``--round-ms``, then timed for
+``--rounds`` rounds; the median time per call is the tracked metric.
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import models  # noqa: E402,F401  register all mappers
+
+
+CPU_THRESHOLD = 0.10
+IO_THRESHOLD = 0.25
+BENCH_EMAIL = "bench-micro@example.com"
+BENCH_POINT_ID = 999_999_999  # Redis keys only, never a real point
+
+BENCHMARKS = []
+
+
+def benchmark(name: str, needs: str = None, threshold: float = CPU_THRESHOLD):
+    """Register a factory returning the callable (sync or async) to time"""
+    def register(factory):
+        BENCHMARKS.append({"name": name, "needs": needs, "threshold": threshold, "factory": factory})
+        return factory
+    return register
+
+
+# Fixtures -----------------------------------------------------------------
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _user_row(**overrides) -> dict:
+    return {
+        "id": 1, "email": BENCH_EMAIL, "full_name": "Bench", "phone": "+70000000000", "avatar_url": None,
+        "auth_provider": "email", "oauth_id": None, "is_active": True, "is_verified": True,
+        "created_at": _now(), "updated_at": None, "last_login": _now(), **overrides,
+    }
+
+
+def _statuses() -> list:
+    return [
+        {"id": i + 1, "name": name, "color": "#007AFF", "order_index": i, "is_final": i > 1}
+        for i, name in enumerate(["в очереди", "обслуживается", "завершен", "отменен"])
+    ]
+
+
+def _order_row(i: int) -> dict:
+    return {
+        "id": 1000 + i, "order_number": f"42-{i:04d}", "order_type": "immediate",
+        "scheduled_time": None, "current_status": _statuses()[i % 2], "created_at": _now() - timedelta(minutes=i),
+    }
+
+
+def _point_row(cashiers: int) -> dict:
+    now = _now()
+    return {
+        "id": 42, "owner_id": 1, "external_id": "bench-42", "name": "Кофейня", "description": "Кофе и выпечка",
+        "detailed_description": None, "address": "ул. Ленина, 1", "latitude": 55.75, "longitude": 37.61,
+        "status": "active",
+        "working_hours": {day: {"start": "09:00", "end": "21:00"} for day in ("monday", "tuesday", "friday")},
+        "timezone": "Europe/Moscow", "accepts_online_orders": True, "accepts_scheduled_orders": True,
+        "slot_duration_minutes": 30, "slots_per_interval": 5, "advance_booking_days": 7,
+        "enable_qr_code": True, "require_phone_verification": False, "created_at": now, "updated_at": now,
+        "cashiers": [
+            {
+                "id": 500 + i, "point_id": 42, "number": str(i + 1), "name": f"Касса {i + 1}",
+                "assigned_user_id": None, "status": "available", "is_active": True, "max_concurrent_orders": 1,
+                "created_at": now, "updated_at": None, "last_activity": now,
+            }
+            for i in range(cashiers)
+        ],
+    }
+
+
+# CPU ----------------------------------------------------------------------
+
+@benchmark("security.create_access_token")
+async def _create_access_token(env):
+    from app.core.security import create_access_token
+
+    return lambda: create_access_token({"sub": BENCH_EMAIL, "type": "access", "fam": "bench"})
+
+
+@benchmark("security.verify_token")
+async def _verify_token(env):
+    from app.core.security import create_access_token, verify_token
+
+    token = create_access_token({"sub": BENCH_EMAIL, "type": "access", "fam": "bench"})
+    return lambda: verify_token(token)
+
+
+@benchmark("security.get_password_hash")
+async def _password_hash(env):
+    from app.core.security import get_password_hash
+
+    return lambda: get_password_hash("correct horse battery")
+
+
+@benchmark("security.verify_password")
+async def _verify_password(env):
+    from app.core.security import get_password_hash, verify_password
+
+    hashed = get_password_hash("correct horse battery")
+    return lambda: verify_password("correct horse battery", hashed)
+
+
+def _serialize(model, data):
+    """What a response_model costs: validation of the returned data, then JSON"""
+    return lambda: model.model_validate(data).model_dump_json()
+
+
+@benchmark("schema.Token")
+async def _token(env):
+    from app.schemas.user import Token
+
+    data = {
+        "access_token": "a" * 300, "token_type": "bearer", "expires_in": 900,
+        "refresh_token": "r" * 300, "refresh_expires_in": 2592000, "user": _user_row(),
+    }
+    return _serialize(Token, data)
+
+
+@benchmark("schema.OrderPublic")
+async def _order_public(env):
+    from app.schemas.order import OrderPublic
+
+    return _serialize(OrderPublic, _order_row(7))
+
+
+@benchmark("schema.QueueStatus[50]")
+async def _queue_status(env):
+    from app.schemas.order import QueueStatus
+
+    data = {
+        "point_id": 42, "total_orders": 50,
+        "current_orders": [_order_row(i) for i in range(50)],
+        "queue": [{"order_id": 1000 + i, "position": i + 1, "estimated_wait_time_minutes": 3 * (i + 1)} for i in range(50)],
+    }
+    return _serialize(QueueStatus, data)
+
+
+@benchmark("schema.PointWithCashiers[10]")
+async def _point_with_cashiers(env):
+    from app.schemas.point import PointWithCashiers
+
+    return _serialize(PointWithCashiers, _point_row(10))
+
+
+# Redis --------------------------------------------------------------------
+
+@benchmark("redis.allocate_order_number", needs="redis", threshold=IO_THRESHOLD)
+async def _allocate_order_number(env):
+    from app.services.order import OrderService
+
+    env["redis_keys"].append(OrderService.order_seq_key(BENCH_POINT_ID))
+    return lambda: OrderService.allocate_order_numbers(BENCH_POINT_ID)
+
+
+@benchmark("redis.active_orders_apply", needs="redis", threshold=IO_THRESHOLD)
+async def _active_orders_apply(env):
+    from types import SimpleNamespace
+
+    from app.core.database import redis_client
+    from app.services.active_orders import ActiveOrdersIndex
+
+    user_id = BENCH_POINT_ID
+    env["redis_keys"].append(ActiveOrdersIndex.key(user_id))
+    payload = {
+        "number": "42-0001", "status_id": 1, "type": "immediate", "scheduled_time": None,
+        "created_at": _now().isoformat(), "position": 3, "v": 0,
+    }
+    versions = iter(range(1, 1 << 62))
+
+    async def apply():
+        row = SimpleNamespace(
+            event_type="order.status_changed", user_id=user_id, entity_id=1000, point_id=42,
+            payload={**payload, "v": next(versions)},
+        )
+        pipe = redis_client.pipeline(transaction=False)
+        await ActiveOrdersIndex.queue_event(pipe, row)
+        await pipe.execute()
+    return apply
+
+
+@benchmark("redis.active_orders_read", needs="redis", threshold=IO_THRESHOLD)
+async def _active_orders_read(env):
+    from app.core.database import redis_client
+    from app.core.redis_layer import autopipeline
+    from app.services.active_orders import COMPLETE_FIELD, ActiveOrdersIndex
+
+    key = ActiveOrdersIndex.key(BENCH_POINT_ID + 1)
+    env["redis_keys"].append(key)
+    await redis_client.hset(key, mapping={
+        COMPLETE_FIELD: "1",
+        **{str(1000 + i): f"{i}|" + json.dumps(_order_row(i), default=str) for i in range(5)},
+    })
+    return lambda: autopipeline.execute_command("HGETALL", key)
+
+
+@benchmark("redis.queue_counters_read", needs="redis", threshold=IO_THRESHOLD)
+async def _queue_counters_read(env):
+    from app.core.database import redis_client
+    from app.services.queue_counters import COMPLETE_FIELD, QueueCounters
+
+    # An owner dashboard of 20 points: one pipelined read
+    point_ids = [BENCH_POINT_ID - index for index in range(20)]
+    for point_id in point_ids:
+        statuses_key, cashiers_key, orders_key = QueueCounters.keys(point_id)
+        env["redis_keys"].extend((statuses_key, cashiers_key, orders_key))
+        await redis_client.hset(statuses_key, mapping={COMPLETE_FIELD: "1", "1": "12", "2": "3", "3": "2"})
+        await redis_client.hset(cashiers_key, mapping={"1": "9", "2": "8"})
+    return lambda: QueueCounters.get_many(None, point_ids)
+
+
+@benchmark("redis.revocation_check", needs="redis", threshold=IO_THRESHOLD)
+async def _revocation_check(env):
+    from app.core.revocation import revocations
+    from app.core.security import new_token_id
+
+    jti, family = new_token_id(), new_token_id()
+    return lambda: revocations.is_revoked(jti, family)
+
+
+# Database -----------------------------------------------------------------
+
+@benchmark("db.get_current_user", needs="db", threshold=IO_THRESHOLD)
+async def _get_current_user(env):
+    from fastapi.security import HTTPAuthorizationCredentials
+    from sqlalchemy import text
+
+    from app.core.database import AsyncSessionLocal
+    from app.core.security import create_access_token
+    from app.services.auth import AuthService
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(text(
+            "INSERT INTO users (email, full_name, auth_provider, is_active, is_verified) "
+            "VALUES (:email, 'Bench', 'EMAIL', true, true) "
+            "ON CONFLICT (email) DO UPDATE SET full_name = EXCLUDED.full_name"
+        ), {"email": BENCH_EMAIL})
+        await db.commit()
+
+    credentials = HTTPAuthorizationCredentials(
+        scheme="Bearer",
+        credentials=create_access_token({"sub": BENCH_EMAIL, "type": "access", "fam": "bench"}),
+    )
+
+    async def get_current_user():
+        # A session per call, like the get_db dependency
+        async with AsyncSessionLocal() as db:
+            await AuthService.get_current_user(credentials, db)
+    return get_current_user
+
+
+# Runner -------------------------------------------------------------------
+
+async def _available(needs: str) -> bool:
+    try:
+        if needs == "redis":
+            from app.core.database import redis_client
+
+            await asyncio.wait_for(redis_client.ping(), 2.0)
+        elif needs == "db":
+            from sqlalchemy import text
+
+            from app.core.database import engine
+
+            async with engine.connect() as connection:
+                await asyncio.wait_for(connection.execute(text("SELECT 1 FROM users LIMIT 1")), 2.0)
+        return True
+    except Exception as error:
+        print(f"{needs} unavailable ({type(error).__name__}: {error}), skipping {needs}.* benchmarks")
+        return False
+
+
+async def _time(fn, loops: int, is_async: bool) -> float:
+    if is_async:
+        started = time.perf_counter()
+        for _ in range(loops):
+            await fn()
+        return time.perf_counter() - started
+    started = time.perf_counter()
+    for _ in range(loops):
+        fn()
+    return time.perf_counter() - started
+
+
+async def _measure(fn, rounds: int, round_seconds: float) -> dict:
+    # Warm-up call, which also tells coroutine-returning callables apart
+    result = fn()
+    is_async = inspect.isawaitable(result)
+    if is_async:
+        await result
+
+    # Calibrate: grow the loop count until a round is long enough
+    loops = 1
+    while True:
+        elapsed = await _time(fn, loops, is_async)
+        if elapsed >= round_seconds or loops >= 1 << 24:
+            break
+        loops = max(loops * 2, int(loops * round_seconds / max(elapsed, 1e-9) * 1.1))
+    per_call = [await _time(fn, loops, is_async) / loops * 1e9 for _ in range(rounds)]
+    return {
+        "median_ns": statistics.median(per_call),
+        "min_ns": min(per_call),
+        "stdev_ns": statistics.stdev(per_call) if len(per_call) > 1 else 0.0,
+        "loops": loops,
+        "rounds": rounds,
+    }
+
+
+def _selected(name: str, only) -> bool:
+    return not only or any(name.startswith(prefix) for prefix in only)
+
+
+async def run_suite(only, rounds: int, round_ms: float) -> dict:
+    from app.core.database import engine, redis_client
+    from app.core.revocation import revocations
+
+    results = {}
+    errors = []
+    env = {"redis_keys": []}
+    wanted = [bench for bench in BENCHMARKS if _selected(bench["name"], only)]
+    available = {None: True}
+    for needs in {bench["needs"] for bench in wanted} - {None}:
+        available[needs] = await _available(needs)
+
+    # Keep the revocation filter in sync as in the API, so checks measure the filter path
+    stop = asyncio.Event()
+    revocation_sync = None
+    if available.get("redis"):
+        revocation_sync = asyncio.create_task(revocations.run(stop))
+        for _ in range(50):
+            if revocations.synced:
+                break
+            await asyncio.sleep(0.1)
+
+    try:
+        for bench in wanted:
+            if not available[bench["needs"]]:
+                continue
+            try:
+                fn = await bench["factory"](env)
+                result = await _measure(fn, rounds, round_ms / 1000)
+            except Exception as error:
+                errors.append(bench["name"])
+                print(f"  {bench['name']:36s} {'error':>10s}  {type(error).__name__}: {error}")
+                continue
+            result["threshold"] = bench["threshold"]
+            results[bench["name"]] = result
+            print(f"  {bench['name']:36s} {_format_ns(result['median_ns']):>10s}  ±{_format_ns(result['stdev_ns'])}")
+    finally:
+        stop.set()
+        if revocation_sync is not None:
+            await revocation_sync
+        if env["redis_keys"]:
+            await redis_client.delete(*env["redis_keys"])
+        if available.get("redis"):
+            await redis_client.aclose()
+        if available.get("db"):
+            await engine.dispose()
+
+    return {
+        "recorded_at": datetime.now(timezone.utc).isoformat(),
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "benchmarks": results,
+        "errors": errors,
+    }
+
+
+def _format_ns(ns: float) -> str:
+    for unit, scale in (("s", 1e9), ("ms", 1e6), ("us", 1e3)):
+        if ns >= scale:
+            return f"{ns / scale:.2f}{unit}"
+    return f"{ns:.0f}ns"
+
+
+def compare(baseline: dict, current: dict, threshold: float = None, only=None) -> int:
+    """Print the changes, return the number of regressions"""
+    if baseline.get("machine") != current.get("machine"):
+        print("warning: results come from different machines or Python versions, differences may not be real")
+    regressions = 0
+    for name, base in baseline["benchmarks"].items():
+        if not _selected(name, only):
+            continue
+        now = current["benchmarks"].get(name)
+        if now is None:
+            print(f"  {name:36s} {'missing':>10s}")
+            continue
+        limit = threshold if threshold is not None else base.get("threshold", CPU_THRESHOLD)
+        change = now["median_ns"] / base["median_ns"] - 1
+        verdict = ""
+        if change > limit:
+            verdict = f"REGRESSION (> {limit:.0%})"
+            regressions += 1
+        elif change < -limit:
+            verdict = "faster"
+        print(
+            f"  {name:36s} {_format_ns(base['median_ns']):>10s} -> {_format_ns(now['median_ns']):>10s}"
+            f"  {change:+7.1%}  {verdict}"
+        )
+    for name in current["benchmarks"].keys() - baseline["benchmarks"].keys():
+        print(f"  {name:36s} {'new':>10s}    {_format_ns(current['benchmarks'][name]['median_ns']):>10s}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command in ("run", "compare"):
+        sub = subparsers.add_parser(command)
+        if command == "compare":
+            sub.add_argument("baseline", help="baseline results JSON")
+            sub.add_argument("current", nargs="?", help="results JSON to check (default: run now)")
+            sub.add_argument("--threshold", type=float, help="allowed slowdown for every benchmark, e.g. 0.1")
+        else:
+            sub.add_argument("--output", help="write results JSON here")
+        sub.add_argument("--only", nargs="+", help="benchmark name prefixes")
+        sub.add_argument("--rounds", type=int, default=15)
+        sub.add_argument("--round-ms", type=float, default=20.0, help="target duration of one round")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = asyncio.run(run_suite(args.only, args.rounds, args.round_ms))
+        if args.output:
+            os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+            with open(args.output, "w") as file:
+                json.dump(results, file, indent=2, sort_keys=True)
+            print(f"wrote {len(results['benchmarks'])} results to {args.output}")
+        return 1 if results["errors"] else 0
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    if args.current:
+        with open(args.current) as file:
+            current = json.load(file)
+    else:
+        only = [name for name in baseline["benchmarks"] if _selected(name, args.only)]
+        current = asyncio.run(run_suite(only, args.rounds, args.round_ms))
+    regressions = compare(baseline, current, args.threshold, args.only)
+    if regressions:
+        print(f"{regressions} benchmark(s) regressed")
+    if current.get("errors"):
+        print(f"{len(current['errors'])} benchmark(s) failed: {', '.join(current['errors'])}")
+    return 1 if regressions or current.get("errors") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""Order creation benchmark: one transaction per order vs group commit.
+
+Needs a migrated database and Redis. Run from backend/:
+    python benchmarks/order_intake.py --orders 5000 --concurrency 500
+Simulates a burst on one point: ``--concurrency`` coroutines create
+``--orders`` orders through ``OrderService.create_order`` (a session and a
+commit each, as the endpoint did before) and then through ``order_intake``,
+and reports orders/s and per-order latency. The orders are deleted afterwards.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from app import models  # noqa: E402,F401  register all mappers
+
+
+CUSTOMER_EMAIL = "bench-orders@example.com"
+POINT_EXTERNAL_ID = "bench-order-intake"
+
+
+async def setup():
+    """Bench customer and an active point with a two-step workflow"""
+    from sqlalchemy import select, text
+
+    from app.core.database import AsyncSessionLocal
+    from app.models.order import OrderStatus
+    from app.models.point import Point
+    from app.models.user import User
+
+    async with AsyncSessionLocal() as db:
+        user_id = await db.scalar(text(
+            "INSERT INTO users (email, full_name, auth_provider, is_active, is_verified) "
+            "VALUES (:email, 'Bench', 'EMAIL', true, true) "
+            "ON CONFLICT (email) DO UPDATE SET full_name = EXCLUDED.full_name RETURNING id"
+        ), {"email": CUSTOMER_EMAIL})
+        point = await db.scalar(select(Point).where(
+            Point.owner_id == user_id, Point.external_id == POINT_EXTERNAL_ID
+        ))
+        if point is None:
+            point = Point(
+                owner_id=user_id, external_id=POINT_EXTERNAL_ID, name="Bench point", address="Bench st.",
+            )
+            db.add(point)
+            await db.flush()
+            db.add_all([
+                OrderStatus(point_id=point.id, name="Принят", order_index=0),
+                OrderStatus(point_id=point.id, name="Выдан", order_index=1, is_final=True),
+            ])
+        await db.commit()
+        return await db.get(User, user_id), point.id
+
+
+async def cleanup(point_id: int) -> None:
+    from sqlalchemy import delete, select
+
+    from app.core.database import AsyncSessionLocal
+    from app.models.order import Order, OrderStatusHistory
+    from app.models.outbox import OutboxEvent
+
+    async with AsyncSessionLocal() as db:
+        orders = select(Order.id).where(Order.point_id == point_id)
+        await db.execute(delete(OrderStatusHistory).where(OrderStatusHistory.order_id.in_(orders)))
+        await db.execute(delete(OutboxEvent).where(OutboxEvent.point_id == point_id))
+        await db.execute(delete(Order).where(Order.point_id == point_id))
+        await db.commit()
+
+
+async def run_mode(label: str, create, orders: int, concurrency: int) -> None:
+    latencies = np.empty(orders)
+    next_index = iter(range(orders))
+
+    async def worker() -> None:
+        for index in next_index:
+            started = time.perf_counter()
+            await create()
+            latencies[index] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    ms = latencies * 1000
+    print(
+        f"{label:13s} {orders / elapsed:8.0f} orders/s"
+        f"  p50 {np.percentile(ms, 50):7.1f}ms  p99 {np.percentile(ms, 99):7.1f}ms"
+    )
+
+
+async def main():
+    from app.core.database import AsyncSessionLocal, engine, redis_client
+    from app.schemas.order import OrderCreate
+    from app.services.order import OrderService
+    from app.services.order_intake import order_intake
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=500)
+    args = parser.parse_args()
+
+    user, point_id = await setup()
+    order_data = OrderCreate(point_id=point_id)
+
+    async def naive():
+        async with AsyncSessionLocal() as db:
+            await OrderService.create_order(db, user, order_data)
+
+    try:
+        await run_mode("per-order", naive, args.orders, args.concurrency)
+        await run_mode("group commit", lambda: order_intake.submit(user, order_data), args.orders, args.concurrency)
+    finally:
+        await cleanup(point_id)
+        await redis_client.aclose()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,74 @@
+"""Redis access layer benchmark: plain pool vs auto-pipeline vs client-side cache.
+
+Needs Redis at REDIS_URL (6.0+ for client tracking). Run from backend/:
+    python benchmarks/redis_layer.py --concurrency 200 --ops 50000
+Each mode runs ``--concurrency`` coroutines issuing GETs of a small set of
+point metadata keys and reports throughput and per-call latency.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from app.core.database import redis_client  # noqa: E402
+from app.core.redis_layer import autopipeline, client_cache  # noqa: E402
+
+
+KEYS = [f"cache:bench:{i}" for i in range(100)]
+
+
+async def run_mode(label: str, get, concurrency: int, ops: int) -> None:
+    latencies = np.empty(ops)
+    per_worker = ops // concurrency
+
+    async def worker(offset: int) -> None:
+        for i in range(per_worker):
+            started = time.perf_counter()
+            await get(KEYS[(offset + i) % len(KEYS)])
+            latencies[offset * per_worker + i] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(offset) for offset in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    done = latencies[:per_worker * concurrency] * 1e6
+    print(
+        f"{label:13s} {len(done) / elapsed:10.0f} ops/s"
+        f"  p50 {np.percentile(done, 50):8.1f}us  p99 {np.percentile(done, 99):8.1f}us"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--ops", type=int, default=50_000)
+    args = parser.parse_args()
+
+    await redis_client.mset({key: '{"name": "Кофейня", "status": "active"}' for key in KEYS})
+
+    stop = asyncio.Event()
+    invalidations = asyncio.create_task(client_cache.run(stop))
+    for _ in range(50):
+        if client_cache.tracking:
+            break
+        await asyncio.sleep(0.1)
+
+    await run_mode("pool", redis_client.get, args.concurrency, args.ops)
+    await run_mode("autopipeline", autopipeline.get, args.concurrency, args.ops)
+    if client_cache.tracking:
+        await run_mode("client cache", client_cache.get, args.concurrency, args.ops)
+    else:
+        print("client cache  skipped: CLIENT TRACKING is not available")
+
+    stop.set()
+    await invalidations
+    await redis_client.delete(*KEYS)
+    await redis_client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
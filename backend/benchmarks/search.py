@@ -0,0 +1,142 @@
+"""Points search benchmark (target: p99 < 30ms at 500k points).
+
+Needs a migrated database (docker-entrypoint.sh migrate). Run from backend/:
+    python benchmarks/search.py --seed 500000 --queries 2000
+--seed inserts synthetic points through COPY; omit it to reuse existing rows.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings  # noqa: E402
+
+
+WORDS = [
+    "кофе", "coffee", "пекарня", "bakery", "аптека", "pharmacy", "бургер", "burger",
+    "пицца", "pizza", "суши", "sushi", "шаурма", "market", "маркет", "почта", "post",
+    "сервис", "service", "ремонт", "repair", "центр", "center", "лавка", "shop",
+]
+STREETS = ["Ленина", "Тверская", "Невский", "Арбат", "Мира", "Gagarina", "Pushkina", "Lenina"]
+
+
+def _point_row(owner_id: int, rng: random.Random):
+    name = " ".join(rng.sample(WORDS, 2)).title() + f" #{rng.randint(1, 9999)}"
+    address = f"ул. {rng.choice(STREETS)}, {rng.randint(1, 200)}"
+    description = " ".join(rng.choices(WORDS, k=8))
+    return (
+        owner_id,
+        name,
+        description,
+        None,
+        address,
+        55.75 + rng.uniform(-0.5, 0.5),
+        37.61 + rng.uniform(-0.8, 0.8),
+        "ACTIVE",
+        True,
+        False,
+        30,
+        5,
+        7,
+        True,
+        False,
+    )
+
+
+async def seed(count: int):
+    import asyncpg
+
+    conn = await asyncpg.connect(settings.DATABASE_URL)
+    try:
+        owner_id = await conn.fetchval(
+            "INSERT INTO users (email, full_name, auth_provider, is_active, is_verified) "
+            "VALUES ('bench-owner@example.com', 'Bench', 'EMAIL', true, true) "
+            "ON CONFLICT (email) DO UPDATE SET full_name = EXCLUDED.full_name RETURNING id"
+        )
+        rng = random.Random(42)
+        columns = [
+            "owner_id", "name", "description", "detailed_description", "address",
+            "latitude", "longitude", "status", "accepts_online_orders",
+            "accepts_scheduled_orders", "slot_duration_minutes", "slots_per_interval",
+            "advance_booking_days", "enable_qr_code", "require_phone_verification",
+        ]
+        batch = 50_000
+        for start in range(0, count, batch):
+            records = [_point_row(owner_id, rng) for _ in range(min(batch, count - start))]
+            await conn.copy_records_to_table("points", records=records, columns=columns)
+        await conn.execute("ANALYZE points")
+    finally:
+        await conn.close()
+
+
+def _typo(word: str, rng: random.Random) -> str:
+    if len(word) < 4:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    return word[:i] + word[i + 1:]
+
+
+def _queries(count: int, rng: random.Random):
+    for _ in range(count):
+        kind = rng.random()
+        word = rng.choice(WORDS)
+        if kind < 0.4:
+            text = word[: rng.randint(2, len(word))]  # as-you-type prefix
+        elif kind < 0.6:
+            text = _typo(word, rng)
+        else:
+            text = f"{word} {rng.choice(STREETS)}"
+        with_location = rng.random() < 0.5
+        yield text, with_location
+
+
+async def run(queries: int):
+    from app.core.database import AsyncSessionLocal, engine
+    from app.schemas.point import PointSearchFilters
+    from app.services.search import PointSearchService
+
+    rng = random.Random(7)
+    timings = []
+    async with AsyncSessionLocal() as db:
+        for text, with_location in _queries(queries, rng):
+            filters = PointSearchFilters(
+                query=text,
+                latitude=55.75 if with_location else None,
+                longitude=37.61 if with_location else None,
+                radius_km=10 if with_location else None,
+            )
+            started = time.perf_counter()
+            await PointSearchService.search(db, filters)
+            await db.rollback()
+            timings.append((time.perf_counter() - started) * 1000)
+    await engine.dispose()
+
+    timings.sort()
+    p = lambda q: timings[min(len(timings) - 1, int(len(timings) * q))]  # noqa: E731
+    print(
+        f"n={len(timings)} mean={statistics.mean(timings):.2f}ms "
+        f"p50={p(0.50):.2f}ms p95={p(0.95):.2f}ms p99={p(0.99):.2f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", type=int, default=0, help="insert this many synthetic points first")
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    if args.seed:
+        started = time.perf_counter()
+        await seed(args.seed)
+        print(f"seeded {args.seed} points in {time.perf_counter() - started:.1f}s")
+
+    await run(args.queries)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
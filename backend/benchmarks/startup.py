@@ -0,0 +1,97 @@
+"""Startup benchmark: import time of main.py and time-to-first-request.
+
+Run from backend/:
+    python benchmarks/startup.py [--runs 5] [--top 15]
+"""
+import argparse
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+) \| (.*)")
+
+
+def measure_import(top: int):
+    """Return total import time of main (ms) and the slowest top-level modules"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        cumulative_us = int(match.group(2))
+        name = match.group(3)
+        # Top-level entries are not indented
+        if not name.startswith(" "):
+            modules.append((cumulative_us / 1000, name.strip()))
+    modules.sort(reverse=True)
+    return sum(ms for ms, _ in modules), modules[:top]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_first_request(timeout: float = 30.0) -> float:
+    """Start uvicorn and return seconds until /health answers 200"""
+    port = _free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError("server did not answer within timeout")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    import_times = []
+    slowest = []
+    for _ in range(args.runs):
+        total_ms, slowest = measure_import(args.top)
+        import_times.append(total_ms)
+
+    first_request = [measure_first_request() * 1000 for _ in range(args.runs)]
+
+    print(f"import main:            median {statistics.median(import_times):8.1f} ms")
+    print(f"time to first request:  median {statistics.median(first_request):8.1f} ms")
+    print()
+    print("slowest top-level imports (last run):")
+    for ms, name in slowest:
+        print(f"  {ms:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -53,10 +53,17 @@ run_migrations() {
     if [ -f "alembic.ini" ]; then
         alembic upgrade head
     else
-        echo "No alembic.ini found, skipping migrations"
+        echo "No alembic.ini found, creating tables instead"
+        create_tables
     fi
 }
 
+# Функция для проверки схемы (воркеры сервера схему не трогают)
+check_schema() {
+    echo "Checking database schema..."
+    python -m app.cli check-schema
+}
+
 # Функция для создания таблиц
 create_tables() {
     echo "Creating database tables..."
@@ -73,8 +80,8 @@ case "$1" in
         echo "Starting FastAPI server..."
         wait_for_db
         wait_for_redis
-        create_tables
-        exec uvicorn main:app --host 0.0.0.0 --port 8000
+        # Preforked uvicorn workers (uvloop/httptools), app preloaded in the master
+        exec gunicorn main:app -c gunicorn.conf.py
         ;;
     "server-dev")
         echo "Starting FastAPI server in development mode..."
@@ -87,6 +94,7 @@ case "$1" in
         echo "Running database migrations..."
         wait_for_db
         run_migrations
+        check_schema
         ;;
     "create-tables")
         echo "Creating database tables..."
@@ -105,6 +113,9 @@ case "$1" in
         echo "Running tests..."
         wait_for_db
         wait_for_redis
+        if [ -f "requirements-dev.txt" ]; then
+            pip install --no-cache-dir -q -r requirements-dev.txt
+        fi
         if [ -f "pytest.ini" ] || [ -f "pyproject.toml" ]; then
             exec pytest "${@:2}"
         else
@@ -116,8 +127,8 @@ case "$1" in
         echo "Starting background worker..."
         wait_for_db
         wait_for_redis
-        # Здесь можно добавить команду для запуска Celery worker или другого worker'а
-        echo "Worker functionality not implemented yet"
+        # Outbox relay и другие фоновые задачи (app/worker.py)
+        exec python -m app.worker
         ;;
     "scheduler")
         echo "Starting scheduler..."
@@ -0,0 +1,29 @@
+import multiprocessing
+
+from app.core.config import settings
+
+
+bind = f"0.0.0.0:{settings.PORT}"
+
+# Preforked async workers, one per core unless WEB_CONCURRENCY is set
+workers = settings.WEB_CONCURRENCY or multiprocessing.cpu_count()
+worker_class = "app.core.workers.QueueUvicornWorker"
+
+# Import the app once in the master so workers fork with modules already loaded
+preload_app = True
+
+timeout = settings.WORKER_TIMEOUT
+graceful_timeout = settings.WORKER_TIMEOUT
+keepalive = 5
+max_requests = settings.WORKER_MAX_REQUESTS
+max_requests_jitter = settings.WORKER_MAX_REQUESTS // 10
+
+accesslog = "-"
+errorlog = "-"
+
+
+def post_fork(server, worker):
+    # Connection pools created while preloading must not be shared across processes
+    from app.core.database import engine
+
+    engine.sync_engine.dispose(close=False)
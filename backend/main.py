@@ -1,19 +1,48 @@
-from fastapi import FastAPI
+import asyncio
+from fastapi import Depends, FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from contextlib import asynccontextmanager
 
 from app.core.config import settings
-from app.core.database import engine, create_tables
+from app.core.database import engine, redis_client
 from app.api.router import api_router
+from app.core.encoding import CompressionMiddleware
+from app.core.load_shedding import LoadSheddingMiddleware, overload_monitor
+from app.core.metrics import REGISTRY, require_metrics_token
+from app.core import profiling
+from app.core.redis_layer import client_cache
+from app.core.revocation import revocations
+from app.core.sharding import shards
+from app.services import write_behind
+from app.services.order_intake import order_intake
+from app.services.geofence import geofence
+from app import models  # noqa: F401  register all mappers before the first query
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    await create_tables()
+    # Schema is managed by the migrate step (docker-entrypoint.sh migrate),
+    # so workers start without touching DDL.
+    profiling.install()
+    stop = asyncio.Event()
+    flusher = asyncio.create_task(write_behind.run_flusher(stop))
+    geofence_batches = asyncio.create_task(geofence.run(stop))
+    monitor = asyncio.create_task(overload_monitor.run(stop))
+    invalidations = asyncio.create_task(client_cache.run(stop))
+    sampler = asyncio.create_task(profiling.sampler.run(stop))
+    revocation_sync = asyncio.create_task(revocations.run(stop))
     yield
     # Shutdown
+    stop.set()
+    await order_intake.drain()
+    await asyncio.gather(flusher, geofence_batches, monitor, invalidations, sampler, revocation_sync)
+    await write_behind.flush_all()
+    await shards.close()
+    await redis_client.close()
+    await engine.dispose()
 
 
 app = FastAPI(
@@ -24,18 +53,29 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
-# Middleware
+# Middleware (the last one added runs first)
+app.add_middleware(
+    TrustedHostMiddleware,
+    allowed_hosts=settings.ALLOWED_HOSTS,
+)
+
+app.add_middleware(CompressionMiddleware)
+
+# Inside load shedding, so queueing for a slot isn't part of the profile
+app.add_middleware(profiling.ProfilingMiddleware)
+
+# Shed before any other work is done
+app.add_middleware(LoadSheddingMiddleware, monitor=overload_monitor)
+
+# Outermost, so every response (503s from load shedding too) carries CORS
+# headers and browsers let clients read Retry-After instead of a CORS error
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.ALLOWED_HOSTS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
-)
-
-app.add_middleware(
-    TrustedHostMiddleware,
-    allowed_hosts=settings.ALLOWED_HOSTS,
+    expose_headers=["Retry-After"],
 )
 
 # Include routers
@@ -49,4 +89,14 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+
+@app.get(
+    "/metrics",
+    response_class=PlainTextResponse,
+    include_in_schema=False,
+    dependencies=[Depends(require_metrics_token)],
+)
+async def metrics():
+    return REGISTRY.render()
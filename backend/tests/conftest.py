@@ -0,0 +1,24 @@
+import asyncio
+
+import fakeredis
+import fakeredis.aioredis
+import pytest
+
+
+@pytest.fixture
+def run():
+    """Run a coroutine on a fresh event loop (no pytest-asyncio needed)"""
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
+
+
+@pytest.fixture
+def redis(run, monkeypatch):
+    """In-memory Redis (with Lua) standing in for the shared client"""
+    from app.services import active_orders
+
+    client = fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+    monkeypatch.setattr(active_orders, "redis_client", client)
+    yield client
+    run(client.aclose())
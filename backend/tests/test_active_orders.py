@@ -0,0 +1,130 @@
+"""Version rule of the per-user active orders index (app/services/active_orders.py)"""
+import json
+from types import SimpleNamespace
+
+from app.core.config import settings
+from app.services.active_orders import COMPLETE_FIELD, ActiveOrdersIndex
+
+USER_ID = 7
+POINT_ID = 3
+ORDER_ID = 42
+KEY = ActiveOrdersIndex.key(USER_ID)
+
+
+def event(event_type: str, version: int, status_id: int = 1, order_id: int = ORDER_ID):
+    return SimpleNamespace(
+        event_type=event_type,
+        user_id=USER_ID,
+        point_id=POINT_ID,
+        entity_id=order_id,
+        payload={
+            "v": version,
+            "number": f"{POINT_ID}-{order_id}",
+            "status_id": status_id,
+            "type": "immediate",
+            "scheduled_time": None,
+            "created_at": "2024-01-01T10:00:00+00:00",
+            "position": 1,
+        },
+    )
+
+
+def order_json(status_id: int = 1, order_id: int = ORDER_ID) -> str:
+    return json.dumps({
+        "id": order_id,
+        "point_id": POINT_ID,
+        "number": f"{POINT_ID}-{order_id}",
+        "status_id": status_id,
+        "type": "immediate",
+        "scheduled_time": None,
+        "created_at": "2024-01-01T10:00:00+00:00",
+        "position": 1,
+    }, separators=(",", ":"))
+
+
+def entry(version: int, status_id: int = 1, order_id: int = ORDER_ID) -> str:
+    """Hash value as the index stores it"""
+    return f"{version}|{order_json(status_id, order_id)}"
+
+
+async def relay(redis, *rows) -> None:
+    """Apply events the way the outbox relay does: queued on one pipeline"""
+    pipe = redis.pipeline(transaction=False)
+    for row in rows:
+        await ActiveOrdersIndex.queue_event(pipe, row)
+    await pipe.execute()
+
+
+def test_out_of_order_delivery_keeps_the_newest_version(redis, run):
+    run(relay(redis, event("order.status_changed", 5, status_id=2)))
+    run(relay(redis, event("order.created", 3, status_id=1)))
+
+    assert run(redis.hgetall(KEY)) == {str(ORDER_ID): entry(5, status_id=2)}
+
+
+def test_duplicate_replay_changes_nothing(redis, run):
+    created = event("order.created", 3)
+    changed = event("order.status_changed", 4, status_id=2)
+    run(relay(redis, created, changed))
+    before = run(redis.hgetall(KEY))
+
+    run(relay(redis, created, changed, changed))
+
+    assert before == {str(ORDER_ID): entry(4, status_id=2)}
+    assert run(redis.hgetall(KEY)) == before
+
+
+def test_late_status_change_does_not_resurrect_a_finalized_order(redis, run):
+    run(relay(redis, event("order.created", 3)))
+    run(relay(redis, event("order.finalized", 7)))
+    run(relay(redis, event("order.status_changed", 6, status_id=2)))
+
+    assert run(redis.hgetall(KEY)) == {str(ORDER_ID): "7|"}
+
+
+def test_events_only_hash_is_not_complete_but_expires(redis, run):
+    run(relay(redis, event("order.created", 3)))
+
+    assert COMPLETE_FIELD not in run(redis.hgetall(KEY))
+    assert 0 < run(redis.ttl(KEY)) <= settings.ACTIVE_ORDERS_TTL_SECONDS
+
+
+def test_rebuild_racing_with_events_keeps_the_newer_entries(redis, run, monkeypatch):
+    other_id = ORDER_ID + 1
+
+    async def stale_load(db, user_id, known_ids):
+        # While the rebuild reads Postgres, the relay applies newer events
+        await relay(
+            redis,
+            event("order.finalized", 9),
+            event("order.status_changed", 5, status_id=3, order_id=other_id),
+        )
+        return [
+            (ORDER_ID, 8, order_json(status_id=2)),
+            (other_id, 4, order_json(order_id=other_id)),
+        ]
+
+    monkeypatch.setattr(ActiveOrdersIndex, "_load", staticmethod(stale_load))
+    merged = run(ActiveOrdersIndex.repair(None, USER_ID, [ORDER_ID]))
+
+    expected = {
+        str(ORDER_ID): "9|",
+        str(other_id): entry(5, status_id=3, order_id=other_id),
+        COMPLETE_FIELD: "1",
+    }
+    assert merged == expected
+    assert run(redis.hgetall(KEY)) == expected
+    assert 0 < run(redis.ttl(KEY)) <= settings.ACTIVE_ORDERS_TTL_SECONDS
+
+
+def test_rebuild_fills_in_what_events_missed(redis, run, monkeypatch):
+    run(relay(redis, event("order.created", 3)))
+
+    async def load(db, user_id, known_ids):
+        assert list(known_ids) == [ORDER_ID]
+        return [(ORDER_ID, 4, order_json(status_id=2))]
+
+    monkeypatch.setattr(ActiveOrdersIndex, "_load", staticmethod(load))
+    run(ActiveOrdersIndex.repair(None, USER_ID, [ORDER_ID]))
+
+    assert run(redis.hgetall(KEY)) == {str(ORDER_ID): entry(4, status_id=2), COMPLETE_FIELD: "1"}
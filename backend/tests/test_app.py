@@ -0,0 +1,39 @@
+"""HTTP-level behaviour of the application stack (main.py)"""
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from main import app
+
+
+@pytest.fixture
+def client():
+    # Not entered as a context manager: no lifespan, so no background tasks
+    return TestClient(app)
+
+
+def test_metrics_are_not_served_without_a_token(client, monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_TOKEN", None)
+
+    assert client.get("/metrics").status_code == 404
+
+
+def test_metrics_require_the_bearer_token(client, monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "scrape-secret")
+
+    assert client.get("/metrics").status_code == 403
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 403
+    response = client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+    assert response.status_code == 200
+    assert "# TYPE" in response.text
+
+
+def test_shed_requests_carry_cors_headers(client, monkeypatch):
+    from app.core.load_shedding import overload_monitor
+
+    monkeypatch.setattr(overload_monitor, "pressure", 100.0)
+    response = client.get("/api/v1/points", headers={"Origin": "https://app.example.com"})
+
+    assert response.status_code == 503
+    assert response.headers["access-control-allow-origin"] in ("*", "https://app.example.com")
+    assert "retry-after" in response.headers["access-control-expose-headers"].lower()
@@ -0,0 +1,42 @@
+"""Relayed deltas of the point change feed (app/services/changefeed.py)"""
+import json
+
+from app.schemas.sync import ChangeKindEnum, ChangeOpEnum
+from app.services.changefeed import ChangeFeed
+
+POINT_ID = 5
+
+
+def upsert(order_id: int, version: int):
+    return (ChangeKindEnum.ORDER, ChangeOpEnum.UPSERT, order_id, {"v": version})
+
+
+async def relay(redis, events):
+    pipe = redis.pipeline(transaction=False)
+    await ChangeFeed.queue_events(pipe, POINT_ID, events)
+    return await pipe.execute()
+
+
+def deltas(redis, run):
+    return [
+        (entry_id, json.loads(fields["d"])["d"])
+        for entry_id, fields in run(redis.xrange(ChangeFeed.stream_key(POINT_ID)))
+    ]
+
+
+def test_retried_batch_is_not_appended_again(redis, run):
+    batch = [(10, upsert(1, 1)), (11, upsert(1, 2))]
+    assert run(relay(redis, batch)) == [2]
+
+    # Partial publish: the rows are claimed again together with a new one
+    assert run(relay(redis, [*batch, (12, upsert(2, 1))])) == [3]
+
+    assert deltas(redis, run) == [("1-0", {"v": 1}), ("2-0", {"v": 2}), ("3-0", {"v": 1})]
+    assert run(redis.get(ChangeFeed.seq_key(POINT_ID))) == "3"
+
+
+def test_late_committed_event_is_still_appended(redis, run):
+    run(relay(redis, [(11, upsert(1, 2))]))
+    run(relay(redis, [(10, upsert(2, 1))]))
+
+    assert deltas(redis, run) == [("1-0", {"v": 2}), ("2-0", {"v": 1})]
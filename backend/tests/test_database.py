@@ -0,0 +1,134 @@
+"""Connection handling of ShortSession and ReadOnlySession (app/core/database.py)"""
+import pytest
+from sqlalchemy import event, insert, literal_column, select, table, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.core.database import ReadOnlySession, ShortSession, db_statements_total
+from app.models.user import PushDevice
+
+
+@pytest.fixture
+def engine(run, tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'short.db'}")
+
+    async def create():
+        async with engine.begin() as connection:
+            await connection.run_sync(PushDevice.metadata.create_all, tables=[PushDevice.__table__])
+            await connection.execute(insert(PushDevice), [{"user_id": 1, "token": "phone"}])
+
+    run(create())
+    yield engine
+    run(engine.dispose())
+
+
+@pytest.fixture
+def statements(engine):
+    """(verb, isolation level) of every statement sent from here on"""
+    sent = []
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def record(connection, cursor, statement, parameters, context, executemany):
+        sent.append((statement.split()[0], connection.get_execution_options().get("isolation_level", "transaction")))
+
+    return sent
+
+
+@pytest.fixture
+def session(run, engine):
+    db = async_sessionmaker(engine, class_=ShortSession, expire_on_commit=False)()
+    yield db
+    run(db.close())
+
+
+@pytest.fixture
+def read_session(run, engine):
+    db = async_sessionmaker(engine, class_=ReadOnlySession, expire_on_commit=False, autoflush=False)()
+    yield db
+    run(db.close())
+
+
+def device_query():
+    return select(PushDevice).where(PushDevice.token == "phone")
+
+
+def test_lone_reads_run_in_autocommit_and_release_the_connection(run, statements, session):
+    before = db_statements_total.get(mode="autocommit")
+
+    device = run(session.scalar(device_query()))
+    run(session.execute(select(PushDevice.id)))
+    run(session.get(PushDevice, device.id, populate_existing=True))
+    run(session.refresh(device))
+
+    assert statements == [("SELECT", "AUTOCOMMIT")] * 4
+    assert not session.in_transaction()
+    assert db_statements_total.get(mode="autocommit") - before == 4
+
+
+def test_writes_and_locking_reads_run_in_a_transaction(run, statements, session):
+    device = run(session.scalar(device_query()))
+    statements.clear()
+
+    run(session.get(PushDevice, device.id, with_for_update=True, populate_existing=True))
+    assert session.in_transaction()
+    run(session.refresh(device, with_for_update=True))
+    run(session.execute(select(PushDevice).with_for_update()))
+    run(session.execute(text("UPDATE push_devices SET platform = 'ios'")))
+    run(session.commit())
+
+    assert {mode for _, mode in statements} == {"transaction"}
+
+
+@pytest.mark.parametrize("change", ["new", "dirty", "deleted"])
+def test_pending_changes_force_a_transaction(run, statements, session, change):
+    device = run(session.scalar(device_query()))
+    if change == "new":
+        session.add(PushDevice(user_id=2, token="tablet"))
+    elif change == "dirty":
+        device.platform = "android"
+    else:
+        run(session.delete(device))
+    statements.clear()
+
+    run(session.execute(select(PushDevice.id)))
+
+    assert session.in_transaction()
+    assert statements[-1] == ("SELECT", "transaction")
+    run(session.rollback())
+
+
+def test_failed_autocommit_read_leaves_the_session_usable(run, statements, session):
+    with pytest.raises(Exception):
+        run(session.execute(select(literal_column("id")).select_from(table("missing_table"))))
+
+    assert not session.in_transaction()
+    assert not session.sync_session.read_alone
+    assert run(session.scalar(device_query())).token == "phone"
+    assert statements[-1] == ("SELECT", "AUTOCOMMIT")
+
+
+def test_explicit_transaction_keeps_reads_in_it(run, statements, session):
+    async def work():
+        async with session.begin():
+            await session.scalar(device_query())
+            return session.in_transaction()
+
+    assert run(work())
+    assert statements[-1] == ("SELECT", "transaction")
+
+
+def test_read_only_session_reads_in_autocommit_and_refuses_writes(run, statements, read_session):
+    device = run(read_session.scalar(device_query()))
+    run(read_session.get(PushDevice, device.id, populate_existing=True))
+    assert statements == [("SELECT", "AUTOCOMMIT")] * 2
+
+    with pytest.raises(RuntimeError):
+        run(read_session.execute(insert(PushDevice).values(user_id=3, token="laptop")))
+    with pytest.raises(RuntimeError):
+        run(read_session.execute(device_query().with_for_update()))
+    with pytest.raises(RuntimeError):
+        run(read_session.get(PushDevice, device.id, with_for_update=True))
+    read_session.add(PushDevice(user_id=3, token="laptop"))
+    with pytest.raises(RuntimeError):
+        run(read_session.flush())
+
+    assert run(read_session.scalar(select(PushDevice.token).where(PushDevice.user_id == 3))) is None
@@ -0,0 +1,157 @@
+"""Idempotency-Key deduplication of retried requests (app/core/idempotency.py)"""
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException, Request
+from pydantic import BaseModel
+
+from app.core import idempotency as idempotency_module
+from app.core.config import settings
+from app.core.idempotency import REPLAYED_HEADER, IdempotencyStore
+
+SCOPE = "orders.create"
+USER_ID = 7
+
+
+class Created(BaseModel):
+    id: int
+    note: str
+
+
+@pytest.fixture(autouse=True)
+def shared_redis(redis, monkeypatch):
+    monkeypatch.setattr(idempotency_module, "redis_client", redis)
+
+
+def request(body: dict, key: str = "retry-1") -> Request:
+    payload = json.dumps(body).encode()
+
+    async def receive():
+        return {"type": "http.request", "body": payload, "more_body": False}
+
+    return Request({
+        "type": "http",
+        "method": "POST",
+        "path": "/api/v1/orders",
+        "headers": [(b"idempotency-key", key.encode())],
+        "query_string": b"",
+        "server": ("test", 80),
+    }, receive)
+
+
+class Handler:
+    """Counts executions; optionally slow or failing"""
+
+    def __init__(self, delay: float = 0, fail: bool = False):
+        self.calls = 0
+        self.delay = delay
+        self.fail = fail
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("database unavailable")
+        return {"id": self.calls, "note": "ünïcode"}
+
+
+def call(handler, body=None, key="retry-1"):
+    return IdempotencyStore().run(request(body or {"point_id": 1}, key), None, SCOPE, USER_ID, handler, Created, 201)
+
+
+def test_retry_replays_the_stored_bytes(run):
+    handler = Handler()
+
+    first = run(call(handler))
+    retry = run(call(handler))
+
+    assert handler.calls == 1
+    assert (retry.status_code, retry.body) == (201, first.body)
+    assert retry.headers[REPLAYED_HEADER] == "true"
+    assert REPLAYED_HEADER not in first.headers
+
+
+def test_key_is_held_as_pending_while_running(run, redis):
+    key = IdempotencyStore._key(SCOPE, USER_ID, "retry-1")
+    seen = {}
+
+    async def handler():
+        seen["entry"] = json.loads(await redis.get(key))
+        seen["ttl"] = await redis.pttl(key)
+        return {"id": 1, "note": ""}
+
+    run(call(handler))
+
+    assert seen["entry"]["state"] == "pending"
+    assert 0 < seen["ttl"] <= settings.IDEMPOTENCY_LOCK_SECONDS * 1000
+    assert json.loads(run(redis.get(key)))["state"] == "done"
+
+
+def test_same_key_with_another_body_is_rejected(run):
+    run(call(Handler(), {"point_id": 1}))
+
+    with pytest.raises(HTTPException) as raised:
+        run(call(Handler(), {"point_id": 2}))
+    assert raised.value.status_code == 422
+
+
+def test_concurrent_duplicates_execute_once(run):
+    handler = Handler(delay=0.1)
+
+    async def duplicates():
+        return await asyncio.gather(*(call(handler) for _ in range(5)))
+
+    responses = run(duplicates())
+
+    assert handler.calls == 1
+    assert len({response.body for response in responses}) == 1
+    assert sum(REPLAYED_HEADER in response.headers for response in responses) == 4
+
+
+def test_duplicate_gives_up_with_409_if_the_first_never_finishes(run, monkeypatch):
+    monkeypatch.setattr(settings, "IDEMPOTENCY_WAIT_SECONDS", 0.2)
+    handler = Handler(delay=1.0)
+
+    async def duplicate_while_running():
+        first = asyncio.ensure_future(call(handler))
+        await asyncio.sleep(0.05)
+        try:
+            await call(handler)
+        finally:
+            first.cancel()
+            await asyncio.gather(first, return_exceptions=True)
+
+    with pytest.raises(HTTPException) as raised:
+        run(duplicate_while_running())
+    assert raised.value.status_code == 409
+    assert raised.value.headers["Retry-After"] == "1"
+    assert handler.calls == 1
+
+
+def test_failed_request_releases_the_key(run, redis):
+    failing = Handler(fail=True)
+    with pytest.raises(RuntimeError):
+        run(call(failing))
+    assert run(redis.keys("idem:*")) == []
+
+    handler = Handler()
+    run(call(handler))
+    assert handler.calls == 1
+
+
+def test_waiting_duplicate_runs_once_the_first_fails(run):
+    failing, retry = Handler(delay=0.1, fail=True), Handler()
+
+    async def race():
+        first = asyncio.ensure_future(call(failing))
+        await asyncio.sleep(0.02)
+        second = await call(retry)
+        with pytest.raises(RuntimeError):
+            await first
+        return second
+
+    response = run(race())
+
+    assert (failing.calls, retry.calls) == (1, 1)
+    assert REPLAYED_HEADER not in response.headers
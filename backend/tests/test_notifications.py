@@ -0,0 +1,269 @@
+"""Order status pushes and queued emails (app/services/notifications.py)"""
+import asyncio
+import email
+import json
+
+import httpx
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.core.config import settings
+from app.models.user import PushDevice
+from app.services import notifications
+from app.services.notifications import (
+    CONSUMER_GROUP, EMAIL_PROCESSING, EMAIL_QUEUE, NotificationService, NotificationWorker,
+    PushGateway, SMTPPool,
+)
+from app.services.outbox import ORDER_EVENTS_STREAM
+
+USER_ID = 7
+POINT_ID = 3
+STATUS_NAMES = {1: "Accepted", 2: "Cooking", 3: "Ready"}
+
+
+def status_event(order_id: int, version: int, status_id: int, user_id: int = USER_ID):
+    return {
+        "type": "order.status_changed",
+        "user_id": user_id,
+        "point_id": POINT_ID,
+        "entity_id": order_id,
+        "data": {"v": version, "status_id": status_id, "number": f"{POINT_ID}-{order_id}"},
+    }
+
+
+class FakePushAPI:
+    """Push gateway behind ``httpx.MockTransport``: records batches, rejects listed tokens"""
+
+    def __init__(self):
+        self.batches = []
+        self.unregistered = set()
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        batch = json.loads(request.content)
+        self.batches.append(batch)
+        return httpx.Response(200, json={"data": [
+            {"status": "error", "details": {"error": "DeviceNotRegistered"}}
+            if message["to"] in self.unregistered else {"status": "ok", "id": "ticket"}
+            for message in batch
+        ]})
+
+    @property
+    def messages(self):
+        return [message for batch in self.batches for message in batch]
+
+
+class SMTPStub:
+    """Minimal in-process SMTP server: records accepted messages, refuses listed recipients"""
+
+    def __init__(self):
+        self.messages = []
+        self.refused = set()
+        self.sessions = set()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.sessions.add(asyncio.current_task())
+        async def reply(line: str) -> None:
+            writer.write(f"{line}\r\n".encode())
+            await writer.drain()
+
+        await reply("220 stub")
+        while line := await reader.readline():
+            command = line.decode().strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                await reply("250 stub")
+            elif verb == "RCPT":
+                address = command.split(":", 1)[1].strip("<> ")
+                await reply("451 try again later" if address in self.refused else "250 ok")
+            elif verb == "DATA":
+                await reply("354 end with .")
+                lines = []
+                while (data := await reader.readline()) != b".\r\n":
+                    lines.append(data)
+                self.messages.append(email.message_from_bytes(b"".join(lines)))
+                await reply("250 queued")
+            elif verb == "QUIT":
+                await reply("221 bye")
+                break
+            else:  # MAIL, RSET, NOOP
+                await reply("250 ok")
+        writer.close()
+
+
+@pytest.fixture(autouse=True)
+def shared_redis(redis, monkeypatch):
+    monkeypatch.setattr(notifications, "redis_client", redis)
+
+
+@pytest.fixture
+def devices(run, tmp_path, monkeypatch):
+    """Push devices in SQLite; ``devices(user_id, *tokens)`` registers tokens"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'devices.db'}")
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def create():
+        async with engine.begin() as connection:
+            await connection.run_sync(PushDevice.metadata.create_all, tables=[PushDevice.__table__])
+
+    async def add(user_id, *tokens):
+        async with sessions() as db:
+            db.add_all(PushDevice(user_id=user_id, token=token) for token in tokens)
+            await db.commit()
+
+    async def texts(db, point_ids):
+        return {POINT_ID: ("Cafe", STATUS_NAMES)}
+
+    run(create())
+    monkeypatch.setattr(notifications, "AsyncSessionLocal", sessions)
+    monkeypatch.setattr(NotificationWorker, "_texts", staticmethod(texts))
+    yield lambda user_id, *tokens: run(add(user_id, *tokens))
+    run(engine.dispose())
+
+
+@pytest.fixture
+def push_api(run, monkeypatch):
+    monkeypatch.setattr(settings, "NOTIFICATIONS_PUSH_URL", "https://push.test/send")
+    api = FakePushAPI()
+    gateway = PushGateway(transport=httpx.MockTransport(api.handle))
+    api.gateway = gateway
+    yield api
+    run(gateway.close())
+
+
+@pytest.fixture
+def smtp_server(run, monkeypatch):
+    stub = SMTPStub()
+    server = run(asyncio.start_server(stub.handle, "127.0.0.1", 0))
+    monkeypatch.setattr(settings, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(settings, "SMTP_PORT", server.sockets[0].getsockname()[1])
+    monkeypatch.setattr(settings, "SMTP_STARTTLS", False)
+    monkeypatch.setattr(settings, "SMTP_USERNAME", None)
+    yield stub
+    server.close()
+    run(server.wait_closed())
+    if stub.sessions:  # let sessions finish answering QUIT
+        run(asyncio.wait(stub.sessions, timeout=1))
+
+
+def test_status_changes_are_coalesced_to_the_newest_version(redis, run, devices, push_api):
+    devices(USER_ID, "phone")
+    worker = NotificationWorker()
+    run(worker._ensure_group())
+    for version, status_id in ((3, 1), (5, 3), (4, 2)):  # v4 redelivered after v5
+        run(redis.xadd(ORDER_EVENTS_STREAM, {"e": json.dumps(status_event(42, version, status_id))}))
+
+    delivered = run(redis.xreadgroup(CONSUMER_GROUP, worker.consumer, {ORDER_EVENTS_STREAM: ">"}))
+    for message_id, fields in delivered[0][1]:
+        worker._add(message_id, json.loads(fields["e"]))
+    run(worker._flush(push_api.gateway, everything=True))
+
+    assert push_api.messages == [{
+        "to": "phone",
+        "title": "Cafe",
+        "body": "Order 3-42: Ready",
+        "data": {"order_id": 42, "point_id": POINT_ID, "status_id": 3},
+    }]
+    assert run(redis.xpending(ORDER_EVENTS_STREAM, CONSUMER_GROUP))["pending"] == 0
+
+
+def test_pushes_are_sent_in_batches(run, devices, push_api, monkeypatch):
+    monkeypatch.setattr(settings, "NOTIFICATIONS_PUSH_BATCH_SIZE", 2)
+    devices(USER_ID, *(f"device-{n}" for n in range(5)))
+
+    run(NotificationWorker()._deliver(push_api.gateway, [status_event(42, 1, 2)]))
+
+    assert [len(batch) for batch in push_api.batches] == [2, 2, 1]
+    assert sorted(message["to"] for message in push_api.messages) == [f"device-{n}" for n in range(5)]
+
+
+def test_pushes_over_the_user_cap_are_dropped(run, devices, push_api, monkeypatch):
+    monkeypatch.setattr(settings, "NOTIFICATIONS_PUSH_USER_CAP", 2)
+    devices(USER_ID, "phone")
+    devices(USER_ID + 1, "tablet")
+    worker = NotificationWorker()
+
+    run(worker._deliver(push_api.gateway, [status_event(order_id, 1, 2) for order_id in (1, 2, 3)]))
+    run(worker._deliver(push_api.gateway, [status_event(4, 1, 2), status_event(5, 1, 2, user_id=USER_ID + 1)]))
+
+    assert [(message["to"], message["data"]["order_id"]) for message in push_api.messages] == [
+        ("phone", 1), ("phone", 2), ("tablet", 5),
+    ]
+
+
+def test_unregistered_devices_are_removed(run, devices, push_api):
+    devices(USER_ID, "phone", "old-phone")
+    push_api.unregistered.add("old-phone")
+
+    run(NotificationWorker()._deliver(push_api.gateway, [status_event(42, 1, 2)]))
+
+    async def tokens():
+        async with notifications.AsyncSessionLocal() as db:
+            return set((await db.scalars(select(PushDevice.token))).all())
+
+    assert len(push_api.messages) == 2
+    assert run(tokens()) == {"phone"}
+
+
+def test_queued_emails_are_sent_in_batches_and_released(redis, run, smtp_server, monkeypatch):
+    monkeypatch.setattr(settings, "NOTIFICATIONS_EMAIL_BATCH", 2)
+    for n in range(3):
+        run(NotificationService.queue_email(f"user{n}@example.com", f"Subject {n}", "Body"))
+    worker, smtp = NotificationWorker(), SMTPPool(2)
+
+    assert run(worker._process_emails(smtp)) == 2
+    assert run(worker._process_emails(smtp)) == 1
+    run(smtp.close())
+
+    assert sorted(message["To"] for message in smtp_server.messages) == [f"user{n}@example.com" for n in range(3)]
+    assert run(redis.llen(EMAIL_QUEUE)) == 0
+    assert run(redis.llen(EMAIL_PROCESSING)) == 0
+
+
+def test_emails_over_the_address_cap_are_dropped(redis, run, smtp_server, monkeypatch):
+    monkeypatch.setattr(settings, "NOTIFICATIONS_EMAIL_USER_CAP", 1)
+    for subject in ("First", "Second"):
+        run(NotificationService.queue_email("user@example.com", subject, "Body"))
+    smtp = SMTPPool(1)
+
+    run(NotificationWorker()._process_emails(smtp))
+    run(smtp.close())
+
+    assert [message["Subject"] for message in smtp_server.messages] == ["First"]
+    assert run(redis.llen(EMAIL_PROCESSING)) == 0
+
+
+def test_failed_email_is_retried_until_the_attempt_limit(redis, run, smtp_server, monkeypatch):
+    monkeypatch.setattr(settings, "NOTIFICATIONS_EMAIL_MAX_ATTEMPTS", 2)
+    smtp_server.refused.add("busy@example.com")
+    run(NotificationService.queue_email("busy@example.com", "Hello", "Body"))
+    worker, smtp = NotificationWorker(), SMTPPool(1)
+
+    run(worker._process_emails(smtp))
+    assert [json.loads(entry)["attempts"] for entry in run(redis.lrange(EMAIL_QUEUE, 0, -1))] == [1]
+
+    smtp_server.refused.clear()
+    run(worker._process_emails(smtp))
+    assert [message["To"] for message in smtp_server.messages] == ["busy@example.com"]
+
+    smtp_server.refused.add("busy@example.com")
+    run(NotificationService.queue_email("busy@example.com", "Again", "Body"))
+    run(worker._process_emails(smtp))
+    run(worker._process_emails(smtp))  # second failure: dropped
+    run(smtp.close())
+
+    assert run(redis.llen(EMAIL_QUEUE)) == 0
+    assert run(redis.llen(EMAIL_PROCESSING)) == 0
+    assert len(smtp_server.messages) == 1
+
+
+def test_emails_left_by_a_crashed_worker_are_sent_first(redis, run, smtp_server):
+    run(NotificationService.queue_email("new@example.com", "New", "Body"))
+    run(redis.lpush(EMAIL_PROCESSING, json.dumps({"to": "old@example.com", "subject": "Old", "body": "Body"})))
+    worker, smtp = NotificationWorker(), SMTPPool(1)
+
+    assert run(worker.requeue_unfinished_emails()) == 1
+    assert run(worker._process_emails(smtp)) == 2
+    run(smtp.close())
+
+    assert [message["To"] for message in smtp_server.messages] == ["old@example.com", "new@example.com"]
@@ -0,0 +1,87 @@
+"""Rebuilding live queue counters from Postgres (app/services/queue_counters.py)"""
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.redis_layer import AutoPipeline
+from app.core.sharding import Shard
+from app.services import queue_counters
+from app.services.queue_counters import COMPLETE_FIELD, QueueCounters
+
+POINT_ID = 4
+ORDER_ID = 42
+STATUSES_KEY, CASHIERS_KEY, ORDERS_KEY = QueueCounters.keys(POINT_ID)
+
+
+@pytest.fixture(autouse=True)
+def point_shard(redis, monkeypatch):
+    monkeypatch.setattr(queue_counters.shards, "_primary", Shard("test", redis, AutoPipeline(redis)))
+
+
+def event(event_type: str, version: int, status_id: int = 1, order_id: int = ORDER_ID, cashier_id=None):
+    return SimpleNamespace(
+        event_type=event_type,
+        entity_id=order_id,
+        payload={"v": version, "status_id": status_id, "cashier_id": cashier_id},
+    )
+
+
+async def relay(redis, *rows) -> None:
+    pipe = redis.pipeline(transaction=False)
+    await QueueCounters.queue_events(pipe, POINT_ID, rows)
+    await pipe.execute()
+
+
+def loads(monkeypatch, live=(), pending=(), meanwhile=None):
+    """Make rebuilds see ``live`` orders and ``pending`` outbox events in Postgres"""
+    async def load(db, point_ids):
+        if meanwhile is not None:
+            await meanwhile()
+        return {POINT_ID: [value for order in live for value in order]}, set(pending)
+
+    monkeypatch.setattr(QueueCounters, "_load", staticmethod(load))
+
+
+def test_tombstone_stays_while_order_events_are_in_the_outbox(redis, run, monkeypatch):
+    run(relay(redis, event("order.created", 3), event("order.finalized", 5)))
+    loads(monkeypatch, pending=[ORDER_ID])
+
+    run(QueueCounters.rebuild(None, [POINT_ID]))
+    run(relay(redis, event("order.created", 3)))  # late duplicate
+
+    assert run(redis.hgetall(ORDERS_KEY)) == {str(ORDER_ID): "5||"}
+    assert run(redis.hgetall(STATUSES_KEY)) == {COMPLETE_FIELD: "1"}
+
+
+def test_tombstone_is_dropped_once_the_outbox_is_drained(redis, run, monkeypatch):
+    run(relay(redis, event("order.created", 3), event("order.finalized", 5)))
+    loads(monkeypatch)
+
+    run(QueueCounters.rebuild(None, [POINT_ID]))
+
+    assert run(redis.hgetall(ORDERS_KEY)) == {}
+
+
+def test_order_relayed_after_the_postgres_read_is_kept(redis, run, monkeypatch):
+    # Committed after Postgres was read (with a lower history id than what
+    # was committed before), relayed before the rebuild script runs
+    loads(monkeypatch, meanwhile=lambda: relay(redis, event("order.created", 7, status_id=2, cashier_id=9)))
+
+    assert run(QueueCounters.rebuild(None, [POINT_ID])) == 0
+
+    assert run(redis.hgetall(ORDERS_KEY)) == {str(ORDER_ID): "7|2|9"}
+    assert run(redis.hgetall(STATUSES_KEY)) == {"2": "1", COMPLETE_FIELD: "1"}
+    assert run(redis.hgetall(CASHIERS_KEY)) == {"9": "1"}
+
+
+def test_rebuild_corrects_counts_from_postgres(redis, run, monkeypatch):
+    other_id = ORDER_ID + 1
+    run(relay(redis, event("order.created", 3, status_id=1, cashier_id=9)))
+    # Finalized by a workflow change: no event, Postgres no longer lists it
+    loads(monkeypatch, live=[(other_id, 6, 2, "")])
+
+    assert run(QueueCounters.rebuild(None, [POINT_ID])) == 3
+
+    assert run(redis.hgetall(ORDERS_KEY)) == {str(other_id): "6|2|"}
+    assert run(redis.hgetall(STATUSES_KEY)) == {"2": "1", COMPLETE_FIELD: "1"}
+    assert run(redis.hgetall(CASHIERS_KEY)) == {}
@@ -0,0 +1,96 @@
+"""GCRA rate limiting with the local blocked-key pre-filter (app/core/rate_limit.py)"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException, Request, Response
+
+from app.core import rate_limit
+from app.core.rate_limit import _GCRA_SCRIPT, RateLimiter, rate_limited_total
+
+ROUTE = "auth.login"
+
+
+@pytest.fixture
+def calls(redis, monkeypatch):
+    """The GCRA script on the in-memory Redis; counts its round trips"""
+    script = redis.register_script(_GCRA_SCRIPT)
+    made = []
+
+    async def gcra(keys, args):
+        made.append(keys)
+        return await script(keys=keys, args=args)
+
+    monkeypatch.setattr(rate_limit, "_gcra", gcra)
+    return made
+
+
+def request(ip: str = "10.0.0.1") -> Request:
+    return Request({"type": "http", "method": "POST", "path": "/", "headers": [], "client": (ip, 5000)})
+
+
+async def attempts(limiter: RateLimiter, count: int, **identities):
+    """Outcome of ``count`` sequential hits: remaining count, or the 429 source"""
+    outcomes = []
+    for _ in range(count):
+        response = Response()
+        try:
+            await limiter.hit(request(), response, ROUTE, **identities)
+        except HTTPException as error:
+            assert error.status_code == 429
+            outcomes.append(int(error.headers["Retry-After"]))
+        else:
+            outcomes.append(response.headers["RateLimit-Remaining"])
+    return outcomes
+
+
+def test_burst_up_to_the_limit_then_429(run, calls):
+    limiter = RateLimiter({ROUTE: ["ip:3/minute"]})
+
+    assert run(attempts(limiter, 4)) == ["2", "1", "0", 20]
+
+
+def test_blocked_key_is_rejected_locally(run, calls):
+    limiter = RateLimiter({ROUTE: ["ip:1/minute"]})
+    run(attempts(limiter, 2))
+    round_trips = len(calls)
+    local = rate_limited_total.get(route=ROUTE, source="local")
+
+    assert run(attempts(limiter, 3)) == [60, 60, 60]
+    assert len(calls) == round_trips
+    assert rate_limited_total.get(route=ROUTE, source="local") - local == 3
+    # Other clients still go to Redis
+    run(limiter.hit(request("10.0.0.2"), None, ROUTE))
+    assert len(calls) == round_trips + 1
+
+
+def test_rejected_request_does_not_count_against_other_policies(run, calls):
+    limiter = RateLimiter({ROUTE: ["ip:10/minute", "email:2/minute"]})
+
+    assert run(attempts(limiter, 3, email="a@example.com")) == ["1", "0", 30]
+    # Only the two admitted requests used up the IP's allowance
+    assert run(attempts(limiter, 1, email="b@example.com")) == ["1"]
+    assert run(attempts(limiter, 1)) == ["6"]
+
+
+def test_concurrent_burst_admits_exactly_the_limit(run, calls):
+    limiter = RateLimiter({ROUTE: ["user:5/minute"]})
+
+    async def burst():
+        return await asyncio.gather(
+            *(limiter.hit(request(), None, ROUTE, user="7") for _ in range(12)), return_exceptions=True
+        )
+
+    results = run(burst())
+    assert results.count(None) == 5
+    assert all(isinstance(result, HTTPException) for result in results if result is not None)
+
+
+def test_redis_unavailable_lets_requests_through(run, monkeypatch):
+    async def failing(keys, args):
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(rate_limit, "_gcra", failing)
+    limiter = RateLimiter({ROUTE: ["ip:1/minute"]})
+
+    for _ in range(3):
+        run(limiter.hit(request(), None, ROUTE))  # no 429